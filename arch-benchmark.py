@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+arch-benchmark.py - Compile/test throughput per dollar on x86_64 and ARM64
+
+Runs a representative CPU-bound development cycle inside a task and prices
+it with the Fargate rate for the task's architecture and size, so an x86_64
+task and a Graviton (ARM64) task of the same or different sizes can be
+compared on work done per dollar rather than on raw speed:
+
+  build      clean parallel build (make -j) of a generated C project
+  rebuild    incremental build after touching a header a tenth of it includes
+  test       the project's test binary, sharded over every CPU
+  pytest     a CPU-bound Python test suite, one process per CPU
+
+The task size is read from the ECS task metadata endpoint (--vcpu/--memory-gb
+when run elsewhere), and the architecture from the machine.
+
+Usage:
+  arch-benchmark.py run [--units 400] [--iterations 3] [--label x86-1vcpu] [--output x86.json]
+  arch-benchmark.py compare x86.json arm64.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Fargate Linux on-demand rates in us-east-1 (USD per vCPU-hour, per GB-hour).
+# Fargate Spot discounts both architectures alike, so it does not change the ranking.
+FARGATE_PRICES = {
+    'x86_64': (0.04048, 0.004445),
+    'arm64': (0.03238, 0.00356),
+}
+
+MACHINE_ARCHITECTURES = {'x86_64': 'x86_64', 'amd64': 'x86_64', 'aarch64': 'arm64', 'arm64': 'arm64'}
+
+UNIT_SOURCE = """\
+#include "common.h"
+#include "config.h"
+
+static double mix_{index}(double x, int rounds)
+{{
+    for (int i = 0; i < rounds; i++)
+        x = x * 1.0000001 + (double)(i % 7) / (x + 3.0);
+    return x;
+}}
+
+uint64_t unit_{index}(uint64_t seed, int rounds)
+{{
+    uint64_t state = seed ^ {index}u;
+    double acc = 1.0;
+    for (int i = 0; i < rounds; i++) {{
+        state = lcg(state);
+        switch (state % 8) {{
+        case 0: acc += mix_{index}(acc, 4); break;
+        case 1: acc -= (double)(state & 0xff) / 255.0; break;
+        case 2: state ^= state >> 13; break;
+        case 3: state = rotl(state, {rotation}); break;
+        case 4: acc *= 1.0000003; break;
+        case 5: state += (uint64_t)acc; break;
+        case 6: acc = acc > 1e9 ? 1.0 : acc + 0.5; break;
+        default: state = state * 0x9E3779B97F4A7C15ull + CONFIG_SALT;
+        }}
+    }}
+    return state ^ (uint64_t)acc;
+}}
+"""
+
+COMMON_HEADER = """\
+#include <stdint.h>
+
+static inline uint64_t lcg(uint64_t x) { return x * 6364136223846793005ull + 1442695040888963407ull; }
+static inline uint64_t rotl(uint64_t x, int r) { return (x << r) | (x >> (64 - r)); }
+"""
+
+MAKEFILE = """\
+CFLAGS = -O2 -g -Wall -MMD -MP
+SOURCES = $(wildcard unit*.c) suite.c
+OBJECTS = $(SOURCES:.c=.o)
+
+suite: $(OBJECTS)
+\t$(CC) -o $@ $(OBJECTS) -lm
+
+%.o: %.c
+\t$(CC) $(CFLAGS) -c -o $@ $<
+
+-include $(OBJECTS:.o=.d)
+"""
+
+PYTHON_TESTS = """\
+import hashlib, json, re, sys
+
+def case(seed):
+    data = [{'id': i, 'name': f"item-{seed}-{i}", 'tags': [str(i % 7), str(seed)]} for i in range(300)]
+    text = json.dumps(data)
+    assert json.loads(text) == data
+    assert len(re.findall(r'item-\\d+-\\d+', text)) == 300
+    words = sorted(text.split(','), key=lambda w: hashlib.sha1(w.encode()).digest())
+    return sum(len(word) for word in words)
+
+shard, shards, cases = map(int, sys.argv[1:4])
+print(sum(case(seed) for seed in range(shard, cases, shards)))
+"""
+
+
+def cpu_count():
+    return len(os.sched_getaffinity(0))
+
+
+def detect_architecture():
+    machine = platform.machine().lower()
+    return MACHINE_ARCHITECTURES.get(machine, machine)
+
+
+def task_size():
+    """
+    (vCPU, memory GB) of the task from the ECS task metadata endpoint, or None
+    outside ECS
+    """
+    metadata_uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4')
+    if not metadata_uri:
+        return None
+    try:
+        with urllib.request.urlopen(f"{metadata_uri}/task", timeout=2) as response:
+            limits = json.load(response).get('Limits', {})
+        return float(limits['CPU']), float(limits['Memory']) / 1024
+    except Exception as e:
+        print(f"Warning: Could not read task metadata: {e}", file=sys.stderr)
+        return None
+
+
+def generate_project(root, units):
+    with open(os.path.join(root, 'common.h'), 'w') as f:
+        f.write(COMMON_HEADER)
+    with open(os.path.join(root, 'config.h'), 'w') as f:
+        f.write("#define CONFIG_SALT 1u\n")
+    with open(os.path.join(root, 'Makefile'), 'w') as f:
+        f.write(MAKEFILE)
+    for index in range(units):
+        source = UNIT_SOURCE.format(index=index, rotation=index % 63 + 1)
+        if index % 10:
+            # Only every tenth unit depends on config.h, which `rebuild` touches
+            source = source.replace('#include "config.h"\n', '#define CONFIG_SALT 1u\n')
+        with open(os.path.join(root, f"unit{index:04d}.c"), 'w') as f:
+            f.write(source)
+    declarations = ''.join(f"uint64_t unit_{index}(uint64_t, int);\n" for index in range(units))
+    table = ', '.join(f"unit_{index}" for index in range(units))
+    with open(os.path.join(root, 'suite.c'), 'w') as f:
+        f.write(f"""#include <stdio.h>
+#include <stdlib.h>
+#include "common.h"
+{declarations}
+static uint64_t (*units[])(uint64_t, int) = {{ {table} }};
+
+int main(int argc, char **argv)
+{{
+    int shard = atoi(argv[1]), shards = atoi(argv[2]), rounds = atoi(argv[3]);
+    uint64_t total = 0;
+    for (int i = shard; i < {units}; i += shards)
+        total ^= units[i](i, rounds);
+    printf("%llu\\n", (unsigned long long)total);
+    return 0;
+}}
+""")
+    with open(os.path.join(root, 'tests.py'), 'w') as f:
+        f.write(PYTHON_TESTS)
+
+
+def run_sharded(command, jobs, cwd, value):
+    """
+    Run jobs copies of command in parallel as `<shard> <shards> <value>`
+    """
+    processes = [subprocess.Popen(command + [str(shard), str(jobs), str(value)], cwd=cwd,
+                                  stdout=subprocess.DEVNULL)
+                 for shard in range(jobs)]
+    if any(process.wait() for process in processes):
+        raise RuntimeError(f"{' '.join(command)} failed")
+
+
+def timed(step):
+    start = time.perf_counter()
+    step()
+    return time.perf_counter() - start
+
+
+def run_cycle(root, jobs, test_rounds, python_cases):
+    make = ['make', '-s', f"-j{jobs}", '-C', root]
+    for name in os.listdir(root):
+        if name.endswith(('.o', '.d')) or name == 'suite':
+            os.unlink(os.path.join(root, name))
+    build = timed(lambda: subprocess.run(make, check=True, stdout=subprocess.DEVNULL))
+    os.utime(os.path.join(root, 'config.h'))
+    rebuild = timed(lambda: subprocess.run(make, check=True, stdout=subprocess.DEVNULL))
+    test = timed(lambda: run_sharded(['./suite'], jobs, root, test_rounds))
+    pytest = timed(lambda: run_sharded([sys.executable, 'tests.py'], jobs, root, python_cases))
+    return {'build': build, 'rebuild': rebuild, 'test': test, 'pytest': pytest}
+
+
+def hourly_price(architecture, vcpu, memory_gb, vcpu_hour=None, gb_hour=None):
+    default_vcpu_hour, default_gb_hour = FARGATE_PRICES.get(architecture, FARGATE_PRICES['x86_64'])
+    return vcpu * (vcpu_hour or default_vcpu_hour) + memory_gb * (gb_hour or default_gb_hour)
+
+
+def run(units, iterations, jobs, vcpu, memory_gb, label, test_rounds, python_cases, vcpu_hour, gb_hour):
+    architecture = detect_architecture()
+    size = (vcpu, memory_gb) if vcpu and memory_gb else task_size()
+    if size is None:
+        size = (vcpu or float(cpu_count()), memory_gb or 2.0 * (vcpu or cpu_count()))
+    vcpu, memory_gb = size
+    jobs = jobs or max(1, round(vcpu))
+
+    root = tempfile.mkdtemp(prefix='arch-benchmark-')
+    try:
+        generate_project(root, units)
+        cycles = [run_cycle(root, jobs, test_rounds, python_cases) for _ in range(iterations)]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    # The median of each step, so one noisy neighbour does not decide the result
+    steps = {step: sorted(cycle[step] for cycle in cycles)[len(cycles) // 2] for step in cycles[0]}
+    cycle_seconds = sum(steps.values())
+    price = hourly_price(architecture, vcpu, memory_gb, vcpu_hour, gb_hour)
+    cycles_per_hour = 3600 / cycle_seconds
+    return {
+        'label': label or f"{architecture}-{vcpu:g}vcpu",
+        'architecture': architecture,
+        'cpu_model': cpu_model(),
+        'vcpu': vcpu,
+        'memory_gb': memory_gb,
+        'jobs': jobs,
+        'units': units,
+        'iterations': iterations,
+        'steps': {step: round(seconds, 3) for step, seconds in steps.items()},
+        'cycle_seconds': round(cycle_seconds, 3),
+        'cycles_per_hour': round(cycles_per_hour, 1),
+        'price_per_hour': round(price, 5),
+        'cycles_per_dollar': round(cycles_per_hour / price, 1),
+    }
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.split(':')[0].strip() in ('model name', 'CPU part'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def print_report(report):
+    print(f"{report['label']}: {report['architecture']} ({report['cpu_model'] or 'unknown CPU'}), "
+          f"{report['vcpu']:g} vCPU / {report['memory_gb']:g} GB, make -j{report['jobs']}, "
+          f"{report['units']} units, median of {report['iterations']}")
+    for step, seconds in report['steps'].items():
+        print(f"  {step:<10} {seconds:>8.2f}s")
+    print(f"  {'cycle':<10} {report['cycle_seconds']:>8.2f}s  {report['cycles_per_hour']:>8.1f}/hour at "
+          f"${report['price_per_hour']:.4f}/hour = {report['cycles_per_dollar']:.1f} cycles per dollar")
+
+
+def compare(reports):
+    baseline = reports[0]
+    print(f"{'':<12} " + ' '.join(f"{report['label'][:18]:>18}" for report in reports))
+    for step in baseline['steps']:
+        print(f"{step:<12} " + ' '.join(f"{report['steps'].get(step, 0):>17.2f}s" for report in reports))
+    print(f"{'cycle':<12} " + ' '.join(f"{report['cycle_seconds']:>17.2f}s" for report in reports))
+    print(f"{'$/hour':<12} " + ' '.join(f"{report['price_per_hour']:>18.4f}" for report in reports))
+    print(f"{'per dollar':<12} " + ' '.join(
+        f"{report['cycles_per_dollar']:>9.1f} ({report['cycles_per_dollar'] / baseline['cycles_per_dollar']:4.2f}x)"
+        for report in reports))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile/test throughput per dollar on x86_64 and ARM64")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the development cycle on this machine")
+    run_parser.add_argument('--units', type=int, default=400, help="C translation units in the generated project")
+    run_parser.add_argument('--iterations', type=int, default=3)
+    run_parser.add_argument('--jobs', type=int, help="Parallel jobs (default: the task's vCPUs)")
+    run_parser.add_argument('--vcpu', type=float, help="Task vCPUs, when not running in ECS")
+    run_parser.add_argument('--memory-gb', type=float, help="Task memory, when not running in ECS")
+    run_parser.add_argument('--test-rounds', type=int, default=2000000, help="Work per unit in the test step")
+    run_parser.add_argument('--python-cases', type=int, default=400, help="Cases in the Python test step")
+    run_parser.add_argument('--vcpu-hour', type=float, help="Override the price per vCPU-hour")
+    run_parser.add_argument('--gb-hour', type=float, help="Override the price per GB-hour")
+    run_parser.add_argument('--label', help="Name for this configuration in reports")
+    run_parser.add_argument('--output', help="Write the results as JSON for `compare`")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare saved runs; the first is the baseline")
+    compare_parser.add_argument('reports', nargs='+')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        reports = []
+        for path in args.reports:
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+        compare(reports)
+        return 0
+
+    if not (shutil.which('make') and shutil.which('cc')):
+        print("Error: make and a C compiler are required (build-essential)", file=sys.stderr)
+        return 1
+    report = run(args.units, args.iterations, args.jobs, args.vcpu, args.memory_gb, args.label,
+                 args.test_rounds, args.python_cases, args.vcpu_hour, args.gb_hour)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+authorized-keys-helper.py - sshd AuthorizedKeysCommand backed by a local key index
+
+The authorized_keys object in S3 (maintained by ssh-key-management.sh) is
+mirrored into a SQLite index keyed by key fingerprint. sshd calls `lookup`
+for every authentication attempt and gets back only the matching key line,
+so lookups cost one indexed read however many keys the fleet has. A `refresh`
+daemon polls S3 with ETag-conditional GETs, so an unchanged object costs a
+304 and a changed one reaches every running container within one interval
+without restarting tasks.
+
+sshd_config:
+  AuthorizedKeysCommand /usr/local/bin/authorized-keys-helper.py lookup %u %f
+  AuthorizedKeysCommandUser nobody
+
+Usage:
+  authorized-keys-helper.py lookup <user> <fingerprint>
+  authorized-keys-helper.py refresh [--bucket B] [--interval 5] [--once]
+  authorized-keys-helper.py check [--bucket B]     # can this container sync keys at all?
+  authorized-keys-helper.py bench [--sizes 1000 10000 50000]
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+KEY_DB = '/var/lib/dev-fleet-keys/keys.db'
+KEYS_OBJECT = 'authorized_keys'
+LOGIN_USER = 'developer'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    fingerprint TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS keys_owner ON keys (owner);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def fingerprint(key_blob_b64):
+    """
+    SHA256 fingerprint in the form sshd passes as %f
+    """
+    digest = hashlib.sha256(base64.b64decode(key_blob_b64)).digest()
+    return 'SHA256:' + base64.b64encode(digest).decode().rstrip('=')
+
+
+def parse_authorized_keys(text, developer=None):
+    """
+    Map fingerprint -> (owner, line) for an authorized_keys file written by
+    ssh-key-management.sh ("<type> <key> [comment] # <owner> (added ...)").
+    With developer set, only that developer's keys are kept.
+    """
+    entries = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        key_part, _, annotation = line.partition(' # ')
+        fields = key_part.split()
+        if len(fields) < 2:
+            continue
+        owner = annotation.split(' (', 1)[0].strip() if annotation else ''
+        if developer and owner != developer:
+            continue
+        try:
+            entries[fingerprint(fields[1])] = (owner, line)
+        except ValueError:
+            print(f"Skipping malformed key for {owner or 'unknown owner'}", file=sys.stderr)
+    return entries
+
+
+def lookup(db_path, user, key_fingerprint):
+    """
+    The authorized_keys line for a fingerprint, or None. Opened read-only so
+    sshd can run it as an unprivileged user.
+    """
+    if user != LOGIN_USER:
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=2.0)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        row = conn.execute('SELECT line FROM keys WHERE fingerprint = ?', (key_fingerprint,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+class KeyStore:
+    """
+    Writer side of the index. Updates are applied as a diff in a single
+    transaction, so readers see either the old or the new key set.
+    """
+
+    def __init__(self, db_path=KEY_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=10.0)
+        self.conn.executescript(SCHEMA)
+        os.chmod(db_path, 0o644)
+
+    def etag(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'etag'").fetchone()
+        return row[0] if row else None
+
+    def apply(self, entries, etag):
+        """
+        Replace the key set with entries; returns (added, removed)
+        """
+        current = dict(self.conn.execute('SELECT fingerprint, line FROM keys'))
+        removed = [fp for fp in current if fp not in entries]
+        changed = [(fp, owner, line) for fp, (owner, line) in entries.items() if current.get(fp) != line]
+        with self.conn:
+            self.conn.executemany('DELETE FROM keys WHERE fingerprint = ?', [(fp,) for fp in removed])
+            self.conn.executemany('INSERT OR REPLACE INTO keys VALUES (?, ?, ?)', changed)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('etag', ?)", (etag,))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed_at', ?)", (str(time.time()),))
+        return len(changed), len(removed)
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+
+def refresh_once(s3_client, bucket, store, developer=None):
+    """
+    Fetch the keys object if its ETag changed and apply it to the store.
+    Returns None when S3 answered 304 Not Modified, else (added, removed).
+    """
+    params = {'Bucket': bucket, 'Key': KEYS_OBJECT}
+    etag = store.etag()
+    if etag:
+        params['IfNoneMatch'] = etag
+    try:
+        response = s3_client.get_object(**params)
+    except Exception as e:
+        code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        if code in ('304', 'NotModified'):
+            return None
+        raise
+    text = response['Body'].read().decode()
+    return store.apply(parse_authorized_keys(text, developer), response['ETag'])
+
+
+def run_refresher(s3_client, bucket, store, interval, developer=None, once=False):
+    while True:
+        try:
+            result = refresh_once(s3_client, bucket, store, developer)
+            if result is not None:
+                print(f"Key index updated: {result[0]} added/changed, {result[1]} removed, "
+                      f"{store.count()} total", flush=True)
+        except Exception as e:
+            # Keep serving the last good index; sshd never waits on S3
+            print(f"Warning: Could not refresh keys from s3://{bucket}/{KEYS_OBJECT}: {e}", file=sys.stderr,
+                  flush=True)
+        if once:
+            return
+        time.sleep(interval)
+
+
+def check(bucket):
+    """
+    Smoke check run at container start: boto3 imports, the task role has
+    credentials, and the keys object is readable
+    """
+    try:
+        import boto3
+    except ImportError as e:
+        print(f"Key sync unavailable: {e}", file=sys.stderr)
+        return 1
+    try:
+        s3_client = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+        head = s3_client.head_object(Bucket=bucket, Key=KEYS_OBJECT)
+    except Exception as e:
+        print(f"Key sync unavailable: s3://{bucket}/{KEYS_OBJECT}: {e}", file=sys.stderr)
+        return 1
+    print(f"Key sync OK: s3://{bucket}/{KEYS_OBJECT} ({head['ContentLength']} bytes, ETag {head['ETag']})")
+    return 0
+
+
+def fake_key_line(index):
+    blob = b'\x00\x00\x00\x0bssh-ed25519\x00\x00\x00\x20' + hashlib.sha256(str(index).encode()).digest()
+    key = base64.b64encode(blob).decode()
+    return f"ssh-ed25519 {key} # dev{index:05d} (added 2025-01-01 00:00:00)", fingerprint(key)
+
+
+def bench(sizes, lookups):
+    from local_aws import LocalS3
+
+    here = os.path.abspath(__file__)
+    workdir = tempfile.mkdtemp(prefix='authorized-keys-bench-')
+    print(f"{'keys':>8} {'index build':>12} {'lookup p50':>11} {'lookup p99':>11} {'sshd exec p50':>14}")
+    for size in sizes:
+        db_path = os.path.join(workdir, f"keys-{size}.db")
+        lines = [fake_key_line(index) for index in range(size)]
+        s3 = LocalS3()
+        s3.create_bucket(Bucket='keys')
+        s3.put_object(Bucket='keys', Key=KEYS_OBJECT, Body='\n'.join(line for line, _ in lines))
+
+        store = KeyStore(db_path)
+        start = time.perf_counter()
+        refresh_once(s3, 'keys', store)
+        build = time.perf_counter() - start
+
+        latencies = []
+        for index in range(lookups):
+            start = time.perf_counter()
+            assert lookup(db_path, LOGIN_USER, lines[(index * 7919) % size][1])
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        # End to end as sshd runs it: a fresh interpreter per authentication
+        exec_latencies = []
+        for index in range(10):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, here, 'lookup', LOGIN_USER, lines[index][1], '--db', db_path],
+                           stdout=subprocess.DEVNULL, check=True)
+            exec_latencies.append(time.perf_counter() - start)
+        exec_latencies.sort()
+        print(f"{size:>8} {build * 1000:>10.0f}ms {latencies[len(latencies) // 2] * 1e6:>9.0f}us "
+              f"{latencies[int(len(latencies) * 0.99)] * 1e6:>9.0f}us {exec_latencies[5] * 1000:>12.1f}ms")
+
+    # Propagation: time from a new key landing in S3 to lookup finding it
+    # with a 1s poll interval
+    s3.put_object(Bucket='keys', Key=KEYS_OBJECT,
+                  Body='\n'.join(line for line, _ in lines) + '\n' + fake_key_line(size)[0])
+    new_fingerprint = fake_key_line(size)[1]
+    start = time.perf_counter()
+    polls = 0
+    while not lookup(db_path, LOGIN_USER, new_fingerprint):
+        polls += 1
+        refresh_once(s3, 'keys', store)
+        if not lookup(db_path, LOGIN_USER, new_fingerprint):
+            time.sleep(1.0)
+    print(f"New key visible after {time.perf_counter() - start:.2f}s ({polls} poll(s) at a 1s interval); "
+          f"S3 calls: {dict(s3.calls)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sshd AuthorizedKeysCommand backed by a local key index")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', default=os.environ.get('DEV_FLEET_KEY_DB', KEY_DB))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    lookup_parser = subparsers.add_parser('lookup', parents=[common],
+                                          help="Print the key line for a user and fingerprint")
+    lookup_parser.add_argument('user')
+    lookup_parser.add_argument('fingerprint')
+
+    refresh_parser = subparsers.add_parser('refresh', parents=[common], help="Keep the index in sync with S3")
+    refresh_parser.add_argument('--bucket', default=os.environ.get('DEV_FLEET_KEYS_BUCKET'))
+    refresh_parser.add_argument('--interval', type=float, default=float(os.environ.get('KEYS_REFRESH_INTERVAL', 5)))
+    refresh_parser.add_argument('--once', action='store_true')
+
+    check_parser = subparsers.add_parser('check', help="Check that the keys object can be read from S3")
+    check_parser.add_argument('--bucket', default=os.environ.get('DEV_FLEET_KEYS_BUCKET'))
+
+    bench_parser = subparsers.add_parser('bench', help="Measure lookup latency and propagation time")
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    bench_parser.add_argument('--lookups', type=int, default=2000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'lookup':
+        line = lookup(args.db, args.user, args.fingerprint)
+        if line:
+            print(line)
+        return 0
+
+    if args.command == 'bench':
+        bench(args.sizes, args.lookups)
+        return 0
+
+    if not args.bucket:
+        print("Error: set --bucket or DEV_FLEET_KEYS_BUCKET", file=sys.stderr)
+        return 1
+    if args.command == 'check':
+        return check(args.bucket)
+
+    import boto3
+    s3_client = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+    run_refresher(s3_client, args.bucket, KeyStore(args.db), args.interval,
+                  developer=os.environ.get('DEV_FLEET_DEVELOPER'), once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
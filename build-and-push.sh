@@ -5,6 +5,11 @@ set -e
 AWS_REGION="us-east-1"  # Change to your preferred region
 ECR_REPOSITORY_NAME="dev-fleet-containers"
 IMAGE_TAG="base-dev-env"
+# Set PLATFORMS=linux/amd64,linux/arm64 to build with buildx and push one image
+# index for both, so x86_64 and Graviton tasks pull the same tag. Building a
+# foreign architecture needs QEMU (docker run --privileged --rm
+# tonistiigi/binfmt --install arm64) or a native buildx node.
+PLATFORMS="${PLATFORMS:-}"
 
 # Create ECR repository if it doesn't exist
 echo "Checking if ECR repository exists..."
@@ -16,9 +21,33 @@ echo "Logging in to ECR..."
 aws ecr get-login-password --region ${AWS_REGION} | docker login --username AWS --password-stdin \
     $(aws sts get-caller-identity --query Account --output text).dkr.ecr.${AWS_REGION}.amazonaws.com
 
-# Build the Docker image
+# Build the Docker image. A multi-arch build is only analyzed for its first
+# platform, exported as a docker-save tarball; the push happens further down.
 echo "Building Docker image..."
-docker build -t ${ECR_REPOSITORY_NAME} .
+if [ -n "${PLATFORMS}" ]; then
+  docker buildx inspect dev-fleet-builder >/dev/null 2>&1 || \
+      docker buildx create --name dev-fleet-builder --driver docker-container >/dev/null
+  BUILDX="docker buildx build --builder dev-fleet-builder"
+  ${BUILDX} --platform "${PLATFORMS%%,*}" --load -t ${ECR_REPOSITORY_NAME} .
+else
+  docker build -t ${ECR_REPOSITORY_NAME} .
+fi
+
+# Report per-layer and compressed size, and fail on misordered layers or
+# wasted bytes. The previous build's tarball is kept to report layer reuse.
+# Set SKIP_IMAGE_ANALYSIS=1 to skip, IMAGE_MAX_COMPRESSED_MB for a size budget.
+if [ -z "${SKIP_IMAGE_ANALYSIS}" ]; then
+  echo "Analyzing image layers..."
+  ANALYSIS_DIR="${IMAGE_ANALYSIS_DIR:-.image-analysis}"
+  mkdir -p ${ANALYSIS_DIR}
+  docker save ${ECR_REPOSITORY_NAME} -o ${ANALYSIS_DIR}/current.tar
+  if [ -f ${ANALYSIS_DIR}/previous.tar ]; then
+    python3 image-analysis.py compare ${ANALYSIS_DIR}/previous.tar ${ANALYSIS_DIR}/current.tar
+  fi
+  python3 image-analysis.py validate ${ANALYSIS_DIR}/current.tar \
+    ${IMAGE_MAX_COMPRESSED_MB:+--max-compressed-mb ${IMAGE_MAX_COMPRESSED_MB}}
+  mv ${ANALYSIS_DIR}/current.tar ${ANALYSIS_DIR}/previous.tar
+fi
 
 # Tag the image for ECR with specific tag and latest
 ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text)
@@ -30,16 +59,25 @@ ECR_LATEST_URI="${ECR_REPO_URI}:latest"
 TIMESTAMP=$(date +%Y%m%d%H%M%S)
 ECR_VERSIONED_URI="${ECR_REPO_URI}:${IMAGE_TAG}-${TIMESTAMP}"
 
-echo "Tagging images..."
-docker tag ${ECR_REPOSITORY_NAME} ${ECR_IMAGE_URI}
-docker tag ${ECR_REPOSITORY_NAME} ${ECR_LATEST_URI}
-docker tag ${ECR_REPOSITORY_NAME} ${ECR_VERSIONED_URI}
+if [ -n "${PLATFORMS}" ]; then
+  # The platform already built comes from the builder's cache; the others
+  # are built now, and all of them are pushed under one image index per tag
+  echo "Building and pushing ${PLATFORMS} image index..."
+  ${BUILDX} --platform "${PLATFORMS}" --push \
+      -t ${ECR_IMAGE_URI} -t ${ECR_LATEST_URI} -t ${ECR_VERSIONED_URI} .
+  docker buildx imagetools inspect ${ECR_IMAGE_URI}
+else
+  echo "Tagging images..."
+  docker tag ${ECR_REPOSITORY_NAME} ${ECR_IMAGE_URI}
+  docker tag ${ECR_REPOSITORY_NAME} ${ECR_LATEST_URI}
+  docker tag ${ECR_REPOSITORY_NAME} ${ECR_VERSIONED_URI}
 
-# Push the images to ECR
-echo "Pushing images to ECR..."
-docker push ${ECR_IMAGE_URI}
-docker push ${ECR_LATEST_URI}
-docker push ${ECR_VERSIONED_URI}
+  # Push the images to ECR
+  echo "Pushing images to ECR..."
+  docker push ${ECR_IMAGE_URI}
+  docker push ${ECR_LATEST_URI}
+  docker push ${ECR_VERSIONED_URI}
+fi
 
 echo "Images successfully built and pushed:"
 echo "- ${ECR_IMAGE_URI}"
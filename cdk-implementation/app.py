@@ -1,18 +1,14 @@
 #!/usr/bin/env python3
 import os
-import json
-import subprocess
+import time
 from aws_cdk import App, Environment, CfnOutput
 
 from lib.dev_fleet_stack import DevFleetStack
+from lib.developer_fleet import DEFAULT_SHARD_SIZE, capacity_provider_strategies, load_roster, log_settings
+from lib.environment_stacks import add_environment_stacks
+from lib.resource_cache import resolver_from_context
 
-# Run the resource lookup script first
-try:
-    subprocess.run(["python", "lib/lookup_resources.py"], check=True)
-    print("Successfully looked up existing resources")
-except Exception as e:
-    print(f"Warning: Could not look up existing resources: {e}")
-    print("Proceeding with deployment without resource lookup")
+synth_start = time.perf_counter()
 
 app = App()
 
@@ -22,29 +18,138 @@ region = os.environ.get('CDK_DEFAULT_REGION', os.environ.get('AWS_REGION', 'us-e
 
 env = Environment(account=account, region=region)
 
-# Load resource exports if available
-resource_exports = {}
-try:
-    if os.path.exists('resource_exports.json'):
-        with open('resource_exports.json', 'r') as f:
-            resource_exports = json.load(f)
-except Exception as e:
-    print(f"Warning: Could not load resource exports: {e}")
+# Existing resources, IAM roles and EFS security groups are resolved from
+# lookup-cache.json; AWS is only queried for missing or expired entries
+resolver = resolver_from_context(app, region, account)
 
 # Define your certificate ARN here
 wildcard_certificate_arn = "arn:aws:acm:us-east-1:510985353423:certificate/93474ca3-71c9-4c70-add6-9211e6c72b58"
 
+# Optional developer roster, e.g. `cdk deploy -c roster=roster.json`
+container_image_tag = "base-dev-env"
+roster_path = app.node.try_get_context('roster')
+roster = load_roster(roster_path, container_image_tag) if roster_path else None
+shard_size = int(app.node.try_get_context('roster_shard_size') or DEFAULT_SHARD_SIZE)
+
+# Tasks kept running by the shared service; 0 when warm-pool-controller.py manages them
+desired_count = app.node.try_get_context('desired_count')
+desired_count = 1 if desired_count is None else int(desired_count)
+
+# Upper bound for session-based autoscaling of the shared service, e.g.
+# `cdk deploy -c max_count=6 -c sessions_per_task=4`; unset disables scaling
+max_count = app.node.try_get_context('max_count')
+max_count = int(max_count) if max_count is not None else None
+sessions_per_task = float(app.node.try_get_context('sessions_per_task') or 4)
+
+# EFS throughput for a newly created file system: bursting, elastic, or
+# provisioned with `-c efs_provisioned_mibps=<n>`
+efs_throughput_mode = app.node.try_get_context('efs_throughput_mode') or "bursting"
+efs_provisioned_mibps = app.node.try_get_context('efs_provisioned_mibps')
+efs_provisioned_mibps = int(efs_provisioned_mibps) if efs_provisioned_mibps is not None else None
+
+# Fargate Spot share, e.g. `cdk deploy -c fargate_spot_weight=3 -c fargate_weight=1
+# -c fargate_base=1`; a spot weight of 0 (the default) runs everything on demand
+fargate_spot_weight = int(app.node.try_get_context('fargate_spot_weight') or 0)
+fargate_weight = app.node.try_get_context('fargate_weight')
+fargate_weight = 1 if fargate_weight is None else int(fargate_weight)
+fargate_base = int(app.node.try_get_context('fargate_base') or 0)
+
+# CPU architecture of the environments, x86_64 or arm64 (Graviton); roster
+# entries can override it with "architecture"
+cpu_architecture = app.node.try_get_context('cpu_architecture') or "x86_64"
+
+# Container logging: blocking (the awslogs default), non-blocking with a
+# `-c log_buffer_mib=<n>` buffer, or firelens (Fluent Bit sidecar sampling
+# routine output past `-c log_lines_per_second=<n>` to 1 in log_sample_every)
+log_mode = app.node.try_get_context('log_mode') or "blocking"
+log_buffer_mib = int(app.node.try_get_context('log_buffer_mib') or 25)
+log_lines_per_second = int(app.node.try_get_context('log_lines_per_second') or 200)
+log_sample_every = int(app.node.try_get_context('log_sample_every') or 20)
+
+# Shared pip/apt/ccache caches on the fleet EFS, `-c toolchain_cache_gib=<n>`
+# large (0, the default, leaves them out)
+toolchain_cache_gib = int(app.node.try_get_context('toolchain_cache_gib') or 0)
+
+# Repositories to keep bare mirrors of on the fleet EFS for near-instant
+# clones, e.g. `-c git_mirrors=git@github.com:org/app.git,https://github.com/org/lib`
+git_mirrors = [url.strip() for url in (app.node.try_get_context('git_mirrors') or '').split(',') if url.strip()]
+
+# Size of the shared environment's task, e.g. `-c task_cpu=2048 -c task_memory=6144`
+# as recommended by `python -m lib.rightsize`; roster entries carry their own
+task_cpu = int(app.node.try_get_context('task_cpu') or 1024)
+task_memory = int(app.node.try_get_context('task_memory') or 2048)
+
+# Container Insights on a newly created cluster, `-c container_insights=true`;
+# its per-task utilisation history is what lib.rightsize reads
+container_insights = str(app.node.try_get_context('container_insights') or '').lower() in ('1', 'true', 'yes')
+
+# Start tasks only in availability zones with a mount target of the fleet
+# EFS, `-c az_affinity=true`; roster entries can pin a zone or ask for a One
+# Zone EFS of their own with "efs": "one-zone"
+az_affinity = str(app.node.try_get_context('az_affinity') or '').lower() in ('1', 'true', 'yes')
+
+# With a roster, `-c environment_stacks=true` gives every developer a stack of
+# their own (DevFleetEnv-<name>) importing DevFleetStack's exports, so
+# deploy.sh can deploy changed environments alone and in parallel
+environment_stacks = str(app.node.try_get_context('environment_stacks') or '').lower() in ('1', 'true', 'yes')
+
+# Take a workspace snapshot during the SIGTERM checkpoint before a task stops
+# (interruption-handler.py), `-c checkpoint_snapshot=true`. It spends part of
+# the 110s budget, so it is off by default.
+checkpoint_snapshot = str(app.node.try_get_context('checkpoint_snapshot') or '').lower() in ('1', 'true', 'yes')
+
 # Create the stack
-DevFleetStack(app, "DevFleetStack",
+shared_stack = DevFleetStack(app, "DevFleetStack",
     domain_name="qdev.ngdegtm.com",
     hosted_zone_name="ngdegtm.com",
     ecr_repository_name="dev-fleet-containers",
-    container_image_tag="base-dev-env",
+    container_image_tag=container_image_tag,
     ecs_cluster_name="dev-fleet-cluster",
     efs_name="dev-fleet-persistent-storage",
     wildcard_certificate_arn=wildcard_certificate_arn,  # Pass the certificate ARN directly
     env=env,
-    existing_resources=resource_exports
+    resolver=resolver,
+    roster=roster,
+    shard_size=shard_size,
+    desired_count=desired_count,
+    max_count=max_count,
+    sessions_per_task=sessions_per_task,
+    efs_throughput_mode=efs_throughput_mode,
+    efs_provisioned_mibps=efs_provisioned_mibps,
+    fargate_spot_weight=fargate_spot_weight,
+    fargate_weight=fargate_weight,
+    fargate_base=fargate_base,
+    cpu_architecture=cpu_architecture,
+    environment_stacks=environment_stacks,
+    log_mode=log_mode,
+    log_buffer_mib=log_buffer_mib,
+    log_lines_per_second=log_lines_per_second,
+    log_sample_every=log_sample_every,
+    toolchain_cache_gib=toolchain_cache_gib,
+    git_mirrors=git_mirrors,
+    task_cpu=task_cpu,
+    task_memory=task_memory,
+    container_insights=container_insights,
+    az_affinity=az_affinity,
+    checkpoint_snapshot=checkpoint_snapshot
 )
 
+if environment_stacks:
+    environment_count = len(add_environment_stacks(
+        app, shared_stack, roster, shard_size,
+        domain_name="qdev.ngdegtm.com",
+        hosted_zone_name="ngdegtm.com",
+        capacity_provider_strategies=capacity_provider_strategies(fargate_spot_weight, fargate_weight, fargate_base),
+        cpu_architecture=cpu_architecture,
+        log_settings=log_settings(log_mode, log_buffer_mib, log_lines_per_second, log_sample_every),
+        toolchain_cache_gib=toolchain_cache_gib,
+        git_mirrors=git_mirrors,
+        availability_zones=shared_stack.efs_availability_zones,
+        checkpoint_snapshot=checkpoint_snapshot,
+        env=env
+    ))
+    print(f"Creating {environment_count} environment stack(s)")
+
 app.synth()
+resolver.report(time.perf_counter() - synth_start)
+
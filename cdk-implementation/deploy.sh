@@ -9,6 +9,12 @@ DOMAIN_NAME="qdev.ngdegtm.com"
 HOSTED_ZONE_NAME="ngdegtm.com"
 ECS_CLUSTER_NAME="dev-fleet-cluster"
 EFS_NAME="dev-fleet-persistent-storage"
+# Stacks deployed at the same time; dependencies are still deployed first
+DEPLOY_CONCURRENCY="${DEPLOY_CONCURRENCY:-4}"
+
+# Extra arguments are passed to the synth as context, e.g.
+#   ./deploy.sh -c roster=roster.json -c environment_stacks=true
+# Set FORCE_DEPLOY=1 to deploy every stack even if its template is unchanged.
 
 # Check for wildcard certificate
 echo "Checking for wildcard certificate..."
@@ -36,14 +42,31 @@ pip install -r requirements.txt
 echo "Bootstrapping CDK..."
 cdk bootstrap
 
-# Deploy the stack
-echo "Deploying CDK stack..."
-cdk deploy --require-approval never $CERT_CONTEXT \
+# Synthesize every stack once
+echo "Synthesizing CDK app..."
+rm -rf cdk.out
+cdk synth --quiet --output cdk.out $CERT_CONTEXT \
     --context domain_name=$DOMAIN_NAME \
     --context hosted_zone_name=$HOSTED_ZONE_NAME \
     --context ecr_repository_name=$ECR_REPOSITORY_NAME \
     --context container_image_tag=$IMAGE_TAG \
     --context ecs_cluster_name=$ECS_CLUSTER_NAME \
-    --context efs_name=$EFS_NAME
+    --context efs_name=$EFS_NAME \
+    "$@"
+
+# Only stacks whose template differs from the deployed one (or that are new
+# or not in a stable state) are deployed
+echo "Comparing templates with the deployed stacks..."
+STACKS=$(AWS_REGION=$AWS_REGION python3 -m lib.deploy_plan cdk.out ${FORCE_DEPLOY:+--all})
+if [ -z "$STACKS" ]; then
+    echo "Every stack is up to date; nothing to deploy."
+    exit 0
+fi
+
+# Deploy the synthesized assembly as-is, in dependency order, independent
+# stacks in parallel
+echo "Deploying $(echo "$STACKS" | wc -l) stack(s), ${DEPLOY_CONCURRENCY} at a time..."
+cdk deploy --app cdk.out --require-approval never --exclusively \
+    --concurrency "$DEPLOY_CONCURRENCY" $STACKS
 
 echo "Deployment complete!"
@@ -0,0 +1,138 @@
+"""
+Decide which stacks of a synthesized cloud assembly need deploying.
+
+A stack is skipped when its synthesized template hashes the same as the
+template CloudFormation last deployed for it and the stack is in a stable,
+successful state. Nested stack templates and other assets are referenced by
+content hash from their parent template, so a change to any of them changes
+the parent's hash too. deploy.sh passes the result to
+`cdk deploy --app cdk.out --exclusively --concurrency N`, which deploys the
+changed stacks in dependency order, independent ones in parallel.
+
+Usage:
+  python -m lib.deploy_plan cdk.out [--region us-east-1] [--all] [--json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# A stack in any other state (failed create, in progress, rollback failed) is
+# always handed to cdk deploy, which knows how to recover or report it
+STABLE_STATUSES = {'CREATE_COMPLETE', 'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_COMPLETE', 'IMPORT_COMPLETE'}
+
+
+def template_hash(template):
+    """
+    SHA-256 of the template's canonical JSON, so formatting and key order
+    do not count as changes
+    """
+    if isinstance(template, str):
+        template = json.loads(template)
+    canonical = json.dumps(template, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def load_stacks(assembly_dir):
+    """
+    Top-level stacks in the assembly manifest, in manifest order, with their
+    template hash and the stacks they depend on
+    """
+    with open(os.path.join(assembly_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    artifacts = manifest.get('artifacts', {})
+    stack_ids = {name for name, artifact in artifacts.items() if artifact['type'] == 'aws:cloudformation:stack'}
+
+    stacks = []
+    for artifact_id, artifact in artifacts.items():
+        if artifact_id not in stack_ids:
+            continue
+        properties = artifact.get('properties', {})
+        with open(os.path.join(assembly_dir, properties['templateFile']), 'r') as f:
+            template = json.load(f)
+        stacks.append({
+            'id': artifact_id,
+            'stack_name': properties.get('stackName', artifact_id),
+            'hash': template_hash(template),
+            'dependencies': [name for name in artifact.get('dependencies', []) if name in stack_ids],
+        })
+    return stacks
+
+
+def deployed_state(cloudformation, stack_name):
+    """
+    (status, template hash) of the deployed stack, or (None, None) if it
+    does not exist
+    """
+    try:
+        stack = cloudformation.describe_stacks(StackName=stack_name)['Stacks'][0]
+    except ClientError as e:
+        if 'does not exist' in str(e):
+            return None, None
+        raise
+    if stack['StackStatus'] not in STABLE_STATUSES:
+        return stack['StackStatus'], None
+    body = cloudformation.get_template(StackName=stack_name, TemplateStage='Original')['TemplateBody']
+    return stack['StackStatus'], template_hash(body)
+
+
+def plan(stacks, cloudformation, workers=8):
+    """
+    Returns [(stack, reason)] for every stack; a reason of None means the
+    stack is unchanged and can be skipped. Deployed templates are fetched in
+    parallel, two API calls per stack.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        states = list(executor.map(lambda stack: deployed_state(cloudformation, stack['stack_name']), stacks))
+
+    decisions = []
+    for stack, (status, deployed_hash) in zip(stacks, states):
+        if status is None:
+            reason = 'new'
+        elif deployed_hash is None:
+            reason = f"status {status}"
+        elif deployed_hash != stack['hash']:
+            reason = 'template changed'
+        else:
+            reason = None
+        decisions.append((stack, reason))
+    return decisions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the stacks of a cloud assembly that need deploying")
+    parser.add_argument('assembly', help="Synthesized cloud assembly directory (cdk.out)")
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    parser.add_argument('--workers', type=int, default=8, help="Parallel CloudFormation requests")
+    parser.add_argument('--all', action='store_true', help="List every stack, changed or not")
+    parser.add_argument('--json', action='store_true', help="Print the full plan as JSON")
+    args = parser.parse_args(argv)
+
+    stacks = load_stacks(args.assembly)
+    if args.all:
+        decisions = [(stack, 'forced') for stack in stacks]
+    else:
+        import boto3
+        decisions = plan(stacks, boto3.client('cloudformation', region_name=args.region), args.workers)
+
+    if args.json:
+        print(json.dumps([dict(stack, reason=reason) for stack, reason in decisions], indent=2))
+        return 0
+
+    # The summary goes to stderr; stdout is only the stacks to deploy, one per line
+    changed = [stack['id'] for stack, reason in decisions if reason]
+    for stack, reason in decisions:
+        print(f"  {stack['id']:<40} {reason or 'unchanged, skipped'}", file=sys.stderr)
+    print(f"{len(changed)} of {len(decisions)} stack(s) to deploy", file=sys.stderr)
+    for stack_id in changed:
+        print(stack_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,14 +10,53 @@ from aws_cdk import (
     aws_route53 as route53,
     aws_route53_targets as targets,
     aws_certificatemanager as acm,
+    aws_cloudwatch as cloudwatch,
+    aws_applicationautoscaling as appscaling,
+    aws_s3 as s3,
     CfnOutput,
     RemovalPolicy,
     Duration,
     Fn,
+    Size,
     CfnParameter
 )
 from constructs import Construct
-import boto3
+
+from lib.developer_fleet import (
+    DEFAULT_SHARD_SIZE,
+    STOP_TIMEOUT_SECONDS,
+    add_developer_shards,
+    capacity_provider_strategies,
+    add_log_router,
+    add_git_mirror,
+    add_git_mirror_access_point,
+    add_toolchain_cache,
+    add_toolchain_cache_access_point,
+    container_logging,
+    log_settings,
+    placement_subnets,
+    public_subnet_zones,
+    runtime_platform,
+    keys_bucket_name,
+    shard_roster,
+    valid_fargate_size
+)
+from lib.environment_stacks import export_shared_values
+from lib.resource_cache import ResourceResolver
+
+# Namespace session-metrics-agent.py publishes under
+SESSION_METRICS_NAMESPACE = "DevFleet"
+# ServiceName dimension of the shared service's session metrics. The
+# service's own name is generated by CloudFormation and can't be passed to
+# its task definition without a circular dependency, so the container and
+# the scaling policies agree on this label instead.
+SESSION_METRICS_SERVICE = "dev-fleet-shared"
+
+EFS_THROUGHPUT_MODES = {
+    "bursting": efs.ThroughputMode.BURSTING,
+    "elastic": efs.ThroughputMode.ELASTIC,
+    "provisioned": efs.ThroughputMode.PROVISIONED,
+}
 
 class DevFleetStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, 
@@ -29,16 +68,65 @@ class DevFleetStack(Stack):
                  efs_name: str,
                  wildcard_certificate_arn: str = None,
                  existing_resources: dict = None,
+                 resolver: ResourceResolver = None,
+                 roster: list = None,
+                 shard_size: int = DEFAULT_SHARD_SIZE,
+                 desired_count: int = 1,
+                 max_count: int = None,
+                 sessions_per_task: float = 4,
+                 efs_throughput_mode: str = "bursting",
+                 efs_provisioned_mibps: int = None,
+                 fargate_spot_weight: int = 0,
+                 fargate_weight: int = 1,
+                 fargate_base: int = 0,
+                 cpu_architecture: str = "x86_64",
+                 environment_stacks: bool = False,
+                 log_mode: str = "blocking",
+                 log_buffer_mib: int = 25,
+                 log_lines_per_second: int = 200,
+                 log_sample_every: int = 20,
+                 toolchain_cache_gib: int = 0,
+                 git_mirrors: list = None,
+                 task_cpu: int = 1024,
+                 task_memory: int = 2048,
+                 container_insights: bool = False,
+                 az_affinity: bool = False,
+                 checkpoint_snapshot: bool = False,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
-        
+
+        # With environment_stacks this stack only holds the shared
+        # infrastructure and exports it; add_environment_stacks creates the
+        # roster's environments as stacks of their own
+        if environment_stacks and not roster:
+            raise ValueError("environment_stacks requires a roster")
+
+        # Spread tasks over on-demand and Spot Fargate; None keeps the FARGATE launch type
+        strategies = capacity_provider_strategies(fargate_spot_weight, fargate_weight, fargate_base)
+        # x86_64 or arm64 (Graviton); None leaves the task definition's platform unset
+        platform = runtime_platform(cpu_architecture)
+        # awslogs blocking (None), non-blocking with a buffer, or a FireLens router
+        logging_settings = log_settings(log_mode, log_buffer_mib, log_lines_per_second, log_sample_every)
+
+        if toolchain_cache_gib < 0:
+            raise ValueError("toolchain_cache_gib must not be negative")
+        # Size of the shared task definition; roster entries carry their own
+        if not valid_fargate_size(task_cpu, task_memory):
+            raise ValueError(f"task_cpu={task_cpu} task_memory={task_memory} is not a valid Fargate task size")
+
+        if efs_throughput_mode not in EFS_THROUGHPUT_MODES:
+            raise ValueError(f"efs_throughput_mode must be one of {', '.join(EFS_THROUGHPUT_MODES)}")
+        if (efs_throughput_mode == "provisioned") != bool(efs_provisioned_mibps):
+            raise ValueError("efs_provisioned_mibps is required with, and only valid with, provisioned throughput")
+        
+        # Existence checks are answered from the lookup cache; boto3 is only
+        # used when an entry is missing or expired
+        if resolver is None:
+            resolver = ResourceResolver(self.region, self.account)
+
         # Initialize existing_resources if not provided
         if existing_resources is None:
-            existing_resources = {
-                'ecr_repositories': [],
-                'efs_filesystems': {},
-                'ecs_clusters': []
-            }
+            existing_resources = resolver.existing_resources()
 
         # Look up VPC
         vpc = ec2.Vpc.from_lookup(self, "VPC", is_default=True)
@@ -90,17 +178,53 @@ class DevFleetStack(Stack):
                 ]
             )
         
-        # IAM Roles - Check if they exist first using boto3
-        iam_client = boto3.client('iam')
+        # Security Groups - Use logical IDs to avoid name conflicts
+        lb_security_group = ec2.SecurityGroup(
+            self, "LoadBalancerSecurityGroup",
+            vpc=vpc,
+            description="Security group for Dev Fleet Load Balancer",
+            allow_all_outbound=True
+        )
         
-        # Check if ecsTaskExecutionRole exists
-        try:
-            iam_client.get_role(RoleName="ecsTaskExecutionRole")
-            role_exists = True
-        except:
-            role_exists = False
-            
-        if role_exists:
+        lb_security_group.add_ingress_rule(
+            ec2.Peer.any_ipv4(),
+            ec2.Port.tcp(22),
+            "Allow SSH access"
+        )
+        
+        lb_security_group.add_ingress_rule(
+            ec2.Peer.any_ipv4(),
+            ec2.Port.tcp(80),
+            "Allow HTTP access"
+        )
+        
+        lb_security_group.add_ingress_rule(
+            ec2.Peer.any_ipv4(),
+            ec2.Port.tcp(443),
+            "Allow HTTPS access"
+        )
+        
+        task_security_group = ec2.SecurityGroup(
+            self, "TaskSecurityGroup",
+            vpc=vpc,
+            description="Security group for Dev Fleet ECS Tasks",
+            allow_all_outbound=True
+        )
+        
+        task_security_group.add_ingress_rule(
+            lb_security_group,
+            ec2.Port.tcp(22),
+            "Allow SSH access from load balancer"
+        )
+        
+        task_security_group.add_ingress_rule(
+            ec2.Peer.any_ipv4(),
+            ec2.Port.tcp(80),
+            "Allow HTTP access for health checks"
+        )
+        
+        # IAM Roles - Check if they exist first
+        if resolver.role_exists("ecsTaskExecutionRole"):
             print("Using existing ECS task execution role")
             ecs_task_execution_role = iam.Role.from_role_name(
                 self, "EcsTaskExecutionRole",
@@ -117,26 +241,42 @@ class DevFleetStack(Stack):
                 ]
             )
         
+        # Content-addressed workspace snapshots (workspace-snapshot.py). Chunks
+        # are shared by every developer, so the bucket outlives the stack, and
+        # multipart uploads interrupted by a stopped task are cleaned up.
+        snapshot_bucket = s3.Bucket(
+            self, "WorkspaceSnapshotBucket",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            removal_policy=RemovalPolicy.RETAIN,
+            lifecycle_rules=[
+                s3.LifecycleRule(abort_incomplete_multipart_upload_after=Duration.days(1))
+            ]
+        )
+        # The FireLens router archives full, gzip-compressed container output under logs/
+        if logging_settings and logging_settings['mode'] == 'firelens':
+            snapshot_bucket.add_lifecycle_rule(prefix="logs/", expiration=Duration.days(30))
+
         # For the task role, we need to handle it differently since we need to modify its policies
         # Check if the role exists first
-        iam_client = boto3.client('iam')
-        try:
-            iam_client.get_role(RoleName="devFleetTaskRole")
-            role_exists = True
-        except:
-            role_exists = False
-            
-        if role_exists:
+        if resolver.role_exists("devFleetTaskRole"):
             print("Using existing dev fleet task role")
+            task_role_created = False
             dev_fleet_task_role = iam.Role.from_role_name(
                 self, "DevFleetTaskRole",
                 role_name="devFleetTaskRole"
             )
             # Note: We can't modify an imported role's policies directly
             # The policy should be managed outside CDK or the role should be recreated
-            print("Note: EFS access policy must be manually attached to existing role")
+            print("Note: EFS access, authorized_keys read and snapshot bucket policies must be manually attached "
+                  "to existing role")
+            if logging_settings and logging_settings['mode'] == 'firelens':
+                print("Note: the FireLens log router also needs logs:CreateLogStream and logs:PutLogEvents "
+                      "on /ecs/dev-environment in the existing task role")
         else:
             print("Creating new dev fleet task role")
+            task_role_created = True
             dev_fleet_task_role = iam.Role(
                 self, "DevFleetTaskRoleResource",
                 role_name="devFleetTaskRole",
@@ -154,6 +294,18 @@ class DevFleetStack(Stack):
                     resources=["*"]
                 )
             )
+
+            # Read access to the authorized_keys object authorized-keys-helper.py polls
+            dev_fleet_task_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["s3:GetObject"],
+                    resources=[f"arn:aws:s3:::{keys_bucket_name(self.account)}/authorized_keys"]
+                )
+            )
+
+            # Snapshot packs, indexes and manifests
+            snapshot_bucket.grant_read_write(dev_fleet_task_role)
         
         # EFS File System - Check if it exists first
         if (existing_resources.get('efs_filesystems') and 
@@ -161,52 +313,34 @@ class DevFleetStack(Stack):
             print(f"Using existing EFS file system: {efs_name}")
             file_system_id = existing_resources['efs_filesystems'][efs_name]
             
-            # For existing EFS, we need to update the security group rules
-            # First, find the security group associated with the EFS mount targets
-            efs_client = boto3.client('efs')
-            ec2_client = boto3.client('ec2')
-            
-            try:
-                # Get mount targets for the file system
-                mount_targets = efs_client.describe_mount_targets(
-                    FileSystemId=file_system_id
-                )['MountTargets']
-                
-                if mount_targets:
-                    # Get security groups for the first mount target
-                    mount_target_id = mount_targets[0]['MountTargetId']
-                    security_groups = efs_client.describe_mount_target_security_groups(
-                        MountTargetId=mount_target_id
-                    )['SecurityGroups']
-                    
-                    # Add ingress rule to each security group
-                    for sg_id in security_groups:
-                        print(f"Adding NFS ingress rule to EFS security group {sg_id}")
-                        try:
-                            ec2_client.authorize_security_group_ingress(
-                                GroupId=sg_id,
-                                IpPermissions=[{
-                                    'IpProtocol': 'tcp',
-                                    'FromPort': 2049,
-                                    'ToPort': 2049,
-                                    'UserIdGroupPairs': [{'GroupId': task_security_group.security_group_id}]
-                                }]
-                            )
-                        except Exception as e:
-                            # Ignore if rule already exists
-                            if 'InvalidPermission.Duplicate' not in str(e):
-                                print(f"Warning: Could not add ingress rule: {e}")
-                
-            except Exception as e:
-                print(f"Warning: Could not update EFS security groups: {e}")
+            # For existing EFS, allow NFS from the tasks on the security groups
+            # of its mount targets. The rules are part of the template rather
+            # than applied with boto3 during synth.
+            efs_security_group_ids = resolver.efs_security_groups(file_system_id)
+            mount_target_zones = resolver.efs_mount_target_zones(file_system_id) if az_affinity else []
+            efs_security_groups = [
+                ec2.SecurityGroup.from_security_group_id(
+                    self, f"ImportedEfsSecurityGroup{index}" if index else "ImportedEfsSecurityGroup",
+                    security_group_id=sg_id
+                )
+                for index, sg_id in enumerate(efs_security_group_ids)
+            ]
+            for sg in efs_security_groups:
+                print(f"Adding NFS ingress rule to EFS security group {sg.security_group_id}")
+                sg.add_ingress_rule(
+                    task_security_group,
+                    ec2.Port.tcp(2049),
+                    "Allow NFS traffic from ECS tasks"
+                )
             
+            if efs_throughput_mode != "bursting":
+                print(f"Note: throughput mode of existing EFS {file_system_id} is not managed here; "
+                      f"change it to {efs_throughput_mode} outside CDK")
+
             file_system = efs.FileSystem.from_file_system_attributes(
                 self, "DevFleetEFS",
                 file_system_id=file_system_id,
-                security_group=ec2.SecurityGroup.from_security_group_id(
-                    self, "ImportedEfsSecurityGroup",
-                    security_group_id=Fn.import_value(f"{efs_name}-sg-id") if Fn.condition_if(f"{efs_name}-sg-id-exists", True, False) else None
-                ) if Fn.condition_if(f"{efs_name}-sg-id-exists", True, False) else None
+                security_group=efs_security_groups[0] if efs_security_groups else task_security_group
             )
         else:
             print(f"Creating new EFS file system: {efs_name}")
@@ -229,13 +363,50 @@ class DevFleetStack(Stack):
                 vpc=vpc,
                 lifecycle_policy=efs.LifecyclePolicy.AFTER_14_DAYS,
                 performance_mode=efs.PerformanceMode.GENERAL_PURPOSE,
-                throughput_mode=efs.ThroughputMode.BURSTING,
+                # Elastic scales with demand instead of draining burst credits
+                # during big builds; provisioned buys a fixed baseline
+                throughput_mode=EFS_THROUGHPUT_MODES[efs_throughput_mode],
+                provisioned_throughput_per_second=(
+                    Size.mebibytes(efs_provisioned_mibps) if efs_provisioned_mibps else None
+                ),
                 security_group=efs_security_group,
                 removal_policy=RemovalPolicy.RETAIN,
                 file_system_name=efs_name,
-                encrypted=True
+                encrypted=True,
+                # Mount targets in the subnets the services use, so an
+                # AZ-affine task always has one in its own zone
+                vpc_subnets=placement_subnets() if az_affinity else None
             )
-        
+            mount_target_zones = public_subnet_zones(vpc) if az_affinity else []
+        
+        # With az_affinity, services only start tasks in zones with a mount
+        # target of the file system, so no workspace I/O crosses zones (a
+        # round trip per small-file operation, plus cross-AZ data charges)
+        self.efs_availability_zones = None
+        if az_affinity:
+            if mount_target_zones:
+                self.efs_availability_zones = mount_target_zones
+                print(f"Placing tasks next to the EFS mount targets in {', '.join(mount_target_zones)}")
+            else:
+                print("Warning: no EFS mount targets found, tasks are placed in every public subnet")
+
+        # Shared pip/apt/ccache caches, kept within toolchain_cache_gib by
+        # toolchain-cache.py's janitor
+        cache_settings = None
+        if toolchain_cache_gib:
+            cache_access_point = add_toolchain_cache_access_point(self, file_system)
+            cache_settings = {'access_point_id': cache_access_point.access_point_id, 'max_gib': toolchain_cache_gib}
+            print(f"Sharing toolchain caches of up to {toolchain_cache_gib} GiB on {efs_name}")
+
+        # Bare mirrors of git_mirrors, fetched by git-mirror.py's scheduler
+        # and borrowed from by clones in every workspace
+        git_mirror_settings = None
+        if git_mirrors:
+            git_mirror_access_point = add_git_mirror_access_point(self, file_system)
+            git_mirror_settings = {'access_point_id': git_mirror_access_point.access_point_id,
+                                   'urls': list(git_mirrors)}
+            print(f"Mirroring {len(git_mirrors)} git repositor{'y' if len(git_mirrors) == 1 else 'ies'} on {efs_name}")
+
         # CloudWatch Log Group
         log_group = logs.LogGroup(
             self, "DevEnvironmentLogGroup",
@@ -243,6 +414,10 @@ class DevFleetStack(Stack):
             retention=logs.RetentionDays.ONE_MONTH,
             removal_policy=RemovalPolicy.DESTROY
         )
+
+        # The FireLens router ships logs with the task role's credentials
+        if logging_settings and logging_settings['mode'] == 'firelens' and task_role_created:
+            log_group.grant_write(dev_fleet_task_role)
         
         # ECS Cluster - Check if it exists first
         if (existing_resources.get('ecs_clusters') and 
@@ -254,67 +429,59 @@ class DevFleetStack(Stack):
                 vpc=vpc,
                 security_groups=[]
             )
+            if strategies:
+                print(f"Note: existing cluster {ecs_cluster_name} must have the FARGATE and FARGATE_SPOT "
+                      f"capacity providers (aws ecs put-cluster-capacity-providers)")
+            if container_insights:
+                print(f"Note: enable Container Insights on existing cluster {ecs_cluster_name} with "
+                      f"aws ecs update-cluster-settings --settings name=containerInsights,value=enabled")
         else:
             print(f"Creating new ECS cluster: {ecs_cluster_name}")
             cluster = ecs.Cluster(
                 self, "DevFleetClusterResource",
                 vpc=vpc,
-                cluster_name=ecs_cluster_name
+                cluster_name=ecs_cluster_name,
+                enable_fargate_capacity_providers=True,
+                # Per-task CPU and memory history for lib.rightsize
+                container_insights_v2=ecs.ContainerInsights.ENABLED if container_insights else None
             )
         
-        # Security Groups - Use logical IDs to avoid name conflicts
-        lb_security_group = ec2.SecurityGroup(
-            self, "LoadBalancerSecurityGroup",
-            vpc=vpc,
-            description="Security group for Dev Fleet Load Balancer",
-            allow_all_outbound=True
-        )
-        
-        lb_security_group.add_ingress_rule(
-            ec2.Peer.any_ipv4(),
-            ec2.Port.tcp(22),
-            "Allow SSH access"
-        )
-        
-        lb_security_group.add_ingress_rule(
-            ec2.Peer.any_ipv4(),
-            ec2.Port.tcp(80),
-            "Allow HTTP access"
-        )
-        
-        lb_security_group.add_ingress_rule(
-            ec2.Peer.any_ipv4(),
-            ec2.Port.tcp(443),
-            "Allow HTTPS access"
-        )
-        
-        task_security_group = ec2.SecurityGroup(
-            self, "TaskSecurityGroup",
-            vpc=vpc,
-            description="Security group for Dev Fleet ECS Tasks",
-            allow_all_outbound=True
-        )
-        
-        task_security_group.add_ingress_rule(
-            lb_security_group,
-            ec2.Port.tcp(22),
-            "Allow SSH access from load balancer"
-        )
-        
-        task_security_group.add_ingress_rule(
-            ec2.Peer.any_ipv4(),
-            ec2.Port.tcp(80),
-            "Allow HTTP access for health checks"
-        )
-        
+        # Roster-driven fleet: one isolated environment per developer, sharded
+        # across nested stacks that each have their own NLB
+        if roster:
+            self._add_roster_fleet(
+                roster, shard_size,
+                vpc=vpc,
+                cluster=cluster,
+                task_security_group=task_security_group,
+                file_system=file_system,
+                log_group=log_group,
+                ecr_repository=ecr_repository,
+                execution_role=ecs_task_execution_role,
+                task_role=dev_fleet_task_role,
+                hosted_zone=hosted_zone,
+                domain_name=domain_name,
+                snapshot_bucket=snapshot_bucket,
+                capacity_provider_strategies=strategies,
+                cpu_architecture=cpu_architecture,
+                log_settings=logging_settings,
+                toolchain_cache=cache_settings,
+                git_mirror=git_mirror_settings,
+                availability_zones=self.efs_availability_zones,
+                checkpoint_snapshot=checkpoint_snapshot,
+                environment_stacks=environment_stacks
+            )
+            return
+
         # ECS Task Definition
         task_definition = ecs.FargateTaskDefinition(
             self, "DevEnvironmentTaskDefinition",
             family="dev-environment",
             execution_role=ecs_task_execution_role,
             task_role=dev_fleet_task_role,
-            cpu=1024,
-            memory_limit_mib=2048
+            cpu=task_cpu,
+            memory_limit_mib=task_memory,
+            runtime_platform=platform
         )
         
         # Add EFS volume to task definition
@@ -334,16 +501,22 @@ class DevFleetStack(Stack):
             "dev-container",
             image=ecs.ContainerImage.from_ecr_repository(ecr_repository, container_image_tag),
             essential=True,
-            logging=ecs.LogDrivers.aws_logs(
-                stream_prefix="ecs",
-                log_group=log_group
-            ),
+            logging=container_logging(log_group, "ecs", logging_settings),
             linux_parameters=ecs.LinuxParameters(
                 self, "LinuxParams",
                 init_process_enabled=True
             ),
+            environment={
+                "DEV_FLEET_KEYS_BUCKET": keys_bucket_name(self.account),
+                "DEV_FLEET_SNAPSHOT_BUCKET": snapshot_bucket.bucket_name,
+                # Dimensions the session scaling policies read
+                "DEV_FLEET_CLUSTER_NAME": cluster.cluster_name,
+                "DEV_FLEET_SERVICE_NAME": SESSION_METRICS_SERVICE,
+                **({"CHECKPOINT_SNAPSHOT": "1"} if checkpoint_snapshot else {})
+            },
+            stop_timeout=Duration.seconds(STOP_TIMEOUT_SECONDS),
             health_check=ecs.HealthCheck(
-                command=["CMD-SHELL", "curl -s http://localhost:80 > /dev/null && echo 'HTTP health check passed' || exit 1"],
+                command=["CMD-SHELL", "curl -sf http://localhost:80/live > /dev/null && echo 'HTTP health check passed' || exit 1"],
                 interval=Duration.seconds(30),
                 timeout=Duration.seconds(5),
                 retries=3,
@@ -368,6 +541,10 @@ class DevFleetStack(Stack):
                 read_only=False
             )
         )
+
+        add_toolchain_cache(task_definition, container, file_system.file_system_id, cache_settings)
+        add_git_mirror(task_definition, container, file_system.file_system_id, git_mirror_settings)
+        add_log_router(task_definition, container, log_group, "ecs", logging_settings, snapshot_bucket.bucket_name)
         
         # Network Load Balancer - Remove fixed name
         nlb = elbv2.NetworkLoadBalancer(
@@ -386,7 +563,7 @@ class DevFleetStack(Stack):
             health_check=elbv2.HealthCheck(
                 protocol=elbv2.Protocol.HTTP,
                 port="80",
-                path="/",
+                path="/ready",
                 interval=Duration.seconds(30),
                 healthy_threshold_count=3,
                 unhealthy_threshold_count=3
@@ -401,18 +578,25 @@ class DevFleetStack(Stack):
             default_target_groups=[ssh_target_group]
         )
         
-        # ECS Service for SSH - Remove fixed name
+        # ECS Service for SSH - Remove fixed name. Set desired_count to 0 when
+        # warm-pool-controller.py hands out tasks instead
         ssh_service = ecs.FargateService(
             self, "DevFleetService",
             cluster=cluster,
             task_definition=task_definition,
-            desired_count=1,
+            desired_count=desired_count,
+            capacity_provider_strategies=strategies,
             security_groups=[task_security_group],
             assign_public_ip=True,
-            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)
+            vpc_subnets=placement_subnets(self.efs_availability_zones)
         )
         
         ssh_service.attach_to_network_target_group(ssh_target_group)
+
+        # Scale on the metrics session-metrics-agent.py writes to the log group
+        # as EMF, so scaling follows SSH load rather than CPU alone
+        if max_count and max_count > desired_count:
+            self._add_session_scaling(ssh_service, cluster, desired_count, max_count, sessions_per_task)
         
         # Route53 Record for SSH
         route53.ARecord(
@@ -442,7 +626,7 @@ class DevFleetStack(Stack):
                 protocol=elbv2.ApplicationProtocol.HTTP,
                 target_type=elbv2.TargetType.IP,
                 health_check=elbv2.HealthCheck(
-                    path="/",
+                    path="/ready",
                     interval=Duration.seconds(30),
                     healthy_threshold_count=3,
                     unhealthy_threshold_count=3
@@ -472,15 +656,17 @@ class DevFleetStack(Stack):
                 default_target_groups=[http_target_group]
             )
             
-            # ECS Service for HTTP - Remove fixed name
+            # ECS Service for HTTP - Remove fixed name. Scales to zero with
+            # the SSH service
             http_service = ecs.FargateService(
                 self, "DevFleetHttpTargetRegistration",
                 cluster=cluster,
                 task_definition=task_definition,
-                desired_count=1,
+                desired_count=desired_count,
+                capacity_provider_strategies=strategies,
                 security_groups=[task_security_group],
                 assign_public_ip=True,
-                vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)
+                vpc_subnets=placement_subnets(self.efs_availability_zones)
             )
             
             http_service.attach_to_application_target_group(http_target_group)
@@ -525,6 +711,12 @@ class DevFleetStack(Stack):
             description="Command to connect to the development environment",
             value=f"ssh -i ~/.ssh/your_key developer@{domain_name}"
         )
+
+        CfnOutput(
+            self, "SnapshotBucketName",
+            description="S3 bucket holding workspace snapshots",
+            value=snapshot_bucket.bucket_name
+        )
         
         if has_certificate and certificate:
             CfnOutput(
@@ -532,3 +724,125 @@ class DevFleetStack(Stack):
                 description="HTTPS URL to check container health",
                 value=f"https://web-{domain_name}/"
             )
+
+    def _add_roster_fleet(self, roster, shard_size, vpc, domain_name, task_security_group,
+                          file_system, ecr_repository, snapshot_bucket, environment_stacks=False,
+                          **environment_props):
+        # NLBs forward SSH from their private addresses inside the VPC
+        task_security_group.add_ingress_rule(
+            ec2.Peer.ipv4(vpc.vpc_cidr_block),
+            ec2.Port.tcp(22),
+            "Allow SSH access from the developer load balancers"
+        )
+
+        if environment_stacks:
+            # Only the shard NLBs live here; each environment's listener,
+            # service and DNS record live in its own stack
+            shard_load_balancers = {
+                index: elbv2.NetworkLoadBalancer(
+                    self, f"DeveloperShard{index}LoadBalancer",
+                    vpc=vpc,
+                    internet_facing=True
+                )
+                for index, developers in enumerate(shard_roster(roster, shard_size))
+                if developers
+            }
+            export_shared_values(self, {
+                'ClusterName': environment_props['cluster'].cluster_name,
+                'TaskSecurityGroupId': task_security_group.security_group_id,
+                'FileSystemId': file_system.file_system_id,
+                'LogGroupName': environment_props['log_group'].log_group_name,
+                'EcrRepositoryName': ecr_repository.repository_name,
+                'ExecutionRoleArn': environment_props['execution_role'].role_arn,
+                'TaskRoleArn': environment_props['task_role'].role_arn,
+                'SnapshotBucketName': snapshot_bucket.bucket_name,
+                **({'ToolchainCacheAccessPointId': environment_props['toolchain_cache']['access_point_id']}
+                   if environment_props.get('toolchain_cache') else {}),
+                **({'GitMirrorAccessPointId': environment_props['git_mirror']['access_point_id']}
+                   if environment_props.get('git_mirror') else {}),
+            }, shard_load_balancers)
+            print(f"Exporting shared infrastructure and {len(shard_load_balancers)} shard load balancer(s) "
+                  f"for the environment stacks")
+        else:
+            shards = add_developer_shards(
+                self, roster, shard_size,
+                vpc=vpc,
+                domain_name=domain_name,
+                task_security_group=task_security_group,
+                file_system=file_system,
+                ecr_repository=ecr_repository,
+                snapshot_bucket_name=snapshot_bucket.bucket_name,
+                **environment_props
+            )
+            environment_count = sum(len(shard.environments) for shard in shards)
+            print(f"Creating {environment_count} developer environment(s) in {len(shards)} shard(s)")
+
+        CfnOutput(
+            self, "CustomDomainName",
+            description="Custom domain name for the development environments",
+            value=domain_name
+        )
+
+        CfnOutput(
+            self, "EfsId",
+            description="ID of the EFS file system",
+            value=file_system.file_system_id
+        )
+
+        CfnOutput(
+            self, "EcrRepositoryUri",
+            description="URI of the ECR repository",
+            value=ecr_repository.repository_uri
+        )
+
+        CfnOutput(
+            self, "ConnectionCommand",
+            description="Command to connect to a developer's environment (python lib/developer_fleet.py <roster> lists ports)",
+            value=f"ssh -i ~/.ssh/your_key -p <port> developer@<name>.{domain_name}"
+        )
+
+        CfnOutput(
+            self, "SnapshotBucketName",
+            description="S3 bucket holding workspace snapshots",
+            value=snapshot_bucket.bucket_name
+        )
+
+    def _add_session_scaling(self, service, cluster, min_count, max_count, sessions_per_task):
+        def session_metric(name, statistic):
+            return cloudwatch.Metric(
+                namespace=SESSION_METRICS_NAMESPACE,
+                metric_name=name,
+                dimensions_map={
+                    "ClusterName": cluster.cluster_name,
+                    "ServiceName": SESSION_METRICS_SERVICE
+                },
+                statistic=statistic,
+                period=Duration.minutes(1)
+            )
+
+        scaling = service.auto_scale_task_count(min_capacity=min_count, max_capacity=max_count)
+
+        # Keep the average number of SSH sessions per task near the target
+        scaling.scale_to_track_custom_metric(
+            "SshSessionTracking",
+            metric=session_metric("ActiveSshSessions", "Average"),
+            target_value=sessions_per_task,
+            scale_out_cooldown=Duration.minutes(2),
+            scale_in_cooldown=Duration.minutes(15)
+        )
+
+        # Add tasks quickly when the busiest task is stalled on CPU or memory,
+        # even if its session count is below target
+        for metric_name in ("CpuPressure", "MemoryPressure"):
+            scaling.scale_on_metric(
+                f"{metric_name}StepScaling",
+                metric=session_metric(metric_name, "Maximum"),
+                scaling_steps=[
+                    appscaling.ScalingInterval(upper=25, change=0),
+                    appscaling.ScalingInterval(lower=25, change=1),
+                    appscaling.ScalingInterval(lower=50, change=2)
+                ],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+                cooldown=Duration.minutes(3),
+                evaluation_periods=3
+            )
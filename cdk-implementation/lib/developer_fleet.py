@@ -0,0 +1,707 @@
+import json
+import math
+import os
+import re
+
+from aws_cdk import (
+    NestedStack,
+    Stack,
+    aws_ec2 as ec2,
+    aws_ecr as ecr,
+    aws_ecs as ecs,
+    aws_efs as efs,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_iam as iam,
+    aws_logs as logs,
+    aws_route53 as route53,
+    aws_route53_targets as targets,
+    CfnOutput,
+    Duration,
+    RemovalPolicy,
+    Size
+)
+from constructs import Construct
+
+def keys_bucket_name(account):
+    """
+    Bucket ssh-key-management.sh keeps authorized_keys in, and that
+    authorized-keys-helper.py polls from inside every container
+    """
+    return f"dev-fleet-keys-{account}"
+
+
+# Named task sizes a roster entry can ask for: size -> (cpu units, memory MiB)
+FARGATE_SIZES = {
+    'small': (512, 1024),
+    'medium': (1024, 2048),
+    'large': (2048, 4096),
+    'xlarge': (4096, 8192),
+}
+
+# Valid Fargate memory values (MiB) for each CPU value
+FARGATE_MEMORY_BY_CPU = {
+    256: [512, 1024, 2048],
+    512: list(range(1024, 4096 + 1, 1024)),
+    1024: list(range(2048, 8192 + 1, 1024)),
+    2048: list(range(4096, 16384 + 1, 1024)),
+    4096: list(range(8192, 30720 + 1, 1024)),
+    8192: list(range(16384, 61440 + 1, 4096)),
+    16384: list(range(32768, 122880 + 1, 8192)),
+}
+
+# An NLB allows 50 listeners, and each developer adds about six resources
+# to a nested stack, so 40 developers per shard stays well inside both the
+# listener limit and the 500 resource CloudFormation limit
+DEFAULT_SHARD_SIZE = 40
+MAX_SHARD_SIZE = 50
+
+# First NLB listener port handed out in every shard
+BASE_SSH_PORT = 2200
+
+# Each developer's EFS access point enforces its own POSIX identity, by default
+# BASE_POSIX_ID + slot for both uid and gid, so no two developers share one
+BASE_POSIX_ID = 20000
+
+DEVELOPER_NAME_PATTERN = re.compile(r'^[a-z][a-z0-9-]{0,30}[a-z0-9]$')
+
+# Seconds between SIGTERM and SIGKILL. Fargate Spot gives two minutes notice
+# and allows at most 120, which interruption-handler.py uses to save editor
+# state, sync the workspace and drain SSH sessions.
+STOP_TIMEOUT_SECONDS = 120
+
+
+def capacity_provider_strategies(spot_weight=0, on_demand_weight=1, on_demand_base=0):
+    """
+    FARGATE/FARGATE_SPOT strategy for the services, or None (plain FARGATE
+    launch type) when nothing runs on Spot. on_demand_base tasks always run
+    on demand; the rest are split by weight.
+    """
+    if min(spot_weight, on_demand_weight, on_demand_base) < 0:
+        raise ValueError("Capacity provider weights and base must not be negative")
+    if not spot_weight:
+        return None
+    strategies = [ecs.CapacityProviderStrategy(capacity_provider="FARGATE_SPOT", weight=spot_weight)]
+    if on_demand_weight or on_demand_base:
+        strategies.insert(0, ecs.CapacityProviderStrategy(
+            capacity_provider="FARGATE", weight=on_demand_weight, base=on_demand_base or None))
+    return strategies
+
+
+# CPU architectures a task can run on. Graviton (arm64) Fargate costs about
+# 20% less per vCPU-hour; the image must be a multi-arch index (see
+# build-and-push.sh) or an arm64 build.
+CPU_ARCHITECTURES = ('x86_64', 'arm64')
+
+
+def runtime_platform(architecture):
+    """
+    Runtime platform for a task definition, or None for x86_64 so existing
+    task definitions stay as they were
+    """
+    if architecture not in CPU_ARCHITECTURES:
+        raise ValueError(f"Unknown CPU architecture '{architecture}', expected one of {', '.join(CPU_ARCHITECTURES)}")
+    if architecture == 'x86_64':
+        return None
+    return ecs.RuntimePlatform(
+        cpu_architecture=ecs.CpuArchitecture.ARM64,
+        operating_system_family=ecs.OperatingSystemFamily.LINUX
+    )
+
+
+# How a container's stdout/stderr reaches CloudWatch Logs. "blocking" is the
+# awslogs default, where a throttled or slow PutLogEvents stalls any process
+# writing to stdout; "non-blocking" buffers in memory and drops lines when the
+# buffer is full instead; "firelens" routes through a Fluent Bit sidecar
+# (log-router/) that samples, batches and archives gzip-compressed to S3.
+LOG_MODES = ('blocking', 'non-blocking', 'firelens')
+LOG_ROUTER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'log-router')
+
+
+def log_settings(mode='blocking', buffer_mib=25, lines_per_second=200, sample_every=20):
+    """
+    Validated logging settings for the dev containers, or None for the
+    blocking awslogs default (so existing task definitions stay as they were)
+    """
+    if mode not in LOG_MODES:
+        raise ValueError(f"Unknown log mode '{mode}', expected one of {', '.join(LOG_MODES)}")
+    if buffer_mib < 1 or lines_per_second < 1 or sample_every < 1:
+        raise ValueError("log buffer, lines per second and sample rate must be at least 1")
+    if mode == 'blocking':
+        return None
+    return {
+        'mode': mode,
+        'buffer_mib': buffer_mib,
+        'lines_per_second': lines_per_second,
+        'sample_every': sample_every,
+    }
+
+
+def container_logging(log_group: logs.ILogGroup, stream_prefix: str, settings: dict = None):
+    """
+    Log driver for the dev container; firelens mode also needs add_log_router
+    """
+    if settings is None:
+        return ecs.LogDrivers.aws_logs(stream_prefix=stream_prefix, log_group=log_group)
+    if settings['mode'] == 'firelens':
+        # No options: the outputs are in the router's own configuration
+        return ecs.LogDrivers.firelens(options={})
+    return ecs.LogDrivers.aws_logs(
+        stream_prefix=stream_prefix,
+        log_group=log_group,
+        mode=ecs.AwsLogDriverMode.NON_BLOCKING,
+        max_buffer_size=Size.mebibytes(settings['buffer_mib'])
+    )
+
+
+def add_log_router(task_definition: ecs.TaskDefinition, container: ecs.ContainerDefinition,
+                   log_group: logs.ILogGroup, stream_prefix: str, settings: dict = None,
+                   archive_bucket_name: str = None):
+    """
+    In firelens mode, add the Fluent Bit router (log-router/) after the dev
+    container, so the dev container stays the task's default container for
+    load balancer targets, and start the dev container once the router runs
+    """
+    if settings is None or settings['mode'] != 'firelens':
+        return None
+    router = task_definition.add_firelens_log_router(
+        "log-router",
+        image=ecs.ContainerImage.from_asset(LOG_ROUTER_DIRECTORY),
+        firelens_config=ecs.FirelensConfig(
+            type=ecs.FirelensLogRouterType.FLUENTBIT,
+            options=ecs.FirelensOptions(
+                config_file_type=ecs.FirelensConfigFileType.FILE,
+                config_file_value="/fluent-bit/etc/dev-fleet.conf",
+                enable_ecs_log_metadata=True
+            )
+        ),
+        essential=True,
+        memory_reservation_mib=64,
+        # The router's own diagnostics go straight to CloudWatch
+        logging=ecs.LogDrivers.aws_logs(
+            stream_prefix=f"{stream_prefix}-log-router",
+            log_group=log_group,
+            mode=ecs.AwsLogDriverMode.NON_BLOCKING
+        ),
+        environment={
+            "AWS_REGION": Stack.of(task_definition).region,
+            "LOG_GROUP_NAME": log_group.log_group_name,
+            "LOG_STREAM_PREFIX": stream_prefix,
+            "LOG_ARCHIVE_BUCKET": archive_bucket_name,
+            "LOG_LINES_PER_SECOND": str(settings['lines_per_second']),
+            "LOG_SAMPLE_EVERY": str(settings['sample_every']),
+        }
+    )
+    container.add_container_dependencies(
+        ecs.ContainerDependency(container=router, condition=ecs.ContainerDependencyCondition.START)
+    )
+    return router
+
+
+# Shared pip/apt/ccache caches (toolchain-cache.py). Every container reaches
+# them through one access point with a fixed POSIX identity outside the
+# developers' range, so anything one container stores, every other container
+# can read and the janitor can evict.
+TOOLCHAIN_CACHE_POSIX_ID = "19999"
+TOOLCHAIN_CACHE_PATH = "/mnt/dev-fleet-cache"
+
+
+def add_toolchain_cache_access_point(scope: Construct, file_system: efs.IFileSystem):
+    return efs.AccessPoint(
+        scope, "ToolchainCacheAccessPoint",
+        file_system=file_system,
+        path="/toolchain-cache",
+        create_acl=efs.Acl(owner_uid=TOOLCHAIN_CACHE_POSIX_ID, owner_gid=TOOLCHAIN_CACHE_POSIX_ID, permissions="755"),
+        posix_user=efs.PosixUser(uid=TOOLCHAIN_CACHE_POSIX_ID, gid=TOOLCHAIN_CACHE_POSIX_ID)
+    )
+
+
+def add_toolchain_cache(task_definition: ecs.TaskDefinition, container: ecs.ContainerDefinition,
+                        file_system_id: str, settings: dict = None):
+    """
+    Mount the shared cache and tell entrypoint.sh where it is and how large
+    it may grow. settings is {'access_point_id', 'max_gib'}, or None for no
+    shared cache.
+    """
+    if settings is None:
+        return
+    task_definition.add_volume(
+        name="toolchain-cache",
+        efs_volume_configuration=ecs.EfsVolumeConfiguration(
+            file_system_id=file_system_id,
+            transit_encryption="ENABLED",
+            authorization_config=ecs.AuthorizationConfig(
+                access_point_id=settings['access_point_id'],
+                iam="ENABLED"
+            )
+        )
+    )
+    container.add_mount_points(
+        ecs.MountPoint(container_path=TOOLCHAIN_CACHE_PATH, source_volume="toolchain-cache", read_only=False)
+    )
+    container.add_environment("DEV_FLEET_CACHE_DIR", TOOLCHAIN_CACHE_PATH)
+    container.add_environment("DEV_FLEET_CACHE_MAX_GIB", str(settings['max_gib']))
+
+
+# Bare mirrors of the team's repositories (git-mirror.py), shared the same
+# way as the toolchain caches under an identity of their own
+GIT_MIRROR_POSIX_ID = "19998"
+GIT_MIRROR_PATH = "/mnt/dev-fleet-git"
+
+
+def add_git_mirror_access_point(scope: Construct, file_system: efs.IFileSystem):
+    return efs.AccessPoint(
+        scope, "GitMirrorAccessPoint",
+        file_system=file_system,
+        path="/git-mirrors",
+        create_acl=efs.Acl(owner_uid=GIT_MIRROR_POSIX_ID, owner_gid=GIT_MIRROR_POSIX_ID, permissions="755"),
+        posix_user=efs.PosixUser(uid=GIT_MIRROR_POSIX_ID, gid=GIT_MIRROR_POSIX_ID)
+    )
+
+
+def add_git_mirror(task_definition: ecs.TaskDefinition, container: ecs.ContainerDefinition,
+                   file_system_id: str, settings: dict = None):
+    """
+    Mount the shared git mirrors and tell entrypoint.sh which repositories
+    to keep mirrored. settings is {'access_point_id', 'urls'}, or None for
+    no mirrors.
+    """
+    if settings is None:
+        return
+    task_definition.add_volume(
+        name="git-mirror",
+        efs_volume_configuration=ecs.EfsVolumeConfiguration(
+            file_system_id=file_system_id,
+            transit_encryption="ENABLED",
+            authorization_config=ecs.AuthorizationConfig(
+                access_point_id=settings['access_point_id'],
+                iam="ENABLED"
+            )
+        )
+    )
+    container.add_mount_points(
+        ecs.MountPoint(container_path=GIT_MIRROR_PATH, source_volume="git-mirror", read_only=False)
+    )
+    container.add_environment("DEV_FLEET_GIT_MIRROR_DIR", GIT_MIRROR_PATH)
+    container.add_environment("DEV_FLEET_GIT_MIRRORS", " ".join(settings['urls']))
+
+
+# Where a developer's workspace lives: "shared" (an access point on the
+# fleet's regional EFS) or "one-zone" (a One Zone EFS of their own, about half
+# the storage price, in a single availability zone next to their task)
+EFS_STORAGE_CLASSES = ('shared', 'one-zone')
+
+AVAILABILITY_ZONE_PATTERN = re.compile(r'^[a-z]{2}(-[a-z]+)+-\d[a-z]$')
+
+
+def placement_subnets(availability_zones=None):
+    """
+    Public subnets for a service, limited to availability_zones when given so
+    tasks start next to an EFS mount target instead of mounting across zones
+    """
+    return ec2.SubnetSelection(
+        subnet_type=ec2.SubnetType.PUBLIC,
+        availability_zones=list(availability_zones) if availability_zones else None
+    )
+
+
+def public_subnet_zones(vpc: ec2.IVpc):
+    return sorted(set(vpc.select_subnets(subnet_type=ec2.SubnetType.PUBLIC).availability_zones))
+
+
+def developer_zone(developer, zones):
+    """
+    Availability zone a developer's task is pinned to: the roster's
+    "availability_zone", or for a One Zone workspace one of zones picked by
+    slot so One Zone file systems spread evenly. None leaves the task free to
+    start in any of zones.
+    """
+    if developer.get('availability_zone'):
+        zone = developer['availability_zone']
+        if zone not in zones:
+            raise ValueError(f"availability_zone '{zone}' for developer '{developer['name']}' is not one of "
+                             f"{', '.join(zones)}")
+        return zone
+    if developer.get('efs') == 'one-zone':
+        return zones[developer['slot'] % len(zones)]
+    return None
+
+
+def valid_fargate_size(cpu, memory):
+    return memory in FARGATE_MEMORY_BY_CPU.get(cpu, [])
+
+
+def load_roster(path, default_image_tag):
+    """
+    Load and validate a developer roster file.
+
+    The roster is a JSON document with a "developers" list. Each entry has a
+    "name", an optional "size" (one of FARGATE_SIZES) or explicit "cpu" and
+    "memory", an optional "image_tag", an optional "architecture" (one of
+    CPU_ARCHITECTURES, default the stack's), optional "uid"/"gid" for the EFS
+    access point (default BASE_POSIX_ID + slot), an optional "efs" (one of
+    EFS_STORAGE_CLASSES, default shared), an optional "availability_zone" to
+    pin the task to, an optional "efs_availability_zone" for a One Zone
+    workspace placed apart from the task, and an optional "retired" flag. A
+    developer's position in the list decides their shard and SSH port, so
+    new developers are appended and leavers are marked retired rather than
+    deleted, which keeps everyone else's port stable.
+    """
+    with open(path, 'r') as f:
+        document = json.load(f)
+
+    roster = []
+    seen = set()
+    for slot, entry in enumerate(document.get('developers', [])):
+        name = entry.get('name', '')
+        if not DEVELOPER_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid developer name '{name}': use lowercase letters, digits and hyphens")
+        if name in seen:
+            raise ValueError(f"Developer '{name}' appears more than once in {path}")
+        seen.add(name)
+
+        if 'cpu' in entry or 'memory' in entry:
+            cpu, memory = int(entry.get('cpu', 0)), int(entry.get('memory', 0))
+        else:
+            size = entry.get('size', 'medium')
+            if size not in FARGATE_SIZES:
+                raise ValueError(f"Unknown size '{size}' for developer '{name}', expected one of {', '.join(FARGATE_SIZES)}")
+            cpu, memory = FARGATE_SIZES[size]
+        if not valid_fargate_size(cpu, memory):
+            raise ValueError(f"cpu={cpu} memory={memory} for developer '{name}' is not a valid Fargate task size")
+        architecture = entry.get('architecture')
+        if architecture is not None and architecture not in CPU_ARCHITECTURES:
+            raise ValueError(f"Unknown architecture '{architecture}' for developer '{name}', "
+                             f"expected one of {', '.join(CPU_ARCHITECTURES)}")
+        storage = entry.get('efs', 'shared')
+        if storage not in EFS_STORAGE_CLASSES:
+            raise ValueError(f"Unknown efs '{storage}' for developer '{name}', "
+                             f"expected one of {', '.join(EFS_STORAGE_CLASSES)}")
+        for key in ('availability_zone', 'efs_availability_zone'):
+            if entry.get(key) is not None and not AVAILABILITY_ZONE_PATTERN.match(entry[key]):
+                raise ValueError(f"Invalid {key} '{entry[key]}' for developer '{name}'")
+        if entry.get('efs_availability_zone') and storage != 'one-zone':
+            raise ValueError(f"efs_availability_zone for developer '{name}' requires \"efs\": \"one-zone\"")
+
+        roster.append({
+            'name': name,
+            'slot': slot,
+            'cpu': cpu,
+            'memory': memory,
+            'image_tag': entry.get('image_tag', default_image_tag),
+            'architecture': architecture,
+            'efs': storage,
+            'availability_zone': entry.get('availability_zone'),
+            'efs_availability_zone': entry.get('efs_availability_zone'),
+            'uid': int(entry.get('uid', BASE_POSIX_ID + slot)),
+            'gid': int(entry.get('gid', entry.get('uid', BASE_POSIX_ID + slot))),
+            'retired': bool(entry.get('retired', False))
+        })
+
+    return roster
+
+
+def shard_roster(roster, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Split the roster into fixed-size shards by slot. Retired developers keep
+    their slot, so shard membership and ports never shift when someone leaves.
+    """
+    if not 1 <= shard_size <= MAX_SHARD_SIZE:
+        raise ValueError(f"shard_size must be between 1 and {MAX_SHARD_SIZE}")
+    shard_count = math.ceil(len(roster) / shard_size)
+    return [
+        [developer for developer in roster[index * shard_size:(index + 1) * shard_size]
+         if not developer['retired']]
+        for index in range(shard_count)
+    ]
+
+
+def ssh_port(developer, shard_size=DEFAULT_SHARD_SIZE):
+    return BASE_SSH_PORT + developer['slot'] % shard_size
+
+
+class DeveloperEnvironment(Construct):
+    """
+    One developer's isolated environment: task definition, service, NLB
+    listener and target group, a DNS record pointing at the shard's NLB, and
+    for a One Zone workspace the developer's own file system
+    """
+
+    def __init__(self, scope: Construct, construct_id: str,
+                 developer: dict,
+                 port: int,
+                 nlb: elbv2.INetworkLoadBalancer,
+                 vpc: ec2.IVpc,
+                 cluster: ecs.ICluster,
+                 task_security_group: ec2.ISecurityGroup,
+                 file_system: efs.IFileSystem,
+                 log_group: logs.ILogGroup,
+                 ecr_repository: ecr.IRepository,
+                 execution_role: iam.IRole,
+                 task_role: iam.IRole,
+                 hosted_zone: route53.IHostedZone,
+                 domain_name: str,
+                 snapshot_bucket_name: str,
+                 capacity_provider_strategies: list = None,
+                 cpu_architecture: str = 'x86_64',
+                 log_settings: dict = None,
+                 toolchain_cache: dict = None,
+                 git_mirror: dict = None,
+                 availability_zones: list = None,
+                 checkpoint_snapshot: bool = False) -> None:
+        super().__init__(scope, construct_id)
+
+        name = developer['name']
+
+        # availability_zones are the shared file system's mount target zones
+        # when the fleet is AZ-affine; a roster zone or a One Zone workspace
+        # narrows placement to a single zone
+        zones = public_subnet_zones(vpc)
+        zone = developer_zone(developer, zones)
+        if zone:
+            if developer.get('efs', 'shared') == 'shared' and availability_zones and zone not in availability_zones:
+                print(f"Note: {name} is pinned to {zone}, which has no mount target of the shared EFS")
+            availability_zones = [zone]
+
+        # The toolchain cache and git mirrors stay on the shared file system either way
+        workspace_file_system = file_system
+        if developer.get('efs') == 'one-zone':
+            efs_zone = developer.get('efs_availability_zone') or zone
+            if efs_zone not in zones:
+                raise ValueError(f"efs_availability_zone '{efs_zone}' for developer '{name}' has no public subnet")
+            workspace_file_system = self._add_one_zone_file_system(name, efs_zone, vpc, task_security_group)
+
+        task_definition = ecs.FargateTaskDefinition(
+            self, "TaskDefinition",
+            family=f"dev-environment-{name}",
+            execution_role=execution_role,
+            task_role=task_role,
+            cpu=developer['cpu'],
+            memory_limit_mib=developer['memory'],
+            runtime_platform=runtime_platform(developer.get('architecture') or cpu_architecture)
+        )
+
+        # The developer's own directory on the workspace file system. NFS requests
+        # through the access point run as the developer's uid/gid whatever
+        # the client sends, and cannot see above the root directory.
+        uid, gid = str(developer['uid']), str(developer['gid'])
+        self.access_point = efs.AccessPoint(
+            self, "AccessPoint",
+            file_system=workspace_file_system,
+            path=f"/developers/{name}",
+            create_acl=efs.Acl(owner_uid=uid, owner_gid=gid, permissions="750"),
+            posix_user=efs.PosixUser(uid=uid, gid=gid)
+        )
+
+        task_definition.add_volume(
+            name="dev-workspace",
+            efs_volume_configuration=ecs.EfsVolumeConfiguration(
+                file_system_id=workspace_file_system.file_system_id,
+                transit_encryption="ENABLED",
+                authorization_config=ecs.AuthorizationConfig(
+                    access_point_id=self.access_point.access_point_id,
+                    iam="ENABLED"
+                )
+            )
+        )
+
+        container = task_definition.add_container(
+            "dev-container",
+            image=ecs.ContainerImage.from_ecr_repository(ecr_repository, developer['image_tag']),
+            essential=True,
+            logging=container_logging(log_group, name, log_settings),
+            linux_parameters=ecs.LinuxParameters(
+                self, "LinuxParams",
+                init_process_enabled=True
+            ),
+            environment={
+                "DEV_FLEET_DEVELOPER": name,
+                "DEV_FLEET_UID": uid,
+                "DEV_FLEET_GID": gid,
+                "DEV_FLEET_KEYS_BUCKET": keys_bucket_name(Stack.of(self).account),
+                "DEV_FLEET_SNAPSHOT_BUCKET": snapshot_bucket_name,
+                # interruption-handler.py snapshots the workspace on SIGTERM
+                **({"CHECKPOINT_SNAPSHOT": "1"} if checkpoint_snapshot else {})
+            },
+            stop_timeout=Duration.seconds(STOP_TIMEOUT_SECONDS),
+            health_check=ecs.HealthCheck(
+                command=["CMD-SHELL", "curl -sf http://localhost:80/live > /dev/null && echo 'HTTP health check passed' || exit 1"],
+                interval=Duration.seconds(30),
+                timeout=Duration.seconds(5),
+                retries=3,
+                start_period=Duration.seconds(60)
+            )
+        )
+
+        container.add_port_mappings(
+            ecs.PortMapping(container_port=22, host_port=22, protocol=ecs.Protocol.TCP),
+            ecs.PortMapping(container_port=80, host_port=80, protocol=ecs.Protocol.TCP)
+        )
+
+        container.add_mount_points(
+            ecs.MountPoint(
+                container_path="/home/developer/workspace",
+                source_volume="dev-workspace",
+                read_only=False
+            )
+        )
+
+        add_toolchain_cache(task_definition, container, file_system.file_system_id, toolchain_cache)
+        add_git_mirror(task_definition, container, file_system.file_system_id, git_mirror)
+        add_log_router(task_definition, container, log_group, name, log_settings, snapshot_bucket_name)
+        if developer.get('efs') == 'one-zone':
+            # Lets efs-benchmark.py label same-zone and cross-zone runs
+            container.add_environment("DEV_FLEET_EFS_ZONE", efs_zone)
+
+        target_group = elbv2.NetworkTargetGroup(
+            self, "TargetGroup",
+            vpc=vpc,
+            port=22,
+            protocol=elbv2.Protocol.TCP,
+            target_type=elbv2.TargetType.IP,
+            health_check=elbv2.HealthCheck(
+                protocol=elbv2.Protocol.HTTP,
+                port="80",
+                path="/ready",
+                interval=Duration.seconds(30),
+                healthy_threshold_count=3,
+                unhealthy_threshold_count=3
+            )
+        )
+
+        nlb.add_listener(
+            f"{name}SshListener",
+            port=port,
+            protocol=elbv2.Protocol.TCP,
+            default_target_groups=[target_group]
+        )
+
+        self.service = ecs.FargateService(
+            self, "Service",
+            cluster=cluster,
+            task_definition=task_definition,
+            desired_count=1,
+            capacity_provider_strategies=capacity_provider_strategies,
+            security_groups=[task_security_group],
+            assign_public_ip=True,
+            vpc_subnets=placement_subnets(availability_zones)
+        )
+
+        self.service.attach_to_network_target_group(target_group)
+
+        route53.ARecord(
+            self, "DnsRecord",
+            zone=hosted_zone,
+            record_name=f"{name}.{domain_name.split('.')[0]}",  # alice.qdev
+            target=route53.RecordTarget.from_alias(
+                targets.LoadBalancerTarget(nlb)
+            )
+        )
+
+        self.host_name = f"{name}.{domain_name}"
+        self.port = port
+
+    def _add_one_zone_file_system(self, name, zone, vpc, task_security_group):
+        """
+        The developer's own One Zone EFS. It has no copy in another zone, so
+        automatic backups stay on; the task role's ClientMount/ClientWrite
+        grant covers it like the shared file system.
+        """
+        security_group = ec2.SecurityGroup(
+            self, "FileSystemSecurityGroup",
+            vpc=vpc,
+            description=f"One Zone EFS security group for {name}",
+            allow_all_outbound=True
+        )
+        security_group.add_ingress_rule(
+            task_security_group,
+            ec2.Port.tcp(2049),
+            "Allow NFS traffic from ECS tasks"
+        )
+        self.file_system = efs.FileSystem(
+            self, "FileSystem",
+            vpc=vpc,
+            one_zone=True,
+            vpc_subnets=placement_subnets([zone]),
+            lifecycle_policy=efs.LifecyclePolicy.AFTER_14_DAYS,
+            performance_mode=efs.PerformanceMode.GENERAL_PURPOSE,
+            security_group=security_group,
+            removal_policy=RemovalPolicy.RETAIN,
+            file_system_name=f"dev-fleet-{name}",
+            encrypted=True,
+            enable_automatic_backups=True
+        )
+        return self.file_system
+
+
+class DeveloperShardStack(NestedStack):
+    """
+    Nested stack holding one shard of the roster behind its own NLB, so the
+    fleet grows by adding shards instead of growing a single template
+    """
+
+    def __init__(self, scope: Construct, construct_id: str,
+                 developers: list,
+                 shard_size: int,
+                 vpc: ec2.IVpc,
+                 domain_name: str,
+                 **environment_props) -> None:
+        super().__init__(scope, construct_id)
+
+        nlb = elbv2.NetworkLoadBalancer(
+            self, "LoadBalancer",
+            vpc=vpc,
+            internet_facing=True
+        )
+
+        self.environments = [
+            DeveloperEnvironment(
+                self, developer['name'],
+                developer=developer,
+                port=ssh_port(developer, shard_size),
+                nlb=nlb,
+                vpc=vpc,
+                domain_name=domain_name,
+                **environment_props
+            )
+            for developer in developers
+        ]
+
+        CfnOutput(
+            self, "LoadBalancerDnsName",
+            description="DNS name of this shard's load balancer",
+            value=nlb.load_balancer_dns_name
+        )
+
+
+def add_developer_shards(scope: Construct, roster: list, shard_size: int, **shard_props):
+    """
+    Create one DeveloperShardStack per shard of the roster
+    """
+    shards = []
+    for index, developers in enumerate(shard_roster(roster, shard_size)):
+        if not developers:
+            continue
+        shards.append(DeveloperShardStack(
+            scope, f"DeveloperShard{index}",
+            developers=developers,
+            shard_size=shard_size,
+            **shard_props
+        ))
+    return shards
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate a developer roster and list connection details")
+    parser.add_argument('roster', help="Path to the roster JSON file")
+    parser.add_argument('--domain-name', default="qdev.ngdegtm.com")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    args = parser.parse_args()
+
+    roster = load_roster(args.roster, "base-dev-env")
+    for index, developers in enumerate(shard_roster(roster, args.shard_size)):
+        for developer in developers:
+            print(f"{developer['name']:<24} shard={index:<3} cpu={developer['cpu']:<5} "
+                  f"memory={developer['memory']:<6} arch={developer['architecture'] or 'default':<7} "
+                  f"ssh -p {ssh_port(developer, args.shard_size)} developer@{developer['name']}.{args.domain_name}")
@@ -0,0 +1,185 @@
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+    aws_ecr as ecr,
+    aws_ecs as ecs,
+    aws_efs as efs,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_iam as iam,
+    aws_logs as logs,
+    aws_route53 as route53,
+    CfnOutput,
+    Fn
+)
+from constructs import Construct
+
+from lib.developer_fleet import DEFAULT_SHARD_SIZE, DeveloperEnvironment, shard_roster, ssh_port
+
+# Values the shared stack exports for the environment stacks. Export names are
+# stable ("<shared stack>-<key>"), so the shared stack can change without
+# touching the environment stacks as long as these keys stay.
+SHARED_EXPORT_KEYS = (
+    'ClusterName',
+    'TaskSecurityGroupId',
+    'FileSystemId',
+    'LogGroupName',
+    'EcrRepositoryName',
+    'ExecutionRoleArn',
+    'TaskRoleArn',
+    'SnapshotBucketName',
+)
+SHARD_EXPORT_KEYS = ('LoadBalancerArn', 'LoadBalancerDnsName', 'LoadBalancerZoneId')
+# Exported only when the shared stack has the feature enabled
+OPTIONAL_EXPORT_KEYS = ('ToolchainCacheAccessPointId', 'GitMirrorAccessPointId')
+
+
+def shared_export_name(shared_stack_name, key, shard=None):
+    if shard is not None:
+        key = f"Shard{shard}{key}"
+    return f"{shared_stack_name}-{key}"
+
+
+def export_shared_values(stack: Stack, values: dict, shard_load_balancers: dict):
+    """
+    Export the shared infrastructure (values keyed by SHARED_EXPORT_KEYS) and
+    every shard's NLB from the shared stack
+    """
+    for key in SHARED_EXPORT_KEYS + tuple(key for key in OPTIONAL_EXPORT_KEYS if key in values):
+        CfnOutput(
+            stack, f"Export{key}",
+            value=values[key],
+            export_name=shared_export_name(stack.stack_name, key)
+        )
+    for shard, nlb in shard_load_balancers.items():
+        attributes = {
+            'LoadBalancerArn': nlb.load_balancer_arn,
+            'LoadBalancerDnsName': nlb.load_balancer_dns_name,
+            'LoadBalancerZoneId': nlb.load_balancer_canonical_hosted_zone_id,
+        }
+        for key in SHARD_EXPORT_KEYS:
+            CfnOutput(
+                stack, f"ExportShard{shard}{key}",
+                value=attributes[key],
+                export_name=shared_export_name(stack.stack_name, key, shard)
+            )
+
+
+class DeveloperEnvironmentStack(Stack):
+    """
+    One developer's environment as its own top-level stack, importing the
+    cluster, file system, roles and shard NLB the shared stack exports. A
+    change to one developer (image tag, size) deploys only this stack.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str,
+                 shared_stack_name: str,
+                 developer: dict,
+                 shard: int,
+                 shard_size: int,
+                 domain_name: str,
+                 hosted_zone_name: str,
+                 capacity_provider_strategies: list = None,
+                 cpu_architecture: str = 'x86_64',
+                 log_settings: dict = None,
+                 toolchain_cache_gib: int = 0,
+                 git_mirrors: list = None,
+                 availability_zones: list = None,
+                 checkpoint_snapshot: bool = False,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        def imported(key, shard=None):
+            return Fn.import_value(shared_export_name(shared_stack_name, key, shard))
+
+        # Both lookups are answered from cdk.context.json, like the shared stack's
+        vpc = ec2.Vpc.from_lookup(self, "VPC", is_default=True)
+        hosted_zone = route53.HostedZone.from_lookup(self, "HostedZone", domain_name=hosted_zone_name)
+
+        task_security_group = ec2.SecurityGroup.from_security_group_id(
+            self, "TaskSecurityGroup", imported('TaskSecurityGroupId'), mutable=False
+        )
+        cluster = ecs.Cluster.from_cluster_attributes(
+            self, "Cluster",
+            cluster_name=imported('ClusterName'),
+            vpc=vpc,
+            security_groups=[]
+        )
+        file_system = efs.FileSystem.from_file_system_attributes(
+            self, "FileSystem",
+            file_system_id=imported('FileSystemId'),
+            security_group=task_security_group
+        )
+        nlb = elbv2.NetworkLoadBalancer.from_network_load_balancer_attributes(
+            self, "LoadBalancer",
+            load_balancer_arn=imported('LoadBalancerArn', shard),
+            load_balancer_dns_name=imported('LoadBalancerDnsName', shard),
+            load_balancer_canonical_hosted_zone_id=imported('LoadBalancerZoneId', shard),
+            vpc=vpc
+        )
+
+        # The roles keep the permissions the shared stack gave them (the task
+        # execution policy covers image pulls and logs); imported as immutable
+        # so no environment stack adds policies of its own to them
+        self.developer_environment = DeveloperEnvironment(
+            self, developer['name'],
+            developer=developer,
+            port=ssh_port(developer, shard_size),
+            nlb=nlb,
+            vpc=vpc,
+            cluster=cluster,
+            task_security_group=task_security_group,
+            file_system=file_system,
+            log_group=logs.LogGroup.from_log_group_name(self, "LogGroup", imported('LogGroupName')),
+            ecr_repository=ecr.Repository.from_repository_name(
+                self, "EcrRepository", imported('EcrRepositoryName')
+            ),
+            execution_role=iam.Role.from_role_arn(
+                self, "ExecutionRole", imported('ExecutionRoleArn'), mutable=False
+            ),
+            task_role=iam.Role.from_role_arn(self, "TaskRole", imported('TaskRoleArn'), mutable=False),
+            hosted_zone=hosted_zone,
+            domain_name=domain_name,
+            snapshot_bucket_name=imported('SnapshotBucketName'),
+            capacity_provider_strategies=capacity_provider_strategies,
+            cpu_architecture=cpu_architecture,
+            log_settings=log_settings,
+            toolchain_cache=(
+                {'access_point_id': imported('ToolchainCacheAccessPointId'), 'max_gib': toolchain_cache_gib}
+                if toolchain_cache_gib else None
+            ),
+            git_mirror=(
+                {'access_point_id': imported('GitMirrorAccessPointId'), 'urls': git_mirrors}
+                if git_mirrors else None
+            ),
+            availability_zones=availability_zones,
+            checkpoint_snapshot=checkpoint_snapshot
+        )
+
+        environment = self.developer_environment
+        CfnOutput(
+            self, "ConnectionCommand",
+            description="Command to connect to this developer's environment",
+            value=f"ssh -i ~/.ssh/your_key -p {environment.port} developer@{environment.host_name}"
+        )
+
+
+def add_environment_stacks(scope: Construct, shared_stack: Stack, roster: list,
+                           shard_size: int = DEFAULT_SHARD_SIZE, **environment_props):
+    """
+    Create a DeveloperEnvironmentStack per active developer, each deployed
+    after the shared stack whose exports it imports
+    """
+    stacks = []
+    for shard, developers in enumerate(shard_roster(roster, shard_size)):
+        for developer in developers:
+            stack = DeveloperEnvironmentStack(
+                scope, f"DevFleetEnv-{developer['name']}",
+                shared_stack_name=shared_stack.stack_name,
+                developer=developer,
+                shard=shard,
+                shard_size=shard_size,
+                **environment_props
+            )
+            stack.add_dependency(shared_stack, "Imports the shared stack's exports")
+            stacks.append(stack)
+    return stacks
@@ -1,76 +1,380 @@
+import argparse
 import boto3
 import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def lookup_ecr_repositories():
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Error codes AWS returns when a caller is being rate limited
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'RequestThrottled',
+    'SlowDown',
+}
+
+DEFAULT_MAX_WORKERS = 16
+
+
+class LookupFailed(RuntimeError):
+    """
+    One or more lookups failed, so the exports would be incomplete
+    """
+
+
+def lookup_ecr_repositories(ecr_client=None):
     """
     Look up existing ECR repositories and export them as a CloudFormation output
     """
-    ecr_client = boto3.client('ecr')
+    ecr_client = ecr_client or boto3.client('ecr')
     repositories = []
-    
-    try:
-        paginator = ecr_client.get_paginator('describe_repositories')
-        for page in paginator.paginate():
-            for repo in page['repositories']:
-                repositories.append(repo['repositoryName'])
-    except Exception as e:
-        print(f"Error looking up ECR repositories: {e}")
-    
+
+    paginator = ecr_client.get_paginator('describe_repositories')
+    for page in paginator.paginate():
+        for repo in page['repositories']:
+            repositories.append(repo['repositoryName'])
+
     return repositories
 
-def lookup_efs_filesystems():
+def lookup_efs_filesystems(efs_client=None):
     """
     Look up existing EFS file systems and export them as a CloudFormation output
     """
-    efs_client = boto3.client('efs')
+    efs_client = efs_client or boto3.client('efs')
     file_systems = {}
-    
-    try:
-        paginator = efs_client.get_paginator('describe_file_systems')
-        for page in paginator.paginate():
-            for fs in page['FileSystems']:
-                if 'Name' in fs and fs['Name']:
-                    file_systems[fs['Name']] = fs['FileSystemId']
-    except Exception as e:
-        print(f"Error looking up EFS file systems: {e}")
-    
+
+    paginator = efs_client.get_paginator('describe_file_systems')
+    for page in paginator.paginate():
+        for fs in page['FileSystems']:
+            if 'Name' in fs and fs['Name']:
+                file_systems[fs['Name']] = fs['FileSystemId']
+
     return file_systems
 
-def lookup_ecs_clusters():
+def lookup_ecs_clusters(ecs_client=None):
     """
     Look up existing ECS clusters and export them as a CloudFormation output
     """
-    ecs_client = boto3.client('ecs')
+    ecs_client = ecs_client or boto3.client('ecs')
     clusters = []
-    
+
+    paginator = ecs_client.get_paginator('list_clusters')
+    for page in paginator.paginate():
+        for cluster_arn in page['clusterArns']:
+            # Extract cluster name from ARN
+            cluster_name = cluster_arn.split('/')[-1]
+            clusters.append(cluster_name)
+
+    return clusters
+
+# Export key -> (boto3 service name, lookup function, empty result)
+SERVICE_LOOKUPS = {
+    'ecr_repositories': ('ecr', lookup_ecr_repositories, list),
+    'efs_filesystems': ('efs', lookup_efs_filesystems, dict),
+    'ecs_clusters': ('ecs', lookup_ecs_clusters, list),
+}
+
+
+class ClientPool:
+    """
+    Thread-safe cache of boto3 clients shared by all discovery workers.
+
+    One session is kept per profile so its service model cache is reused
+    across regions. boto3 sessions are not thread-safe, so each session has
+    its own lock for client creation; the clients themselves are safe to
+    share between threads and keep their HTTP connection pools alive across
+    lookups.
+    """
+
+    def __init__(self, max_pool_connections=DEFAULT_MAX_WORKERS):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+        self._config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={'mode': 'adaptive', 'max_attempts': 10}
+        )
+
+    def _new_session(self, profile):
+        return boto3.session.Session(profile_name=profile)
+
+    def _new_client(self, session, service, region, profile):
+        return session.client(service, region_name=region, config=self._config)
+
+    def client(self, service, region, profile=None):
+        key = (profile, region, service)
+        with self._lock:
+            entry = self._sessions.setdefault(profile, [threading.Lock(), None])
+        with entry[0]:
+            if key not in self._clients:
+                if entry[1] is None:
+                    entry[1] = self._new_session(profile)
+                self._clients[key] = self._new_client(entry[1], service, region, profile)
+            return self._clients[key]
+
+
+def call_with_backoff(func, *args, max_attempts=6, base_delay=0.5, max_delay=20.0):
+    """
+    Call func, retrying with exponential backoff and full jitter when AWS
+    throttles the request after botocore's own retries are exhausted
+    """
+    for attempt in range(max_attempts):
+        try:
+            return func(*args)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in THROTTLING_ERROR_CODES or attempt == max_attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            print(f"Throttled ({code}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def resolve_account(pool, profile, region):
+    """
+    Return the account ID behind a profile, falling back to the profile name
+    """
     try:
-        paginator = ecs_client.get_paginator('list_clusters')
-        for page in paginator.paginate():
-            for cluster_arn in page['clusterArns']:
-                # Extract cluster name from ARN
-                cluster_name = cluster_arn.split('/')[-1]
-                clusters.append(cluster_name)
+        sts_client = pool.client('sts', region, profile)
+        return call_with_backoff(sts_client.get_caller_identity)['Account']
     except Exception as e:
-        print(f"Error looking up ECS clusters: {e}")
-    
-    return clusters
+        print(f"Warning: Could not resolve account for profile {profile or 'default'}: {e}")
+        return profile or 'default'
+
 
-def generate_exports():
+def _lookup_worker(pool, profile, region, export_key):
+    service, lookup, _ = SERVICE_LOOKUPS[export_key]
+    try:
+        client = pool.client(service, region, profile)
+        return call_with_backoff(lookup, client)
+    except Exception as e:
+        print(f"Error looking up {export_key} in {region} ({profile or 'default'}): {e}")
+        raise
+
+
+def discover_resources(regions, profiles=None, pool=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Fan the lookups out over a bounded thread pool, one worker per
+    (account, region, service), and merge them into exports keyed by region
+    and then by account ID. Raises LookupFailed once every lookup has
+    finished if any of them failed: an empty result would read as "nothing
+    exists" and make the stack create resources that already do.
+    """
+    profiles = profiles or [None]
+    pool = pool or ClientPool(max_pool_connections=max_workers)
+    exports = {region: {} for region in regions}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        accounts = {
+            executor.submit(resolve_account, pool, profile, regions[0]): profile
+            for profile in profiles
+        }
+        lookups = {
+            executor.submit(_lookup_worker, pool, profile, region, export_key): (profile, region, export_key)
+            for profile in profiles
+            for region in regions
+            for export_key in SERVICE_LOOKUPS
+        }
+
+        account_ids = {accounts[future]: future.result() for future in as_completed(accounts)}
+        failures = []
+        for future in as_completed(lookups):
+            profile, region, export_key = lookups[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append(f"{export_key} in {region} ({profile or 'default'}): {e}")
+                continue
+            account_exports = exports[region].setdefault(account_ids[profile], {})
+            account_exports[export_key] = result
+
+    if failures:
+        raise LookupFailed(f"{len(failures)} lookup(s) failed: {'; '.join(sorted(failures))}")
+    return exports
+
+
+def exports_for(exports, region, account=None):
+    """
+    Select the exports DevFleetStack expects for one region and account.
+
+    Accepts both the region-keyed layout written by generate_exports and the
+    older flat layout with the lookup keys at the top level.
+    """
+    if any(key in exports for key in SERVICE_LOOKUPS):
+        return exports
+
+    accounts = exports.get(region, {})
+    if account and account in accounts:
+        return accounts[account]
+    if len(accounts) == 1:
+        return next(iter(accounts.values()))
+    return {}
+
+
+def generate_exports(regions=None, profiles=None, output='resource_exports.json',
+                     max_workers=DEFAULT_MAX_WORKERS, pool=None):
     """
     Generate exports for CloudFormation to use
     """
-    exports = {
-        'ecr_repositories': lookup_ecr_repositories(),
-        'efs_filesystems': lookup_efs_filesystems(),
-        'ecs_clusters': lookup_ecs_clusters()
-    }
-    
+    regions = regions or [boto3.session.Session().region_name or 'us-east-1']
+
+    start = time.perf_counter()
+    exports = discover_resources(regions, profiles, pool=pool, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+
     # Write to a file that can be imported by CDK
-    with open('resource_exports.json', 'w') as f:
-        json.dump(exports, f, indent=2)
-    
-    print("Resource exports generated successfully")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(exports, f, indent=2)
+
+    print(f"Resource exports generated successfully in {elapsed:.2f}s")
+    return exports
+
+
+class StubbedClientPool(ClientPool):
+    """
+    Client pool backed by botocore Stubber for offline benchmarking.
+
+    Every client answers with canned pages and sleeps for a fixed latency
+    before each call, so serial and concurrent discovery can be compared
+    without touching AWS.
+    """
+
+    def __init__(self, latency=0.05, pages=3, items_per_page=20, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.pages = pages
+        self.items_per_page = items_per_page
+        self.stubbers = []
+
+    def _new_session(self, profile):
+        return boto3.session.Session(
+            aws_access_key_id='testing',
+            aws_secret_access_key='testing'
+        )
+
+    def _sleep(self, **kwargs):
+        time.sleep(self.latency)
+
+    def _page(self, service, region, profile, page):
+        last = page == self.pages - 1
+        names = [f"{profile or 'default'}-{region}-{service}-{page}-{i}" for i in range(self.items_per_page)]
+        if service == 'ecr':
+            response = {'repositories': [{'repositoryName': name} for name in names]}
+            if not last:
+                response['nextToken'] = f"token-{page}"
+            return 'describe_repositories', response
+        if service == 'efs':
+            response = {'FileSystems': [
+                {
+                    'Name': name,
+                    'FileSystemId': f"fs-{page:04d}{i:04d}",
+                    'OwnerId': '123456789012',
+                    'CreationToken': name,
+                    'CreationTime': 0,
+                    'LifeCycleState': 'available',
+                    'NumberOfMountTargets': 0,
+                    'SizeInBytes': {'Value': 0},
+                    'PerformanceMode': 'generalPurpose',
+                    'Tags': []
+                }
+                for i, name in enumerate(names)
+            ]}
+            if not last:
+                response['NextMarker'] = f"marker-{page}"
+            return 'describe_file_systems', response
+        response = {'clusterArns': [
+            f"arn:aws:ecs:{region}:123456789012:cluster/{name}" for name in names
+        ]}
+        if not last:
+            response['nextToken'] = f"token-{page}"
+        return 'list_clusters', response
+
+    def _new_client(self, session, service, region, profile):
+        from botocore.stub import Stubber
+
+        client = super()._new_client(session, service, region, profile)
+        stubber = Stubber(client)
+        if service == 'sts':
+            stubber.add_response('get_caller_identity', {
+                'Account': f"{abs(hash(profile)) % 10 ** 12:012d}",
+                'Arn': 'arn:aws:iam::123456789012:user/stub',
+                'UserId': 'stub'
+            })
+        else:
+            for page in range(self.pages):
+                operation, response = self._page(service, region, profile, page)
+                stubber.add_response(operation, response)
+        client.meta.events.register('before-parameter-build.*.*', self._sleep)
+        stubber.activate()
+        self.stubbers.append(stubber)
+        return client
+
+
+def benchmark(regions, profiles, max_workers, latency, pages):
+    """
+    Compare serial and concurrent discovery against stubbed clients
+    """
+    timings = {}
+    for label, workers in (('serial', 1), ('concurrent', max_workers)):
+        pool = StubbedClientPool(latency=latency, pages=pages, max_pool_connections=workers)
+        start = time.perf_counter()
+        discover_resources(regions, profiles, pool=pool, max_workers=workers)
+        timings[label] = time.perf_counter() - start
+        for stubber in pool.stubbers:
+            stubber.assert_no_pending_responses()
+
+    workers_needed = len(profiles) * len(regions) * len(SERVICE_LOOKUPS)
+    print(f"Stubbed discovery: {len(profiles)} account(s) x {len(regions)} region(s) x "
+          f"{len(SERVICE_LOOKUPS)} services = {workers_needed} lookups, "
+          f"{pages} page(s) each at {latency * 1000:.0f}ms per call")
+    print(f"  serial:     {timings['serial']:.2f}s")
+    print(f"  concurrent: {timings['concurrent']:.2f}s ({max_workers} workers)")
+    print(f"  speedup:    {timings['serial'] / timings['concurrent']:.1f}x")
+    return timings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Discover existing fleet resources across regions and accounts")
+    parser.add_argument('--regions', nargs='+',
+                        default=os.environ.get('LOOKUP_REGIONS', '').split() or None,
+                        help="Regions to search (default: the session region)")
+    parser.add_argument('--profiles', nargs='+',
+                        default=os.environ.get('LOOKUP_PROFILES', '').split() or None,
+                        help="AWS CLI profiles, one per account (default: current credentials)")
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Upper bound on concurrent lookups")
+    parser.add_argument('--output', default='resource_exports.json',
+                        help="File to write the merged exports to")
+    parser.add_argument('--stub', action='store_true',
+                        help="Benchmark serial vs concurrent discovery against botocore Stubber")
+    parser.add_argument('--stub-latency', type=float, default=0.05,
+                        help="Simulated per-call latency in seconds for --stub")
+    parser.add_argument('--stub-pages', type=int, default=3,
+                        help="Pages returned by each stubbed paginator for --stub")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    generate_exports()
+    args = parse_args()
+    if args.stub:
+        benchmark(
+            args.regions or ['us-east-1', 'us-west-2', 'eu-west-1'],
+            args.profiles or ['dev', 'staging'],
+            args.max_workers,
+            args.stub_latency,
+            args.stub_pages
+        )
+    else:
+        try:
+            generate_exports(args.regions, args.profiles, args.output, args.max_workers)
+        except LookupFailed as e:
+            raise SystemExit(f"Not writing {args.output}: {e}")
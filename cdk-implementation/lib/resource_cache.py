@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_FILE = 'lookup-cache.json'
+
+# Cache modes:
+#   auto    - serve fresh entries from the cache, look up anything missing or expired
+#   refresh - ignore the cache and look everything up again
+#   offline - never call AWS; missing entries resolve to "does not exist"
+CACHE_MODES = ('auto', 'refresh', 'offline')
+
+# Seconds before an entry of each kind is looked up again in auto mode
+DEFAULT_TTLS = {
+    'existing-resources': 60 * 60,
+    'iam-role': 24 * 60 * 60,
+    'efs-security-groups': 24 * 60 * 60,
+    'efs-mount-target-zones': 24 * 60 * 60,
+}
+
+
+class LookupCache:
+    """
+    Persistent on-disk cache of AWS lookups made during synth, kept next to
+    cdk.context.json. Each entry records when it was fetched and how long the
+    lookup took so cache hits can report the time they saved.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"Warning: Could not read lookup cache {path}: {e}")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value, elapsed):
+        with self._lock:
+            self.entries[key] = {
+                'value': value,
+                'fetched_at': time.time(),
+                'elapsed': round(elapsed, 4)
+            }
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+class ResourceResolver:
+    """
+    Answers the existence questions DevFleetStack asks during synth from the
+    lookup cache, falling back to boto3 only when an entry is missing or
+    expired. boto3 is imported lazily, so a warm synth makes no AWS calls.
+    """
+
+    def __init__(self, region, account=None, cache=None, mode='auto', ttls=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown lookup cache mode '{mode}', expected one of {', '.join(CACHE_MODES)}")
+        self.region = region
+        self.account = account or 'default'
+        self.cache = cache if cache is not None else LookupCache()
+        self.mode = mode
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    def _key(self, kind, name=''):
+        return f"{kind}:account={self.account}:region={self.region}:{name}"
+
+    def _resolve(self, kind, name, fetch, default):
+        key = self._key(kind, name)
+        entry = self.cache.get(key)
+
+        if self.mode != 'refresh' and entry is not None:
+            fresh = time.time() - entry['fetched_at'] < self.ttls[kind]
+            if fresh or self.mode == 'offline':
+                self.hits += 1
+                self.saved_seconds += entry.get('elapsed', 0.0)
+                return entry['value']
+
+        if self.mode == 'offline':
+            print(f"Warning: No cached lookup for {key} in offline mode, assuming it does not exist")
+            self.misses += 1
+            return default
+
+        # Failed lookups are not cached so a transient error is retried on
+        # the next synth instead of being remembered for a whole TTL. An
+        # expired answer is still a better guess than "does not exist".
+        self.misses += 1
+        start = time.perf_counter()
+        try:
+            value = fetch()
+        except Exception as e:
+            if entry is not None:
+                print(f"Warning: Lookup for {key} failed, using the expired cached answer: {e}")
+                return entry['value']
+            print(f"Warning: Lookup for {key} failed, assuming it does not exist: {e}")
+            return default
+        elapsed = time.perf_counter() - start
+        self.lookup_seconds += elapsed
+        self.cache.put(key, value, elapsed)
+        return value
+
+    def existing_resources(self):
+        """
+        ECR repositories, EFS file systems and ECS clusters in this region
+        """
+        def fetch():
+            from lib.lookup_resources import discover_resources, exports_for
+            return exports_for(discover_resources([self.region]), self.region, self.account)
+
+        return self._resolve('existing-resources', '', fetch, {
+            'ecr_repositories': [],
+            'efs_filesystems': {},
+            'ecs_clusters': []
+        })
+
+    def role_exists(self, role_name):
+        def fetch():
+            import boto3
+            iam_client = boto3.client('iam')
+            try:
+                iam_client.get_role(RoleName=role_name)
+                return True
+            except iam_client.exceptions.NoSuchEntityException:
+                return False
+
+        return self._resolve('iam-role', role_name, fetch, False)
+
+    def efs_security_groups(self, file_system_id):
+        """
+        Security groups attached to the first mount target of a file system
+        """
+        def fetch():
+            import boto3
+            efs_client = boto3.client('efs', region_name=self.region)
+            mount_targets = efs_client.describe_mount_targets(
+                FileSystemId=file_system_id
+            )['MountTargets']
+            if not mount_targets:
+                return []
+            return efs_client.describe_mount_target_security_groups(
+                MountTargetId=mount_targets[0]['MountTargetId']
+            )['SecurityGroups']
+
+        return self._resolve('efs-security-groups', file_system_id, fetch, [])
+
+    def efs_mount_target_zones(self, file_system_id):
+        """
+        Availability zones a file system has mount targets in
+        """
+        def fetch():
+            import boto3
+            efs_client = boto3.client('efs', region_name=self.region)
+            mount_targets = efs_client.describe_mount_targets(
+                FileSystemId=file_system_id
+            )['MountTargets']
+            return sorted({target['AvailabilityZoneName'] for target in mount_targets})
+
+        return self._resolve('efs-mount-target-zones', file_system_id, fetch, [])
+
+    def report(self, synth_seconds=None):
+        self.cache.save()
+        summary = (f"Lookup cache ({self.mode}): {self.hits} hit(s), {self.misses} miss(es), "
+                   f"{self.lookup_seconds:.2f}s spent on lookups, ~{self.saved_seconds:.2f}s saved")
+        if synth_seconds is not None:
+            summary += f", synth took {synth_seconds:.2f}s"
+        print(summary)
+
+
+def resolver_from_context(app, region, account):
+    """
+    Build a resolver from CDK context, e.g. `cdk synth -c lookup_mode=offline`,
+    or the DEV_FLEET_LOOKUP_MODE / DEV_FLEET_LOOKUP_CACHE environment variables
+    """
+    mode = app.node.try_get_context('lookup_mode') or os.environ.get('DEV_FLEET_LOOKUP_MODE', 'auto')
+    path = app.node.try_get_context('lookup_cache') or os.environ.get('DEV_FLEET_LOOKUP_CACHE', DEFAULT_CACHE_FILE)
+    return ResourceResolver(region, account, cache=LookupCache(path), mode=mode)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the synth lookup cache")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, help="Path to the lookup cache file")
+    parser.add_argument('--clear', action='store_true', help="Remove every cached lookup")
+    args = parser.parse_args()
+
+    cache = LookupCache(args.cache)
+    if args.clear:
+        cache.clear()
+        cache.save()
+        print(f"Cleared lookup cache {args.cache}")
+    else:
+        now = time.time()
+        for key, entry in sorted(cache.entries.items()):
+            age = now - entry['fetched_at']
+            print(f"{key}  age={age / 60:.0f}m  lookup={entry.get('elapsed', 0.0):.2f}s")
@@ -0,0 +1,468 @@
+"""
+Recommend Fargate task sizes from the tasks' CPU and memory utilisation.
+
+Reads Container Insights task performance events (Type "Task", with
+CpuUtilized/CpuReserved in CPU units and MemoryUtilized/MemoryReserved in
+MiB) from the cluster's performance log group, from files exported from it
+(plain or gzipped, one event per line, with or without the S3 export's
+timestamp prefix), or from a fixture written by `fixture`. Events are
+streamed, and every developer keeps one fixed-size histogram for CPU and
+one for memory, so memory use does not grow with the length of the history.
+
+For each developer, the p95 CPU demand plus headroom and the larger of the
+p99 memory plus headroom and the peak memory decide the cheapest valid
+Fargate size. A sample at the task's CPU limit was throttled, and its real
+demand is unknown, so a developer whose samples are capped more than 5% of
+the time gets at least one CPU step more than they have. The report shows
+the monthly cost at each developer's observed running hours, and the share
+of samples throttled now and projected at the recommended size.
+
+--write-roster writes the roster with the recommended cpu/memory for
+`cdk deploy -c roster=...`. The shared environment's recommendation is
+printed as `-c task_cpu/-c task_memory` context (TaskCpu/TaskMemory in
+dev-fleet-cloudformation.yaml).
+
+Usage:
+  python -m lib.rightsize recommend --log-group /aws/ecs/containerinsights/dev-fleet-cluster/performance [--since 14d]
+  python -m lib.rightsize recommend export/*.gz [--roster roster.json --write-roster roster.rightsized.json] [--json]
+  python -m lib.rightsize fixture fixture.jsonl.gz [--developers 40] [--days 14]
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+from array import array
+
+from lib.developer_fleet import FARGATE_MEMORY_BY_CPU, load_roster
+
+# Fargate Linux on-demand rates in us-east-1 (USD per vCPU-hour, per GB-hour),
+# as in arch-benchmark.py
+FARGATE_PRICES = {
+    'x86_64': (0.04048, 0.004445),
+    'arm64': (0.03238, 0.00356),
+}
+HOURS_PER_MONTH = 730
+
+SHARED_FAMILY = 'dev-environment'
+SHARED_NAME = '(shared)'
+PERFORMANCE_FILTER = '{ $.Type = "Task" }'
+
+CPU_BIN_UNITS = 8
+MEMORY_BIN_MIB = 32
+# A sample using this share of its CPU limit or more counts as throttled
+SATURATION = 0.95
+# Share of capped samples above which the CPU size is raised regardless
+CAPPED_STEP_UP = 0.05
+
+
+class Histogram:
+    """
+    Counts of values in fixed-width bins up to a maximum. Percentiles are
+    the upper edge of the bin they fall in (but at most the peak), so they
+    err on the large side by at most one bin.
+    """
+
+    def __init__(self, width, maximum):
+        self.width = width
+        self.counts = array('Q', bytes(8 * (int(maximum // width) + 1)))
+        self.total = 0
+        self.peak = 0.0
+
+    def add(self, value):
+        self.counts[min(int(value // self.width), len(self.counts) - 1)] += 1
+        self.total += 1
+        if value > self.peak:
+            self.peak = value
+
+    def percentile(self, pct):
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min((index + 1) * self.width, self.peak)
+        return self.peak
+
+    def share_at_least(self, value):
+        """
+        Share of the values in value's bin or above
+        """
+        if not self.total:
+            return 0.0
+        return sum(self.counts[min(int(value // self.width), len(self.counts) - 1):]) / self.total
+
+
+class Usage:
+    """
+    One developer's utilisation history, in constant memory
+    """
+
+    def __init__(self):
+        self.cpu = Histogram(CPU_BIN_UNITS, max(FARGATE_MEMORY_BY_CPU))
+        self.memory = Histogram(MEMORY_BIN_MIB, max(max(values) for values in FARGATE_MEMORY_BY_CPU.values()))
+        self.capped = 0
+        self.latest = (0, None, None)
+
+    def add(self, timestamp, cpu, cpu_reserved, memory, memory_reserved):
+        self.cpu.add(cpu)
+        self.memory.add(memory)
+        if cpu_reserved and cpu >= SATURATION * cpu_reserved:
+            self.capped += 1
+        if timestamp >= self.latest[0]:
+            self.latest = (timestamp, int(cpu_reserved or 0), int(memory_reserved or 0))
+
+    @property
+    def samples(self):
+        return self.cpu.total
+
+    @property
+    def current(self):
+        return self.latest[1], self.latest[2]
+
+
+def developer_for_family(family):
+    if family == SHARED_FAMILY:
+        return SHARED_NAME
+    if family and family.startswith(f"{SHARED_FAMILY}-"):
+        return family[len(SHARED_FAMILY) + 1:]
+    return None
+
+
+def file_events(paths):
+    """
+    Performance events from exported or fixture files, one line at a time
+    """
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt') as f:
+            for line in f:
+                # S3 exports prefix every event with its timestamp
+                start = line.find('{')
+                if start < 0 or '"Task"' not in line:
+                    continue
+                try:
+                    yield json.loads(line[start:])
+                except ValueError:
+                    continue
+
+
+def log_group_events(logs_client, log_group, since):
+    """
+    Task performance events from the Container Insights log group, page by page
+    """
+    paginator = logs_client.get_paginator('filter_log_events')
+    for page in paginator.paginate(logGroupName=log_group, filterPattern=PERFORMANCE_FILTER,
+                                   startTime=int(since * 1000)):
+        for event in page['events']:
+            try:
+                yield json.loads(event['message'])
+            except ValueError:
+                continue
+
+
+def ingest(events):
+    """
+    Fold task performance events into per-developer Usage. Returns
+    (usage by developer, stats)
+    """
+    usage = {}
+    stats = {'events': 0, 'skipped': 0, 'first': None, 'last': None}
+    for event in events:
+        developer = developer_for_family(event.get('TaskDefinitionFamily'))
+        if event.get('Type') != 'Task' or developer is None or event.get('CpuUtilized') is None:
+            stats['skipped'] += 1
+            continue
+        timestamp = int(event.get('Timestamp', 0))
+        if developer not in usage:
+            usage[developer] = Usage()
+        usage[developer].add(
+            timestamp, float(event['CpuUtilized']), float(event.get('CpuReserved') or 0),
+            float(event.get('MemoryUtilized') or 0), float(event.get('MemoryReserved') or 0)
+        )
+        stats['events'] += 1
+        stats['first'] = timestamp if stats['first'] is None else min(stats['first'], timestamp)
+        stats['last'] = timestamp if stats['last'] is None else max(stats['last'], timestamp)
+    return usage, stats
+
+
+def hourly_price(cpu, memory, architecture='x86_64'):
+    vcpu_hour, gb_hour = FARGATE_PRICES.get(architecture or 'x86_64', FARGATE_PRICES['x86_64'])
+    return cpu / 1024 * vcpu_hour + memory / 1024 * gb_hour
+
+
+def cheapest_size(cpu_needed, memory_needed, architecture='x86_64', min_cpu=256):
+    """
+    Cheapest valid Fargate (cpu, memory) with at least the given CPU units
+    and MiB, or the largest size when nothing is big enough
+    """
+    candidates = [
+        (hourly_price(cpu, memory, architecture), cpu, memory)
+        for cpu, memories in FARGATE_MEMORY_BY_CPU.items() if cpu >= min_cpu
+        for memory in memories
+        if cpu >= cpu_needed and memory >= memory_needed
+    ]
+    if not candidates:
+        cpu = max(FARGATE_MEMORY_BY_CPU)
+        return cpu, max(FARGATE_MEMORY_BY_CPU[cpu])
+    _, cpu, memory = min(candidates)
+    return cpu, memory
+
+
+def next_cpu_step(cpu):
+    larger = [value for value in sorted(FARGATE_MEMORY_BY_CPU) if value > cpu]
+    return larger[0] if larger else cpu
+
+
+def recommend(usage, architecture='x86_64', cpu_headroom=0.25, memory_headroom=0.2, min_cpu=512,
+              task_hours_per_month=None):
+    """
+    The recommendation for one developer's Usage. task_hours_per_month
+    (default: always running) prices the current and recommended sizes.
+    """
+    cpu_p95, cpu_p99 = usage.cpu.percentile(95), usage.cpu.percentile(99)
+    memory_p95, memory_p99 = usage.memory.percentile(95), usage.memory.percentile(99)
+    capped_share = usage.capped / usage.samples if usage.samples else 0.0
+    current_cpu, current_memory = usage.current
+
+    cpu_needed = cpu_p95 * (1 + cpu_headroom)
+    if current_cpu and capped_share > CAPPED_STEP_UP:
+        cpu_needed = max(cpu_needed, next_cpu_step(current_cpu))
+    memory_needed = max(memory_p99 * (1 + memory_headroom), usage.memory.peak)
+    cpu, memory = cheapest_size(cpu_needed, memory_needed, architecture, min_cpu)
+
+    hours = HOURS_PER_MONTH if task_hours_per_month is None else task_hours_per_month
+    current_cost = hourly_price(current_cpu, current_memory, architecture) * hours if current_cpu else None
+    return {
+        'samples': usage.samples,
+        'cpu_p95': cpu_p95,
+        'cpu_p99': cpu_p99,
+        'memory_p95': memory_p95,
+        'memory_p99': memory_p99,
+        'memory_peak': usage.memory.peak,
+        'current': {'cpu': current_cpu, 'memory': current_memory} if current_cpu else None,
+        'recommended': {'cpu': cpu, 'memory': memory},
+        'task_hours_per_month': round(hours, 1),
+        'monthly_cost_now': round(current_cost, 2) if current_cost is not None else None,
+        'monthly_cost_after': round(hourly_price(cpu, memory, architecture) * hours, 2),
+        'throttled_now': capped_share,
+        # Capped samples' real demand is unknown, so for a larger size this
+        # is a lower bound
+        'throttled_after': usage.cpu.share_at_least(SATURATION * cpu),
+        'throttled_after_is_lower_bound': bool(usage.capped) and cpu > (current_cpu or 0),
+    }
+
+
+def recommend_all(usage_by_developer, stats, architectures=None, sample_seconds=60, **options):
+    """
+    Recommendations for every developer, priced at their observed task-hours
+    scaled to a month
+    """
+    window_hours = max(sample_seconds, ((stats['last'] or 0) - (stats['first'] or 0)) / 1000) / 3600
+    recommendations = {}
+    for developer, usage in sorted(usage_by_developer.items()):
+        task_hours = usage.samples * sample_seconds / 3600
+        recommendations[developer] = recommend(
+            usage,
+            architecture=(architectures or {}).get(developer) or 'x86_64',
+            task_hours_per_month=task_hours * HOURS_PER_MONTH / window_hours,
+            **options
+        )
+    return recommendations
+
+
+def format_size(size):
+    return f"{size['cpu']}/{size['memory']}" if size else '-'
+
+
+def print_recommendations(recommendations):
+    print(f"{'DEVELOPER':<20} {'SAMPLES':>8} {'CPU P95':>8} {'CPU P99':>8} {'MEM P99':>8} {'MEM MAX':>8} "
+          f"{'CURRENT':>11} {'RECOMMENDED':>11} {'$/MONTH NOW':>12} {'AFTER':>8} {'THROTTLED NOW':>14} {'AFTER':>7}")
+    for developer, row in recommendations.items():
+        now = f"{row['monthly_cost_now']:.2f}" if row['monthly_cost_now'] is not None else '-'
+        after = ('>=' if row['throttled_after_is_lower_bound'] else '') + f"{row['throttled_after']:.1%}"
+        print(f"{developer[:20]:<20} {row['samples']:>8} {row['cpu_p95']:>8.0f} {row['cpu_p99']:>8.0f} "
+              f"{row['memory_p99']:>8.0f} {row['memory_peak']:>8.0f} {format_size(row['current']):>11} "
+              f"{format_size(row['recommended']):>11} {now:>12} {row['monthly_cost_after']:>8.2f} "
+              f"{row['throttled_now']:>14.1%} {after:>7}")
+
+    priced = [row for row in recommendations.values() if row['monthly_cost_now'] is not None]
+    before = sum(row['monthly_cost_now'] for row in priced)
+    after = sum(row['monthly_cost_after'] for row in priced)
+    changed = sum(1 for row in priced if row['current'] != row['recommended'])
+    print(f"{changed} of {len(recommendations)} size(s) change; ${before:,.2f} -> ${after:,.2f} a month "
+          f"({before - after:+,.2f} saved)")
+    throttled = [developer for developer, row in recommendations.items() if row['throttled_now'] > CAPPED_STEP_UP]
+    if throttled:
+        print(f"Throttled more than {CAPPED_STEP_UP:.0%} of the time now: {', '.join(throttled)}")
+
+
+def write_roster(roster_path, recommendations, output_path):
+    """
+    Copy the roster with each measured developer's cpu/memory replaced by
+    the recommendation, then validate the copy as the stack would
+    """
+    with open(roster_path, 'r') as f:
+        document = json.load(f)
+    for entry in document.get('developers', []):
+        row = recommendations.get(entry.get('name'))
+        if row is None or entry.get('retired'):
+            continue
+        entry.pop('size', None)
+        entry['cpu'] = row['recommended']['cpu']
+        entry['memory'] = row['recommended']['memory']
+    with open(output_path, 'w') as f:
+        json.dump(document, f, indent=2)
+        f.write('\n')
+    load_roster(output_path, 'base-dev-env')
+
+
+PROFILES = {
+    # share of the time building, CPU share idle/building, memory MiB idle/building
+    'idle': (0.01, (0.02, 0.10), (500, 800)),
+    'steady': (0.10, (0.15, 0.60), (900, 1400)),
+    'builder': (0.25, (0.10, 1.00), (1100, 1900)),
+    'memory-heavy': (0.10, (0.10, 0.50), (2600, 3400)),
+}
+
+
+def write_fixture(path, developers=40, days=14, sample_seconds=60, seed=1, start=None):
+    """
+    Synthetic Container Insights task events for a roster of medium
+    (1024/2048) and large (2048/4096) tasks, written one line at a time
+    """
+    rng = random.Random(seed)
+    start = start or int(time.time()) - days * 86400
+    names = [f"dev{index:03d}" for index in range(developers)]
+    plans = {}
+    for name in names:
+        profile = rng.choices(list(PROFILES), weights=(4, 3, 2, 1))[0]
+        cpu, memory = (2048, 4096) if profile == 'memory-heavy' or rng.random() < 0.2 else (1024, 2048)
+        plans[name] = (profile, cpu, memory, f"{rng.getrandbits(64):016x}{rng.getrandbits(64):016x}")
+
+    opener = gzip.open if path.endswith('.gz') else open
+    lines = 0
+    with opener(path, 'wt') as f:
+        for offset in range(0, days * 86400, sample_seconds):
+            timestamp = start + offset
+            working = 8 <= (timestamp // 3600) % 24 < 19
+            for name in names:
+                profile, cpu_reserved, memory_reserved, task = plans[name]
+                build_share, (cpu_idle, cpu_build), (memory_idle, memory_build) = PROFILES[profile]
+                building = working and rng.random() < build_share
+                cpu_share = cpu_build if building else cpu_idle * (1 if working else 0.3)
+                cpu = min(cpu_reserved, cpu_reserved * cpu_share * rng.uniform(0.6, 1.3))
+                memory = min(memory_reserved, (memory_build if building else memory_idle) * rng.uniform(0.9, 1.1))
+                f.write(json.dumps({
+                    'Version': '0', 'Type': 'Task', 'ClusterName': 'dev-fleet-cluster', 'TaskId': task,
+                    'TaskDefinitionFamily': f"{SHARED_FAMILY}-{name}", 'Timestamp': timestamp * 1000,
+                    'CpuUtilized': round(cpu, 2), 'CpuReserved': cpu_reserved,
+                    'MemoryUtilized': round(memory), 'MemoryReserved': memory_reserved,
+                }, separators=(',', ':')) + '\n')
+                lines += 1
+    return lines
+
+
+def parse_duration(text):
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recommend Fargate task sizes from utilisation history")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    recommend_parser = subparsers.add_parser('recommend', help="Recommend a size per developer")
+    recommend_parser.add_argument('files', nargs='*', help="Exported or fixture event files (.gz or plain)")
+    recommend_parser.add_argument('--log-group', help="Read the Container Insights performance log group instead")
+    recommend_parser.add_argument('--since', default='14d', help="History to read from the log group")
+    recommend_parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    recommend_parser.add_argument('--roster', help="Roster the sizes apply to (for architectures and --write-roster)")
+    recommend_parser.add_argument('--write-roster', help="Write the roster with the recommended sizes here")
+    recommend_parser.add_argument('--architecture', default='x86_64', help="The stack's default architecture")
+    recommend_parser.add_argument('--cpu-headroom', type=float, default=0.25, help="Added to the p95 CPU demand")
+    recommend_parser.add_argument('--memory-headroom', type=float, default=0.2, help="Added to the p99 memory")
+    recommend_parser.add_argument('--min-cpu', type=int, default=512, help="Smallest CPU size to recommend")
+    recommend_parser.add_argument('--sample-seconds', type=int, default=60, help="Seconds between samples")
+    recommend_parser.add_argument('--json', action='store_true')
+
+    fixture_parser = subparsers.add_parser('fixture', help="Write synthetic Container Insights task events")
+    fixture_parser.add_argument('path')
+    fixture_parser.add_argument('--developers', type=int, default=40)
+    fixture_parser.add_argument('--days', type=int, default=14)
+    fixture_parser.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'fixture':
+        start = time.perf_counter()
+        lines = write_fixture(args.path, args.developers, args.days, seed=args.seed)
+        print(f"Wrote {lines:,} events for {args.developers} developers over {args.days} days to {args.path} "
+              f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        return 0
+
+    if bool(args.files) == bool(args.log_group):
+        parser.error("give either event files or --log-group")
+    if args.write_roster and not args.roster:
+        parser.error("--write-roster needs --roster")
+
+    if args.log_group:
+        import boto3
+        events = log_group_events(boto3.client('logs', region_name=args.region), args.log_group,
+                                  time.time() - parse_duration(args.since))
+    else:
+        events = file_events(args.files)
+
+    # ru_maxrss is in KiB on Linux
+    rss_before_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    usage, stats = ingest(events)
+    elapsed = time.perf_counter() - start
+    rss_after_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if not usage:
+        print("No task performance events for dev-environment task families", file=sys.stderr)
+        return 1
+
+    architectures = {}
+    if args.roster:
+        architectures = {developer['name']: developer['architecture'] or args.architecture
+                         for developer in load_roster(args.roster, 'base-dev-env')}
+    architectures.setdefault(SHARED_NAME, args.architecture)
+    recommendations = recommend_all(
+        usage, stats, {name: architectures.get(name, args.architecture) for name in usage},
+        sample_seconds=args.sample_seconds, cpu_headroom=args.cpu_headroom,
+        memory_headroom=args.memory_headroom, min_cpu=args.min_cpu
+    )
+
+    days = ((stats['last'] or 0) - (stats['first'] or 0)) / 86400000
+    print(f"Read {stats['events']:,} task samples ({stats['skipped']:,} skipped) for {len(usage)} developer(s) "
+          f"over {days:.1f} days in {elapsed:.1f}s; peak RSS {rss_before_mib:.0f} MiB before, "
+          f"{rss_after_mib:.0f} MiB after", file=sys.stderr)
+
+    if args.write_roster:
+        write_roster(args.roster, recommendations, args.write_roster)
+        print(f"Wrote {args.write_roster}; deploy with `cdk deploy -c roster={args.write_roster}`", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(recommendations, indent=2))
+        return 0
+    print_recommendations(recommendations)
+    shared = recommendations.get(SHARED_NAME)
+    if shared:
+        size = shared['recommended']
+        print(f"Shared environment: cdk deploy -c task_cpu={size['cpu']} -c task_memory={size['memory']} "
+              f"(CloudFormation: TaskCpu={size['cpu']} TaskMemory={size['memory']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
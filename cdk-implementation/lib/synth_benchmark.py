@@ -0,0 +1,247 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_BASELINE_FILE = 'synth-baseline.json'
+DEFAULT_FLEET_SIZES = [0, 10, 100]
+
+WILDCARD_CERTIFICATE_ARN = "arn:aws:acm:us-east-1:510985353423:certificate/93474ca3-71c9-4c70-add6-9211e6c72b58"
+
+# Allowed growth over the baseline before a metric counts as a regression
+TOLERANCES = {
+    'synth_seconds': 0.50,
+    'peak_rss_mb': 0.20,
+    'construct_count': 0.05,
+    'template_bytes': 0.10,
+}
+
+
+def benchmark_matrix(fleet_sizes=None):
+    """
+    Every combination of certificate, existing vs new resources and fleet
+    size. A fleet size of 0 synthesizes the single shared environment.
+    """
+    configs = []
+    for certificate, existing, fleet_size in itertools.product(
+            (False, True), (False, True), fleet_sizes or DEFAULT_FLEET_SIZES):
+        name = (f"{'cert' if certificate else 'nocert'}-"
+                f"{'existing' if existing else 'new'}-"
+                f"fleet{fleet_size}")
+        configs.append({
+            'name': name,
+            'certificate': certificate,
+            'existing': existing,
+            'fleet_size': fleet_size
+        })
+    return configs
+
+
+def context_account(context):
+    """
+    Account the cdk.context.json lookups were recorded for
+    """
+    for key in context:
+        if key.startswith('vpc-provider:account='):
+            return key.split('account=')[1].split(':')[0]
+    return '123456789012'
+
+
+def stubbed_resolver(region, account, existing):
+    """
+    Resolver whose cache answers every lookup, so synth never calls AWS
+    """
+    from lib.resource_cache import LookupCache, ResourceResolver
+
+    resolver = ResourceResolver(
+        region, account,
+        cache=LookupCache(os.path.join(tempfile.gettempdir(), 'synth-benchmark-no-cache.json')),
+        mode='offline'
+    )
+    cache = resolver.cache
+    cache.entries = {}
+    cache.put(resolver._key('existing-resources'), {
+        'ecr_repositories': ['dev-fleet-containers'] if existing else [],
+        'efs_filesystems': {'dev-fleet-persistent-storage': 'fs-0123456789abcdef0'} if existing else {},
+        'ecs_clusters': ['dev-fleet-cluster'] if existing else []
+    }, 0.0)
+    for role_name in ('ecsTaskExecutionRole', 'devFleetTaskRole'):
+        cache.put(resolver._key('iam-role', role_name), existing, 0.0)
+    cache.put(resolver._key('efs-security-groups', 'fs-0123456789abcdef0'), ['sg-0123456789abcdef0'], 0.0)
+    cache.put(resolver._key('efs-mount-target-zones', 'fs-0123456789abcdef0'), ['us-east-1a', 'us-east-1b'], 0.0)
+    return resolver
+
+
+def run_worker(config):
+    """
+    Synthesize one configuration in this process and print its metrics as JSON
+    """
+    from aws_cdk import App, Environment
+
+    from lib.dev_fleet_stack import DevFleetStack
+
+    with open('cdk.context.json', 'r') as f:
+        context = json.load(f)
+    account = context_account(context)
+    region = 'us-east-1'
+
+    roster = [
+        {
+            'name': f"dev{index:04d}",
+            'slot': index,
+            'cpu': 1024,
+            'memory': 2048,
+            'image_tag': 'base-dev-env',
+            'uid': 20000 + index,
+            'gid': 20000 + index,
+            'retired': False
+        }
+        for index in range(config['fleet_size'])
+    ]
+
+    outdir = tempfile.mkdtemp(prefix='synth-benchmark-')
+    start = time.perf_counter()
+    app = App(outdir=outdir, context=context)
+    DevFleetStack(app, "DevFleetStack",
+        domain_name="qdev.ngdegtm.com",
+        hosted_zone_name="ngdegtm.com",
+        ecr_repository_name="dev-fleet-containers",
+        container_image_tag="base-dev-env",
+        ecs_cluster_name="dev-fleet-cluster",
+        efs_name="dev-fleet-persistent-storage",
+        wildcard_certificate_arn=WILDCARD_CERTIFICATE_ARN if config['certificate'] else None,
+        env=Environment(account=account, region=region),
+        resolver=stubbed_resolver(region, account, config['existing']),
+        roster=roster or None
+    )
+    app.synth()
+    synth_seconds = time.perf_counter() - start
+
+    template_bytes = sum(
+        os.path.getsize(os.path.join(outdir, name))
+        for name in os.listdir(outdir)
+        if name.endswith('.template.json')
+    )
+    metrics = {
+        'synth_seconds': round(synth_seconds, 3),
+        'construct_count': len(app.node.find_all()),
+        'template_bytes': template_bytes
+    }
+    print("SYNTH_BENCHMARK " + json.dumps(metrics))
+
+
+def measure(config):
+    """
+    Run one configuration in a fresh process and add its peak RSS, which
+    covers the Python process and the jsii node runtime it waits for
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'lib.synth_benchmark', '--worker', json.dumps(config)],
+            stdout=stdout,
+            stderr=stderr,
+            env=dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION='1')
+        )
+        # wait4 reports the usage of this child alone; RUSAGE_CHILDREN would
+        # keep the largest RSS of every configuration run so far
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stdout.seek(0)
+        stderr.seek(0)
+        output, errors = stdout.read().decode(), stderr.read().decode()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Synth failed for {config['name']}:\n{errors[-2000:]}")
+
+    for line in output.splitlines():
+        if line.startswith('SYNTH_BENCHMARK '):
+            metrics = json.loads(line[len('SYNTH_BENCHMARK '):])
+            break
+    else:
+        raise RuntimeError(f"No metrics reported for {config['name']}")
+
+    # ru_maxrss is in KiB on Linux
+    metrics['peak_rss_mb'] = round(usage.ru_maxrss / 1024, 1)
+    return metrics
+
+
+def compare(results, baseline):
+    """
+    Return (config, metric, baseline value, current value) for every metric
+    that grew past its tolerance
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, tolerance in TOLERANCES.items():
+            expected = baseline[name].get(metric)
+            if expected and metrics[metric] > expected * (1 + tolerance):
+                regressions.append((name, metric, expected, metrics[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DevFleetStack synth across a configuration matrix")
+    parser.add_argument('--fleet-sizes', type=int, nargs='+', default=DEFAULT_FLEET_SIZES,
+                        help="Roster sizes to synthesize (0 = single shared environment)")
+    parser.add_argument('--only', help="Only run configurations whose name contains this string")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE, help="Baseline file to compare against")
+    parser.add_argument('--update-baseline', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        return 0
+
+    # The worker runs with this script's parent directory as the working
+    # directory so `lib.` imports and cdk.context.json resolve
+    args.baseline = os.path.abspath(args.baseline)
+    args.output = args.output and os.path.abspath(args.output)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    configs = [c for c in benchmark_matrix(args.fleet_sizes) if not args.only or args.only in c['name']]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'configuration':<28} {'synth s':>8} {'rss MB':>8} {'constructs':>10} {'template B':>11}")
+    for config in configs:
+        metrics = measure(config)
+        results[config['name']] = metrics
+        print(f"{config['name']:<28} {metrics['synth_seconds']:>8.2f} {metrics['peak_rss_mb']:>8.1f} "
+              f"{metrics['construct_count']:>10} {metrics['template_bytes']:>11}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline)
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+    for name, metric, expected, actual in regressions:
+        print(f"REGRESSION {name}: {metric} {actual} exceeds baseline {expected} "
+              f"by more than {TOLERANCES[metric]:.0%}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+cold-start-trace.py - Per-phase cold-start timeline of the fleet's tasks
+
+Splits every task's cold start into phases and reports p50/p95/p99 for each,
+so image, EFS and health-check tuning goes to the slowest one:
+
+  provisioning     createdAt -> pullStartedAt      capacity and ENI attachment
+  image pull       pullStartedAt -> pullStoppedAt
+  container start  pullStoppedAt -> startedAt      EFS mounts and container start
+  sshd ready       startedAt -> "sshd ready"       entrypoint.sh up to sshd's first banner
+  target healthy   "sshd ready" -> healthy         NLB health checks passing
+  total            createdAt -> healthy
+
+The lifecycle timestamps come from DescribeTasks, 100 tasks per call. The
+"sshd ready" time is the event `health-server.py ready-marker` logs from
+entrypoint.sh, read back with one paginated FilterLogEvents query. ELBv2
+keeps no history of target health, so `watch` polls DescribeTargetHealth and
+records when each new task's target turns healthy. The transition lies
+between the last poll that saw the target unhealthy and the first that saw
+it healthy, and the report uses the midpoint (at most half an interval off).
+Each task's target groups come from its service's load balancers
+(DescribeServices, 10 services per call, once per service), and only the
+groups of tasks still on their way to healthy are polled.
+`watch` keeps the lifecycle timestamps in its state file too, since ECS
+forgets stopped tasks after about an hour.
+
+Usage:
+  cold-start-trace.py watch [--cluster dev-fleet-cluster] [--interval 5] [--state PATH]
+  cold-start-trace.py report [--cluster dev-fleet-cluster] [--since 24h] [--state PATH] [--json]
+  cold-start-trace.py simulate [--tasks 200] [--health-interval 30] [--healthy-threshold 3]
+"""
+
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from fleet_ecs import (
+    TASK_FAMILY_PREFIX, describe_services, describe_tasks, list_task_arns, task_developer, task_private_ip
+)
+
+DEFAULT_CLUSTER = 'dev-fleet-cluster'
+LOG_GROUP = '/ecs/dev-environment'
+STATE_PATH = os.path.expanduser('~/.cache/dev-fleet/cold-start-trace.json')
+SSHD_READY_PATTERN = '{ $.Event = "sshd_ready" }'
+RETENTION_DAYS = 14
+
+LIFECYCLE_FIELDS = {
+    'created': 'createdAt',
+    'pull_started': 'pullStartedAt',
+    'pull_stopped': 'pullStoppedAt',
+    'started': 'startedAt',
+    'stopped': 'stoppedAt',
+}
+STARTING_STATUSES = {'PROVISIONING', 'PENDING', 'ACTIVATING', 'RUNNING'}
+PHASES = (
+    ('provisioning', 'created', 'pull_started'),
+    ('image pull', 'pull_started', 'pull_stopped'),
+    ('container start', 'pull_stopped', 'started'),
+    ('sshd ready', 'started', 'sshd_ready'),
+    ('target healthy', 'sshd_ready', 'healthy'),
+)
+TOTAL = ('total', 'created', 'healthy')
+
+
+def epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def task_id(task_arn):
+    return task_arn.split('/')[-1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def parse_duration(text):
+    """
+    Seconds in a duration such as 90m, 24h or 7d (plain numbers are seconds)
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def load_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}"
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+def fetch_tasks(ecs_client, cluster):
+    """
+    Running and recently stopped tasks of a cluster, described 100 at a time
+    """
+    arns = list_task_arns(ecs_client, cluster) + list_task_arns(ecs_client, cluster, desired_status='STOPPED')
+    return describe_tasks(ecs_client, cluster, arns)
+
+
+def record_tasks(state, tasks):
+    """
+    Merge the tasks' lifecycle timestamps into the state, keyed by task ID
+    """
+    for task in tasks:
+        record = state.setdefault(task_id(task['taskArn']), {})
+        record['developer'] = task_developer(task)
+        record['status'] = task['lastStatus']
+        record['ip'] = task_private_ip(task)
+        if task.get('group', '').startswith('service:'):
+            record['service'] = task['group'][len('service:'):]
+        for key, field in LIFECYCLE_FIELDS.items():
+            if task.get(field) is not None:
+                record[key] = epoch(task[field])
+
+
+def pending(state):
+    """
+    Records of tasks still on their way to a healthy target
+    """
+    return {
+        tid: record for tid, record in state.items()
+        if record.get('status') in STARTING_STATUSES
+        and not {'healthy_at', 'healthy_before', 'untargeted'} & set(record)
+    }
+
+
+def service_target_groups(ecs_client, cluster, service_names, known):
+    """
+    Add the target group ARNs of each service not in known yet (service
+    name -> ARNs; an empty list for a service without a load balancer)
+    """
+    missing = sorted(set(service_names) - set(known))
+    for service in describe_services(ecs_client, cluster, missing):
+        known[service['serviceName']] = [
+            balancer['targetGroupArn'] for balancer in service.get('loadBalancers', [])
+            if balancer.get('targetGroupArn')
+        ]
+    for name in missing:
+        known.setdefault(name, [])
+    return known
+
+
+def groups_to_poll(state, service_groups):
+    """
+    The target groups the pending tasks register with. A pending task
+    outside any load-balanced service (a warm pool task, say) has no target
+    to wait for and stops counting as pending.
+    """
+    groups = set()
+    for record in pending(state).values():
+        record_groups = service_groups.get(record.get('service'), [])
+        if not record_groups:
+            record['untargeted'] = True
+        groups.update(record_groups)
+    return sorted(groups)
+
+
+def target_health(elbv2_client, group_arns, workers=8):
+    """
+    Map target IP -> (target group ARN, state). DescribeTargetHealth takes
+    one target group per call, so the groups are described in parallel.
+    """
+    def describe(arn):
+        return arn, elbv2_client.describe_target_health(TargetGroupArn=arn)['TargetHealthDescriptions']
+
+    health = {}
+    if not group_arns:
+        return health
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(group_arns)))) as pool:
+        for arn, descriptions in pool.map(describe, group_arns):
+            for description in descriptions:
+                health[description['Target']['Id']] = (arn, description['TargetHealth']['State'])
+    return health
+
+
+def record_health(state, health, polled_at):
+    """
+    Note, for every pending task, whether its target was healthy at
+    polled_at. Returns the IDs of the tasks that just turned healthy.
+    """
+    turned_healthy = []
+    for tid, record in pending(state).items():
+        target = health.get(record.get('ip')) if record.get('ip') else None
+        if target is None or target[1] != 'healthy':
+            record['unhealthy_at'] = polled_at
+            continue
+        record['target_group'] = target[0]
+        if 'unhealthy_at' in record:
+            record['healthy_after'] = record.pop('unhealthy_at')
+            record['healthy_at'] = polled_at
+            turned_healthy.append(tid)
+        else:
+            # Already healthy the first time the watcher saw it
+            record['healthy_before'] = polled_at
+    return turned_healthy
+
+
+def prune(state, now, retention_days=RETENTION_DAYS):
+    cutoff = now - retention_days * 86400
+    for tid in [tid for tid, record in state.items() if record.get('created', now) < cutoff]:
+        del state[tid]
+
+
+def watch_round(ecs_client, elbv2_client, cluster, state, service_groups, workers=8):
+    """
+    One poll: describe the cluster's tasks, then the health of the target
+    groups pending tasks register with. service_groups caches the services'
+    target groups across rounds.
+    """
+    record_tasks(state, fetch_tasks(ecs_client, cluster))
+    services = {record['service'] for record in pending(state).values() if record.get('service')}
+    service_target_groups(ecs_client, cluster, services, service_groups)
+    groups = groups_to_poll(state, service_groups)
+    polled_at = time.time()
+    health = target_health(elbv2_client, groups, workers)
+    return record_health(state, health, polled_at)
+
+
+def sshd_ready_times(logs_client, log_group, since):
+    """
+    Map task ID -> first "sshd ready" time logged since the given epoch
+    """
+    ready = {}
+    paginator = logs_client.get_paginator('filter_log_events')
+    for page in paginator.paginate(logGroupName=log_group, filterPattern=SSHD_READY_PATTERN,
+                                   startTime=int(since * 1000)):
+        for event in page['events']:
+            try:
+                document = json.loads(event['message'])
+            except ValueError:
+                continue
+            if document.get('TaskArn'):
+                tid = task_id(document['TaskArn'])
+            else:
+                # awslogs streams end in "/<task ID>", FireLens ones in "-firelens-<task ID>"
+                tid = event['logStreamName'].rsplit('/', 1)[-1].rsplit('-', 1)[-1]
+            at = document.get('_aws', {}).get('Timestamp', event['timestamp']) / 1000
+            ready[tid] = min(ready.get(tid, at), at)
+    return ready
+
+
+def timeline(record, sshd_ready=None):
+    """
+    Seconds spent in each phase the record has both ends of
+    """
+    points = dict(record, sshd_ready=sshd_ready)
+    if 'healthy_at' in record:
+        # The target cannot pass its checks before sshd answers
+        after = max(record['healthy_after'], sshd_ready or record.get('started') or 0)
+        points['healthy'] = (after + record['healthy_at']) / 2 if after < record['healthy_at'] else record['healthy_at']
+    durations = {}
+    for name, start, end in PHASES + (TOTAL,):
+        if points.get(start) is not None and points.get(end) is not None:
+            durations[name] = max(0.0, points[end] - points[start])
+    return durations
+
+
+def summarize(timelines):
+    summary = {}
+    for name, _, _ in PHASES + (TOTAL,):
+        values = [durations[name] for durations in timelines if name in durations]
+        if values:
+            summary[name] = {
+                'tasks': len(values),
+                'mean': sum(values) / len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': max(values),
+            }
+    return summary
+
+
+def print_summary(summary):
+    total_mean = sum(summary[name]['mean'] for name, _, _ in PHASES if name in summary)
+    print(f"  {'PHASE':<16} {'TASKS':>6} {'P50':>8} {'P95':>8} {'P99':>8} {'MAX':>8} {'SHARE':>6}")
+    for name, _, _ in PHASES + (TOTAL,):
+        row = summary.get(name)
+        if row is None:
+            print(f"  {name:<16} {0:>6}")
+            continue
+        share = f"{row['mean'] / total_mean:.0%}" if name != TOTAL[0] and total_mean else ''
+        print(f"  {name:<16} {row['tasks']:>6} {row['p50']:>7.1f}s {row['p95']:>7.1f}s {row['p99']:>7.1f}s "
+              f"{row['max']:>7.1f}s {share:>6}")
+    slowest = max((name for name, _, _ in PHASES if name in summary),
+                  key=lambda name: summary[name]['p95'], default=None)
+    if slowest:
+        print(f"  Slowest phase at p95: {slowest} ({summary[slowest]['p95']:.1f}s"
+              + (f" of {summary[TOTAL[0]]['p95']:.1f}s total)" if TOTAL[0] in summary else ")"))
+
+
+def report(args):
+    import boto3
+    ecs_client = boto3.client('ecs', region_name=args.region)
+    logs_client = boto3.client('logs', region_name=args.region)
+
+    now = time.time()
+    since = now - parse_duration(args.since)
+    state = load_state(args.state)
+    record_tasks(state, fetch_tasks(ecs_client, args.cluster))
+    records = {tid: record for tid, record in state.items() if record.get('created', 0) >= since}
+    ready = sshd_ready_times(logs_client, args.log_group, since)
+    timelines = {tid: timeline(record, ready.get(tid)) for tid, record in records.items()}
+    summary = summarize(timelines.values())
+
+    if args.json:
+        print(json.dumps({
+            'since': since,
+            'phases': summary,
+            'tasks': [dict(durations, task_id=tid, developer=records[tid].get('developer'))
+                      for tid, durations in sorted(timelines.items())],
+        }, indent=2))
+        return 0
+
+    observed = sum(1 for record in records.values() if 'healthy_at' in record)
+    started = datetime.fromtimestamp(since, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+    print(f"{len(records)} task(s) created since {started} in {args.cluster}; "
+          f"{sum(1 for tid in records if tid in ready)} logged \"sshd ready\", "
+          f"{observed} healthy transition(s) observed")
+    print_summary(summary)
+    if not observed:
+        print("  Run `cold-start-trace.py watch` to record target health transitions")
+    return 0
+
+
+def watch(args):
+    import boto3
+    ecs_client = boto3.client('ecs', region_name=args.region)
+    elbv2_client = boto3.client('elbv2', region_name=args.region)
+
+    state = load_state(args.state)
+    service_groups = {}
+    print(f"Watching {args.cluster} every {args.interval:g}s; state in {args.state}")
+    while True:
+        started = time.monotonic()
+        turned_healthy = watch_round(ecs_client, elbv2_client, args.cluster, state, service_groups)
+        prune(state, time.time())
+        save_state(args.state, state)
+        for tid in turned_healthy:
+            record = state[tid]
+            print(f"{datetime.now(timezone.utc):%H:%M:%S} {tid} ({record.get('developer') or '-'}) healthy "
+                  f"{record['healthy_at'] - record['created']:.0f}s after it was created", flush=True)
+        if args.once:
+            return 0
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+def simulate(args):
+    """
+    Cold-start a roster on the local stand-ins and trace it. The phase
+    durations drawn here are illustrative; the target health phase comes
+    from the NLB health-check model, so --health-interval and
+    --healthy-threshold show what health-check tuning would save.
+    Simulated seconds run time_scale times faster than real ones.
+    """
+    from local_aws import LocalECS, LocalELBv2, LocalLogs
+
+    scale = args.time_scale
+    rng = random.Random(args.seed)
+
+    def draw():
+        return (rng.lognormvariate(math.log(7), 0.35), rng.lognormvariate(math.log(28), 0.45),
+                rng.lognormvariate(math.log(3), 0.7), rng.lognormvariate(math.log(2.5), 0.5))
+
+    draws = [draw() for _ in range(args.tasks)]
+    phase_queue = iter([tuple(seconds * scale for seconds in drawn[:3]) for drawn in draws])
+    ecs_client = LocalECS(phases=lambda: next(phase_queue))
+    elbv2_client = LocalELBv2()
+    logs_client = LocalLogs()
+    cluster = DEFAULT_CLUSTER
+
+    developers = [f"dev{index:03d}" for index in range(args.tasks)]
+    groups = {}
+    for developer in developers:
+        groups[developer] = elbv2_client.create_target_group(
+            Name=f"dev-fleet-{developer}",
+            HealthCheckIntervalSeconds=args.health_interval * scale,
+            HealthyThresholdCount=args.healthy_threshold
+        )['TargetGroups'][0]['TargetGroupArn']
+        ecs_client.create_service(
+            cluster=cluster, serviceName=f"{TASK_FAMILY_PREFIX}{developer}",
+            taskDefinition=f"{TASK_FAMILY_PREFIX}{developer}",
+            loadBalancers=[{'targetGroupArn': groups[developer], 'containerName': 'dev-container',
+                            'containerPort': 22}]
+        )
+    arrivals = sorted(rng.uniform(0, args.window) * scale for _ in developers)
+
+    # The ECS agent and the containers: start each task at its arrival time,
+    # register its IP when it is running, and log "sshd ready" when sshd answers
+    stop = threading.Event()
+
+    def drive():
+        origin = time.time()
+        events = [(origin + at, 0, 'launch', index) for index, at in enumerate(arrivals)]
+        heapq.heapify(events)
+        tasks = {}
+        while events and not stop.is_set():
+            due, _, kind, index = events[0]
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(min(wait, 0.005))
+                continue
+            heapq.heappop(events)
+            developer = developers[index]
+            if kind == 'launch':
+                task = ecs_client.run_task(
+                    cluster=cluster,
+                    taskDefinition=f"arn:aws:ecs:us-east-1:123456789012:task-definition/"
+                                   f"{TASK_FAMILY_PREFIX}{developer}:1",
+                    group=f"service:{TASK_FAMILY_PREFIX}{developer}"
+                )['tasks'][0]
+                tasks[index] = task
+                started = epoch(task['createdAt']) + sum(draws[index][:3]) * scale
+                heapq.heappush(events, (started, 1, 'register', index))
+                heapq.heappush(events, (started + draws[index][3] * scale, 2, 'ready', index))
+            elif kind == 'register':
+                elbv2_client.register_targets(TargetGroupArn=groups[developer],
+                                              Targets=[{'Id': task_private_ip(tasks[index]), 'Port': 22}])
+            else:
+                arn = tasks[index]['taskArn']
+                logs_client.put_log_events(
+                    logGroupName=LOG_GROUP,
+                    logStreamName=f"{developer}/dev-container/{task_id(arn)}",
+                    logEvents=[{'timestamp': int(due * 1000), 'message': json.dumps({
+                        '_aws': {'Timestamp': int(due * 1000)}, 'Event': 'sshd_ready', 'TaskArn': arn,
+                    })}]
+                )
+                elbv2_client.mark_ready(groups[developer], task_private_ip(tasks[index]), at=due)
+
+    driver = threading.Thread(target=drive, daemon=True)
+    started = time.time()
+    driver.start()
+
+    state = {}
+    service_groups = {}
+    interval = args.poll_interval * scale
+    deadline = started + (args.window + 900) * scale
+    rounds = 0
+    while time.time() < deadline:
+        round_started = time.monotonic()
+        watch_round(ecs_client, elbv2_client, cluster, state, service_groups)
+        rounds += 1
+        if not driver.is_alive() and len(state) == args.tasks and not pending(state):
+            break
+        time.sleep(max(0.0, interval - (time.monotonic() - round_started)))
+    stop.set()
+
+    ready = sshd_ready_times(logs_client, LOG_GROUP, started - 1)
+    timelines = [
+        {name: seconds / scale for name, seconds in timeline(record, ready.get(tid)).items()}
+        for tid, record in state.items()
+    ]
+
+    print(f"{args.tasks} cold starts over {args.window:g}s; targets health-checked every "
+          f"{args.health_interval:g}s, healthy after {args.healthy_threshold} passing check(s); "
+          f"polled every {args.poll_interval:g}s ({rounds} rounds)")
+    print_summary(summarize(timelines))
+    health_calls = elbv2_client.calls['DescribeTargetHealth']
+    print(f"  API calls: ListTasks {ecs_client.calls['ListTasks']}, DescribeTasks {ecs_client.calls['DescribeTasks']}, "
+          f"DescribeServices {ecs_client.calls['DescribeServices']}, "
+          f"DescribeTargetHealth {health_calls} (every group every round: {rounds * len(groups)}), "
+          f"FilterLogEvents {logs_client.calls['FilterLogEvents']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-phase cold-start timeline of the fleet's tasks")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cluster', default=DEFAULT_CLUSTER)
+    common.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    common.add_argument('--state', default=STATE_PATH, help="Where watch keeps task timelines and health transitions")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    watch_parser = subparsers.add_parser('watch', parents=[common], help="Record target health transitions")
+    watch_parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls")
+    watch_parser.add_argument('--once', action='store_true', help="Poll once and exit")
+
+    report_parser = subparsers.add_parser('report', parents=[common], help="Per-phase cold-start percentiles")
+    report_parser.add_argument('--since', default='24h', help="Tasks created within this long (90m, 24h, 7d)")
+    report_parser.add_argument('--log-group', default=LOG_GROUP)
+    report_parser.add_argument('--json', action='store_true')
+
+    simulate_parser = subparsers.add_parser('simulate', help="Trace a roster's cold starts on local stand-ins")
+    simulate_parser.add_argument('--tasks', type=int, default=200)
+    simulate_parser.add_argument('--window', type=float, default=600.0, help="Seconds over which tasks start")
+    simulate_parser.add_argument('--health-interval', type=float, default=30.0)
+    simulate_parser.add_argument('--healthy-threshold', type=int, default=3)
+    simulate_parser.add_argument('--poll-interval', type=float, default=5.0)
+    simulate_parser.add_argument('--time-scale', type=float, default=0.01,
+                                 help="Real seconds per simulated second")
+    simulate_parser.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args(argv)
+    if args.command == 'simulate':
+        simulate(args)
+        return 0
+    if args.command == 'watch':
+        return watch(args)
+    return report(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,18 @@
 #!/bin/bash
 set -e
 
+# Thin wrapper around fleet-tasks.py, which resolves the task from a cached,
+# batched listing of the whole fleet instead of one describe-tasks call per
+# invocation. Use `fleet-tasks.py status` to see every task at once.
+
 # Configuration
-AWS_REGION="us-east-1"  # Change to your preferred region
-CLUSTER_NAME="dev-fleet-cluster"
+AWS_REGION="${AWS_REGION:-us-east-1}"  # Change to your preferred region
 
-# Check if task ID is provided
+# Check if a task ID or developer name is provided
 if [ -z "$1" ]; then
-  echo "Usage: $0 <task-id>"
+  echo "Usage: $0 <task-id|developer> [--exec | --ecs-exec] [--identity ~/.ssh/your_key]"
   echo "Example: $0 1a2b3c4d5e6f7g8h9i0j"
   exit 1
 fi
 
-TASK_ID=$1
-
-# Get the public IP of the task
-echo "Getting task details..."
-PUBLIC_IP=$(aws ecs describe-tasks \
-  --cluster ${CLUSTER_NAME} \
-  --tasks ${TASK_ID} \
-  --region ${AWS_REGION} \
-  --query 'tasks[0].attachments[0].details[?name==`publicIp`].value' \
-  --output text)
-
-if [ -z "$PUBLIC_IP" ]; then
-  echo "Could not find public IP for task ${TASK_ID}"
-  exit 1
-fi
-
-echo "Found public IP: ${PUBLIC_IP}"
-echo "To connect to the development environment:"
-echo "ssh -i ~/.ssh/your_key developer@${PUBLIC_IP}"
-
-# Alternatively, use ECS Exec for direct access
-echo ""
-echo "Or use ECS Exec for direct access:"
-echo "aws ecs execute-command --cluster ${CLUSTER_NAME} --task ${TASK_ID} --container dev-container --command \"/bin/bash\" --interactive --region ${AWS_REGION}"
+exec python3 "$(dirname "$0")/fleet-tasks.py" connect "$@" --region "${AWS_REGION}"
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+efs-benchmark.py - Workspace I/O benchmark for comparing EFS configurations
+
+Runs developer-shaped workloads against any mounted path, so bursting,
+elastic and provisioned throughput (or an access point vs the file system
+root, or EFS vs local disk) can be compared on the same numbers:
+
+  tree       create a source tree of many small files (checkout / unpack)
+  status     stat every file in the tree, and `git status` when git is installed
+  build      read every source file and write an object file next to it, then clean up
+  seqwrite   write one large file sequentially
+  seqread    read it back after dropping it from the page cache
+  fsync      create, write and fsync small files one at a time
+  reopen     open and close them again, a GETATTR round trip each
+
+fsync and reopen wait on one NFS round trip per file, so they show the
+distance to the mount target: run them from a task in the file system's
+zone and from one in another zone (roster "efs_availability_zone", see
+cdk-implementation/README.md) and compare. The task's zone is read from the
+ECS metadata endpoint and the file system's from DEV_FLEET_EFS_ZONE or
+--efs-zone, and both are recorded with the results.
+
+Usage:
+  efs-benchmark.py run /home/developer/workspace [--files 5000] [--large-mb 1024] [--label elastic]
+      [--latency-files 500] [--efs-zone us-east-1a] [--output elastic.json]
+  efs-benchmark.py compare bursting.json elastic.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+SOURCE_FILE_BYTES = 4096
+CHUNK_BYTES = 1 << 20
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def tree_paths(root, files, files_per_dir=50):
+    return [
+        os.path.join(root, f"pkg{index // files_per_dir:04d}", f"module{index % files_per_dir:03d}.c")
+        for index in range(files)
+    ]
+
+
+def timed(operation, items):
+    """
+    Run operation on every item, returning (total seconds, per-item latencies)
+    """
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        began = time.perf_counter()
+        operation(item)
+        latencies.append(time.perf_counter() - began)
+    return time.perf_counter() - start, latencies
+
+
+def op_result(name, elapsed, latencies, count, unit='ops'):
+    return {
+        'workload': name,
+        'seconds': round(elapsed, 3),
+        'rate': round(count / elapsed, 1) if elapsed else None,
+        'unit': f"{unit}/s",
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+
+
+def bench_tree(paths):
+    payload = b'/* generated */\n' + b'x' * (SOURCE_FILE_BYTES - 16)
+
+    def create(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(payload)
+
+    elapsed, latencies = timed(create, paths)
+    return op_result('tree', elapsed, latencies, len(paths), 'files')
+
+
+def bench_status(root, paths):
+    elapsed, latencies = timed(os.lstat, paths)
+    results = [op_result('status (stat)', elapsed, latencies, len(paths), 'files')]
+
+    if shutil.which('git'):
+        git = ['git', '-C', root, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+        subprocess.run(git + ['init', '-q'], check=True)
+        subprocess.run(git + ['add', '-A'], check=True)
+        subprocess.run(git + ['commit', '-q', '-m', 'bench'], check=True)
+        runs = []
+        for _ in range(3):
+            start = time.perf_counter()
+            subprocess.run(git + ['status', '--porcelain'], check=True, stdout=subprocess.DEVNULL)
+            runs.append(time.perf_counter() - start)
+        results.append(op_result('status (git)', sum(runs), runs, len(runs), 'runs'))
+    return results
+
+
+def bench_build(paths):
+    def compile_one(path):
+        with open(path, 'rb') as f:
+            source = f.read()
+        with open(path[:-2] + '.o', 'wb') as f:
+            f.write(source[::-1])
+
+    elapsed, latencies = timed(compile_one, paths)
+    result = op_result('build', elapsed, latencies, len(paths), 'files')
+    start = time.perf_counter()
+    for path in paths:
+        os.unlink(path[:-2] + '.o')
+    clean = time.perf_counter() - start
+    return [result, op_result('clean', clean, [], len(paths), 'files')]
+
+
+def bench_sequential(root, size_mb):
+    path = os.path.join(root, 'large.bin')
+    chunk = os.urandom(CHUNK_BYTES)
+
+    start = time.perf_counter()
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    write_seconds = time.perf_counter() - start
+
+    # Drop the file from the client page cache so the read goes to the server
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        start = time.perf_counter()
+        while os.read(fd, CHUNK_BYTES):
+            pass
+        read_seconds = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+    return [
+        op_result('seqwrite', write_seconds, [], size_mb, 'MB'),
+        op_result('seqread', read_seconds, [], size_mb, 'MB'),
+    ]
+
+
+def bench_latency(root, files):
+    """
+    Small-file operations that each wait on the server, one at a time
+    """
+    directory = os.path.join(root, 'latency')
+    os.makedirs(directory)
+    paths = [os.path.join(directory, f"file{index:05d}") for index in range(files)]
+    payload = b'x' * SOURCE_FILE_BYTES
+
+    def create(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def reopen(path):
+        # NFS close-to-open consistency revalidates the attributes on open
+        os.close(os.open(path, os.O_RDONLY))
+
+    elapsed, latencies = timed(create, paths)
+    results = [op_result('fsync', elapsed, latencies, len(paths), 'files')]
+    elapsed, latencies = timed(reopen, paths)
+    results.append(op_result('reopen', elapsed, latencies, len(paths), 'files'))
+    return results
+
+
+def task_zone():
+    """
+    Availability zone of the ECS task this runs in, or None outside ECS
+    """
+    metadata_uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4')
+    if not metadata_uri:
+        return None
+    try:
+        with urllib.request.urlopen(f"{metadata_uri}/task", timeout=2) as response:
+            return json.load(response).get('AvailabilityZone')
+    except (OSError, ValueError):
+        return None
+
+
+def placement(zone, efs_zone):
+    if not zone or not efs_zone:
+        return None
+    return 'same-zone' if zone == efs_zone else 'cross-zone'
+
+
+def run(path, files, large_mb, label, latency_files=500, efs_zone=None):
+    root = os.path.join(path, f".efs-benchmark-{uuid.uuid4().hex[:8]}")
+    os.makedirs(root)
+    try:
+        paths = tree_paths(root, files)
+        results = [bench_tree(paths)]
+        results += bench_status(root, paths)
+        results += bench_build(paths)
+        if large_mb:
+            results += bench_sequential(root, large_mb)
+        if latency_files:
+            results += bench_latency(root, latency_files)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    zone = task_zone()
+    return {
+        'label': label or path, 'path': path, 'files': files, 'large_mb': large_mb, 'results': results,
+        'zone': zone, 'efs_zone': efs_zone, 'placement': placement(zone, efs_zone),
+    }
+
+
+def print_report(report):
+    print(f"{report['label']}: {report['files']} files, {report['large_mb']} MB sequential")
+    if report.get('zone') or report.get('efs_zone'):
+        print(f"  task in {report.get('zone') or 'unknown'}, EFS in {report.get('efs_zone') or 'unknown'}"
+              f"{' (' + report['placement'] + ')' if report.get('placement') else ''}")
+    print(f"  {'workload':<16} {'seconds':>9} {'rate':>14} {'p50':>10} {'p99':>10}")
+    for r in report['results']:
+        p50 = f"{r['p50_ms']:.2f}ms" if r['p50_ms'] is not None else '-'
+        p99 = f"{r['p99_ms']:.2f}ms" if r['p99_ms'] is not None else '-'
+        print(f"  {r['workload']:<16} {r['seconds']:>9.2f} {r['rate']:>8} {r['unit']:<5} {p50:>10} {p99:>10}")
+
+
+def compare(reports):
+    baseline = {r['workload']: r for r in reports[0]['results']}
+    print(f"{'workload':<16} " + ' '.join(f"{report['label'][:18]:>18}" for report in reports))
+    for workload in baseline:
+        row = []
+        for report in reports:
+            result = next((r for r in report['results'] if r['workload'] == workload), None)
+            if result is None:
+                row.append(f"{'-':>18}")
+                continue
+            speedup = baseline[workload]['seconds'] / result['seconds'] if result['seconds'] else 0
+            row.append(f"{result['seconds']:>9.2f}s ({speedup:4.1f}x)")
+        print(f"{workload:<16} " + ' '.join(row))
+    # Per-operation latency is what zone placement changes
+    for workload in ('fsync', 'reopen'):
+        if workload not in baseline:
+            continue
+        row = []
+        for report in reports:
+            result = next((r for r in report['results'] if r['workload'] == workload), None)
+            latency = f"{result['p50_ms']:.2f}/{result['p99_ms']:.2f}ms" if result else '-'
+            row.append(f"{latency:>18}")
+        print(f"{workload + ' p50/p99':<16} " + ' '.join(row))
+    placements = [report.get('placement') or '-' for report in reports]
+    if any(p != '-' for p in placements):
+        print(f"{'placement':<16} " + ' '.join(f"{p:>18}" for p in placements))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Workspace I/O benchmark for comparing EFS configurations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the workloads against a mounted path")
+    run_parser.add_argument('path')
+    run_parser.add_argument('--files', type=int, default=5000, help="Files in the generated source tree")
+    run_parser.add_argument('--large-mb', type=int, default=1024, help="Size of the sequential file (0 to skip)")
+    run_parser.add_argument('--latency-files', type=int, default=500,
+                            help="Files for the fsync/reopen round-trip workloads (0 to skip)")
+    run_parser.add_argument('--efs-zone', default=os.environ.get('DEV_FLEET_EFS_ZONE'),
+                            help="Availability zone of the mounted file system's mount target")
+    run_parser.add_argument('--label', help="Name for this configuration in reports")
+    run_parser.add_argument('--output', help="Write the results as JSON for `compare`")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare saved runs; the first is the baseline")
+    compare_parser.add_argument('reports', nargs='+')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        reports = []
+        for path in args.reports:
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+        compare(reports)
+        return 0
+
+    if not os.path.isdir(args.path):
+        print(f"Error: {args.path} is not a directory", file=sys.stderr)
+        return 1
+    report = run(args.path, args.files, args.large_mb, args.label, args.latency_files, args.efs_zone)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
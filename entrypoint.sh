@@ -1,8 +1,75 @@
 #!/bin/bash
 # entrypoint.sh - Start SSH server and HTTP server for health checks
 
-# Start the HTTP server for health checks
-python3 -m http.server 80 --directory /var/www/html &
+# Roster environments mount the workspace through an EFS access point that
+# enforces the developer's own uid/gid. Give the developer user that identity
+# so workspace files are theirs (git refuses repositories owned by someone
+# else). usermod -u would walk the EFS workspace, so edit the entries directly
+# and only re-own files on the local filesystem (-xdev).
+if [ -n "${DEV_FLEET_UID}" ] && [ "$(id -u developer)" != "${DEV_FLEET_UID}" ]; then
+  OLD_UID=$(id -u developer)
+  OLD_GID=$(id -g developer)
+  DEV_FLEET_GID="${DEV_FLEET_GID:-${DEV_FLEET_UID}}"
+  sed -i "s/^developer:x:${OLD_UID}:${OLD_GID}:/developer:x:${DEV_FLEET_UID}:${DEV_FLEET_GID}:/" /etc/passwd
+  sed -i "s/^developer:x:${OLD_GID}:/developer:x:${DEV_FLEET_GID}:/" /etc/group
+  find /home/developer -xdev -uid "${OLD_UID}" -exec chown -h "${DEV_FLEET_UID}:${DEV_FLEET_GID}" {} +
+fi
 
-# Start SSH server in the foreground
-/usr/sbin/sshd -D
+# Start the health server (/live for the container check, /ready for the load balancers)
+/usr/local/bin/health-server.py serve --port 80 &
+
+# Publish SSH session and pressure metrics as EMF lines on stdout (awslogs ships
+# them to /ecs/dev-environment, where CloudWatch extracts the metrics)
+/usr/local/bin/session-metrics-agent.py --interval "${METRICS_INTERVAL:-60}" &
+
+# Keep the SSH key index in sync with S3. The first refresh runs before sshd
+# starts so keys are available for the first connection. The check makes a
+# container that cannot sync keys say so at the top of its log.
+if [ -n "${DEV_FLEET_KEYS_BUCKET}" ]; then
+  if ! /usr/local/bin/authorized-keys-helper.py check; then
+    echo "entrypoint: SSH keys will not sync; only keys already in the index can log in" >&2
+  fi
+  /usr/local/bin/authorized-keys-helper.py refresh --once
+  /usr/local/bin/authorized-keys-helper.py refresh --interval "${KEYS_REFRESH_INTERVAL:-5}" &
+fi
+
+# Workspace snapshots, including the one interruption-handler.py takes on
+# stop, need S3 access: find out now rather than when the task is stopping
+if [ -n "${DEV_FLEET_SNAPSHOT_BUCKET}" ]; then
+  if ! /usr/local/bin/workspace-snapshot.py check; then
+    echo "entrypoint: workspace snapshots will fail in this container" >&2
+  fi
+fi
+
+# Shared pip/apt/ccache caches on EFS: point the tools at them, serve pip and
+# apt through the local pull-through proxy, and keep the cache within its
+# size budget (only one container's janitor evicts at a time)
+if [ -n "${DEV_FLEET_CACHE_DIR}" ] && [ -d "${DEV_FLEET_CACHE_DIR}" ]; then
+  /usr/local/bin/toolchain-cache.py configure
+  /usr/local/bin/toolchain-cache.py serve &
+  /usr/local/bin/toolchain-cache.py janitor --interval "${CACHE_JANITOR_INTERVAL:-1800}" &
+fi
+
+# Shared bare git mirrors on EFS: add the `git mclone` alias and keep the
+# mirrors of DEV_FLEET_GIT_MIRRORS fetched (containers take turns per mirror)
+if [ -n "${DEV_FLEET_GIT_MIRROR_DIR}" ] && [ -d "${DEV_FLEET_GIT_MIRROR_DIR}" ]; then
+  /usr/local/bin/git-mirror.py configure
+  /usr/local/bin/git-mirror.py serve --interval "${GIT_MIRROR_FETCH_INTERVAL:-300}" &
+fi
+
+# Start SSH server. ECS sends SIGTERM before stopping the task (including a
+# Fargate Spot interruption notice), so checkpoint editors, dirty pages and
+# sessions before the stop timeout runs out.
+/usr/sbin/sshd -D &
+SSHD_PID=$!
+
+# Log the moment sshd first answers, for the cold-start timeline
+# (cold-start-trace.py)
+/usr/local/bin/health-server.py ready-marker &
+
+checkpoint() {
+  /usr/local/bin/interruption-handler.py checkpoint --sshd-pid "${SSHD_PID}"
+  exit 0
+}
+trap checkpoint TERM INT
+wait "${SSHD_PID}"
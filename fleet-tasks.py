@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+fleet-tasks.py - Fleet-wide task status and connect helper
+
+Lists every task across the fleet's clusters (ListClusters and ListTasks,
+paginated), describes them 100 at a time, and resolves their ENIs' public
+and private addresses in one DescribeNetworkInterfaces call per 200 tasks.
+Clusters are fetched in parallel, so the status of hundreds of tasks costs
+one short round of calls instead of one CLI process and API call per task.
+The result is cached for a few seconds, and `connect` resolves tasks from
+the same cache.
+
+Usage:
+  fleet-tasks.py status [--cluster dev-fleet-cluster ...] [--filter alice] [--refresh] [--json]
+  fleet-tasks.py connect <task-id|developer> [--identity ~/.ssh/id_ed25519] [--exec | --ecs-exec]
+  fleet-tasks.py bench [--tasks 500] [--clusters 3] [--api-latency 0.05]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from fleet_ecs import TASK_FAMILY_PREFIX, fetch_fleet, find_task, list_task_arns, task_network_interface_id
+
+CONTAINER_NAME = 'dev-container'
+CACHE_DIR = os.path.expanduser('~/.cache/dev-fleet')
+CACHE_TTL = 30.0
+
+
+class FleetCache:
+    """
+    The last fleet listing, kept in a file so repeated invocations (status,
+    then connect) within ttl seconds make no API calls
+    """
+
+    def __init__(self, region, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+        self.path = os.path.join(cache_dir, f"fleet-tasks-{region}.json")
+        self.ttl = ttl
+
+    def load(self, clusters=None):
+        try:
+            with open(self.path, 'r') as f:
+                fleet = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - fleet['fetched_at'] > self.ttl:
+            return None
+        if clusters and not set(clusters) <= set(fleet['clusters']):
+            return None
+        return fleet
+
+    def save(self, fleet):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}"
+        with open(temporary, 'w') as f:
+            json.dump(fleet, f)
+        os.replace(temporary, self.path)
+
+
+def get_fleet(ecs_client, ec2_client, cache, clusters=None, refresh=False):
+    """
+    Returns (fleet, from_cache)
+    """
+    fleet = None if refresh else cache.load(clusters)
+    if fleet is not None:
+        return fleet, True
+    fleet = fetch_fleet(ecs_client, ec2_client, clusters)
+    cache.save(fleet)
+    return fleet, False
+
+
+def select_rows(fleet, clusters=None, text=None):
+    rows = fleet['tasks']
+    if clusters:
+        rows = [row for row in rows if row['cluster'] in clusters]
+    if text:
+        rows = [row for row in rows if any(text in str(row[field] or '') for field in
+                                           ('task_id', 'developer', 'private_ip', 'public_ip', 'cluster'))]
+    return rows
+
+
+def format_uptime(started_at, now):
+    if not started_at:
+        return '-'
+    seconds = int(now - started_at)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes = seconds // 60
+    if days:
+        return f"{days}d{hours:02d}h"
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m"
+
+
+def print_status(rows, now):
+    print(f"{'CLUSTER':<20} {'TASK':<32} {'DEVELOPER':<14} {'STATUS':<12} {'HEALTH':<10} {'UPTIME':>7} "
+          f"{'PUBLIC IP':<15} {'PRIVATE IP':<15}")
+    for row in sorted(rows, key=lambda row: (row['cluster'], row['developer'] or '', row['task_id'])):
+        print(f"{row['cluster'][:20]:<20} {row['task_id'][:32]:<32} {(row['developer'] or '-')[:14]:<14} "
+              f"{row['status']:<12} {row['health']:<10} {format_uptime(row['started_at'], now):>7} "
+              f"{row['public_ip'] or '-':<15} {row['private_ip'] or '-':<15}")
+
+
+def ssh_command(row, identity=None, private=False):
+    address = row['private_ip'] if private else row['public_ip'] or row['private_ip']
+    command = ['ssh']
+    if identity:
+        command += ['-i', os.path.expanduser(identity)]
+    return command + [f"developer@{address}"]
+
+
+def ecs_exec_command(row, region):
+    return ['aws', 'ecs', 'execute-command', '--cluster', row['cluster'], '--task', row['task_id'],
+            '--container', CONTAINER_NAME, '--command', '/bin/bash', '--interactive', '--region', region]
+
+
+def bench(tasks, clusters, api_latency):
+    """
+    Time the batched listing against one DescribeTasks and one
+    DescribeNetworkInterfaces call per task (what looping over
+    connect-to-container.sh costs), on the local stand-ins
+    """
+    import tempfile
+    from local_aws import LocalEC2, LocalECS
+
+    ecs_client = LocalECS(start_delay=0, api_latency=api_latency)
+    ec2_client = LocalEC2(ecs_client, api_latency=api_latency)
+    names = [f"dev-fleet-cluster-{index}" for index in range(clusters)]
+    for index in range(tasks):
+        ecs_client.run_task(cluster=names[index % clusters],
+                            taskDefinition=f"arn:aws:ecs:us-east-1:123456789012:task-definition/"
+                                           f"{TASK_FAMILY_PREFIX}dev{index:04d}:1")
+    ecs_client.calls.clear()
+
+    start = time.perf_counter()
+    for cluster in names:
+        for arn in list_task_arns(ecs_client, cluster):
+            task = ecs_client.describe_tasks(cluster=cluster, tasks=[arn])['tasks'][0]
+            ec2_client.describe_network_interfaces(NetworkInterfaceIds=[task_network_interface_id(task)])
+    per_task = time.perf_counter() - start
+    per_task_calls = sum(ecs_client.calls.values()) + sum(ec2_client.calls.values())
+    ecs_client.calls.clear()
+    ec2_client.calls.clear()
+
+    cache = FleetCache('bench', cache_dir=tempfile.mkdtemp(prefix='fleet-tasks-'))
+    start = time.perf_counter()
+    fleet, _ = get_fleet(ecs_client, ec2_client, cache)
+    batched = time.perf_counter() - start
+    batched_calls = dict(ecs_client.calls) | dict(ec2_client.calls)
+
+    start = time.perf_counter()
+    cached_fleet, from_cache = get_fleet(ecs_client, ec2_client, cache)
+    row = find_task(cached_fleet, 'dev0042')
+    cached = time.perf_counter() - start
+    assert from_cache and row and row['public_ip']
+
+    print(f"{tasks} tasks in {clusters} clusters, {api_latency * 1000:.0f}ms per API call")
+    print(f"  per task (script loop)   {per_task:>7.2f}s  {per_task_calls} calls")
+    print(f"  batched listing          {batched:>7.2f}s  {sum(batched_calls.values())} calls {batched_calls}")
+    print(f"  cached status + connect  {cached * 1000:>7.1f}ms  0 calls "
+          f"(dev0042 -> {row['public_ip']}, {len(fleet['tasks'])} tasks listed)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fleet-wide task status and connect helper")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    common.add_argument('--cluster', action='append', dest='clusters',
+                        help="Cluster to include (repeatable; default: every cluster)")
+    common.add_argument('--max-age', type=float, default=float(os.environ.get('FLEET_TASKS_CACHE_TTL', CACHE_TTL)),
+                        help="Seconds a cached listing is reused")
+    common.add_argument('--refresh', action='store_true', help="Ignore the cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    status_parser = subparsers.add_parser('status', parents=[common], help="Show every task in the fleet")
+    status_parser.add_argument('--filter', help="Only rows containing this text (developer, task ID, IP)")
+    status_parser.add_argument('--json', action='store_true')
+
+    connect_parser = subparsers.add_parser('connect', parents=[common], help="Show or run the commands to reach a task")
+    connect_parser.add_argument('target', help="Task ID, ID prefix, ARN or developer name")
+    connect_parser.add_argument('--identity', help="SSH private key")
+    connect_parser.add_argument('--private', action='store_true', help="Use the private IP (from inside the VPC)")
+    mode = connect_parser.add_mutually_exclusive_group()
+    mode.add_argument('--exec', action='store_true', help="Run ssh instead of printing the command")
+    mode.add_argument('--ecs-exec', action='store_true', help="Open a shell with ECS Exec")
+
+    bench_parser = subparsers.add_parser('bench', help="Compare batched and per-task listing on local stand-ins")
+    bench_parser.add_argument('--tasks', type=int, default=500)
+    bench_parser.add_argument('--clusters', type=int, default=3)
+    bench_parser.add_argument('--api-latency', type=float, default=0.05)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        bench(args.tasks, args.clusters, args.api_latency)
+        return 0
+
+    import boto3
+    ecs_client = boto3.client('ecs', region_name=args.region)
+    ec2_client = boto3.client('ec2', region_name=args.region)
+    cache = FleetCache(args.region, ttl=args.max_age)
+    fleet, from_cache = get_fleet(ecs_client, ec2_client, cache, args.clusters, args.refresh)
+
+    if args.command == 'status':
+        rows = select_rows(fleet, args.clusters, args.filter)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+            return 0
+        print_status(rows, time.time())
+        age = time.time() - fleet['fetched_at']
+        fetched = datetime.fromtimestamp(fleet['fetched_at'], timezone.utc).strftime('%H:%M:%S UTC')
+        print(f"{len(rows)} task(s); fetched {fetched}" + (f" (cached, {age:.0f}s old)" if from_cache else ''))
+        return 0
+
+    row = find_task(fleet, args.target)
+    if row is None and from_cache:
+        # Started since the cached listing
+        fleet, _ = get_fleet(ecs_client, ec2_client, cache, args.clusters, refresh=True)
+        row = find_task(fleet, args.target)
+    if row is None:
+        print(f"Could not find a task for {args.target}", file=sys.stderr)
+        return 1
+    if not (row['public_ip'] or row['private_ip']):
+        print(f"Task {row['task_id']} has no IP address yet (status {row['status']})", file=sys.stderr)
+        return 1
+
+    ssh = ssh_command(row, args.identity, args.private)
+    ecs_exec = ecs_exec_command(row, args.region)
+    if args.exec:
+        os.execvp(ssh[0], ssh)
+    if args.ecs_exec:
+        os.execvp(ecs_exec[0], ecs_exec)
+    print(f"Task {row['task_id']} ({row['developer'] or 'shared'}) in {row['cluster']}: "
+          f"{row['status']}, {row['health']}, public IP {row['public_ip'] or '-'}, private IP {row['private_ip']}")
+    print("To connect to the development environment:")
+    print(' '.join(ssh))
+    print("")
+    print("Or use ECS Exec for direct access:")
+    print(' '.join(ecs_exec))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
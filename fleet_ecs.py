@@ -0,0 +1,221 @@
+"""
+Batched ECS helpers shared by the fleet tools.
+
+DescribeTasks accepts at most 100 task ARNs, DescribeServices 10 services,
+RunTask starts at most 10 tasks per call and a DescribeNetworkInterfaces filter takes at most 200
+values, so every tool goes through these helpers instead of making one API
+call per task.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DESCRIBE_TASKS_BATCH = 100
+DESCRIBE_SERVICES_BATCH = 10
+RUN_TASK_BATCH = 10
+NETWORK_INTERFACE_BATCH = 200
+
+DEVELOPER_TAG = 'dev-fleet:developer'
+TASK_FAMILY_PREFIX = 'dev-environment-'
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def list_clusters(ecs_client):
+    """
+    All cluster ARNs in the region, following ListClusters pagination
+    """
+    arns = []
+    for page in ecs_client.get_paginator('list_clusters').paginate():
+        arns.extend(page['clusterArns'])
+    return arns
+
+
+def list_task_arns(ecs_client, cluster, desired_status='RUNNING', started_by=None):
+    """
+    All task ARNs in a cluster, following ListTasks pagination
+    """
+    params = {'cluster': cluster, 'desiredStatus': desired_status}
+    if started_by:
+        params['startedBy'] = started_by
+    arns = []
+    paginator = ecs_client.get_paginator('list_tasks')
+    for page in paginator.paginate(**params):
+        arns.extend(page['taskArns'])
+    return arns
+
+
+def describe_tasks(ecs_client, cluster, task_arns, include_tags=False):
+    """
+    Describe any number of tasks in batches of 100
+    """
+    tasks = []
+    for batch in chunks(task_arns, DESCRIBE_TASKS_BATCH):
+        params = {'cluster': cluster, 'tasks': batch}
+        if include_tags:
+            params['include'] = ['TAGS']
+        tasks.extend(ecs_client.describe_tasks(**params)['tasks'])
+    return tasks
+
+
+def describe_services(ecs_client, cluster, service_names):
+    """
+    Describe any number of services in batches of 10
+    """
+    services = []
+    for batch in chunks(service_names, DESCRIBE_SERVICES_BATCH):
+        services.extend(ecs_client.describe_services(cluster=cluster, services=batch)['services'])
+    return services
+
+
+def run_tasks(ecs_client, count, **run_task_params):
+    """
+    Start count tasks using as few RunTask calls as possible
+    """
+    tasks = []
+    failures = []
+    remaining = count
+    while remaining > 0:
+        batch = min(remaining, RUN_TASK_BATCH)
+        response = ecs_client.run_task(count=batch, **run_task_params)
+        tasks.extend(response['tasks'])
+        failures.extend(response.get('failures', []))
+        remaining -= batch
+    return tasks, failures
+
+
+def capacity_provider_strategy(spot_weight=0, on_demand_weight=1, on_demand_base=0):
+    """
+    RunTask capacityProviderStrategy matching the stack's
+    capacity_provider_strategies (cdk-implementation/lib/developer_fleet.py),
+    or None for the plain FARGATE launch type when nothing runs on Spot
+    """
+    if min(spot_weight, on_demand_weight, on_demand_base) < 0:
+        raise ValueError("Capacity provider weights and base must not be negative")
+    if not spot_weight:
+        return None
+    strategy = [{'capacityProvider': 'FARGATE_SPOT', 'weight': spot_weight}]
+    if on_demand_weight or on_demand_base:
+        on_demand = {'capacityProvider': 'FARGATE', 'weight': on_demand_weight}
+        if on_demand_base:
+            on_demand['base'] = on_demand_base
+        strategy.insert(0, on_demand)
+    return strategy
+
+
+def task_private_ip(task):
+    """
+    Private IPv4 address of an awsvpc task, if its ENI is attached
+    """
+    for attachment in task.get('attachments', []):
+        for detail in attachment.get('details', []):
+            if detail['name'] == 'privateIPv4Address':
+                return detail['value']
+    return None
+
+
+def task_network_interface_id(task):
+    for attachment in task.get('attachments', []):
+        for detail in attachment.get('details', []):
+            if detail['name'] == 'networkInterfaceId':
+                return detail['value']
+    return None
+
+
+def network_interface_addresses(ec2_client, eni_ids):
+    """
+    Map ENI ID -> {'private': ip, 'public': ip or None} for any number of
+    ENIs, 200 per call. A filter is used instead of NetworkInterfaceIds so
+    an ENI deleted in the meantime is left out instead of failing the call.
+    """
+    addresses = {}
+    for batch in chunks(sorted(set(eni_ids)), NETWORK_INTERFACE_BATCH):
+        paginator = ec2_client.get_paginator('describe_network_interfaces')
+        for page in paginator.paginate(Filters=[{'Name': 'network-interface-id', 'Values': batch}]):
+            for eni in page['NetworkInterfaces']:
+                addresses[eni['NetworkInterfaceId']] = {
+                    'private': eni.get('PrivateIpAddress'),
+                    'public': eni.get('Association', {}).get('PublicIp'),
+                }
+    return addresses
+
+
+def task_tags(task):
+    return {tag['key']: tag['value'] for tag in task.get('tags', [])}
+
+
+def task_developer(task):
+    """
+    The developer a task belongs to: the warm pool's assignment tag, else
+    the roster environment's task definition family
+    """
+    developer = task_tags(task).get(DEVELOPER_TAG)
+    if developer:
+        return developer
+    family = task.get('taskDefinitionArn', '').split('/')[-1].split(':')[0]
+    if family.startswith(TASK_FAMILY_PREFIX):
+        return family[len(TASK_FAMILY_PREFIX):]
+    return None
+
+
+def _epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def fetch_cluster(ecs_client, cluster):
+    arns = list_task_arns(ecs_client, cluster)
+    return cluster, describe_tasks(ecs_client, cluster, arns, include_tags=True)
+
+
+def fetch_fleet(ecs_client, ec2_client, clusters=None, workers=8):
+    """
+    One row per task in the given clusters (all clusters when None)
+    """
+    clusters = clusters or [arn.split('/')[-1] for arn in list_clusters(ecs_client)]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(clusters)))) as pool:
+        described = list(pool.map(lambda cluster: fetch_cluster(ecs_client, cluster), clusters))
+
+    tasks = [(cluster, task) for cluster, cluster_tasks in described for task in cluster_tasks]
+    addresses = network_interface_addresses(
+        ec2_client, [eni for eni in (task_network_interface_id(task) for _, task in tasks) if eni])
+
+    rows = []
+    for cluster, task in tasks:
+        address = addresses.get(task_network_interface_id(task), {})
+        rows.append({
+            'cluster': cluster,
+            'task_id': task['taskArn'].split('/')[-1],
+            'task_arn': task['taskArn'],
+            'developer': task_developer(task),
+            'status': task['lastStatus'],
+            'health': task.get('healthStatus', 'UNKNOWN'),
+            'private_ip': address.get('private') or task_private_ip(task),
+            'public_ip': address.get('public'),
+            'started_at': _epoch(task.get('startedAt')),
+        })
+    return {'fetched_at': time.time(), 'clusters': clusters, 'tasks': rows}
+
+
+def find_task(fleet, target):
+    """
+    The task row for a task ID, ID prefix, ARN or developer name
+    """
+    rows = fleet['tasks']
+    for matches in (
+        [row for row in rows if target in (row['task_id'], row['task_arn'])],
+        [row for row in rows if row['developer'] == target],
+        [row for row in rows if len(target) >= 6 and row['task_id'].startswith(target)],
+    ):
+        running = [row for row in matches if row['status'] == 'RUNNING'] or matches
+        if running:
+            return max(running, key=lambda row: row['started_at'] or 0)
+    return None
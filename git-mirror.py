@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+git-mirror.py - Shared bare mirrors of the team's repositories on EFS
+
+A fresh workspace starts empty, so every developer otherwise clones the same
+large repositories in full from the remote. Every container mounts one
+mirror directory from the fleet EFS. Clones borrow the mirror's objects
+through --reference (objects/info/alternates), so only objects newer than
+the mirror's last fetch cross the network and a multi-GB clone writes little
+more than its checkout.
+
+Layout under DEV_FLEET_GIT_MIRROR_DIR:
+  mirrors/<name>.git  bare mirrors (`git clone --mirror`)
+  state/<name>.json   the mirror's URL and last fetch: started, seconds, result, fetch count
+  locks/<name>.lock   held while the mirror is created, fetched or repacked
+  tmp/                mirrors being created, renamed into mirrors/ when complete
+
+Every container runs the fetch scheduler (`serve`). It refreshes each mirror
+every --interval with an incremental `git fetch --prune` and answers fetch
+requests from `clone` on 127.0.0.1. Requests are coalesced: a request made
+at time T is answered by any fetch that started at or after T (or within its
+max age), so requests arriving while a fetch runs wait for it, and a burst
+of requests from many containers costs at most one fetch after the running
+one. Threads of one scheduler coalesce on a lock per mirror, containers on
+the mirror's lock file on EFS; when another container is already fetching,
+the scheduler skips its own round.
+
+Objects are never pruned from a mirror: a workspace borrowing an object
+would break if it disappeared. Once a mirror has more than MAX_PACKS packs
+from incremental fetches they are repacked into one, keeping unreachable
+objects.
+
+The image sets `git mclone` to `git-mirror.py clone`, which clones with
+--reference when the URL has a mirror and plainly otherwise.
+
+Usage (every command takes [--mirror-dir DIR] [--port 9419] before it):
+  git-mirror.py configure             # at container start, as root
+  git-mirror.py serve [--interval 300]
+  git-mirror.py add URL
+  git-mirror.py clone URL [DIRECTORY] [--max-age 60] [-- git clone options]
+  git-mirror.py attach [REPOSITORY]   # borrow from the mirror in an existing clone
+  git-mirror.py fetch URL [--max-age 0]
+  git-mirror.py status [--json]
+  git-mirror.py simulate [--files 2000] [--file-kb 32] [--commits 50] [--clients 8]
+"""
+
+import argparse
+import collections
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MIRROR_DIR = os.environ.get('DEV_FLEET_GIT_MIRROR_DIR', '/mnt/dev-fleet-git')
+SCHEDULER_PORT = 9419
+# Seconds between scheduled fetches of each mirror
+FETCH_INTERVAL = 300
+# A clone accepts a mirror fetched this recently; anything newer comes from
+# the remote as part of the clone itself
+CLONE_MAX_AGE = 60
+REQUEST_TIMEOUT = 3600
+# Incremental fetches add one pack each; past this many, repack into one
+MAX_PACKS = 16
+# Mirror settings: never gc or prune on their own, since workspaces borrow
+# their objects
+MIRROR_CONFIG = {
+    'gc.auto': '0',
+    'gc.pruneExpire': 'never',
+    'fetch.prune': 'true',
+}
+GITCONFIG_ALIAS = '!/usr/local/bin/git-mirror.py clone'
+
+
+def normalize_url(url):
+    """
+    One key for the spellings of a repository URL: scheme, user, a
+    trailing .git, /.git and slash are dropped and the host is lowercased, so
+    git@github.com:org/repo and https://github.com/org/repo.git share a mirror
+    """
+    url = url.strip()
+    scp = re.match(r'^(?:[^@/]+@)?([^:/]+):(?!//)(.+)$', url)
+    if scp:
+        host, path = scp.group(1), scp.group(2)
+    else:
+        parsed = urllib.parse.urlsplit(url)
+        host, path = (parsed.hostname or '').lower(), parsed.path
+        if parsed.port:
+            host = f"{host}:{parsed.port}"
+    path = path.strip('/')
+    if path.endswith('/.git'):
+        # A local working tree, e.g. file:///src/repo/.git
+        path = path[:-5]
+    elif path.endswith('.git'):
+        path = path[:-4]
+    return f"{host}/{path}" if host else f"/{path}"
+
+
+def mirror_name(url):
+    key = normalize_url(url)
+    readable = re.sub(r'[^A-Za-z0-9._-]+', '-', key).strip('-')[-64:]
+    return f"{readable}-{hashlib.sha256(key.encode()).hexdigest()[:10]}"
+
+
+def directory_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def git(args, git_dir=None, check=True, capture=True):
+    """
+    Run git. Mirrors on EFS are owned by the access point's POSIX user, not
+    the caller, so git's ownership check is lifted for the one repository
+    """
+    command = ['git']
+    if git_dir:
+        command += ['-c', f"safe.directory={git_dir}", f"--git-dir={git_dir}"]
+    result = subprocess.run(command + args, capture_output=capture, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError((result.stderr or '').strip() or f"git {args[0]} exited {result.returncode}")
+    return result
+
+
+class Mirrors:
+    def __init__(self, root):
+        self.root = root
+        # lockf locks belong to the process, so threads coalesce on these
+        self._thread_locks = collections.defaultdict(threading.Lock)
+        self._guard = threading.Lock()
+
+    def path(self, url):
+        return os.path.join(self.root, 'mirrors', f"{mirror_name(url)}.git")
+
+    def state_path(self, url):
+        return os.path.join(self.root, 'state', f"{mirror_name(url)}.json")
+
+    def exists(self, url):
+        return os.path.isdir(self.path(url))
+
+    def read_state(self, url):
+        try:
+            with open(self.state_path(url), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_state(self, url, state):
+        path = self.state_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def urls(self):
+        """
+        URL of every mirror, from their state files
+        """
+        urls = []
+        for path in sorted(glob.glob(os.path.join(self.root, 'state', '*.json'))):
+            try:
+                with open(path, 'r') as f:
+                    url = json.load(f).get('url')
+            except (OSError, ValueError):
+                continue
+            if url and self.exists(url):
+                urls.append(url)
+        return urls
+
+    def _thread_lock(self, url):
+        with self._guard:
+            return self._thread_locks[mirror_name(url)]
+
+    def _locked(self, url, wait):
+        """
+        Open and lock the mirror's lock file, or None if wait is False and
+        another container holds it
+        """
+        path = os.path.join(self.root, 'locks', f"{mirror_name(url)}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(path, 'a')
+        try:
+            fcntl.lockf(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    @staticmethod
+    def _covers(state, requested_at, max_age):
+        # A failed attempt answers the requests waiting on it too, so an
+        # unreachable remote is not retried once per waiting request
+        return state.get('started', 0) >= requested_at - max_age
+
+    def fetch(self, url, requested_at=None, max_age=0, create=False, wait=True):
+        """
+        Make sure the mirror has everything the remote had at requested_at
+        (less max_age seconds), fetching only when no fetch since then has.
+        Returns the mirror's state with 'coalesced' set when another
+        request's fetch answered this one, or None when wait is False and
+        another container is fetching.
+        """
+        requested_at = time.time() if requested_at is None else requested_at
+        if not self.exists(url) and not create:
+            raise LookupError(f"no mirror of {url}")
+
+        state = self.read_state(url)
+        if self.exists(url) and self._covers(state, requested_at, max_age):
+            return dict(state, coalesced=True)
+
+        thread_lock = self._thread_lock(url)
+        if not thread_lock.acquire(blocking=wait):
+            return None
+        try:
+            lock = self._locked(url, wait)
+            if lock is None:
+                return None
+            with lock:
+                # Whoever held the lock may have fetched for us
+                state = self.read_state(url)
+                if self.exists(url) and self._covers(state, requested_at, max_age):
+                    return dict(state, coalesced=True)
+                return dict(self._update(url, state), coalesced=False)
+        finally:
+            thread_lock.release()
+
+    def _update(self, url, state):
+        """
+        Create or incrementally fetch the mirror. Called with its lock held.
+        """
+        path = self.path(url)
+        started = time.time()
+        begin = time.perf_counter()
+        created = not os.path.isdir(path)
+        error = None
+        try:
+            if created:
+                tmp_path = os.path.join(self.root, 'tmp', f"{mirror_name(url)}-{uuid.uuid4().hex[:8]}.git")
+                os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+                try:
+                    git(['clone', '--mirror', '--quiet', url, tmp_path])
+                    for key, value in MIRROR_CONFIG.items():
+                        git(['config', key, value], git_dir=tmp_path)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Readers never see a half-cloned mirror
+                    os.rename(tmp_path, path)
+                finally:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+            else:
+                git(['fetch', '--prune', '--quiet', 'origin'], git_dir=path)
+            repacked = self._maybe_repack(path)
+        except RuntimeError as e:
+            error, repacked = str(e), False
+
+        state = {
+            'url': url,
+            'started': started,
+            'seconds': round(time.perf_counter() - begin, 3),
+            'ok': error is None,
+            'error': error,
+            'created': created,
+            'repacked': repacked,
+            'fetches': state.get('fetches', 0) + 1,
+            'last_ok': started if error is None else state.get('last_ok'),
+        }
+        self.write_state(url, state)
+        if error is not None and created:
+            raise RuntimeError(error)
+        return state
+
+    @staticmethod
+    def _maybe_repack(path):
+        packs = glob.glob(os.path.join(path, 'objects', 'pack', '*.pack'))
+        if len(packs) <= MAX_PACKS:
+            return False
+        git(['repack', '-a', '-d', '--keep-unreachable', '-q'], git_dir=path)
+        return True
+
+    def status(self):
+        rows = []
+        for url in self.urls():
+            state = self.read_state(url)
+            rows.append({
+                'url': url,
+                'path': self.path(url),
+                'bytes': directory_size(self.path(url)),
+                'packs': len(glob.glob(os.path.join(self.path(url), 'objects', 'pack', '*.pack'))),
+                **{key: state.get(key) for key in ('started', 'last_ok', 'seconds', 'ok', 'error', 'fetches')},
+            })
+        return rows
+
+
+class SchedulerHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self.reply(404, {'error': 'not found'})
+        self.reply(200, {'mirrors': self.server.mirrors.status(), 'counters': dict(self.server.counters)})
+
+    def do_POST(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parsed.query)
+        if parsed.path != '/fetch' or 'url' not in query:
+            return self.reply(404, {'error': 'expected POST /fetch?url=...'})
+        url = query['url'][0]
+        requested_at = time.time()
+        try:
+            state = self.server.mirrors.fetch(
+                url, requested_at,
+                max_age=float(query.get('max_age', ['0'])[0]),
+                create=query.get('create', ['0'])[0] == '1'
+            )
+        except LookupError as e:
+            return self.reply(404, {'error': str(e)})
+        except RuntimeError as e:
+            return self.reply(502, {'error': str(e)})
+        self.server.count('coalesced' if state['coalesced'] else 'fetched')
+        self.reply(200, dict(state, path=self.server.mirrors.path(url)))
+
+
+class Scheduler(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, mirrors, port):
+        super().__init__(('127.0.0.1', port), SchedulerHandler)
+        self.mirrors = mirrors
+        self.counters = collections.Counter()
+        self._counter_lock = threading.Lock()
+
+    def count(self, key):
+        with self._counter_lock:
+            self.counters[key] += 1
+
+
+def schedule(mirrors, interval, configured, stop=None):
+    """
+    Create the configured mirrors, then fetch every mirror once per
+    interval. A round skips mirrors another container is fetching, and the
+    start is jittered so containers started together do not line up.
+    """
+    stop = stop or threading.Event()
+    for url in configured:
+        try:
+            mirrors.fetch(url, max_age=interval, create=True)
+        except RuntimeError as e:
+            print(f"git-mirror: could not create a mirror of {url}: {e}", file=sys.stderr)
+    stop.wait(random.uniform(0, interval / 10))
+    while not stop.is_set():
+        for url in mirrors.urls():
+            try:
+                state = mirrors.fetch(url, max_age=interval * 0.9, wait=False)
+            except RuntimeError as e:
+                print(f"git-mirror: fetch of {url} failed: {e}", file=sys.stderr)
+                continue
+            if state and not state['coalesced']:
+                print(json.dumps({'event': 'git-mirror-fetch', 'url': url, 'seconds': state['seconds'],
+                                  'ok': state['ok'], 'repacked': state['repacked']}), flush=True)
+        stop.wait(interval)
+
+
+def serve(root, port, interval, configured):
+    mirrors = Mirrors(root)
+    server = Scheduler(mirrors, port)
+    threading.Thread(target=schedule, args=(mirrors, interval, configured), daemon=True).start()
+    print(f"git-mirror: scheduler on 127.0.0.1:{port} for {root}", file=sys.stderr)
+    server.serve_forever()
+
+
+def request_fetch(root, url, max_age, create=False, port=SCHEDULER_PORT):
+    """
+    Ask the scheduler for a fresh-enough mirror. Without a scheduler, fetch
+    in this process if the mirror directory is writable, else use the
+    mirror as it is. Returns (state or None, how).
+    """
+    query = urllib.parse.urlencode({'url': url, 'max_age': max_age, 'create': int(create)})
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/fetch?{query}", method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.load(response), 'scheduler'
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None, 'no mirror'
+        return None, f"scheduler: {json.load(e).get('error')}"
+    except OSError:
+        pass
+    mirrors = Mirrors(root)
+    try:
+        return mirrors.fetch(url, max_age=max_age, create=create), 'local'
+    except LookupError:
+        return None, 'no mirror'
+    except PermissionError:
+        # Only the scheduler, as root, can write to the mirrors
+        return (mirrors.read_state(url) if mirrors.exists(url) else None), 'as is'
+
+
+def clone(root, url, directory, max_age, options, port=SCHEDULER_PORT):
+    mirrors = Mirrors(root)
+    directory = directory or os.path.basename(normalize_url(url))
+    state, how = request_fetch(root, url, max_age, port=port)
+    command = ['git', 'clone'] + options
+    if mirrors.exists(url):
+        mirror = mirrors.path(url)
+        command += ['--reference', mirror]
+        age = time.time() - state['last_ok'] if state and state.get('last_ok') else None
+        print(f"git-mirror: cloning with --reference {mirror} (mirror {how}"
+              f"{f', fetched {age:.0f}s ago' if age is not None else ''})", file=sys.stderr)
+    else:
+        print(f"git-mirror: no mirror of {url}, cloning in full (`git-mirror.py add {url}` creates one)",
+              file=sys.stderr)
+    return subprocess.run(command + [url, directory]).returncode
+
+
+def attach(root, repository):
+    """
+    Borrow objects from the mirror of the repository's origin, then drop the
+    local copies the mirror has
+    """
+    git_dir = git(['-C', repository or '.', 'rev-parse', '--absolute-git-dir']).stdout.strip()
+    url = git(['config', '--get', 'remote.origin.url'], git_dir=git_dir).stdout.strip()
+    mirrors = Mirrors(root)
+    if not mirrors.exists(url):
+        print(f"git-mirror: no mirror of {url}", file=sys.stderr)
+        return 1
+    objects = os.path.join(mirrors.path(url), 'objects')
+    alternates = os.path.join(git_dir, 'objects', 'info', 'alternates')
+    try:
+        with open(alternates, 'r') as f:
+            current = f.read().split()
+    except FileNotFoundError:
+        current = []
+    before = directory_size(os.path.join(git_dir, 'objects'))
+    if objects not in current:
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        with open(alternates, 'a') as f:
+            f.write(objects + '\n')
+    # -l leaves out objects the alternate has
+    git(['repack', '-a', '-d', '-l', '-q'], git_dir=git_dir)
+    after = directory_size(os.path.join(git_dir, 'objects'))
+    print(f"git-mirror: {git_dir} borrows from {mirrors.path(url)}, objects {before / 1e6:.1f} MB -> "
+          f"{after / 1e6:.1f} MB")
+    return 0
+
+
+def configure(root):
+    """
+    Create the mirror layout and the `git mclone` alias. Run as root when
+    the container starts, before the scheduler.
+    """
+    for directory in ('mirrors', 'state', 'locks', 'tmp'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    subprocess.run(['git', 'config', '--system', 'alias.mclone', GITCONFIG_ALIAS], check=True)
+    print(f"git-mirror: `git mclone` clones with --reference to the mirrors in {root}", file=sys.stderr)
+    return 0
+
+
+def print_status(rows, counters=None):
+    print(f"{'mirror':<48} {'size':>10} {'packs':>6} {'fetched':>10} {'took':>8} {'fetches':>8}")
+    now = time.time()
+    for row in rows:
+        age = f"{now - row['last_ok']:.0f}s ago" if row.get('last_ok') else '-'
+        took = f"{row['seconds']:.1f}s" if row.get('seconds') is not None else '-'
+        print(f"{normalize_url(row['url'])[-48:]:<48} {row['bytes'] / 1e6:>8.1f}MB {row['packs']:>6} "
+              f"{age:>10} {took:>8} {row.get('fetches') or 0:>8}{'' if row.get('ok', True) else '  FAILING'}")
+    if counters:
+        print(f"Requests answered: {counters.get('fetched', 0)} by a fetch, "
+              f"{counters.get('coalesced', 0)} coalesced")
+
+
+def make_upstream(path, files, file_kb, commits, seed=7):
+    """
+    A repository of incompressible files, built with fast-import so a large
+    one takes seconds. Later commits each rewrite a few files.
+    """
+    rng = random.Random(seed)
+    git(['init', '--quiet', '-b', 'main', path])
+    git_dir = os.path.join(path, '.git')
+    stream = []
+
+    def blob(index):
+        data = rng.randbytes(file_kb * 1024)
+        return f"M 100644 inline src/pkg{index // 100:03d}/file{index:05d}.bin\ndata {len(data)}\n".encode() + data
+
+    timestamp = 1700000000
+    for number in range(commits + 1):
+        message = f"commit {number}".encode()
+        changed = range(files) if number == 0 else rng.sample(range(files), max(1, files // 100))
+        stream.append(f"commit refs/heads/main\ncommitter Bench <bench@localhost> {timestamp + number} +0000\n"
+                      f"data {len(message)}\n".encode() + message + b"\n")
+        stream += [blob(index) + b"\n" for index in changed]
+    subprocess.run(['git', f"--git-dir={git_dir}", 'fast-import', '--quiet'], input=b''.join(stream), check=True)
+    subprocess.run(['git', '-C', path, 'checkout', '--quiet', '-f', 'main'], check=True)
+
+
+def add_commits(path, count, rng):
+    for number in range(count):
+        name = os.path.join(path, 'src', f"new{rng.randrange(1 << 30):010d}.bin")
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, 'wb') as f:
+            f.write(rng.randbytes(16 * 1024))
+        subprocess.run(['git', '-C', path, 'add', name], check=True)
+        subprocess.run(['git', '-C', path, '-c', 'user.name=Bench', '-c', 'user.email=bench@localhost',
+                        'commit', '--quiet', '-m', f"new {number}"], check=True)
+
+
+def timed_run(command):
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def simulate(files, file_kb, commits, clients):
+    """
+    Full clone vs a clone borrowing from the mirror, and concurrent fetch
+    requests coalescing, against file:// repositories in a temporary directory
+    """
+    work = tempfile.mkdtemp(prefix='git-mirror-')
+    try:
+        upstream = os.path.join(work, 'upstream')
+        root = os.path.join(work, 'mirror-root')
+        url = f"file://{upstream}"
+        start = time.perf_counter()
+        make_upstream(upstream, files, file_kb, commits)
+        print(f"Upstream: {files} files of {file_kb} KiB, {commits + 1} commits, "
+              f"{directory_size(os.path.join(upstream, '.git')) / 1e6:.1f} MB of objects "
+              f"(built in {time.perf_counter() - start:.1f}s)")
+
+        full_seconds = timed_run(['git', 'clone', '--quiet', url, os.path.join(work, 'full')])
+        full_bytes = directory_size(os.path.join(work, 'full', '.git'))
+
+        mirrors = Mirrors(root)
+        state = mirrors.fetch(url, create=True)
+        print(f"Mirror created in {state['seconds']:.2f}s")
+
+        # Upstream moves on after the mirror's fetch, as it would between
+        # scheduled fetches
+        rng = random.Random(11)
+        add_commits(upstream, 5, rng)
+        reference_seconds = timed_run(['git', 'clone', '--quiet', '--reference', mirrors.path(url),
+                                       url, os.path.join(work, 'borrowed')])
+        reference_bytes = directory_size(os.path.join(work, 'borrowed', '.git'))
+        fsck = subprocess.run(['git', '-C', os.path.join(work, 'borrowed'), 'fsck', '--connectivity-only'],
+                              capture_output=True)
+
+        print(f"\n{'clone':<24} {'seconds':>9} {'.git size':>12}")
+        print(f"{'full':<24} {full_seconds:>9.2f} {full_bytes / 1e6:>10.1f}MB")
+        print(f"{'--reference mirror':<24} {reference_seconds:>9.2f} {reference_bytes / 1e6:>10.1f}MB")
+        print(f"Speedup {full_seconds / reference_seconds:.1f}x, "
+              f"borrowed clone {'passes' if fsck.returncode == 0 else 'FAILS'} git fsck")
+
+        # The documented form, with git clone options after --, with and
+        # without a directory
+        clones = os.path.join(work, 'clones')
+        os.makedirs(clones)
+        for directory in ([], ['named']):
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--mirror-dir', root, 'clone', url,
+                            *directory, '--max-age', '3600', '--', '--depth', '1', '--quiet'],
+                           cwd=clones, stderr=subprocess.DEVNULL)
+        shallow = [subprocess.run(['git', '-C', os.path.join(clones, name), 'rev-parse', '--is-shallow-repository'],
+                                  capture_output=True, text=True).stdout.strip() == 'true'
+                   for name in ('upstream', 'named')]
+        print(f"clone URL [DIRECTORY] -- --depth 1: {'shallow clones' if all(shallow) else 'FAILED'}")
+
+        # Concurrent requests after upstream changed: threads of one
+        # scheduler, then separate processes standing in for containers
+        add_commits(upstream, 5, rng)
+        server = Scheduler(Mirrors(root), 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        before = mirrors.read_state(url)['fetches']
+        start = time.perf_counter()
+        threads = [threading.Thread(target=request_fetch, args=(root, url, 0), kwargs={'port': port})
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        thread_seconds = time.perf_counter() - start
+        thread_fetches = mirrors.read_state(url)['fetches'] - before
+        server.shutdown()
+
+        add_commits(upstream, 5, rng)
+        before = mirrors.read_state(url)['fetches']
+        start = time.perf_counter()
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--mirror-dir', root,
+                                       'fetch', url], stdout=subprocess.DEVNULL)
+                     for _ in range(clients)]
+        for process in processes:
+            process.wait()
+        process_seconds = time.perf_counter() - start
+        process_fetches = mirrors.read_state(url)['fetches'] - before
+        incremental = mirrors.read_state(url)['seconds']
+
+        print(f"\n{'concurrent requests':<24} {'requests':>9} {'fetches':>8} {'seconds':>9}")
+        print(f"{'one scheduler':<24} {clients:>9} {thread_fetches:>8} {thread_seconds:>9.2f}")
+        print(f"{'separate containers':<24} {clients:>9} {process_fetches:>8} {process_seconds:>9.2f}")
+        print(f"Incremental fetch of 5 commits: {incremental:.2f}s (creating the mirror took {state['seconds']:.2f}s)")
+        return 0
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared bare git mirrors on EFS")
+    parser.add_argument('--mirror-dir', default=MIRROR_DIR)
+    parser.add_argument('--port', type=int, default=SCHEDULER_PORT)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('configure', help="Create the mirror layout and the `git mclone` alias")
+
+    serve_parser = subparsers.add_parser('serve', help="Run the fetch scheduler")
+    serve_parser.add_argument('--interval', type=float, default=FETCH_INTERVAL)
+
+    add_parser = subparsers.add_parser('add', help="Create a mirror of a repository")
+    add_parser.add_argument('url')
+
+    clone_parser = subparsers.add_parser('clone', help="Clone, borrowing objects from the mirror")
+    clone_parser.add_argument('url')
+    clone_parser.add_argument('directory', nargs='?')
+    clone_parser.add_argument('--max-age', type=float, default=CLONE_MAX_AGE,
+                              help="Seconds since the mirror's last fetch that are still fresh enough")
+
+    attach_parser = subparsers.add_parser('attach', help="Borrow from the mirror in an existing clone")
+    attach_parser.add_argument('repository', nargs='?')
+
+    fetch_parser = subparsers.add_parser('fetch', help="Fetch one mirror now, coalescing with running fetches")
+    fetch_parser.add_argument('url')
+    fetch_parser.add_argument('--max-age', type=float, default=0)
+
+    status_parser = subparsers.add_parser('status', help="Mirrors, sizes and last fetches")
+    status_parser.add_argument('--json', action='store_true')
+
+    simulate_parser = subparsers.add_parser('simulate', help="Clone and coalescing benchmark on file:// repositories")
+    simulate_parser.add_argument('--files', type=int, default=2000)
+    simulate_parser.add_argument('--file-kb', type=int, default=32)
+    simulate_parser.add_argument('--commits', type=int, default=50)
+    simulate_parser.add_argument('--clients', type=int, default=8)
+
+    # git clone options follow `--`. Split them off before parsing, or
+    # argparse hands the first of them to the optional DIRECTORY.
+    argv = list(sys.argv[1:] if argv is None else argv)
+    options = []
+    if '--' in argv:
+        argv, options = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+    args = parser.parse_args(argv)
+    if options and args.command != 'clone':
+        parser.error("only clone takes options after --")
+    root = args.mirror_dir
+
+    if args.command == 'configure':
+        return configure(root)
+    if args.command == 'serve':
+        configured = os.environ.get('DEV_FLEET_GIT_MIRRORS', '').replace(',', ' ').split()
+        return serve(root, args.port, args.interval, configured)
+    if args.command == 'simulate':
+        return simulate(args.files, args.file_kb, args.commits, args.clients)
+    if args.command == 'clone':
+        return clone(root, args.url, args.directory, args.max_age, options, args.port)
+    if args.command == 'attach':
+        return attach(root, args.repository)
+    if args.command == 'status':
+        rows = Mirrors(root).status()
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_status(rows)
+        return 0
+
+    # add and fetch
+    state, how = request_fetch(root, args.url, getattr(args, 'max_age', 0), create=args.command == 'add',
+                               port=args.port)
+    if state is None:
+        print(f"git-mirror: {how} for {args.url}", file=sys.stderr)
+        return 1
+    print(json.dumps({'url': args.url, 'via': how, **{key: state.get(key) for key in
+                      ('ok', 'coalesced', 'seconds', 'fetches', 'error')}}))
+    return 0 if state.get('ok') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
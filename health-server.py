@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+health-server.py - Asyncio liveness/readiness server for development containers
+
+Replaces `python3 -m http.server` and the shell health probes. Every check
+runs in-process (no forks of service, netstat, ps, df or free) and results
+are cached for a short interval, so the NLB, ALB and container health checks
+probing every 30s cost almost nothing.
+
+Endpoints:
+  /live   sshd is running (container health check; a failure replaces the task)
+  /ready  sshd answers with its banner, the workspace is writable, and disk
+          and memory are within limits (load balancer target health)
+  /       same as /ready, for health checks still configured with "/"
+  /sessions  live SSH sessions, which warm-pool-controller.py checks before
+          stopping an idle task
+
+Usage:
+  health-server.py serve [--port 80] [--cache-ttl 5]
+  health-server.py check [--live]          # one-shot probe, exit code 0/1
+  health-server.py ready-marker            # log an "sshd ready" event once sshd answers
+  health-server.py bench [--probes 200]    # probe latency and CPU vs the shell scripts
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SSHD_PID_FILE = '/var/run/sshd.pid'
+WORKSPACE = '/home/developer/workspace'
+MAX_DISK_USED_PERCENT = 90
+MIN_MEMORY_AVAILABLE_PERCENT = 10
+METRICS_NAMESPACE = 'DevFleet'
+SSHD_READY_EVENT = 'sshd_ready'
+
+
+def sshd_running(pid_file=SSHD_PID_FILE):
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return True, f"sshd running as pid {pid}"
+    except (OSError, ValueError) as e:
+        return False, f"sshd is not running: {e}"
+
+
+async def sshd_banner(host='127.0.0.1', port=22, timeout=2.0):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            banner = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        if banner.startswith(b'SSH-'):
+            return True, banner.decode(errors='replace').strip()
+        return False, f"unexpected banner {banner[:40]!r}"
+    except (OSError, asyncio.TimeoutError) as e:
+        return False, f"sshd is not accepting connections on port {port}: {e or 'timeout'}"
+
+
+_session_metrics = None
+
+
+def active_ssh_sessions():
+    """
+    Live SSH sessions, counted the way session-metrics-agent.py counts
+    ActiveSshSessions
+    """
+    global _session_metrics
+    if _session_metrics is None:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(
+            'session_metrics_agent',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'session-metrics-agent.py'))
+        _session_metrics = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_session_metrics)
+    return _session_metrics.active_ssh_sessions()
+
+
+def workspace_writable(path=WORKSPACE):
+    # A real write catches a hung or read-only EFS mount, which os.access does not
+    probe = os.path.join(path, f".health-probe-{os.getpid()}")
+    try:
+        with open(probe, 'w') as f:
+            f.write('ok')
+        os.unlink(probe)
+        return True, f"{path} is writable"
+    except OSError as e:
+        return False, f"workspace is not writable: {e}"
+
+
+def disk_usage(path='/'):
+    stats = os.statvfs(path)
+    total = stats.f_blocks * stats.f_frsize
+    available = stats.f_bavail * stats.f_frsize
+    used_percent = 100.0 * (total - available) / total if total else 0.0
+    return used_percent <= MAX_DISK_USED_PERCENT, f"{used_percent:.0f}% of {path} used"
+
+
+def memory_available_percent():
+    """
+    Available memory as a percentage of the container's cgroup limit, falling
+    back to /proc/meminfo when no limit is set
+    """
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:
+            limit = f.read().strip()
+        if limit != 'max':
+            with open('/sys/fs/cgroup/memory.current') as f:
+                current = int(f.read())
+            inactive_file = 0
+            with open('/sys/fs/cgroup/memory.stat') as f:
+                for line in f:
+                    if line.startswith('inactive_file '):
+                        inactive_file = int(line.split()[1])
+                        break
+            return 100.0 * (int(limit) - (current - inactive_file)) / int(limit)
+    except (OSError, ValueError):
+        pass
+
+    meminfo = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            meminfo[key] = int(value.split()[0])
+    return 100.0 * meminfo['MemAvailable'] / meminfo['MemTotal']
+
+
+def memory_ok():
+    available = memory_available_percent()
+    return available >= MIN_MEMORY_AVAILABLE_PERCENT, f"{available:.0f}% memory available"
+
+
+class HealthChecker:
+    """
+    Runs the checks for each endpoint at most once per cache_ttl seconds.
+    Concurrent probes that arrive while a check is running wait for that run
+    instead of starting another.
+    """
+
+    def __init__(self, cache_ttl=5.0, workspace=WORKSPACE, sshd_port=22, pid_file=SSHD_PID_FILE):
+        self.cache_ttl = cache_ttl
+        self.workspace = workspace
+        self.sshd_port = sshd_port
+        self.pid_file = pid_file
+        self._cache = {}
+        self._inflight = {}
+        self.runs = 0
+        # A write to a hung EFS mount never returns and its thread can't be
+        # stopped, so workspace writes get a thread of their own and run one
+        # at a time instead of piling up in the default executor
+        self._workspace_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='workspace-probe')
+        self._workspace_probe = None
+        self._workspace_probe_started = 0.0
+
+    async def _workspace_check(self, timeout=5.0):
+        if self._workspace_probe is not None and not self._workspace_probe.done():
+            return False, (f"workspace write still running after "
+                           f"{time.monotonic() - self._workspace_probe_started:.0f}s")
+        loop = asyncio.get_running_loop()
+        self._workspace_probe = loop.run_in_executor(self._workspace_executor, workspace_writable, self.workspace)
+        self._workspace_probe_started = time.monotonic()
+        try:
+            # shield: a timed-out wait must not cancel the write the next probes check on
+            return await asyncio.wait_for(asyncio.shield(self._workspace_probe), timeout)
+        except asyncio.TimeoutError:
+            return False, f"workspace write timed out after {timeout:g}s"
+
+    async def _run(self, kind):
+        loop = asyncio.get_running_loop()
+        if kind == 'sessions':
+            sessions = await loop.run_in_executor(None, active_ssh_sessions)
+            self.runs += 1
+            return {'status': 'ok', 'active_ssh_sessions': sessions, 'checked_at': time.time()}
+        checks = {'sshd': sshd_running(self.pid_file)}
+        if kind == 'ready':
+            checks['sshd_banner'] = await sshd_banner(port=self.sshd_port)
+            # The workspace is on EFS, so keep a slow write off the event loop
+            checks['workspace'] = await self._workspace_check()
+            checks['disk'] = disk_usage('/')
+            checks['memory'] = memory_ok()
+        self.runs += 1
+        return {
+            'status': 'ok' if all(ok for ok, _ in checks.values()) else 'fail',
+            'checks': {name: {'ok': ok, 'detail': detail} for name, (ok, detail) in checks.items()},
+            'checked_at': time.time()
+        }
+
+    async def result(self, kind):
+        cached = self._cache.get(kind)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl:
+            return cached[1]
+        if kind not in self._inflight:
+            self._inflight[kind] = asyncio.ensure_future(self._run(kind))
+        try:
+            result = await asyncio.shield(self._inflight[kind])
+        finally:
+            if self._inflight.get(kind) and self._inflight[kind].done():
+                del self._inflight[kind]
+        self._cache[kind] = (time.monotonic(), result)
+        return result
+
+
+ROUTES = {'/live': 'live', '/ready': 'ready', '/': 'ready', '/sessions': 'sessions'}
+
+
+async def handle(checker, reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5.0)
+        # Drain the headers; probes never send a body
+        while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode(errors='replace').split()
+        path = parts[1].split('?')[0] if len(parts) > 1 else '/'
+        kind = ROUTES.get(path)
+        if kind is None:
+            status, body = '404 Not Found', {'status': 'not found'}
+        else:
+            body = await checker.result(kind)
+            status = '200 OK' if body['status'] == 'ok' else '503 Service Unavailable'
+        payload = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, checker, ready=None):
+    server = await asyncio.start_server(lambda r, w: handle(checker, r, w), '0.0.0.0', port)
+    if ready is not None:
+        ready.set_result(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+async def bench_server(probes, cache_ttl, workspace):
+    checker = HealthChecker(cache_ttl=cache_ttl, workspace=workspace)
+    ready = asyncio.get_running_loop().create_future()
+    server_task = asyncio.ensure_future(serve(0, checker, ready))
+    port = await ready
+
+    latencies = []
+    cpu_before = cpu_seconds(resource.RUSAGE_SELF)
+    for index in range(probes):
+        path = ('/live', '/ready', '/')[index % 3]
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        await reader.read()
+        writer.close()
+        latencies.append(time.perf_counter() - start)
+    cpu = cpu_seconds(resource.RUSAGE_SELF) - cpu_before
+
+    server_task.cancel()
+    return latencies, cpu, checker.runs
+
+
+def container_uptime():
+    """
+    Seconds since the container's PID 1 started
+    """
+    with open('/proc/1/stat') as f:
+        start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+    with open('/proc/uptime') as f:
+        uptime = float(f.read().split()[0])
+    return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+
+
+def task_arn():
+    metadata_uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4')
+    if not metadata_uri:
+        return None
+    try:
+        with urllib.request.urlopen(f"{metadata_uri}/task", timeout=2) as response:
+            return json.load(response).get('TaskARN')
+    except (OSError, ValueError):
+        return None
+
+
+async def wait_for_sshd(timeout, port=22):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ok, _ = await sshd_banner(port=port)
+        if ok:
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+def ready_marker(timeout, port=22):
+    """
+    Wait for sshd to answer with its banner, then print one EMF line with
+    the container's uptime at that moment. cold-start-trace.py finds these
+    lines by their Event field; being EMF, they also survive FireLens
+    sampling and publish SshdReadySeconds.
+    """
+    if not asyncio.run(wait_for_sshd(timeout, port)):
+        print(f"sshd did not answer on port {port} within {timeout:g}s", file=sys.stderr)
+        return 1
+    now = time.time()
+    dimensions = [['Developer']] if os.environ.get('DEV_FLEET_DEVELOPER') else [[]]
+    document = {
+        '_aws': {
+            'Timestamp': int(now * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': dimensions,
+                'Metrics': [{'Name': 'SshdReadySeconds', 'Unit': 'Seconds'}]
+            }]
+        },
+        'Event': SSHD_READY_EVENT,
+        'TaskArn': task_arn(),
+        'Developer': os.environ.get('DEV_FLEET_DEVELOPER'),
+        'SshdReadySeconds': round(container_uptime(), 3),
+    }
+    print(json.dumps({key: value for key, value in document.items() if value is not None},
+                     separators=(',', ':')), flush=True)
+    return 0
+
+
+def bench_script(script, probes):
+    latencies = []
+    cpu_before = cpu_seconds(resource.RUSAGE_CHILDREN)
+    for _ in range(probes):
+        start = time.perf_counter()
+        subprocess.run(['bash', script], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        latencies.append(time.perf_counter() - start)
+    return latencies, cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_before
+
+
+def bench(args):
+    def report(label, latencies, cpu):
+        print(f"{label:<34} p50={percentile(latencies, 50) * 1000:7.2f}ms "
+              f"p99={percentile(latencies, 99) * 1000:7.2f}ms "
+              f"cpu/probe={cpu / len(latencies) * 1000:7.3f}ms")
+
+    latencies, cpu, runs = asyncio.run(bench_server(args.probes, args.cache_ttl, args.workspace))
+    report(f"health-server.py (ttl {args.cache_ttl:g}s)", latencies, cpu)
+    print(f"{'':<34} {runs} check run(s) for {args.probes} probes; "
+          "cpu/probe covers both the server and the probing client")
+
+    for script in args.scripts:
+        if os.path.exists(script):
+            latencies, cpu = bench_script(script, args.script_probes)
+            report(os.path.basename(script), latencies, cpu)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Liveness/readiness server for development containers")
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help="Serve /live, /ready and /sessions")
+    serve_parser.add_argument('--port', type=int, default=int(os.environ.get('HEALTH_PORT', 80)))
+    serve_parser.add_argument('--cache-ttl', type=float, default=float(os.environ.get('HEALTH_CACHE_TTL', 5)))
+
+    check_parser = subparsers.add_parser('check', help="Run the checks once and exit 0 when healthy")
+    check_parser.add_argument('--live', action='store_true', help="Only check liveness")
+
+    marker_parser = subparsers.add_parser('ready-marker', help="Log an \"sshd ready\" event once sshd answers")
+    marker_parser.add_argument('--timeout', type=float, default=600.0)
+    marker_parser.add_argument('--sshd-port', type=int, default=22)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    bench_parser = subparsers.add_parser('bench', help="Measure probe latency and CPU cost")
+    bench_parser.add_argument('--probes', type=int, default=300)
+    bench_parser.add_argument('--script-probes', type=int, default=30)
+    bench_parser.add_argument('--cache-ttl', type=float, default=5.0)
+    bench_parser.add_argument('--workspace', default=WORKSPACE if os.path.isdir(WORKSPACE) else '/tmp')
+    bench_parser.add_argument('--scripts', nargs='*', default=[
+        os.path.join(here, 'health-check-script.sh'),
+        os.path.join(here, 'updated-health-check.sh'),
+    ])
+
+    args = parser.parse_args(argv)
+    if args.command == 'check':
+        result = asyncio.run(HealthChecker(cache_ttl=0)._run('live' if args.live else 'ready'))
+        print(json.dumps(result, indent=2))
+        return 0 if result['status'] == 'ok' else 1
+    if args.command == 'ready-marker':
+        return ready_marker(args.timeout, args.sshd_port)
+    if args.command == 'bench':
+        bench(args)
+        return 0
+
+    port = getattr(args, 'port', int(os.environ.get('HEALTH_PORT', 80)))
+    cache_ttl = getattr(args, 'cache_ttl', float(os.environ.get('HEALTH_CACHE_TTL', 5)))
+    print(f"Health server listening on port {port} (cache {cache_ttl:g}s)")
+    asyncio.run(serve(port, HealthChecker(cache_ttl=cache_ttl)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+image-analysis.py - Layer, duplication and churn analysis for `docker save` tarballs
+
+Reports what every layer of the dev image costs to pull: uncompressed and
+gzip-compressed size (what ECR stores and Fargate downloads on every task
+start), file count and the Dockerfile instruction that produced it. It also
+finds bytes that are shipped but never visible in the final filesystem
+(files overwritten or deleted by later layers, identical files under several
+paths, package-manager caches) and classifies layers as rarely changing
+(package installs, user setup) or frequently changing (files copied from the
+build context). Layers of the FROM image (by default everything up to and
+including its root filesystem, `ADD file:<digest> in /`) are classified as
+base and left out of the ordering check. Given the previous build, it
+reports which layers were reused.
+
+Usage:
+  docker save dev-fleet-containers -o image.tar
+  image-analysis.py analyze image.tar [--previous old.tar] [--json]
+  image-analysis.py validate image.tar [--max-compressed-mb 400] [--max-waste-percent 5]
+  image-analysis.py compare old.tar new.tar
+  image-analysis.py simulate     # validate synthetic tarballs with a real ubuntu:22.04 base history
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tarfile
+import tempfile
+import zlib
+
+# Layers that change on nearly every build: files copied in from the build context
+FREQUENT_INSTRUCTIONS = ('COPY', 'ADD')
+# How a base image's root filesystem shows up in its history, e.g.
+# "/bin/sh -c #(nop) ADD file:3bd10da0...fa in / "
+ROOTFS_ADD = re.compile(r'^ADD file:[0-9a-f]+ in /\s*$')
+CACHE_PREFIXES = ('var/lib/apt/lists/', 'var/cache/apt/archives/', 'root/.cache/pip/', 'tmp/')
+WHITEOUT_PREFIX = '.wh.'
+OPAQUE_WHITEOUT = '.wh..wh..opq'
+
+# Rough pull model for estimates: ECR download throughput seen by a Fargate task
+DEFAULT_BANDWIDTH_MBPS = 80
+
+
+def _instruction(created_by):
+    """
+    Dockerfile instruction name from a history entry's created_by
+    """
+    text = (created_by or '').strip()
+    if '#(nop)' in text:
+        text = text.split('#(nop)', 1)[1].strip()
+    elif text.startswith('/bin/sh -c ') or text.startswith('|'):
+        return 'RUN'
+    word = text.split(' ', 1)[0].upper() if text else ''
+    return word or 'RUN'
+
+
+def _clean_created_by(created_by):
+    return created_by.replace('/bin/sh -c ', '').replace('#(nop) ', '').strip()
+
+
+def _gzip_size(fileobj, chunk_size=1 << 20):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    size = 0
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        size += len(compressor.compress(chunk))
+    return size + len(compressor.flush())
+
+
+class ImageTarball:
+    """
+    Reads the manifest, config and layers of a `docker save` tarball. Both
+    the legacy layout (<id>/layer.tar) and the OCI layout written by newer
+    Docker versions (blobs/sha256/<digest>) carry a manifest.json, which is
+    what this follows.
+    """
+
+    def __init__(self, path, base_layers=None):
+        self.path = path
+        self.tar = tarfile.open(path, 'r:*')
+        manifest = json.load(self.tar.extractfile('manifest.json'))[0]
+        self.tags = manifest.get('RepoTags') or []
+        self.config = json.load(self.tar.extractfile(manifest['Config']))
+        self.layer_paths = manifest['Layers']
+        self.diff_ids = self.config.get('rootfs', {}).get('diff_ids', [])
+
+        history = [h for h in self.config.get('history', []) if not h.get('empty_layer')]
+        if len(history) != len(self.layer_paths):
+            history = [{}] * len(self.layer_paths)
+        self.history = history
+        self.base_layers = base_layers if base_layers is not None else self._rootfs_layers()
+
+    def _rootfs_layers(self):
+        """
+        Layers up to and including the last root filesystem ADD, which is
+        where the FROM image ends for images built on a distribution base
+        """
+        count = 0
+        for index, entry in enumerate(self.history):
+            if ROOTFS_ADD.match(_clean_created_by(entry.get('created_by', ''))):
+                count = index + 1
+        return count
+
+    def _open_layer(self, index):
+        raw = self.tar.extractfile(self.layer_paths[index])
+        return tarfile.open(fileobj=raw, mode='r|*')
+
+    def layers(self, compress=True):
+        """
+        Yield one dict per layer with its sizes and files. Files are
+        (path, size, sha256 or None, kind) where kind is 'file', 'link',
+        'dir', 'whiteout' or 'opaque'.
+        """
+        for index, layer_path in enumerate(self.layer_paths):
+            member = self.tar.getmember(layer_path)
+            compressed = _gzip_size(self.tar.extractfile(layer_path)) if compress else None
+            files = []
+            with self._open_layer(index) as layer:
+                for entry in layer:
+                    # Only a leading "./": root-level dotfiles and .wh. whiteouts keep their dots
+                    path = '' if entry.name == '.' else entry.name.removeprefix('./')
+                    base = path.rsplit('/', 1)[-1]
+                    if base == OPAQUE_WHITEOUT:
+                        files.append((path.rsplit('/', 1)[0] if '/' in path else '', 0, None, 'opaque'))
+                    elif base.startswith(WHITEOUT_PREFIX):
+                        parent = path.rsplit('/', 1)[0] + '/' if '/' in path else ''
+                        files.append((parent + base[len(WHITEOUT_PREFIX):], 0, None, 'whiteout'))
+                    elif entry.isfile():
+                        digest = hashlib.sha256()
+                        stream = layer.extractfile(entry)
+                        for chunk in iter(lambda: stream.read(1 << 20), b''):
+                            digest.update(chunk)
+                        files.append((path, entry.size, digest.hexdigest(), 'file'))
+                    elif entry.isdir():
+                        files.append((path, 0, None, 'dir'))
+                    else:
+                        files.append((path, 0, None, 'link'))
+
+            created_by = self.history[index].get('created_by', '')
+            instruction = _instruction(created_by)
+            yield {
+                'index': index,
+                'diff_id': self.diff_ids[index] if index < len(self.diff_ids) else None,
+                'size': member.size,
+                'compressed': compressed,
+                'files': files,
+                'created_by': _clean_created_by(created_by),
+                'instruction': instruction,
+                'churn': ('base' if index < self.base_layers
+                          else 'frequent' if instruction in FREQUENT_INSTRUCTIONS else 'rare'),
+            }
+
+
+def analyze(path, previous=None, compress=True, base_layers=None):
+    image = ImageTarball(path, base_layers)
+    previous_ids = set(ImageTarball(previous).diff_ids) if previous else None
+
+    layers = []
+    # file path -> (layer index, size, sha256) of the version visible so far
+    visible = {}
+    waste = {'overwritten': 0, 'deleted': 0, 'duplicate_content': 0, 'caches': 0}
+    overwritten = []
+
+    for layer in image.layers(compress):
+        for file_path, size, digest, kind in layer['files']:
+            if kind == 'opaque':
+                prefix = file_path + '/' if file_path else ''
+                for hidden in [p for p in visible if p.startswith(prefix) and visible[p][0] < layer['index']]:
+                    waste['deleted'] += visible.pop(hidden)[1]
+            elif kind == 'whiteout':
+                for hidden in [p for p in visible
+                               if (p == file_path or p.startswith(file_path + '/'))
+                               and visible[p][0] < layer['index']]:
+                    waste['deleted'] += visible.pop(hidden)[1]
+            elif kind == 'file':
+                if file_path in visible:
+                    earlier_layer, earlier_size, _ = visible[file_path]
+                    waste['overwritten'] += earlier_size
+                    overwritten.append((earlier_size, file_path, earlier_layer, layer['index']))
+                visible[file_path] = (layer['index'], size, digest)
+        if previous_ids is not None:
+            layer['reused'] = layer['diff_id'] in previous_ids
+        layer['file_count'] = sum(1 for f in layer['files'] if f[3] == 'file')
+        del layer['files']
+        layers.append(layer)
+
+    content = {}
+    for file_path, (_, size, digest) in visible.items():
+        if size:
+            content.setdefault(digest, []).append(file_path)
+    duplicates = []
+    for paths in content.values():
+        if len(paths) > 1:
+            extra = visible[paths[0]][1] * (len(paths) - 1)
+            waste['duplicate_content'] += extra
+            duplicates.append((extra, sorted(paths)))
+    waste['caches'] = sum(size for file_path, (_, size, _) in visible.items() if file_path.startswith(CACHE_PREFIXES))
+
+    return {
+        'image': path,
+        'tags': image.tags,
+        'layers': layers,
+        'total_size': sum(layer['size'] for layer in layers),
+        'total_compressed': sum(layer['compressed'] or 0 for layer in layers) if compress else None,
+        'waste': waste,
+        'overwritten': sorted(overwritten, reverse=True)[:20],
+        'duplicates': sorted(duplicates, reverse=True)[:20],
+    }
+
+
+def ordering_problems(report, min_bytes=1 << 20):
+    """
+    Rarely changing layers that come after a frequently changing one. Every
+    edit to the copied files rebuilds and re-pushes them. Base layers are
+    not ours to reorder, so they count as neither.
+    """
+    problems = []
+    seen_frequent = None
+    for layer in report['layers']:
+        if layer['churn'] == 'frequent' and seen_frequent is None:
+            seen_frequent = layer
+        elif layer['churn'] == 'rare' and seen_frequent is not None and layer['size'] >= min_bytes:
+            problems.append(
+                f"layer {layer['index']} ({_mb(layer['size'])}, {layer['created_by'][:60]!r}) comes after "
+                f"frequently changing layer {seen_frequent['index']} ({seen_frequent['created_by'][:60]!r})"
+            )
+    return problems
+
+
+def pull_seconds(compressed_bytes, bandwidth_mbps=DEFAULT_BANDWIDTH_MBPS):
+    return compressed_bytes / (bandwidth_mbps * 1024 * 1024)
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def print_report(report, bandwidth_mbps):
+    print(f"Image: {report['image']} {' '.join(report['tags'])}")
+    has_reuse = any('reused' in layer for layer in report['layers'])
+    print(f"{'#':>3} {'size':>10} {'gzip':>10} {'files':>7} {'churn':<9}{' reused' if has_reuse else ''}  instruction")
+    for layer in report['layers']:
+        compressed = _mb(layer['compressed']) if layer['compressed'] is not None else '-'
+        reused = f" {'yes' if layer.get('reused') else 'no':<6}" if has_reuse else ''
+        print(f"{layer['index']:>3} {_mb(layer['size']):>10} {compressed:>10} {layer['file_count']:>7} "
+              f"{layer['churn']:<9}{reused}  {layer['created_by'][:70]}")
+
+    print(f"\nTotal: {_mb(report['total_size'])} uncompressed", end='')
+    if report['total_compressed'] is not None:
+        print(f", {_mb(report['total_compressed'])} compressed, "
+              f"~{pull_seconds(report['total_compressed'], bandwidth_mbps):.1f}s to pull at {bandwidth_mbps} MB/s")
+    else:
+        print()
+
+    by_churn = {churn: sum(layer['size'] for layer in report['layers'] if layer['churn'] == churn)
+                for churn in ('base', 'rare', 'frequent')}
+    print(f"Base image: {_mb(by_churn['base'])}; rarely changing: {_mb(by_churn['rare'])}; "
+          f"frequently changing: {_mb(by_churn['frequent'])}")
+    if has_reuse:
+        changed = [layer for layer in report['layers'] if not layer['reused']]
+        changed_bytes = sum(layer['compressed'] or layer['size'] for layer in changed)
+        print(f"Changed since previous build: {len(changed)} layer(s), {_mb(changed_bytes)} to push")
+
+    waste = report['waste']
+    print(f"Shipped but not needed: {_mb(waste['overwritten'])} overwritten by later layers, "
+          f"{_mb(waste['deleted'])} deleted by later layers, {_mb(waste['duplicate_content'])} duplicate content, "
+          f"{_mb(waste['caches'])} package caches")
+    for size, path, earlier, later in report['overwritten'][:10]:
+        print(f"  overwritten: /{path} ({_mb(size)}) layer {earlier} -> {later}")
+    for extra, paths in report['duplicates'][:10]:
+        print(f"  duplicate: {_mb(extra)} across {', '.join('/' + p for p in paths[:3])}")
+    for problem in ordering_problems(report):
+        print(f"  ordering: {problem}")
+
+
+def validate(report, max_compressed_mb=None, max_waste_percent=5.0, max_cache_mb=1.0):
+    failures = ordering_problems(report)
+    waste = report['waste']
+    wasted = waste['overwritten'] + waste['deleted'] + waste['duplicate_content']
+    if report['total_size'] and 100.0 * wasted / report['total_size'] > max_waste_percent:
+        failures.append(f"{_mb(wasted)} ({100.0 * wasted / report['total_size']:.1f}%) of the image is "
+                        f"overwritten, deleted or duplicated content (limit {max_waste_percent:g}%)")
+    if waste['caches'] > max_cache_mb * 1024 * 1024:
+        failures.append(f"{_mb(waste['caches'])} of package manager caches or /tmp files left in the image")
+    if max_compressed_mb and report['total_compressed'] and report['total_compressed'] > max_compressed_mb * 1024 * 1024:
+        failures.append(f"compressed size {_mb(report['total_compressed'])} exceeds {max_compressed_mb} MB")
+    return failures
+
+
+# `docker history --no-trunc ubuntu:22.04`, oldest first
+UBUNTU_HISTORY = [
+    ('/bin/sh -c #(nop)  ARG RELEASE', 0),
+    ('/bin/sh -c #(nop)  ARG LAUNCHPAD_BUILD_ARCH', 0),
+    ('/bin/sh -c #(nop)  LABEL org.opencontainers.image.ref.name=ubuntu', 0),
+    ('/bin/sh -c #(nop)  LABEL org.opencontainers.image.version=22.04', 0),
+    ('/bin/sh -c #(nop) ADD file:3bd10da0673e2e72cb06a1f64a9df49a36341df39b0f762e3d1b38ee4de296fa in / ', 3 << 20),
+    ('/bin/sh -c #(nop)  CMD ["/bin/bash"]', 0),
+]
+# The fleet Dockerfile as BuildKit records it: packages, then setup, then the scripts
+FLEET_HISTORY = [
+    ('ENV DEBIAN_FRONTEND=noninteractive', 0),
+    ('RUN /bin/sh -c apt-get update && apt-get install -y --no-install-recommends openssh-server # buildkit', 4 << 20),
+    ('RUN /bin/sh -c useradd -m developer && mkdir -p /run/sshd # buildkit', 64 << 10),
+    ('WORKDIR /opt/dev-fleet', 0),
+    ('COPY /out/ / # buildkit', 256 << 10),
+    ('CMD ["/opt/dev-fleet/entrypoint.sh"]', 0),
+]
+
+
+def _write_image(path, history):
+    """A `docker save` tarball with one random-content layer per non-empty history entry"""
+    layer_paths, diff_ids, entries = [], [], []
+    with tarfile.open(path, 'w') as image:
+        for index, (created_by, size) in enumerate(history):
+            entry = {'created_by': created_by}
+            if not size:
+                entry['empty_layer'] = True
+                entries.append(entry)
+                continue
+            entries.append(entry)
+            layer = io.BytesIO()
+            with tarfile.open(fileobj=layer, mode='w') as layer_tar:
+                info = tarfile.TarInfo(f"layer{index}/data.bin")
+                info.size = size
+                layer_tar.addfile(info, io.BytesIO(os.urandom(size)))
+            data = layer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+            layer_paths.append(f"{digest}/layer.tar")
+            diff_ids.append(f"sha256:{digest}")
+            info = tarfile.TarInfo(layer_paths[-1])
+            info.size = len(data)
+            image.addfile(info, io.BytesIO(data))
+
+        config = json.dumps({'history': entries, 'rootfs': {'type': 'layers', 'diff_ids': diff_ids}}).encode()
+        config_name = f"{hashlib.sha256(config).hexdigest()}.json"
+        manifest = json.dumps([{'Config': config_name, 'RepoTags': ['dev-fleet:simulate'],
+                                'Layers': layer_paths}]).encode()
+        for name, data in ((config_name, config), ('manifest.json', manifest)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            image.addfile(info, io.BytesIO(data))
+
+
+def simulate():
+    """
+    Validate a FROM ubuntu:22.04 image laid out like the fleet Dockerfile,
+    then the same image with the scripts copied in before the packages
+    """
+    ordered = UBUNTU_HISTORY + FLEET_HISTORY
+    misordered = UBUNTU_HISTORY + [FLEET_HISTORY[0], FLEET_HISTORY[4], *FLEET_HISTORY[1:4], FLEET_HISTORY[5]]
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, history, expect_pass in (('ordered', ordered, True), ('misordered', misordered, False)):
+            path = os.path.join(workdir, f"{label}.tar")
+            _write_image(path, history)
+            report = analyze(path, compress=False)
+            failures = validate(report)
+            churn = ' '.join(layer['churn'] for layer in report['layers'])
+            print(f"{label}: layers {churn}; {len(failures)} validation failure(s)")
+            for failure in failures:
+                print(f"  FAIL: {failure}")
+            if (not failures) != expect_pass:
+                print(f"  expected the {label} image to {'pass' if expect_pass else 'fail'}")
+                ok = False
+    print("Simulation OK" if ok else "Simulation FAILED")
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a `docker save` image tarball")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze_parser = subparsers.add_parser('analyze', help="Per-layer sizes, waste and churn")
+    analyze_parser.add_argument('image')
+    analyze_parser.add_argument('--previous', help="Tarball of the previous build, to report layer reuse")
+    analyze_parser.add_argument('--json', action='store_true')
+
+    validate_parser = subparsers.add_parser('validate', help="Exit non-zero if the image breaks the size rules")
+    validate_parser.add_argument('image')
+    validate_parser.add_argument('--max-compressed-mb', type=float)
+    validate_parser.add_argument('--max-waste-percent', type=float, default=5.0)
+
+    compare_parser = subparsers.add_parser('compare', help="Compressed size and pull time of two builds")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    subparsers.add_parser('simulate', help="Validate synthetic tarballs built on a real ubuntu:22.04 history")
+
+    for sub in (analyze_parser, validate_parser, compare_parser):
+        sub.add_argument('--bandwidth-mbps', type=float, default=DEFAULT_BANDWIDTH_MBPS,
+                         help="Pull throughput used for pull time estimates")
+        sub.add_argument('--no-compress', action='store_true', help="Skip gzip size estimation (faster)")
+    for sub in (analyze_parser, validate_parser):
+        sub.add_argument('--base-layers', type=int,
+                         help="Number of layers that come from the FROM image "
+                              "(default: up to its root filesystem ADD)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'simulate':
+        return simulate()
+    compress = not args.no_compress
+
+    if args.command == 'analyze':
+        report = analyze(args.image, args.previous, compress, args.base_layers)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report, args.bandwidth_mbps)
+        return 0
+
+    if args.command == 'validate':
+        report = analyze(args.image, compress=compress, base_layers=args.base_layers)
+        print_report(report, args.bandwidth_mbps)
+        failures = validate(report, args.max_compressed_mb, args.max_waste_percent)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        print("Image passes validation" if not failures else f"{len(failures)} validation failure(s)")
+        return 1 if failures else 0
+
+    old = analyze(args.old, compress=compress)
+    new = analyze(args.new, args.old, compress=compress)
+    key = 'total_compressed' if compress else 'total_size'
+    for label, report in (('old', old), ('new', new)):
+        print(f"{label}: {len(report['layers'])} layers, {_mb(report[key])}, "
+              f"~{pull_seconds(report[key], args.bandwidth_mbps):.1f}s pull")
+    if old[key]:
+        change = 100.0 * (new[key] - old[key]) / old[key]
+        print(f"Change: {change:+.1f}% size, {pull_seconds(new[key] - old[key], args.bandwidth_mbps):+.1f}s pull")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
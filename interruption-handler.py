@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+interruption-handler.py - Checkpoint a development container before it stops
+
+ECS sends SIGTERM when a task is stopped, including the two-minute notice
+for a Fargate Spot interruption, and SIGKILL once the container's stop
+timeout (120s) has passed. entrypoint.sh traps SIGTERM and runs
+`checkpoint`, which within its budget:
+
+  1. stops sshd accepting new connections and writes a notice to every
+     session's terminal
+  2. sends editors SIGHUP, which makes vim/nvim preserve their swap files
+     and nano/emacs write their emergency saves, and waits for them to exit
+  3. flushes dirty pages to EFS (sync)
+  4. takes a workspace snapshot when DEV_FLEET_SNAPSHOT_BUCKET and
+     CHECKPOINT_SNAPSHOT=1 are set
+  5. waits for SSH sessions to end, then hangs up the rest
+
+The duration of every phase is logged as one JSON line.
+
+Usage:
+  interruption-handler.py checkpoint [--sshd-pid PID] [--budget 110] [--drain-timeout 60]
+  interruption-handler.py simulate [--editors 4] [--sessions 8] [--dirty-mb 256] [--snapshot-mb 0]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WORKSPACE = '/home/developer/workspace'
+SSHD_PID_FILE = '/var/run/sshd.pid'
+EDITORS = {'vim', 'vi', 'vim.basic', 'vim.tiny', 'nvim', 'nano', 'emacs', 'emacs-nox'}
+BUDGET = 110.0
+DRAIN_TIMEOUT = 60.0
+EDITOR_TIMEOUT = 10.0
+HANGUP_GRACE = 2.0
+POLL_INTERVAL = 0.05
+NOTICE = ("\r\n*** This environment is stopping (capacity interruption or redeploy). Open editors are being "
+          "saved and the workspace synced; please save your work and disconnect. ***\r\n")
+
+
+def processes():
+    """
+    Yield (pid, comm, cmdline) for every live process
+    """
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", 'rb') as f:
+                stat = f.read()
+            comm = stat[stat.index(b'(') + 1:stat.rindex(b')')].decode(errors='replace')
+            if stat[stat.rindex(b')') + 2:stat.rindex(b')') + 3] == b'Z':
+                continue
+            with open(f"/proc/{name}/cmdline", 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='replace').strip()
+        except (OSError, ValueError):
+            continue
+        yield int(name), comm, cmdline
+
+
+def find_editors():
+    return [pid for pid, comm, _ in processes() if comm in EDITORS]
+
+
+def find_sessions():
+    """
+    (pid, tty path or None) for the user side of every SSH session, whose
+    title sshd sets to "sshd: <user>@pts/<n>" (or "@notty")
+    """
+    sessions = []
+    for pid, comm, cmdline in processes():
+        if comm == 'sshd' and cmdline.startswith('sshd: ') and '@' in cmdline:
+            terminal = cmdline.split('@', 1)[1].split()[0]
+            sessions.append((pid, f"/dev/{terminal}" if terminal.startswith('pts/') else None))
+    return sessions
+
+
+def sshd_listener_pid(pid_file=SSHD_PID_FILE):
+    try:
+        with open(pid_file) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def signal_all(pids, signum):
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+
+def wait_until_empty(find, deadline):
+    remaining = find()
+    while remaining and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        remaining = find()
+    return remaining
+
+
+def sync_filesystems(timeout):
+    """
+    sync(2) in a thread, so a hung NFS server cannot eat the whole budget
+    """
+    thread = threading.Thread(target=os.sync, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def snapshot_command(workspace):
+    if not os.environ.get('DEV_FLEET_SNAPSHOT_BUCKET') or os.environ.get('CHECKPOINT_SNAPSHOT') != '1':
+        return None
+    return ['/usr/local/bin/workspace-snapshot.py', 'create', '--path', workspace]
+
+
+class Checkpoint:
+    """
+    Runs the checkpoint phases against a deadline. The process finders and
+    the snapshot step can be replaced, which the simulation does.
+    """
+
+    def __init__(self, workspace=WORKSPACE, budget=BUDGET, drain_timeout=DRAIN_TIMEOUT, sshd_pid=None,
+                 find_editors=find_editors, find_sessions=find_sessions, snapshot=None):
+        self.workspace = workspace
+        self.budget = budget
+        self.drain_timeout = drain_timeout
+        self.sshd_pid = sshd_pid
+        self.find_editors = find_editors
+        self.find_sessions = find_sessions
+        self.snapshot = snapshot
+        self.phases = []
+
+    def _phase(self, name, started, **detail):
+        self.phases.append({'phase': name, 'seconds': round(time.monotonic() - started, 3), **detail})
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def run(self):
+        self.started = time.monotonic()
+        self.deadline = self.started + self.budget
+
+        started = time.monotonic()
+        if self.sshd_pid:
+            signal_all([self.sshd_pid], signal.SIGTERM)
+        sessions = self.find_sessions()
+        notified = 0
+        for _, tty in sessions:
+            if tty is None:
+                continue
+            try:
+                fd = os.open(tty, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+                try:
+                    os.write(fd, NOTICE.encode())
+                    notified += 1
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        self._phase('notify', started, sessions=len(sessions), notified=notified)
+
+        started = time.monotonic()
+        editors = self.find_editors()
+        signal_all(editors, signal.SIGHUP)
+        left = wait_until_empty(self.find_editors, min(self.deadline, started + EDITOR_TIMEOUT))
+        self._phase('editors', started, editors=len(editors), still_running=len(left))
+
+        started = time.monotonic()
+        synced = sync_filesystems(max(1.0, self.remaining() - HANGUP_GRACE))
+        self._phase('sync', started, completed=synced)
+
+        if self.snapshot is not None:
+            started = time.monotonic()
+            try:
+                ok = self.snapshot(max(1.0, self.remaining() - HANGUP_GRACE * 2))
+            except Exception as e:
+                print(f"Warning: Workspace snapshot failed: {e}", file=sys.stderr, flush=True)
+                ok = False
+            self._phase('snapshot', started, completed=bool(ok))
+
+        started = time.monotonic()
+        drain_deadline = min(self.deadline - HANGUP_GRACE, started + self.drain_timeout)
+        left = wait_until_empty(self.find_sessions, drain_deadline)
+        self._phase('drain', started, sessions=len(sessions), disconnected=len(sessions) - len(left))
+
+        started = time.monotonic()
+        signal_all([pid for pid, _ in left], signal.SIGHUP)
+        survivors = wait_until_empty(self.find_sessions, time.monotonic() + HANGUP_GRACE)
+        signal_all([pid for pid, _ in survivors], signal.SIGKILL)
+        self._phase('hangup', started, hung_up=len(left), killed=len(survivors))
+
+        return {
+            'event': 'checkpoint',
+            'seconds': round(time.monotonic() - self.started, 3),
+            'budget': self.budget,
+            'phases': self.phases,
+        }
+
+
+def subprocess_snapshot(command):
+    def run(timeout):
+        return subprocess.run(command, timeout=timeout).returncode == 0
+    return run
+
+
+# Simulation: stand-ins for editors and SSH sessions are child processes, so
+# nothing outside the simulation is signalled.
+
+FAKE_EDITOR = r"""
+import ctypes, os, signal, sys, time
+ctypes.CDLL(None).prctl(15, b'vim', 0, 0, 0)
+swap, size = sys.argv[1], int(sys.argv[2])
+def preserve(signum, frame):
+    with open(swap, 'wb') as f:
+        f.write(os.urandom(size))
+        f.flush()
+        os.fsync(f.fileno())
+    sys.exit(1)
+signal.signal(signal.SIGHUP, preserve)
+print('ready', flush=True)
+while True:
+    time.sleep(1)
+"""
+
+FAKE_SESSION = r"""
+import signal, sys, time
+signal.signal(signal.SIGHUP, lambda *a: sys.exit(0))
+print('ready', flush=True)
+time.sleep(float(sys.argv[1]))
+"""
+
+
+def simulate(editors, sessions, lingering, dirty_mb, snapshot_mb, budget, drain_timeout, disconnect_after):
+    import random
+
+    random.seed(3)
+    workdir = tempfile.mkdtemp(prefix='interruption-')
+    workspace = os.path.join(workdir, 'workspace')
+    os.makedirs(workspace)
+    children = []
+
+    def spawn(*args):
+        process = subprocess.Popen([sys.executable, '-c', *args], stdout=subprocess.PIPE)
+        children.append(process)
+        return process
+
+    def ready(group):
+        for process in group:
+            process.stdout.readline()
+        return group
+
+    snapshot = None
+    if snapshot_mb:
+        import importlib.util
+        from local_aws import LocalS3
+        spec = importlib.util.spec_from_file_location(
+            'workspace_snapshot', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'workspace-snapshot.py'))
+        workspace_snapshot = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(workspace_snapshot)
+        s3 = LocalS3(api_latency=0.01)
+        s3.create_bucket(Bucket='snapshots')
+        for index in range(8):
+            with open(os.path.join(workspace, f"data{index}.bin"), 'wb') as f:
+                f.write(random.randbytes(snapshot_mb * 1024 * 1024 // 8))
+        cache = os.path.join(workdir, 'cache')
+        workspace_snapshot.create_snapshot(s3, 'snapshots', workspace, 'developer', cache_dir=cache)
+
+        def snapshot(timeout):
+            _, stats = workspace_snapshot.create_snapshot(s3, 'snapshots', workspace, 'developer', cache_dir=cache)
+            print(f"  incremental snapshot: {stats['changed_files']} changed files, "
+                  f"{stats['bytes_uploaded'] / 1e6:.1f} MB uploaded")
+            return True
+
+    # Unsynced work in the page cache
+    with open(os.path.join(workspace, 'build-output.bin'), 'wb') as f:
+        for _ in range(dirty_mb):
+            f.write(os.urandom(1024 * 1024))
+    time.sleep(0.5)
+
+    # Editors and sessions start right before the interruption
+    listener = spawn('import time; time.sleep(600)')
+    editor_processes = ready([spawn(FAKE_EDITOR, os.path.join(workspace, f".file{index}.swp"), str(256 * 1024))
+                              for index in range(editors)])
+    # Most developers disconnect within disconnect_after seconds of the
+    # notice; lingering ones stay until they are hung up
+    session_processes = ready([
+        spawn(FAKE_SESSION, str(600 if index < lingering else random.uniform(0.2, disconnect_after)))
+        for index in range(sessions)
+    ])
+
+    def alive(group):
+        return [process.pid for process in group if process.poll() is None]
+
+    checkpoint = Checkpoint(
+        workspace=workspace, budget=budget, drain_timeout=drain_timeout, sshd_pid=listener.pid,
+        find_editors=lambda: alive(editor_processes),
+        find_sessions=lambda: [(pid, None) for pid in alive(session_processes)],
+        snapshot=snapshot
+    )
+    print(f"Interrupting: {editors} editors, {sessions} sessions ({lingering} lingering), "
+          f"{dirty_mb} MB unsynced, budget {budget:.0f}s")
+    result = checkpoint.run()
+
+    for phase in result['phases']:
+        detail = ', '.join(f"{key}={value}" for key, value in phase.items() if key not in ('phase', 'seconds'))
+        print(f"  {phase['phase']:<10} {phase['seconds']:>8.3f}s  {detail}")
+    saved = sum(os.path.exists(os.path.join(workspace, f".file{index}.swp")) for index in range(editors))
+    data_phases = sum(phase['seconds'] for phase in result['phases'] if phase['phase'] in ('editors', 'sync', 'snapshot'))
+    print(f"Checkpoint finished in {result['seconds']:.2f}s of the {budget:.0f}s budget "
+          f"(editor state and data safe after {data_phases:.2f}s); swap files preserved: {saved}/{editors}; "
+          f"sshd listener stopped: {listener.poll() is not None}")
+
+    for process in children:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+    return 0 if saved == editors and result['seconds'] <= budget else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkpoint a development container before it stops")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    checkpoint_parser = subparsers.add_parser('checkpoint', help="Save editor state, sync and drain SSH")
+    checkpoint_parser.add_argument('--sshd-pid', type=int, help="sshd listener (default: from its pid file)")
+    checkpoint_parser.add_argument('--workspace', default=os.environ.get('WORKSPACE', WORKSPACE))
+    checkpoint_parser.add_argument('--budget', type=float, default=float(os.environ.get('CHECKPOINT_BUDGET', BUDGET)),
+                                   help="Seconds for the whole checkpoint; keep it under the stop timeout")
+    checkpoint_parser.add_argument('--drain-timeout', type=float,
+                                   default=float(os.environ.get('CHECKPOINT_DRAIN_TIMEOUT', DRAIN_TIMEOUT)),
+                                   help="Seconds to wait for SSH sessions to end before hanging up")
+
+    simulate_parser = subparsers.add_parser('simulate', help="Time a checkpoint against stand-in processes")
+    simulate_parser.add_argument('--editors', type=int, default=4)
+    simulate_parser.add_argument('--sessions', type=int, default=8)
+    simulate_parser.add_argument('--lingering', type=int, default=2, help="Sessions that never disconnect")
+    simulate_parser.add_argument('--dirty-mb', type=int, default=256)
+    simulate_parser.add_argument('--snapshot-mb', type=int, default=0,
+                                 help="Also snapshot a workspace of this size to local S3")
+    simulate_parser.add_argument('--budget', type=float, default=BUDGET)
+    simulate_parser.add_argument('--drain-timeout', type=float, default=5.0)
+    simulate_parser.add_argument('--disconnect-after', type=float, default=3.0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        return simulate(args.editors, args.sessions, args.lingering, args.dirty_mb, args.snapshot_mb, args.budget,
+                        args.drain_timeout, args.disconnect_after)
+
+    command = snapshot_command(args.workspace)
+    checkpoint = Checkpoint(
+        workspace=args.workspace, budget=args.budget, drain_timeout=args.drain_timeout,
+        sshd_pid=args.sshd_pid or sshd_listener_pid(),
+        snapshot=subprocess_snapshot(command) if command else None
+    )
+    print(json.dumps(checkpoint.run()), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,753 @@
+"""
+In-process stand-ins for the AWS APIs the fleet tools use, so they can be
+exercised and benchmarked offline.
+
+The stand-ins accept the same keyword arguments and return the same
+response shapes as the boto3 clients for the operations they implement,
+enforce the same batch limits, and count every call they serve.
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def _timestamp(seconds):
+    # boto3 returns timestamps as timezone-aware datetimes
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+class LocalAwsError(Exception):
+    """
+    Raised where the real API would return a client error
+    """
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+def error_code(error):
+    """
+    Error code of a botocore ClientError or a LocalAwsError, else None
+    """
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+class _Paginator:
+    def __init__(self, method, token_in, token_out, max_key, max_value):
+        self.method = method
+        self.token_in = token_in
+        self.token_out = token_out
+        self.max_key = max_key
+        self.max_value = max_value
+
+    def paginate(self, **params):
+        params.setdefault(self.max_key, self.max_value)
+        while True:
+            page = self.method(**params)
+            yield page
+            token = page.get(self.token_out)
+            if not token:
+                return
+            params[self.token_in] = token
+
+
+class LocalECS:
+    """
+    Stand-in for the ECS client covering the task lifecycle.
+
+    Tasks move from PROVISIONING to PENDING to RUNNING as start_delay
+    seconds pass, and the lifecycle timestamps (createdAt, pullStartedAt,
+    pullStoppedAt, startedAt) are filled in along the way. phases, when
+    given, is called once per task and returns its (provisioning, pull,
+    start) durations in seconds instead. Every call sleeps for api_latency
+    seconds to model the round trip.
+    """
+
+    def __init__(self, start_delay=1.0, pull_fraction=0.6, api_latency=0.0, region='us-east-1',
+                 account='123456789012', phases=None):
+        self.start_delay = start_delay
+        self.pull_fraction = pull_fraction
+        self.phases = phases
+        self.api_latency = api_latency
+        self.region = region
+        self.account = account
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._services = {}
+        self._ips = itertools.count(10)
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def _refresh(self, task, now):
+        if task['lastStatus'] == 'STOPPED':
+            return
+        age = now - task['_created']
+        provisioning, pull, start = task['_phases']
+        pull_started = provisioning
+        pull_stopped = provisioning + pull
+        started = provisioning + pull + start
+        if age >= pull_started and 'pullStartedAt' not in task:
+            task['pullStartedAt'] = _timestamp(task['_created'] + pull_started)
+            task['lastStatus'] = 'PENDING'
+        if age >= pull_stopped and 'pullStoppedAt' not in task:
+            task['pullStoppedAt'] = _timestamp(task['_created'] + pull_stopped)
+        if age >= started and task['lastStatus'] != 'RUNNING':
+            task['startedAt'] = _timestamp(task['_created'] + started)
+            task['lastStatus'] = 'RUNNING'
+            task['healthStatus'] = 'HEALTHY'
+
+    def _task_phases(self):
+        if self.phases:
+            return tuple(self.phases())
+        return (self.start_delay * 0.1, self.start_delay * self.pull_fraction,
+                self.start_delay * (0.9 - self.pull_fraction))
+
+    def _public(self, task, include_tags):
+        return {
+            key: value for key, value in task.items()
+            if not key.startswith('_') and (include_tags or key != 'tags')
+        }
+
+    def run_task(self, cluster, taskDefinition, count=1, startedBy=None, tags=None, **kwargs):
+        self._call('RunTask')
+        if not 1 <= count <= 10:
+            raise LocalAwsError('InvalidParameterException', 'count must be between 1 and 10')
+        now = time.time()
+        cluster = cluster.split('/')[-1]
+        started = []
+        with self._lock:
+            for _ in range(count):
+                task_id = uuid.uuid4().hex
+                ip_index = next(self._ips)
+                task = {
+                    'taskArn': f"arn:aws:ecs:{self.region}:{self.account}:task/{cluster}/{task_id}",
+                    'clusterArn': f"arn:aws:ecs:{self.region}:{self.account}:cluster/{cluster}",
+                    'taskDefinitionArn': taskDefinition,
+                    'group': kwargs.get('group', f"family:{taskDefinition.split('/')[-1].split(':')[0]}"),
+                    'lastStatus': 'PROVISIONING',
+                    'desiredStatus': 'RUNNING',
+                    'healthStatus': 'UNKNOWN',
+                    'launchType': kwargs.get('launchType', 'FARGATE'),
+                    'createdAt': _timestamp(now),
+                    'startedBy': startedBy or '',
+                    'tags': list(tags or []),
+                    'attachments': [{
+                        'type': 'ElasticNetworkInterface',
+                        'status': 'ATTACHED',
+                        'details': [
+                            {'name': 'networkInterfaceId', 'value': f"eni-{task_id[:17]}"},
+                            {'name': 'privateIPv4Address', 'value': f"10.0.{ip_index // 250}.{ip_index % 250 + 4}"},
+                        ]
+                    }],
+                    '_cluster': cluster,
+                    '_created': now,
+                    '_phases': self._task_phases(),
+                }
+                self._tasks[task['taskArn']] = task
+                started.append(self._public(task, True))
+        return {'tasks': started, 'failures': []}
+
+    def describe_tasks(self, cluster, tasks, include=None):
+        self._call('DescribeTasks')
+        if len(tasks) > 100:
+            raise LocalAwsError('InvalidParameterException', 'Tasks cannot have more than 100 elements')
+        now = time.time()
+        found = []
+        failures = []
+        with self._lock:
+            for arn in tasks:
+                task = self._tasks.get(arn) or self._tasks.get(self._arn_for_id(cluster, arn))
+                if task is None or task['_cluster'] != cluster.split('/')[-1]:
+                    failures.append({'arn': arn, 'reason': 'MISSING'})
+                    continue
+                self._refresh(task, now)
+                found.append(self._public(task, include and 'TAGS' in include))
+        return {'tasks': found, 'failures': failures}
+
+    def _arn_for_id(self, cluster, task_id):
+        return f"arn:aws:ecs:{self.region}:{self.account}:task/{cluster.split('/')[-1]}/{task_id}"
+
+    def list_tasks(self, cluster, desiredStatus='RUNNING', startedBy=None, maxResults=100, nextToken=None,
+                   **kwargs):
+        self._call('ListTasks')
+        with self._lock:
+            arns = sorted(
+                arn for arn, task in self._tasks.items()
+                if task['_cluster'] == cluster.split('/')[-1]
+                and task['desiredStatus'] == desiredStatus
+                and (startedBy is None or task['startedBy'] == startedBy)
+            )
+        start = int(nextToken or 0)
+        page = {'taskArns': arns[start:start + maxResults]}
+        if start + maxResults < len(arns):
+            page['nextToken'] = str(start + maxResults)
+        return page
+
+    def stop_task(self, cluster, task, reason=''):
+        self._call('StopTask')
+        with self._lock:
+            stopped = self._tasks.get(task) or self._tasks.get(self._arn_for_id(cluster, task))
+            if stopped is None:
+                raise LocalAwsError('InvalidParameterException', 'The referenced task was not found')
+            stopped['desiredStatus'] = 'STOPPED'
+            stopped['lastStatus'] = 'STOPPED'
+            stopped['stoppedAt'] = _timestamp(time.time())
+            stopped['stoppedReason'] = reason
+            return {'task': self._public(stopped, False)}
+
+    def tag_resource(self, resourceArn, tags):
+        self._call('TagResource')
+        with self._lock:
+            task = self._tasks.get(resourceArn)
+            if task is None:
+                raise LocalAwsError('ResourceNotFoundException', 'The specified resource is not found')
+            current = {tag['key']: tag for tag in task['tags']}
+            current.update({tag['key']: tag for tag in tags})
+            task['tags'] = list(current.values())
+        return {}
+
+    def create_service(self, cluster, serviceName, taskDefinition, loadBalancers=None, desiredCount=0, **kwargs):
+        """
+        Records the service; its tasks are started with run_task and
+        group="service:<name>", as the service scheduler would
+        """
+        self._call('CreateService')
+        cluster = cluster.split('/')[-1]
+        service = {
+            'serviceArn': f"arn:aws:ecs:{self.region}:{self.account}:service/{cluster}/{serviceName}",
+            'serviceName': serviceName,
+            'clusterArn': f"arn:aws:ecs:{self.region}:{self.account}:cluster/{cluster}",
+            'taskDefinition': taskDefinition,
+            'loadBalancers': list(loadBalancers or []),
+            'desiredCount': desiredCount,
+            'status': 'ACTIVE',
+        }
+        with self._lock:
+            self._services[(cluster, serviceName)] = service
+        return {'service': dict(service)}
+
+    def describe_services(self, cluster, services, include=None):
+        self._call('DescribeServices')
+        if len(services) > 10:
+            raise LocalAwsError('InvalidParameterException', 'Services cannot have more than 10 elements')
+        cluster = cluster.split('/')[-1]
+        found = []
+        failures = []
+        with self._lock:
+            for name in services:
+                service = self._services.get((cluster, name.split('/')[-1]))
+                if service is None:
+                    failures.append({'arn': name, 'reason': 'MISSING'})
+                else:
+                    found.append(dict(service))
+        return {'services': found, 'failures': failures}
+
+    def list_clusters(self, maxResults=100, nextToken=None, **kwargs):
+        self._call('ListClusters')
+        with self._lock:
+            clusters = sorted({task['_cluster'] for task in self._tasks.values()})
+        arns = [f"arn:aws:ecs:{self.region}:{self.account}:cluster/{name}" for name in clusters]
+        start = int(nextToken or 0)
+        page = {'clusterArns': arns[start:start + maxResults]}
+        if start + maxResults < len(arns):
+            page['nextToken'] = str(start + maxResults)
+        return page
+
+    def get_paginator(self, operation):
+        if operation == 'list_tasks':
+            return _Paginator(self.list_tasks, 'nextToken', 'nextToken', 'maxResults', 100)
+        if operation == 'list_clusters':
+            return _Paginator(self.list_clusters, 'nextToken', 'nextToken', 'maxResults', 100)
+        raise NotImplementedError(operation)
+
+
+class LocalEC2:
+    """
+    Stand-in for the EC2 client's DescribeNetworkInterfaces, answering for
+    the ENIs of a LocalECS's tasks. Every task gets a public IP.
+    """
+
+    MAX_FILTER_VALUES = 200
+
+    def __init__(self, ecs, api_latency=0.0):
+        self.ecs = ecs
+        self.api_latency = api_latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def describe_network_interfaces(self, NetworkInterfaceIds=None, Filters=None, MaxResults=1000,
+                                    NextToken=None, **kwargs):
+        self._call('DescribeNetworkInterfaces')
+        wanted = set(NetworkInterfaceIds or [])
+        for name_values in Filters or []:
+            if len(name_values['Values']) > self.MAX_FILTER_VALUES:
+                raise LocalAwsError('InvalidParameterValue',
+                                    f"The maximum number of filter values is {self.MAX_FILTER_VALUES}")
+            if name_values['Name'] == 'network-interface-id':
+                wanted |= set(name_values['Values'])
+        interfaces = {}
+        with self.ecs._lock:
+            for task in self.ecs._tasks.values():
+                if task['lastStatus'] == 'STOPPED':
+                    continue
+                details = {d['name']: d['value'] for d in task['attachments'][0]['details']}
+                private_ip = details['privateIPv4Address']
+                octets = private_ip.split('.')
+                interfaces[details['networkInterfaceId']] = {
+                    'NetworkInterfaceId': details['networkInterfaceId'],
+                    'PrivateIpAddress': private_ip,
+                    'Association': {'PublicIp': f"54.{octets[1]}.{octets[2]}.{octets[3]}"},
+                    'Status': 'in-use',
+                }
+        if NetworkInterfaceIds:
+            missing = set(NetworkInterfaceIds) - set(interfaces)
+            if missing:
+                raise LocalAwsError('InvalidNetworkInterfaceID.NotFound',
+                                    f"The networkInterface ID '{sorted(missing)[0]}' does not exist")
+        found = [interfaces[eni] for eni in sorted(wanted) if eni in interfaces]
+        start = int(NextToken or 0)
+        page = {'NetworkInterfaces': found[start:start + MaxResults]}
+        if start + MaxResults < len(found):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+    def get_paginator(self, operation):
+        if operation == 'describe_network_interfaces':
+            return _Paginator(self.describe_network_interfaces, 'NextToken', 'NextToken', 'MaxResults', 1000)
+        raise NotImplementedError(operation)
+
+
+class LocalELBv2:
+    """
+    Stand-in for the ELBv2 client's target groups and target health.
+
+    Each target group health-checks its targets every interval seconds from
+    the moment they register. mark_ready (not an AWS API) records when a
+    target's application starts answering; the target turns healthy at the
+    healthy_threshold-th passing check after that, and is "initial" until
+    then, the way a new NLB target is.
+    """
+
+    def __init__(self, api_latency=0.0, region='us-east-1', account='123456789012'):
+        self.api_latency = api_latency
+        self.region = region
+        self.account = account
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def _group(self, arn):
+        if arn not in self._groups:
+            raise LocalAwsError('TargetGroupNotFound', f"Target groups '{arn}' not found")
+        return self._groups[arn]
+
+    def create_target_group(self, Name, Port=22, Protocol='TCP', TargetType='ip', HealthCheckIntervalSeconds=30,
+                            HealthyThresholdCount=3, **kwargs):
+        self._call('CreateTargetGroup')
+        arn = (f"arn:aws:elasticloadbalancing:{self.region}:{self.account}:targetgroup/"
+               f"{Name}/{uuid.uuid4().hex[:16]}")
+        group = {
+            'TargetGroupArn': arn,
+            'TargetGroupName': Name,
+            'Protocol': Protocol,
+            'Port': Port,
+            'TargetType': TargetType,
+            'HealthCheckIntervalSeconds': HealthCheckIntervalSeconds,
+            'HealthyThresholdCount': HealthyThresholdCount,
+            'LoadBalancerArns': list(kwargs.get('LoadBalancerArns', [])),
+        }
+        with self._lock:
+            self._groups[arn] = dict(group, _targets={})
+        return {'TargetGroups': [group]}
+
+    def describe_target_groups(self, LoadBalancerArn=None, TargetGroupArns=None, Names=None, Marker=None,
+                               PageSize=400):
+        self._call('DescribeTargetGroups')
+        with self._lock:
+            groups = [
+                {key: value for key, value in group.items() if not key.startswith('_')}
+                for arn, group in sorted(self._groups.items())
+                if (TargetGroupArns is None or arn in TargetGroupArns)
+                and (Names is None or group['TargetGroupName'] in Names)
+                and (LoadBalancerArn is None or LoadBalancerArn in group['LoadBalancerArns'])
+            ]
+        start = int(Marker or 0)
+        page = {'TargetGroups': groups[start:start + PageSize]}
+        if start + PageSize < len(groups):
+            page['NextMarker'] = str(start + PageSize)
+        return page
+
+    def register_targets(self, TargetGroupArn, Targets):
+        self._call('RegisterTargets')
+        now = time.time()
+        with self._lock:
+            group = self._group(TargetGroupArn)
+            for target in Targets:
+                group['_targets'][target['Id']] = {
+                    'Port': target.get('Port', group['Port']), '_registered': now, '_ready': None,
+                }
+        return {}
+
+    def deregister_targets(self, TargetGroupArn, Targets):
+        self._call('DeregisterTargets')
+        with self._lock:
+            group = self._group(TargetGroupArn)
+            for target in Targets:
+                group['_targets'].pop(target['Id'], None)
+        return {}
+
+    def mark_ready(self, target_group_arn, target_id, at=None):
+        with self._lock:
+            self._groups[target_group_arn]['_targets'][target_id]['_ready'] = time.time() if at is None else at
+
+    def _state(self, group, target, now):
+        if target['_ready'] is None:
+            return 'initial', 'Elb.RegistrationInProgress'
+        interval = group['HealthCheckIntervalSeconds']
+        # Checks run at registration + k * interval; count the passing ones
+        first_pass = max(0, -(-(target['_ready'] - target['_registered']) // interval))
+        healthy_at = target['_registered'] + (first_pass + group['HealthyThresholdCount'] - 1) * interval
+        if now >= healthy_at:
+            return 'healthy', None
+        return 'initial', 'Elb.InitialHealthChecking'
+
+    def describe_target_health(self, TargetGroupArn, Targets=None):
+        self._call('DescribeTargetHealth')
+        now = time.time()
+        wanted = {target['Id'] for target in Targets} if Targets else None
+        descriptions = []
+        with self._lock:
+            group = self._group(TargetGroupArn)
+            for target_id, target in sorted(group['_targets'].items()):
+                if wanted is not None and target_id not in wanted:
+                    continue
+                state, reason = self._state(group, target, now)
+                health = {'State': state}
+                if reason:
+                    health['Reason'] = reason
+                descriptions.append({
+                    'Target': {'Id': target_id, 'Port': target['Port']},
+                    'HealthCheckPort': str(target['Port']),
+                    'TargetHealth': health,
+                })
+        return {'TargetHealthDescriptions': descriptions}
+
+    def get_paginator(self, operation):
+        if operation == 'describe_target_groups':
+            return _Paginator(self.describe_target_groups, 'Marker', 'NextMarker', 'PageSize', 400)
+        raise NotImplementedError(operation)
+
+
+class LocalLogs:
+    """
+    Stand-in for the CloudWatch Logs client's PutLogEvents and
+    FilterLogEvents. Groups and streams are created on first write, the way
+    the awslogs driver creates its streams. Filter patterns support a quoted
+    term ("sshd_ready", matched anywhere in the message) and a single JSON
+    equality ({ $.Event = "sshd_ready" }).
+    """
+
+    def __init__(self, api_latency=0.0):
+        self.api_latency = api_latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._event_ids = itertools.count(1)
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents, **kwargs):
+        self._call('PutLogEvents')
+        ingested = int(time.time() * 1000)
+        with self._lock:
+            stream = self._groups.setdefault(logGroupName, {}).setdefault(logStreamName, [])
+            for event in logEvents:
+                stream.append({
+                    'logStreamName': logStreamName,
+                    'timestamp': event['timestamp'],
+                    'message': event['message'],
+                    'ingestionTime': ingested,
+                    'eventId': str(next(self._event_ids)),
+                })
+        return {'nextSequenceToken': str(ingested)}
+
+    @staticmethod
+    def _matcher(pattern):
+        if not pattern:
+            return lambda message: True
+        pattern = pattern.strip()
+        if pattern.startswith('{'):
+            key, _, value = pattern.strip('{} ').partition('=')
+            key = key.strip().removeprefix('$.')
+            value = value.strip().strip('"')
+
+            def matches(message):
+                try:
+                    document = json.loads(message)
+                except ValueError:
+                    return False
+                return isinstance(document, dict) and str(document.get(key)) == value
+            return matches
+        terms = [term.strip('"') for term in pattern.split()]
+        return lambda message: all(term in message for term in terms)
+
+    def filter_log_events(self, logGroupName, filterPattern=None, startTime=None, endTime=None,
+                          logStreamNamePrefix=None, nextToken=None, limit=10000, **kwargs):
+        self._call('FilterLogEvents')
+        matches = self._matcher(filterPattern)
+        with self._lock:
+            if logGroupName not in self._groups:
+                raise LocalAwsError('ResourceNotFoundException', 'The specified log group does not exist.')
+            events = sorted(
+                (
+                    event for name, stream in self._groups[logGroupName].items()
+                    if logStreamNamePrefix is None or name.startswith(logStreamNamePrefix)
+                    for event in stream
+                    if (startTime is None or event['timestamp'] >= startTime)
+                    and (endTime is None or event['timestamp'] <= endTime)
+                ),
+                key=lambda event: (event['timestamp'], int(event['eventId']))
+            )
+        found = [dict(event) for event in events if matches(event['message'])]
+        start = int(nextToken or 0)
+        page = {'events': found[start:start + limit]}
+        if start + limit < len(found):
+            page['nextToken'] = str(start + limit)
+        return page
+
+    def get_paginator(self, operation):
+        if operation == 'filter_log_events':
+            return _Paginator(self.filter_log_events, 'nextToken', 'nextToken', 'limit', 10000)
+        raise NotImplementedError(operation)
+
+
+class LocalS3:
+    """
+    Stand-in for the S3 client covering object reads and writes.
+
+    Objects carry an MD5 ETag, and get_object honours IfNoneMatch/IfMatch
+    the way S3 does (a 304 or 412 client error). Multipart uploads enforce
+    the 5 MiB minimum for every part but the last. Every call sleeps for
+    api_latency seconds to model the round trip, and bytes_in/bytes_out
+    count object data transferred.
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, api_latency=0.0):
+        self.api_latency = api_latency
+        self.calls = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._uploads = {}
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def _bucket(self, bucket):
+        if bucket not in self._buckets:
+            raise LocalAwsError('NoSuchBucket', 'The specified bucket does not exist')
+        return self._buckets[bucket]
+
+    def _object(self, bucket, key, missing_code='NoSuchKey'):
+        obj = self._bucket(bucket).get(key)
+        if obj is None:
+            raise LocalAwsError(missing_code, 'The specified key does not exist.')
+        return obj
+
+    def create_bucket(self, Bucket, **kwargs):
+        self._call('CreateBucket')
+        with self._lock:
+            self._buckets.setdefault(Bucket, {})
+        return {'Location': f"/{Bucket}"}
+
+    def head_bucket(self, Bucket):
+        self._call('HeadBucket')
+        with self._lock:
+            if Bucket not in self._buckets:
+                raise LocalAwsError('404', 'Not Found')
+        return {}
+
+    def put_object(self, Bucket, Key, Body=b'', IfMatch=None, IfNoneMatch=None, **kwargs):
+        self._call('PutObject')
+        if isinstance(Body, str):
+            Body = Body.encode()
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            self.bytes_in += len(Body)
+            bucket = self._bucket(Bucket)
+            current = bucket.get(Key)
+            if IfNoneMatch == '*' and current is not None:
+                raise LocalAwsError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+            if IfMatch is not None and (current is None or current['ETag'] != IfMatch):
+                raise LocalAwsError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+            bucket[Key] = {
+                'Body': bytes(Body),
+                'ETag': etag,
+                'LastModified': _timestamp(time.time()),
+                'Metadata': dict(kwargs.get('Metadata') or {}),
+            }
+        return {'ETag': etag}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, IfMatch=None, Range=None, **kwargs):
+        self._call('GetObject')
+        with self._lock:
+            obj = self._object(Bucket, Key)
+        if IfMatch is not None and obj['ETag'] != IfMatch:
+            raise LocalAwsError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+        if IfNoneMatch is not None and obj['ETag'] == IfNoneMatch:
+            raise LocalAwsError('304', 'Not Modified')
+        body = obj['Body']
+        if Range:
+            start, _, end = Range.split('=', 1)[1].partition('-')
+            body = body[int(start):int(end) + 1 if end else None]
+        with self._lock:
+            self.bytes_out += len(body)
+        return {
+            'Body': io.BytesIO(body),
+            'ContentLength': len(body),
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified'],
+            'Metadata': dict(obj['Metadata']),
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        with self._lock:
+            obj = self._object(Bucket, Key, missing_code='404')
+        return {
+            'ContentLength': len(obj['Body']),
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified'],
+            'Metadata': dict(obj['Metadata']),
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call('DeleteObject')
+        with self._lock:
+            self._bucket(Bucket).pop(Key, None)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self._call('CopyObject')
+        with self._lock:
+            source = dict(self._object(CopySource['Bucket'], CopySource['Key']))
+            source['LastModified'] = _timestamp(time.time())
+            self._bucket(Bucket)[Key] = source
+        return {'CopyObjectResult': {'ETag': source['ETag'], 'LastModified': source['LastModified']}}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._bucket(Bucket)
+            self._uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'Parts': {}}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._call('UploadPart')
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        Body = bytes(Body)
+        if not 1 <= PartNumber <= 10000:
+            raise LocalAwsError('InvalidArgument', 'Part number must be an integer between 1 and 10000')
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            upload = self._uploads.get(UploadId)
+            if upload is None or upload['Key'] != Key:
+                raise LocalAwsError('NoSuchUpload', 'The specified upload does not exist')
+            upload['Parts'][PartNumber] = (etag, Body)
+            self.bytes_in += len(Body)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call('CompleteMultipartUpload')
+        with self._lock:
+            upload = self._uploads.pop(UploadId, None)
+            if upload is None:
+                raise LocalAwsError('NoSuchUpload', 'The specified upload does not exist')
+            parts = sorted(MultipartUpload['Parts'], key=lambda part: part['PartNumber'])
+            bodies = []
+            for index, part in enumerate(parts):
+                etag, body = upload['Parts'].get(part['PartNumber'], (None, None))
+                if etag is None or etag != part['ETag']:
+                    raise LocalAwsError('InvalidPart', f"Part {part['PartNumber']} was not uploaded")
+                if index < len(parts) - 1 and len(body) < self.MIN_PART_SIZE:
+                    raise LocalAwsError('EntityTooSmall', 'Your proposed upload is smaller than the minimum allowed size')
+                bodies.append(body)
+            digest = hashlib.md5(b''.join(bytes.fromhex(upload['Parts'][p['PartNumber']][0].strip('"'))
+                                          for p in parts)).hexdigest()
+            etag = f'"{digest}-{len(parts)}"'
+            self._bucket(Bucket)[Key] = {
+                'Body': b''.join(bodies),
+                'ETag': etag,
+                'LastModified': _timestamp(time.time()),
+                'Metadata': {},
+            }
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload')
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000, StartAfter='', **kwargs):
+        self._call('ListObjectsV2')
+        with self._lock:
+            keys = sorted(key for key in self._bucket(Bucket) if key.startswith(Prefix) and key > StartAfter)
+            start = int(ContinuationToken or 0)
+            contents = [
+                {
+                    'Key': key,
+                    'Size': len(self._buckets[Bucket][key]['Body']),
+                    'ETag': self._buckets[Bucket][key]['ETag'],
+                    'LastModified': self._buckets[Bucket][key]['LastModified'],
+                }
+                for key in keys[start:start + MaxKeys]
+            ]
+        page = {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': start + MaxKeys < len(keys)}
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = str(start + MaxKeys)
+        return page
+
+    def get_paginator(self, operation):
+        if operation == 'list_objects_v2':
+            return _Paginator(self.list_objects_v2, 'ContinuationToken', 'NextContinuationToken', 'MaxKeys', 1000)
+        raise NotImplementedError(operation)
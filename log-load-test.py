@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+log-load-test.py - stdout write latency and dropped lines per log mode
+
+A child process writes a heavy, build-like log stream to stdout (a pipe) and
+times every write. This process plays the log driver on the other end of
+the pipe and ships batches to a stand-in for CloudWatch Logs PutLogEvents
+that throttles for a few seconds in the middle of the run:
+
+  blocking      awslogs default: a 4096-line queue; when it is full the
+                driver stops reading and the writer's write() blocks
+  non-blocking  awslogs mode=non-blocking: a max-buffer-size ring buffer;
+                when it is full new lines are dropped and write() never waits
+  firelens      non-blocking into the Fluent Bit router, which applies
+                log-router/sample.lua (errors, warnings and EMF always kept)
+                before batching to CloudWatch
+
+Each mode reports write latency percentiles and the longest stall, lines
+delivered, dropped from the buffer, sampled out and lost after retries, and
+whether every error and EMF line arrived.
+
+--check-router runs log-router/dev-fleet.conf itself in the router image
+(docker required), with each output swapped for a file, and checks which
+outputs a routine, error, EMF and blank line reach. Without docker it
+traces the lines' tags through the config's Match rules instead, which
+catches retag loops but not the plugins' behaviour.
+
+Usage:
+  log-load-test.py [--modes blocking non-blocking firelens] [--rate 40000] [--seconds 6]
+      [--buffer-mib 1 25] [--throttle-at 1 --throttle-for 3]
+  log-load-test.py --check-router [--router-seconds 15]
+"""
+
+import argparse
+import collections
+import fnmatch
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# docker's awslogs driver: queue length, and PutLogEvents batch limits
+BLOCKING_QUEUE_LINES = 4096
+BATCH_MAX_EVENTS = 10000
+BATCH_MAX_BYTES = 1024 * 1024
+EVENT_OVERHEAD_BYTES = 26
+BATCH_INTERVAL = 5.0
+
+# Retries of a throttled PutLogEvents before the batch is given up
+MAX_RETRIES = 5
+FIRST_BACKOFF = 0.1
+
+IMPORTANT_WORDS = ('error', 'warn', 'fail', 'traceback', 'panic', 'fatal')
+
+ROUTER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log-router')
+ROUTER_IMAGE = 'public.ecr.aws/aws-observability/aws-for-fluent-bit:stable'
+# The tag FireLens gives the dev container's records
+ROUTER_TAG = 'dev-container-firelens-0123456789abcdef0123456789abcdef'
+ROUTER_LINES = {
+    'routine': '[       1] cc -O2 -c src/module_0001.c -o build/module_0001.o',
+    'error': '[       2] src/module_0002.c:97:3: error: expected ; before } token',
+    'emf': '{"_aws":{"Timestamp":1700000000000,"CloudWatchMetrics":[]},"ActiveSshSessions":1}',
+    'blank': '   ',
+}
+# Outputs (by Match) each line should reach exactly once
+ROUTER_EXPECTED = {
+    'routine': ['archive.*', 'dev-container-firelens-*'],
+    'error': ['archive.*', 'dev-container-firelens-*'],
+    'emf': ['emf.*'],
+    'blank': [],
+}
+
+WRITER = r"""
+import json, os, sys, time
+rate, seconds = float(sys.argv[1]), float(sys.argv[2])
+total = int(rate * seconds)
+routine = b'[%8d] cc -O2 -c src/module_%04d.c -o build/module_%04d.o   ' + b'.' * 48 + b'\n'
+warning = b'[%8d] src/module_%04d.c:42:7: warning: unused variable tmp [-Wunused-variable]\n'
+error = b'[%8d] src/module_%04d.c:97:3: error: expected ; before } token (TEST FAILED)\n'
+emf = b'{"_aws":{"Timestamp":%d,"CloudWatchMetrics":[]},"ActiveSshSessions":%d}\n'
+latencies = []
+counts = {'routine': 0, 'warning': 0, 'error': 0, 'emf': 0}
+start = time.perf_counter()
+next_emf = start
+for index in range(total):
+    now = time.perf_counter()
+    if index % 256 == 0:
+        ahead = start + index / rate - now
+        if ahead > 0:
+            time.sleep(ahead)
+    if now >= next_emf:
+        line, kind = emf % (int(time.time() * 1000), index), 'emf'
+        next_emf += 1.0
+    elif index % 1000 == 0:
+        line, kind = error % (index, index % 9973), 'error'
+    elif index % 100 == 0:
+        line, kind = warning % (index, index % 9973), 'warning'
+    else:
+        line, kind = routine % (index, index % 9973, index % 9973), 'routine'
+    began = time.perf_counter()
+    os.write(1, line)
+    latencies.append(time.perf_counter() - began)
+    counts[kind] += 1
+elapsed = time.perf_counter() - start
+latencies.sort()
+def pct(p):
+    return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+stalled = sum(l for l in latencies if l > 0.01)
+print(json.dumps({'lines': total, 'elapsed': elapsed, 'counts': counts, 'p50': pct(50), 'p99': pct(99),
+                  'p999': pct(99.9), 'max': latencies[-1], 'stalled': stalled}), file=sys.stderr)
+"""
+
+
+def line_kind(line):
+    if line.startswith(b'{"_aws"'):
+        return 'emf'
+    if b'error' in line:
+        return 'error'
+    if b'warning' in line:
+        return 'warning'
+    return 'routine'
+
+
+class Sampler:
+    """
+    The same decisions as log-router/sample.lua, on this process's clock
+    """
+
+    def __init__(self, lines_per_second, sample_every):
+        self.lines_per_second = lines_per_second
+        self.sample_every = sample_every
+        self.second = -1
+        self.kept = 0
+        self.over_rate = 0
+        self.sampled_out = 0
+
+    def keep(self, line, now):
+        # EMF lines are retagged before sampling in the Fluent Bit pipeline
+        if line.startswith(b'{"_aws"'):
+            return True
+        lower = line.lower()
+        if any(word.encode() in lower for word in IMPORTANT_WORDS):
+            return True
+        second = int(now)
+        if second != self.second:
+            self.second, self.kept, self.over_rate = second, 0, 0
+        if self.kept < self.lines_per_second:
+            self.kept += 1
+            return True
+        self.over_rate += 1
+        if self.over_rate % self.sample_every == 0:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class FakeCloudWatch:
+    """
+    PutLogEvents with a fixed latency that answers ThrottlingException
+    between throttle_at and throttle_at + throttle_for seconds into the run
+    """
+
+    def __init__(self, start, latency, throttle_at, throttle_for):
+        self.start = start
+        self.latency = latency
+        self.throttle_window = (throttle_at, throttle_at + throttle_for)
+        self.calls = 0
+        self.throttled = 0
+        self.delivered = collections.Counter()
+        self.bytes = 0
+
+    def put_log_events(self, lines):
+        time.sleep(self.latency)
+        self.calls += 1
+        offset = time.perf_counter() - self.start
+        if self.throttle_window[0] <= offset < self.throttle_window[1]:
+            self.throttled += 1
+            return False
+        for line in lines:
+            self.delivered[line_kind(line)] += 1
+            self.bytes += len(line) + EVENT_OVERHEAD_BYTES
+        return True
+
+
+class Driver:
+    """
+    Reads the writer's pipe line by line into a blocking queue or a bounded
+    ring buffer, and ships batches from it like the awslogs driver does
+    """
+
+    def __init__(self, mode, buffer_bytes, cloudwatch, sampler=None):
+        self.mode = mode
+        self.buffer_bytes = buffer_bytes
+        self.cloudwatch = cloudwatch
+        self.sampler = sampler
+        self.queue = queue.Queue(maxsize=BLOCKING_QUEUE_LINES)
+        self.ring = collections.deque()
+        self.ring_bytes = 0
+        self.ring_lock = threading.Condition()
+        self.dropped = collections.Counter()
+        self.lost = collections.Counter()
+        self.done = False
+
+    def accept(self, line):
+        if self.sampler is not None and not self.sampler.keep(line, time.time()):
+            return
+        if self.mode == 'blocking':
+            self.queue.put(line)
+            return
+        with self.ring_lock:
+            if self.ring_bytes + len(line) > self.buffer_bytes:
+                self.dropped[line_kind(line)] += 1
+                return
+            self.ring.append(line)
+            self.ring_bytes += len(line)
+            self.ring_lock.notify()
+
+    def take(self, timeout):
+        if self.mode == 'blocking':
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        with self.ring_lock:
+            if not self.ring:
+                self.ring_lock.wait(timeout)
+            if not self.ring:
+                return None
+            line = self.ring.popleft()
+            self.ring_bytes -= len(line)
+            return line
+
+    def read(self, pipe):
+        pending = b''
+        while True:
+            chunk = os.read(pipe, 65536)
+            if not chunk:
+                break
+            pending += chunk
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                self.accept(line + b'\n')
+        self.done = True
+
+    def publish(self, batch):
+        backoff = FIRST_BACKOFF
+        for _ in range(MAX_RETRIES + 1):
+            if self.cloudwatch.put_log_events(batch):
+                return
+            time.sleep(backoff)
+            backoff *= 2
+        for line in batch:
+            self.lost[line_kind(line)] += 1
+
+    def ship(self):
+        batch, batch_bytes = [], 0
+        deadline = time.perf_counter() + BATCH_INTERVAL
+        while True:
+            line = self.take(timeout=0.05)
+            if line is not None:
+                size = len(line) + EVENT_OVERHEAD_BYTES
+                if len(batch) >= BATCH_MAX_EVENTS or batch_bytes + size > BATCH_MAX_BYTES:
+                    self.publish(batch)
+                    batch, batch_bytes = [], 0
+                    deadline = time.perf_counter() + BATCH_INTERVAL
+                batch.append(line)
+                batch_bytes += size
+            finished = line is None and self.done and self.queue.empty() and not self.ring
+            if batch and (finished or time.perf_counter() >= deadline):
+                self.publish(batch)
+                batch, batch_bytes = [], 0
+                deadline = time.perf_counter() + BATCH_INTERVAL
+            if finished:
+                return
+
+
+def run_mode(mode, buffer_mib, rate, seconds, api_latency, throttle_at, throttle_for,
+             lines_per_second, sample_every):
+    start = time.perf_counter()
+    cloudwatch = FakeCloudWatch(start, api_latency, throttle_at, throttle_for)
+    sampler = Sampler(lines_per_second, sample_every) if mode == 'firelens' else None
+    driver = Driver(mode, (buffer_mib or 0) * 1024 * 1024, cloudwatch, sampler)
+
+    read_end, write_end = os.pipe()
+    writer = subprocess.Popen([sys.executable, '-c', WRITER, str(rate), str(seconds)],
+                              stdout=write_end, stderr=subprocess.PIPE)
+    os.close(write_end)
+    reader = threading.Thread(target=driver.read, args=(read_end,), daemon=True)
+    shipper = threading.Thread(target=driver.ship, daemon=True)
+    reader.start()
+    shipper.start()
+    stats = json.loads(writer.communicate()[1].decode().strip().splitlines()[-1])
+    reader.join()
+    shipper.join()
+    os.close(read_end)
+
+    written = stats['counts']
+    return {
+        'mode': mode,
+        'buffer_mib': buffer_mib if mode != 'blocking' else None,
+        'lines': stats['lines'],
+        'write_seconds': stats['elapsed'],
+        'p50_us': stats['p50'] * 1e6,
+        'p99_us': stats['p99'] * 1e6,
+        'p999_us': stats['p999'] * 1e6,
+        'max_ms': stats['max'] * 1000,
+        'stalled_s': stats['stalled'],
+        'delivered': sum(cloudwatch.delivered.values()),
+        'dropped': sum(driver.dropped.values()),
+        'sampled_out': sampler.sampled_out if sampler else 0,
+        'lost': sum(driver.lost.values()),
+        'errors': f"{cloudwatch.delivered['error']}/{written['error']}",
+        'emf': f"{cloudwatch.delivered['emf']}/{written['emf']}",
+        'calls': cloudwatch.calls,
+        'throttled': cloudwatch.throttled,
+        'shipped_mb': cloudwatch.bytes / 1e6,
+    }
+
+
+def router_sections(text):
+    """[(section, {key: value})] of a Fluent Bit classic-mode config, keys lowercased"""
+    sections = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('['):
+            sections.append((line.strip('[]').upper(), {}))
+        elif sections:
+            key, _, value = line.partition(' ')
+            sections[-1][1][key.lower()] = value.strip()
+    return sections
+
+
+class RouterLoop(Exception):
+    pass
+
+
+def trace_router(sections, tag, record, depth=0):
+    """
+    Match patterns of the outputs a record reaches. rewrite_tag re-emits its
+    copies into the start of the pipeline, so they go through every filter again.
+    """
+    if depth > 4:
+        raise RouterLoop(f"{tag} is still being retagged after {depth} passes")
+    reached = []
+    for section, options in sections:
+        if section != 'FILTER' or not fnmatch.fnmatchcase(tag, options.get('match', '')):
+            continue
+        if options['name'] == 'grep' and 'exclude' in options:
+            key, _, regex = options['exclude'].partition(' ')
+            if re.search(regex.strip(), record.get(key, '')):
+                return reached
+        elif options['name'] == 'rewrite_tag':
+            key, regex, new_tag, keep = options['rule'].split()
+            if re.search(regex, record.get(key.lstrip('$'), '')):
+                reached += trace_router(sections, new_tag.replace('$TAG', tag), record, depth + 1)
+                if keep == 'false':
+                    return reached
+    for section, options in sections:
+        if section == 'OUTPUT' and fnmatch.fnmatchcase(tag, options.get('match', '')):
+            reached.append(options['match'])
+    return reached
+
+
+def router_check_config(sections, seconds):
+    """dev-fleet.conf with one dummy input per test line and every output written to a file"""
+    lines = []
+    for section, options in sections:
+        if section == 'OUTPUT':
+            options = {'Name': 'file', 'Match': options['match'], 'Path': '/check/out',
+                       'File': re.sub(r'[^\w-]', '_', options['match']), 'Format': 'plain'}
+        elif section == 'SERVICE':
+            options = dict(options, flush='1', grace=str(max(1, seconds // 3)))
+        lines.append(f"[{section}]")
+        lines += [f"    {key} {value}" for key, value in options.items()]
+    for kind, line in ROUTER_LINES.items():
+        lines += ['[INPUT]', '    Name dummy', f"    Tag {ROUTER_TAG}", '    Samples 1',
+                  f"    Dummy {json.dumps({'log': line})}"]
+    return '\n'.join(lines) + '\n'
+
+
+def run_router(sections, seconds):
+    """Outputs each test line reached, running the config in the router image"""
+    workdir = tempfile.mkdtemp(prefix='router-check-')
+    try:
+        os.makedirs(os.path.join(workdir, 'out'))
+        with open(os.path.join(workdir, 'fluent-bit.conf'), 'w') as f:
+            f.write(router_check_config(sections, seconds))
+        name = f"router-check-{os.getpid()}"
+        environment = {'AWS_REGION': 'us-east-1', 'LOG_GROUP_NAME': 'check', 'LOG_STREAM_PREFIX': 'check',
+                       'LOG_ARCHIVE_BUCKET': 'check', 'LOG_LINES_PER_SECOND': '200', 'LOG_SAMPLE_EVERY': '20'}
+        command = ['docker', 'run', '--rm', '--name', name, '-v', f"{workdir}:/check",
+                   '-v', f"{ROUTER_DIRECTORY}:/fluent-bit/etc:ro"]
+        for key, value in environment.items():
+            command += ['-e', f"{key}={value}"]
+        router = subprocess.Popen(command + [ROUTER_IMAGE, '/fluent-bit/bin/fluent-bit', '-c',
+                                             '/check/fluent-bit.conf'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        time.sleep(seconds)
+        subprocess.run(['docker', 'stop', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        log = router.communicate()[0].decode(errors='replace')
+        if router.returncode not in (0, 137, 143):
+            raise RuntimeError(f"fluent-bit exited with {router.returncode}:\n{log}")
+
+        reached = {kind: [] for kind in ROUTER_LINES}
+        outputs = {re.sub(r'[^\w-]', '_', options['match']): options['match']
+                   for section, options in sections if section == 'OUTPUT'}
+        for file_name in os.listdir(os.path.join(workdir, 'out')):
+            with open(os.path.join(workdir, 'out', file_name)) as f:
+                for line in f:
+                    text = json.loads(line).get('log', '')
+                    kind = next(kind for kind, sent in ROUTER_LINES.items() if sent == text)
+                    reached[kind].append(outputs[file_name])
+        return reached
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def check_router(seconds):
+    with open(os.path.join(ROUTER_DIRECTORY, 'dev-fleet.conf')) as f:
+        sections = router_sections(f.read())
+    if shutil.which('docker'):
+        print(f"Running log-router/dev-fleet.conf in {ROUTER_IMAGE} for {seconds}s")
+        reached = run_router(sections, seconds)
+    else:
+        print("docker not found; tracing tags through log-router/dev-fleet.conf's Match rules instead")
+        try:
+            reached = {kind: trace_router(sections, ROUTER_TAG, {'log': line})
+                       for kind, line in ROUTER_LINES.items()}
+        except RouterLoop as e:
+            print(f"FAIL: {e}")
+            return 1
+    failures = 0
+    for kind, expected in ROUTER_EXPECTED.items():
+        ok = sorted(reached[kind]) == sorted(expected)
+        failures += not ok
+        print(f"{kind:<8} -> {', '.join(sorted(reached[kind])) or 'dropped':<36} "
+              f"{'ok' if ok else 'FAIL, expected ' + (', '.join(expected) or 'dropped')}")
+    print("Router config OK" if not failures else f"{failures} line(s) routed wrongly")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="stdout write latency and dropped lines per log mode")
+    parser.add_argument('--modes', nargs='+', default=['blocking', 'non-blocking', 'firelens'],
+                        choices=['blocking', 'non-blocking', 'firelens'])
+    parser.add_argument('--rate', type=float, default=40000, help="Lines per second the writer attempts")
+    parser.add_argument('--seconds', type=float, default=6)
+    parser.add_argument('--buffer-mib', type=int, nargs='+', default=[1, 25],
+                        help="max-buffer-size values to try in the non-blocking modes (docker's default is 1)")
+    parser.add_argument('--api-latency', type=float, default=0.03, help="Seconds per PutLogEvents call")
+    parser.add_argument('--throttle-at', type=float, default=1.0, help="Seconds into the run throttling starts")
+    parser.add_argument('--throttle-for', type=float, default=3.0)
+    parser.add_argument('--lines-per-second', type=int, default=200, help="firelens: routine lines kept per second")
+    parser.add_argument('--sample-every', type=int, default=20, help="firelens: then keep 1 in this many")
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--check-router', action='store_true',
+                        help="Check which outputs of log-router/dev-fleet.conf each kind of line reaches")
+    parser.add_argument('--router-seconds', type=int, default=15, help="--check-router: how long to run Fluent Bit")
+    args = parser.parse_args(argv)
+    if args.check_router:
+        return check_router(args.router_seconds)
+
+    runs = []
+    for mode in args.modes:
+        for buffer_mib in ([None] if mode == 'blocking' else args.buffer_mib):
+            runs.append(run_mode(mode, buffer_mib, args.rate, args.seconds, args.api_latency,
+                                 args.throttle_at, args.throttle_for, args.lines_per_second, args.sample_every))
+
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return 0
+    print(f"{args.rate:.0f} lines/s for {args.seconds:g}s; PutLogEvents {args.api_latency * 1000:.0f}ms, "
+          f"throttled from {args.throttle_at:g}s for {args.throttle_for:g}s")
+    print(f"{'mode':<16} {'write p50':>9} {'p99':>9} {'p99.9':>9} {'max':>9} {'stalled':>8} {'took':>6} "
+          f"{'delivered':>9} {'dropped':>8} {'sampled':>8} {'lost':>6} {'errors':>11} {'emf':>6} {'MB':>6}")
+    for run in runs:
+        name = run['mode'] + (f" {run['buffer_mib']}M" if run['buffer_mib'] else '')
+        print(f"{name:<16} {run['p50_us']:>7.1f}us {run['p99_us']:>7.1f}us {run['p999_us']:>7.0f}us "
+              f"{run['max_ms']:>7.0f}ms {run['stalled_s']:>7.2f}s {run['write_seconds']:>5.1f}s "
+              f"{run['delivered']:>9} {run['dropped']:>8} {run['sampled_out']:>8} {run['lost']:>6} "
+              f"{run['errors']:>11} {run['emf']:>6} {run['shipped_mb']:>6.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
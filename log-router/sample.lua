@@ -0,0 +1,60 @@
+-- Sampling for the CloudWatch copy of a development container's output.
+--
+-- Errors, warnings and failures are always kept. Other lines are kept up to
+-- LOG_LINES_PER_SECOND each second; past that, one in LOG_SAMPLE_EVERY is
+-- kept and carries a "sampled_out" count of the lines dropped before it.
+-- The S3 archive gets every line regardless.
+
+local lines_per_second = tonumber(os.getenv("LOG_LINES_PER_SECOND") or "200")
+local sample_every = tonumber(os.getenv("LOG_SAMPLE_EVERY") or "20")
+
+local current_second = -1
+local kept_this_second = 0
+local seen_over_rate = 0
+local sampled_out = 0
+
+local important = { "error", "warn", "fail", "traceback", "panic", "fatal" }
+
+local function is_important(line)
+    local lower = string.lower(line)
+    for _, word in ipairs(important) do
+        if string.find(lower, word, 1, true) then
+            return true
+        end
+    end
+    return false
+end
+
+local function keep(record)
+    if sampled_out > 0 then
+        record["sampled_out"] = sampled_out
+        sampled_out = 0
+        return 2, 0, record
+    end
+    return 0, 0, record
+end
+
+function sample(tag, timestamp, record)
+    local line = record["log"] or ""
+    if is_important(line) then
+        return keep(record)
+    end
+
+    local second = math.floor(timestamp)
+    if second ~= current_second then
+        current_second = second
+        kept_this_second = 0
+        seen_over_rate = 0
+    end
+    if kept_this_second < lines_per_second then
+        kept_this_second = kept_this_second + 1
+        return keep(record)
+    end
+
+    seen_over_rate = seen_over_rate + 1
+    if seen_over_rate % sample_every == 0 then
+        return keep(record)
+    end
+    sampled_out = sampled_out + 1
+    return -1, 0, 0
+end
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+session-metrics-agent.py - Low-overhead session and pressure metrics for development containers
+
+Samples active SSH sessions, logged-in users, CPU/memory pressure and EFS
+I/O wait once per interval and prints them to stdout as CloudWatch Embedded
+Metric Format (EMF) lines. The awslogs driver ships stdout to the
+/ecs/dev-environment log group, where CloudWatch extracts the metrics, so
+publishing costs no extra API calls.
+
+Usage:
+  session-metrics-agent.py [--interval 60]
+  session-metrics-agent.py --once               # print a single sample
+  session-metrics-agent.py bench [--samples 2000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import struct
+import sys
+import time
+import urllib.request
+
+NAMESPACE = 'DevFleet'
+WORKSPACE = '/home/developer/workspace'
+UTMP_FILE = '/var/run/utmp'
+
+# struct utmp on Linux: ut_type is the first int32, ut_user is 32 bytes at
+# offset 44, and each record is 384 bytes
+UTMP_RECORD_SIZE = 384
+UTMP_USER_PROCESS = 7
+
+UNITS = {
+    'ActiveSshSessions': 'Count',
+    'LoggedInUsers': 'Count',
+    'CpuUtilization': 'Percent',
+    'CpuPressure': 'Percent',
+    'MemoryUtilization': 'Percent',
+    'MemoryPressure': 'Percent',
+    'IoPressure': 'Percent',
+    'EfsOpLatency': 'Milliseconds',
+}
+
+
+def active_ssh_sessions(proc='/proc'):
+    """
+    Count per-connection sshd processes ("sshd: user@pts/0", "sshd: user@notty")
+    """
+    sessions = 0
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"{proc}/{pid}/cmdline", 'rb') as f:
+                cmdline = f.read(128)
+        except OSError:
+            continue
+        if cmdline.startswith(b'sshd: ') and b'@' in cmdline:
+            sessions += 1
+    return sessions
+
+
+def logged_in_users(utmp_file=UTMP_FILE):
+    users = set()
+    try:
+        with open(utmp_file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return 0
+    for offset in range(0, len(data) - UTMP_RECORD_SIZE + 1, UTMP_RECORD_SIZE):
+        (ut_type,) = struct.unpack_from('<i', data, offset)
+        if ut_type == UTMP_USER_PROCESS:
+            users.add(data[offset + 44:offset + 76].split(b'\0', 1)[0])
+    return len(users)
+
+
+def pressure(resource_name):
+    """
+    PSI "some avg60" for cpu, memory or io: the share of the last minute in
+    which at least one task was stalled waiting on that resource
+    """
+    for path in (f"/sys/fs/cgroup/{resource_name}.pressure", f"/proc/pressure/{resource_name}"):
+        try:
+            with open(path) as f:
+                fields = dict(item.split('=') for item in f.readline().split()[1:])
+            return float(fields['avg60'])
+        except (OSError, KeyError, ValueError):
+            continue
+    return None
+
+
+class Sampler:
+    """
+    Keeps the previous cgroup CPU and NFS counters so each sample reports
+    rates over the interval
+    """
+
+    def __init__(self, workspace=WORKSPACE):
+        self.workspace = workspace
+        self._cpu = None
+        self._nfs = None
+
+    def cpu_utilization(self):
+        """
+        CPU used as a percentage of the task's CPU quota (cgroup v2)
+        """
+        try:
+            with open('/sys/fs/cgroup/cpu.stat') as f:
+                usage_usec = int(f.readline().split()[1])
+            with open('/sys/fs/cgroup/cpu.max') as f:
+                quota, period = f.read().split()
+        except (OSError, ValueError, IndexError):
+            return None
+        cpus = os.cpu_count() if quota == 'max' else int(quota) / int(period)
+        now = time.monotonic()
+        previous, self._cpu = self._cpu, (now, usage_usec)
+        if previous is None or now <= previous[0]:
+            return None
+        return 100.0 * (usage_usec - previous[1]) / 1e6 / (now - previous[0]) / cpus
+
+    def memory_utilization(self):
+        try:
+            with open('/sys/fs/cgroup/memory.max') as f:
+                limit = f.read().strip()
+            with open('/sys/fs/cgroup/memory.current') as f:
+                current = int(f.read())
+        except (OSError, ValueError):
+            return None
+        if limit == 'max':
+            return None
+        return 100.0 * current / int(limit)
+
+    def efs_op_latency(self, mountstats='/proc/self/mountstats'):
+        """
+        Average NFS operation execution time (ms) on the workspace mount over
+        the interval, from the per-op counters in mountstats
+        """
+        try:
+            with open(mountstats) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        ops = execute_ms = 0
+        found = in_mount = in_ops = False
+        for line in lines:
+            if line.startswith('device '):
+                in_mount = f" mounted on {self.workspace} " in line and 'nfs' in line
+                found = found or in_mount
+                in_ops = False
+            elif in_mount and line.strip() == 'per-op statistics':
+                in_ops = True
+            elif in_mount and in_ops and ':' in line:
+                fields = line.split(':', 1)[1].split()
+                if len(fields) >= 8:
+                    ops += int(fields[0])
+                    execute_ms += int(fields[7])
+        if not found:
+            return None
+
+        previous, self._nfs = self._nfs, (ops, execute_ms)
+        if previous is None:
+            return None
+        if ops <= previous[0]:
+            return 0.0
+        return (execute_ms - previous[1]) / (ops - previous[0])
+
+    def sample(self):
+        values = {
+            'ActiveSshSessions': active_ssh_sessions(),
+            'LoggedInUsers': logged_in_users(),
+            'CpuUtilization': self.cpu_utilization(),
+            'CpuPressure': pressure('cpu'),
+            'MemoryUtilization': self.memory_utilization(),
+            'MemoryPressure': pressure('memory'),
+            'IoPressure': pressure('io'),
+            'EfsOpLatency': self.efs_op_latency(),
+        }
+        return {name: round(value, 2) for name, value in values.items() if value is not None}
+
+
+def task_dimensions():
+    """
+    Cluster and service names for the metric dimensions. The stack sets
+    them to what its scaling policies read; otherwise they come from the
+    ECS task metadata endpoint (a local call inside the task). Without a
+    service name the ClusterName/ServiceName set is not published, since
+    no alarm could read it.
+    """
+    dimensions = {
+        'ClusterName': os.environ.get('DEV_FLEET_CLUSTER_NAME', ''),
+        'ServiceName': os.environ.get('DEV_FLEET_SERVICE_NAME', ''),
+    }
+    metadata_uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4')
+    if metadata_uri and not all(dimensions.values()):
+        try:
+            with urllib.request.urlopen(f"{metadata_uri}/task", timeout=2) as response:
+                task = json.load(response)
+            dimensions['ClusterName'] = dimensions['ClusterName'] or task.get('Cluster', '').split('/')[-1]
+            dimensions['ServiceName'] = dimensions['ServiceName'] or task.get('ServiceName', '')
+        except Exception as e:
+            print(f"Warning: Could not read task metadata: {e}", file=sys.stderr)
+    developer = os.environ.get('DEV_FLEET_DEVELOPER')
+    if developer:
+        dimensions['Developer'] = developer
+    return {key: value for key, value in dimensions.items() if value}
+
+
+def emf_line(values, dimensions, timestamp=None):
+    dimension_sets = [['ClusterName', 'ServiceName']] if {'ClusterName', 'ServiceName'} <= set(dimensions) else [[]]
+    if 'Developer' in dimensions:
+        dimension_sets.append(['Developer'])
+    document = {
+        '_aws': {
+            'Timestamp': int((timestamp or time.time()) * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': dimension_sets,
+                'Metrics': [{'Name': name, 'Unit': UNITS[name]} for name in values]
+            }]
+        }
+    }
+    document.update(dimensions)
+    document.update(values)
+    return json.dumps(document, separators=(',', ':'))
+
+
+def bench(samples):
+    """
+    Measure the agent's own CPU time per sample and its peak RSS
+    """
+    sampler = Sampler()
+    dimensions = {'ClusterName': 'dev-fleet-cluster', 'ServiceName': 'bench'}
+    sampler.sample()
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    for _ in range(samples):
+        emf_line(sampler.sample(), dimensions)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    per_sample_ms = cpu / samples * 1000
+    print(f"{samples} samples: {elapsed / samples * 1000:.3f}ms wall, {per_sample_ms:.3f}ms CPU per sample")
+    print(f"Peak RSS: {after.ru_maxrss / 1024:.1f} MiB")
+    print(f"At a 60s interval that is {per_sample_ms / 60000 * 100:.5f}% of one vCPU")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish session and pressure metrics as CloudWatch EMF")
+    parser.add_argument('command', nargs='?', choices=['run', 'bench'], default='run')
+    parser.add_argument('--interval', type=float, default=float(os.environ.get('METRICS_INTERVAL', 60)))
+    parser.add_argument('--once', action='store_true', help="Print one sample and exit")
+    parser.add_argument('--samples', type=int, default=2000, help="Samples to take in bench mode")
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        bench(args.samples)
+        return 0
+
+    sampler = Sampler()
+    dimensions = task_dimensions()
+    # Prime the rate counters so the first published sample covers a full interval
+    sampler.sample()
+    while True:
+        if not args.once:
+            time.sleep(args.interval)
+        print(emf_line(sampler.sample(), dimensions), flush=True)
+        if args.once:
+            return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
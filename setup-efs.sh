@@ -5,6 +5,8 @@ set -e
 AWS_REGION="us-east-1"  # Change to your preferred region
 VPC_ID=$(aws ec2 describe-vpcs --query "Vpcs[0].VpcId" --output text --region ${AWS_REGION})
 EFS_NAME="dev-fleet-persistent-storage"
+# bursting, elastic, or provisioned (set EFS_PROVISIONED_MIBPS as well)
+EFS_THROUGHPUT_MODE="${EFS_THROUGHPUT_MODE:-bursting}"
 
 # Create security group for EFS
 echo "Creating security group for EFS..."
@@ -31,7 +33,8 @@ EFS_ID=$(aws efs create-file-system \
     --creation-token ${EFS_NAME} \
     --encrypted \
     --performance-mode generalPurpose \
-    --throughput-mode bursting \
+    --throughput-mode ${EFS_THROUGHPUT_MODE} \
+    ${EFS_PROVISIONED_MIBPS:+--provisioned-throughput-in-mibps ${EFS_PROVISIONED_MIBPS}} \
     --tags Key=Name,Value=${EFS_NAME} \
     --region ${AWS_REGION} \
     --output text \
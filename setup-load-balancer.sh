@@ -114,7 +114,7 @@ if [ -z "$TG_ARN" ]; then
     --target-type ip \
     --health-check-protocol HTTP \
     --health-check-port 80 \
-    --health-check-path "/" \
+    --health-check-path "/ready" \
     --health-check-enabled \
     --health-check-interval-seconds 30 \
     --healthy-threshold-count 3 \
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+ssh-client-config.py - Multiplexed ~/.ssh/config for the fleet, from the stack outputs
+
+Every new terminal, git fetch or editor remote session otherwise pays a full
+TCP and SSH handshake (key exchange, host key and public key checks) through
+the NLB. This writes one managed block into ~/.ssh/config with a Host entry
+per environment in the deployed stacks, sharing one master connection per
+host (ControlMaster/ControlPersist), so later sessions open a channel on the
+existing connection instead:
+
+  Host dev-fleet-alice
+    HostName alice.qdev.ngdegtm.com
+    Port 2201
+    User developer
+    ControlMaster auto
+    ControlPath ~/.ssh/cm-dev-fleet-alice-%C
+    ControlPersist 10m
+    ServerAliveInterval 30
+    ...
+  Host *
+
+Hosts come from DevFleetStack's ConnectionCommand output and from every
+DevFleetEnv-<name> environment stack, read with one paginated DescribeStacks,
+or from a `cdk deploy --outputs-file` JSON file. A roster deployed in nested
+shards exports no per-developer outputs; name those with --developer
+NAME:PORT. With --front-proxy the hosts go through ssh-front-proxy.py as a
+ProxyCommand instead of their own NLB listeners.
+
+`open` starts each master in the background and checks that a command runs
+over it; `measure` times a command with and without multiplexing.
+
+Usage:
+  ssh-client-config.py write [--stack DevFleetStack | --outputs-file outputs.json] [--identity ~/.ssh/id_ed25519]
+      [--developer alice:2201 ...] [--front-proxy fleet.qdev.ngdegtm.com] [--persist 10m] [--compression]
+      [--config ~/.ssh/config] [--dry-run]
+  ssh-client-config.py open [HOST ...]
+  ssh-client-config.py close [HOST ...]
+  ssh-client-config.py measure [HOST ...] [--commands 10] [--command true] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+SHARED_STACK_NAME = 'DevFleetStack'
+ENVIRONMENT_STACK_PREFIX = 'DevFleetEnv-'
+HOST_PREFIX = 'dev-fleet'
+BLOCK_BEGIN = '# BEGIN dev-fleet (managed by ssh-client-config.py)'
+BLOCK_END = '# END dev-fleet'
+DEFAULT_CONFIG = '~/.ssh/config'
+
+# The NLB drops a TCP flow after 350 idle seconds, so a ServerAlive probe
+# every 30s keeps quiet sessions (and the idle master) open. Probes travel
+# inside the encrypted channel, unlike TCPKeepAlive, so they cannot be
+# spoofed, and 4 unanswered probes drop a dead connection after about 2
+# minutes instead of hanging every multiplexed session on it.
+SERVER_ALIVE_INTERVAL = 30
+SERVER_ALIVE_COUNT_MAX = 4
+CONNECT_TIMEOUT = 10
+# %C is a hash of the connection, which keeps the socket path short of the
+# ~104 byte limit on Unix socket paths. It covers host, port and user but not
+# ProxyCommand, and behind --front-proxy every developer shares those, so the
+# alias goes in the path too; otherwise one developer's master would carry
+# another's sessions.
+CONTROL_PATH = '~/.ssh/cm-{alias}-%C'
+CONTROL_PERSIST = '10m'
+
+CONNECTION_PATTERN = re.compile(
+    r'ssh(?: -i (?P<identity>\S+))?(?: -p (?P<port>\d+))? (?P<user>[^@\s]+)@(?P<host>\S+)$'
+)
+
+
+def parse_connection(command):
+    """
+    (user, host, port) from a ConnectionCommand output, or None for the
+    roster template with <name> and <port> placeholders
+    """
+    match = CONNECTION_PATTERN.match(command.strip())
+    if not match or '<' in command:
+        return None
+    return match['user'], match['host'], int(match['port'] or 22)
+
+
+def fetch_outputs(region, stack_name):
+    """
+    {stack name: {output key: value}} for the shared stack and every
+    environment stack, from one paginated DescribeStacks
+    """
+    import boto3
+    cloudformation = boto3.client('cloudformation', region_name=region)
+    outputs = {}
+    for page in cloudformation.get_paginator('describe_stacks').paginate():
+        for stack in page['Stacks']:
+            name = stack['StackName']
+            if name == stack_name or name.startswith(ENVIRONMENT_STACK_PREFIX):
+                outputs[name] = {output['OutputKey']: output['OutputValue'] for output in stack.get('Outputs', [])}
+    return outputs
+
+
+def fleet_hosts(outputs, stack_name, developers=()):
+    """
+    [{'alias', 'developer', 'host', 'port', 'user'}] for every environment in
+    the outputs; developers are (name, port) pairs for roster shards
+    """
+    hosts = []
+    for name, values in sorted(outputs.items()):
+        if not name.startswith(ENVIRONMENT_STACK_PREFIX) or 'ConnectionCommand' not in values:
+            continue
+        connection = parse_connection(values['ConnectionCommand'])
+        if not connection:
+            continue
+        developer = name[len(ENVIRONMENT_STACK_PREFIX):]
+        user, host, port = connection
+        hosts.append({'alias': f"{HOST_PREFIX}-{developer}", 'developer': developer,
+                      'host': host, 'port': port, 'user': user})
+
+    shared = outputs.get(stack_name, {})
+    domain_name = shared.get('CustomDomainName')
+    connection = parse_connection(shared.get('ConnectionCommand', ''))
+    if connection:
+        # The single shared environment
+        user, host, port = connection
+        hosts.append({'alias': HOST_PREFIX, 'developer': None, 'host': host, 'port': port, 'user': user})
+    known = {host['developer'] for host in hosts}
+    for developer, port in developers:
+        if developer in known:
+            continue
+        if not domain_name:
+            raise ValueError(f"{stack_name} has no CustomDomainName output to build {developer}'s host name from")
+        hosts.append({'alias': f"{HOST_PREFIX}-{developer}", 'developer': developer,
+                      'host': f"{developer}.{domain_name}", 'port': port, 'user': 'developer'})
+    return hosts
+
+
+def render_block(hosts, identity=None, persist=CONTROL_PERSIST, compression=False, front_proxy=None):
+    lines = [BLOCK_BEGIN]
+    for entry in hosts:
+        lines.append(f"Host {entry['alias']}")
+        if front_proxy and entry['developer']:
+            # One proxy listener routes by the developer in the route line
+            lines += [f"  HostName {front_proxy}", "  Port 22",
+                      f"  ProxyCommand ssh-front-proxy.py connect %h %p {entry['developer']}"]
+        else:
+            lines += [f"  HostName {entry['host']}", f"  Port {entry['port']}"]
+        lines.append(f"  User {entry['user']}")
+        if identity:
+            lines += [f"  IdentityFile {identity}", "  IdentitiesOnly yes"]
+        lines += [
+            "  ControlMaster auto",
+            f"  ControlPath {CONTROL_PATH.format(alias=entry['alias'])}",
+            f"  ControlPersist {persist}",
+            f"  ServerAliveInterval {SERVER_ALIVE_INTERVAL}",
+            f"  ServerAliveCountMax {SERVER_ALIVE_COUNT_MAX}",
+            f"  ConnectTimeout {CONNECT_TIMEOUT}",
+            # Interactive keystrokes and git packs (already zlib) gain nothing
+            # from compression over the AWS network; it helps on slow links
+            f"  Compression {'yes' if compression else 'no'}",
+        ]
+    # Directives after the block in the file stay global instead of landing
+    # in the last Host entry
+    lines += ["Host *", BLOCK_END]
+    return '\n'.join(lines) + '\n'
+
+
+def install_block(path, block):
+    """
+    Replace the managed block in the config file, or put it first, keeping
+    everything outside the markers as it was. ssh uses the first value it
+    finds for an option, so a `Host *` further down cannot override it, and
+    the block's closing `Host *` keeps the file's own top-level options global.
+    """
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    try:
+        with open(path, 'r') as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = ''
+
+    begin, end = current.find(BLOCK_BEGIN), current.find(BLOCK_END)
+    if begin != -1 and end != -1:
+        rest = current[end + len(BLOCK_END):]
+        updated = current[:begin] + block + (rest[1:] if rest.startswith('\n') else rest)
+    else:
+        updated = block + ('\n' + current if current else '')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(updated)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+    return updated != current
+
+
+def managed_aliases(path):
+    """
+    Host aliases in the managed block, for open/close/measure without
+    arguments
+    """
+    try:
+        with open(os.path.expanduser(path), 'r') as f:
+            current = f.read()
+    except FileNotFoundError:
+        return []
+    begin, end = current.find(BLOCK_BEGIN), current.find(BLOCK_END)
+    if begin == -1 or end == -1:
+        return []
+    return [line.split()[1] for line in current[begin:end].splitlines() if line.startswith('Host ')]
+
+
+# `-F <file>` when --config is not the default ~/.ssh/config
+SSH_CONFIG_ARGS = []
+
+
+def ssh(args, timeout=60):
+    return subprocess.run(['ssh'] + SSH_CONFIG_ARGS + args, capture_output=True, text=True, timeout=timeout)
+
+
+def control_path(host):
+    """
+    The host's ControlPath with %C expanded, from `ssh -G`
+    """
+    for line in ssh(['-G', host]).stdout.splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'controlpath':
+            return os.path.expanduser(value)
+    return None
+
+
+def master_running(host):
+    return ssh(['-O', 'check', host]).returncode == 0
+
+
+def open_master(host):
+    """
+    Start the host's master in the background unless one is running, then
+    check a command runs over it. Returns (ok, seconds to open, detail).
+    """
+    if master_running(host):
+        return True, 0.0, 'already open'
+    # A socket left by a master that died stops a new one from listening
+    path = control_path(host)
+    if path and os.path.exists(path):
+        os.unlink(path)
+    start = time.perf_counter()
+    result = ssh(['-f', '-N', '-o', 'ControlMaster=yes', host])
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        return False, elapsed, result.stderr.strip() or f"ssh exited {result.returncode}"
+    if not master_running(host):
+        return False, elapsed, 'master did not start'
+    probe = ssh([host, 'true'])
+    if probe.returncode != 0:
+        return False, elapsed, probe.stderr.strip() or 'command over the master failed'
+    return True, elapsed, 'opened'
+
+
+def close_master(host):
+    return ssh(['-O', 'exit', host]).returncode == 0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def time_commands(arguments, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        result = ssh(arguments)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"ssh exited {result.returncode}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summary(latencies):
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+    }
+
+
+def measure(host, count, command):
+    """
+    Time `ssh host command` with a fresh connection each time, then over
+    the master. A master this opened is closed again afterwards.
+    """
+    direct = time_commands(['-o', 'ControlMaster=no', '-o', 'ControlPath=none', host, command], count)
+    was_open = master_running(host)
+    ok, open_seconds, detail = open_master(host)
+    if not ok:
+        raise RuntimeError(f"could not open a master: {detail}")
+    try:
+        multiplexed = time_commands([host, command], count)
+    finally:
+        if not was_open:
+            close_master(host)
+    result = {'host': host, 'commands': count, 'direct': summary(direct), 'multiplexed': summary(multiplexed),
+              'master_open_ms': round(open_seconds * 1000, 1)}
+    result['speedup'] = round(result['direct']['p50_ms'] / result['multiplexed']['p50_ms'], 1) \
+        if result['multiplexed']['p50_ms'] else None
+    return result
+
+
+def print_measurements(results):
+    print(f"{'host':<24} {'direct p50':>11} {'p95':>9} {'mux p50':>9} {'p95':>9} {'open':>9} {'speedup':>8}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['host']:<24} error: {r['error']}")
+            continue
+        print(f"{r['host']:<24} {r['direct']['p50_ms']:>9.1f}ms {r['direct']['p95_ms']:>7.1f}ms "
+              f"{r['multiplexed']['p50_ms']:>7.1f}ms {r['multiplexed']['p95_ms']:>7.1f}ms "
+              f"{r['master_open_ms']:>7.1f}ms {r['speedup'] or 0:>7.1f}x")
+
+
+def parse_developer(value):
+    name, _, port = value.partition(':')
+    if not name or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected NAME:PORT, got '{value}'")
+    return name, int(port)
+
+
+def write(args):
+    if args.outputs_file:
+        with open(args.outputs_file, 'r') as f:
+            outputs = json.load(f)
+    else:
+        outputs = fetch_outputs(args.region, args.stack)
+    hosts = fleet_hosts(outputs, args.stack, args.developers)
+    if not hosts:
+        print(f"No environments found in the outputs of {args.stack}; a roster in nested shards needs "
+              f"--developer NAME:PORT", file=sys.stderr)
+        return 1
+    block = render_block(hosts, args.identity, args.persist, args.compression, args.front_proxy)
+    if args.dry_run:
+        print(block, end='')
+        return 0
+    changed = install_block(args.config, block)
+    print(f"{'Updated' if changed else 'Unchanged'} {args.config}: {', '.join(h['alias'] for h in hosts)}")
+    print("Open the master connections with: ssh-client-config.py open")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multiplexed SSH client config for the fleet")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help="SSH client config file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    write_parser = subparsers.add_parser('write', help="Write the managed Host block from the stack outputs")
+    source = write_parser.add_mutually_exclusive_group()
+    source.add_argument('--stack', default=SHARED_STACK_NAME, help="Shared stack name")
+    source.add_argument('--outputs-file', help="JSON written by `cdk deploy --outputs-file`")
+    write_parser.add_argument('--identity', help="SSH private key, e.g. ~/.ssh/id_ed25519")
+    write_parser.add_argument('--developer', action='append', dest='developers', type=parse_developer, default=[],
+                              help="NAME:PORT of a roster environment without a stack of its own")
+    write_parser.add_argument('--front-proxy', help="Route developer hosts through ssh-front-proxy.py at this host")
+    write_parser.add_argument('--persist', default=CONTROL_PERSIST,
+                              help="How long an idle master stays open (ControlPersist)")
+    write_parser.add_argument('--compression', action='store_true', help="Compress, for slow links")
+    write_parser.add_argument('--dry-run', action='store_true', help="Print the block instead of writing it")
+    write_parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+
+    for name, help_text in (('open', "Start and health-check the master connections"),
+                            ('close', "Stop the master connections")):
+        command_parser = subparsers.add_parser(name, help=help_text)
+        command_parser.add_argument('hosts', nargs='*', help="Host aliases (default: every managed host)")
+
+    measure_parser = subparsers.add_parser('measure', help="Time commands with and without multiplexing")
+    measure_parser.add_argument('hosts', nargs='*', help="Host aliases (default: every managed host)")
+    measure_parser.add_argument('--commands', type=int, default=10, help="Commands timed per mode")
+    measure_parser.add_argument('--command', default='true', help="Remote command to time")
+    measure_parser.add_argument('--json', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.command == 'write':
+        try:
+            return write(args)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+
+    if os.path.expanduser(args.config) != os.path.expanduser(DEFAULT_CONFIG):
+        SSH_CONFIG_ARGS[:] = ['-F', os.path.expanduser(args.config)]
+    hosts = args.hosts or managed_aliases(args.config)
+    if not hosts:
+        print(f"No managed hosts in {args.config}; run `ssh-client-config.py write` first", file=sys.stderr)
+        return 1
+
+    if args.command == 'close':
+        for host in hosts:
+            print(f"{host:<24} {'closed' if close_master(host) else 'no master'}")
+        return 0
+
+    if args.command == 'open':
+        failed = 0
+        for host in hosts:
+            ok, elapsed, detail = open_master(host)
+            failed += not ok
+            print(f"{host:<24} {'ok' if ok else 'FAILED':<7} {elapsed * 1000:>8.1f}ms  {detail}")
+        return 1 if failed else 0
+
+    results = []
+    for host in hosts:
+        try:
+            results.append(measure(host, args.commands, args.command))
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            results.append({'host': host, 'error': str(e)})
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_measurements(results)
+    return 1 if any('error' in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
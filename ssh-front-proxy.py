@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+ssh-front-proxy.py - Routing SSH front proxy, so one NLB listener serves the whole fleet
+
+SSH encrypts everything after the version exchange, including the user name,
+so a proxy that does not terminate SSH cannot see who is connecting. Clients
+therefore send one cleartext route line before the SSH stream, from a
+ProxyCommand:
+
+  DEVFLEET-ROUTE <developer>\\r\\n
+
+The proxy looks the developer's task up in a cached registry (the fleet
+listing from fleet_ecs, or a JSON file), connects to it, and splices the
+two sockets together. On Linux the bytes move socket -> pipe -> socket with
+splice(2) and never enter the process; elsewhere a fixed buffer per
+direction is reused. Connections that start straight with "SSH-" go to
+--default-backend if one is set.
+
+~/.ssh/config:
+  Host alice.dev-fleet
+    HostName fleet.qdev.ngdegtm.com
+    User developer
+    ProxyCommand ssh-front-proxy.py connect %h %p alice
+
+Usage:
+  ssh-front-proxy.py serve [--listen 0.0.0.0:22] [--registry routes.json | --cluster dev-fleet-cluster ...]
+      [--backend-port 22] [--default-backend 10.0.1.5:22]
+  ssh-front-proxy.py connect HOST PORT DEVELOPER
+  ssh-front-proxy.py bench [--sessions 2000] [--rtt-samples 2000] [--mb 256]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import selectors
+import socket
+import sys
+import time
+
+ROUTE_PREFIX = b'DEVFLEET-ROUTE '
+MAX_ROUTE_LINE = 256
+ROUTE_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 5.0
+SPLICE_BYTES = 1 << 16
+REGISTRY_TTL = 15.0
+# A developer missing from the registry triggers a refresh at most this often
+MISS_REFRESH_INTERVAL = 2.0
+CAN_SPLICE = hasattr(os, 'splice')
+
+
+def parse_address(value, default_port=22):
+    host, _, port = value.rpartition(':')
+    if not host:
+        return value, default_port
+    return host, int(port)
+
+
+def raise_fd_limit():
+    """
+    Each spliced session holds two sockets and two pipes
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+class Registry:
+    """
+    developer -> (host, port), reloaded every ttl seconds and on a miss, at
+    most once every MISS_REFRESH_INTERVAL. Loads run in a thread and are
+    shared by every connection waiting on them.
+    """
+
+    def __init__(self, load, ttl=REGISTRY_TTL):
+        self.load = load
+        self.ttl = ttl
+        self.routes = {}
+        self.loaded_at = 0.0
+        self._loading = None
+
+    async def refresh(self):
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(None, self.load))
+        loading = self._loading
+        try:
+            self.routes = await loading
+            self.loaded_at = time.monotonic()
+        except Exception as e:
+            # Keep routing with the last good registry
+            print(f"Warning: Could not reload the route registry: {e}", file=sys.stderr, flush=True)
+        finally:
+            if self._loading is loading:
+                self._loading = None
+
+    async def lookup(self, developer):
+        age = time.monotonic() - self.loaded_at
+        if age > self.ttl or (developer not in self.routes and age > MISS_REFRESH_INTERVAL):
+            await self.refresh()
+        return self.routes.get(developer)
+
+
+def file_registry(path, backend_port):
+    """
+    Loader for a JSON object of developer -> "host" or "host:port"
+    """
+    def load():
+        with open(path, 'r') as f:
+            return {developer: parse_address(address, backend_port) for developer, address in json.load(f).items()}
+    return load
+
+
+def fleet_registry(region, clusters, backend_port):
+    """
+    Loader routing each developer to the private IP of their newest
+    running task
+    """
+    import boto3
+    from fleet_ecs import fetch_fleet
+
+    ecs_client = boto3.client('ecs', region_name=region)
+    ec2_client = boto3.client('ec2', region_name=region)
+
+    def load():
+        routes = {}
+        newest = {}
+        for row in fetch_fleet(ecs_client, ec2_client, clusters)['tasks']:
+            developer = row['developer']
+            if not developer or row['status'] != 'RUNNING' or not row['private_ip']:
+                continue
+            if (row['started_at'] or 0) >= newest.get(developer, -1):
+                newest[developer] = row['started_at'] or 0
+                routes[developer] = (row['private_ip'], backend_port)
+        return routes
+    return load
+
+
+async def _wait(add, remove, fd):
+    future = asyncio.get_running_loop().create_future()
+    add(fd, lambda: future.done() or future.set_result(None))
+    try:
+        await future
+    finally:
+        remove(fd)
+
+
+async def splice_pump(src, dst):
+    """
+    Move bytes from src to dst through a pipe with splice(2) until src
+    reaches EOF, then half-close dst
+    """
+    loop = asyncio.get_running_loop()
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    pipe_r, pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    try:
+        while True:
+            try:
+                pending = os.splice(src_fd, pipe_w, SPLICE_BYTES, flags=flags)
+            except BlockingIOError:
+                await _wait(loop.add_reader, loop.remove_reader, src_fd)
+                continue
+            if pending == 0:
+                break
+            while pending:
+                try:
+                    pending -= os.splice(pipe_r, dst_fd, pending, flags=flags)
+                except BlockingIOError:
+                    await _wait(loop.add_writer, loop.remove_writer, dst_fd)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+    dst.shutdown(socket.SHUT_WR)
+
+
+async def buffer_pump(src, dst):
+    """
+    Portable pump reusing one buffer per direction
+    """
+    loop = asyncio.get_running_loop()
+    buffer = bytearray(SPLICE_BYTES)
+    view = memoryview(buffer)
+    while True:
+        received = await loop.sock_recv_into(src, buffer)
+        if not received:
+            break
+        await loop.sock_sendall(dst, view[:received])
+    dst.shutdown(socket.SHUT_WR)
+
+
+class FrontProxy:
+    def __init__(self, registry, default_backend=None, splice=CAN_SPLICE):
+        self.registry = registry
+        self.default_backend = default_backend
+        self.pump = splice_pump if splice else buffer_pump
+        self.active = 0
+        self.total = 0
+        self.rejected = 0
+
+    async def read_route(self, client):
+        """
+        Returns (developer or None, bytes read past the route line)
+        """
+        loop = asyncio.get_running_loop()
+        data = b''
+        while b'\n' not in data and len(data) < MAX_ROUTE_LINE:
+            chunk = await loop.sock_recv(client, MAX_ROUTE_LINE - len(data))
+            if not chunk:
+                break
+            data += chunk
+            if data.startswith(b'SSH-') or not ROUTE_PREFIX.startswith(data[:len(ROUTE_PREFIX)]):
+                return None, data
+        line, _, rest = data.partition(b'\n')
+        if not line.startswith(ROUTE_PREFIX):
+            return None, data
+        return line[len(ROUTE_PREFIX):].strip().decode('ascii', 'replace'), rest
+
+    async def handle(self, client):
+        loop = asyncio.get_running_loop()
+        backend = None
+        self.active += 1
+        self.total += 1
+        try:
+            developer, rest = await asyncio.wait_for(self.read_route(client), ROUTE_TIMEOUT)
+            address = await self.registry.lookup(developer) if developer else self.default_backend
+            if address is None:
+                self.rejected += 1
+                if developer:
+                    # Shown by ssh as the reason the connection closed
+                    await loop.sock_sendall(client, f"No running environment for {developer}\r\n".encode())
+                return
+            backend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            backend.setblocking(False)
+            backend.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            await asyncio.wait_for(loop.sock_connect(backend, address), CONNECT_TIMEOUT)
+            if rest:
+                await loop.sock_sendall(backend, rest)
+            pumps = [asyncio.ensure_future(self.pump(client, backend)),
+                     asyncio.ensure_future(self.pump(backend, client))]
+            _, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+        except (OSError, asyncio.TimeoutError):
+            self.rejected += backend is None
+        finally:
+            self.active -= 1
+            client.close()
+            if backend is not None:
+                backend.close()
+
+    async def serve(self, listener, stats_interval=60.0):
+        loop = asyncio.get_running_loop()
+        sessions = set()
+
+        async def report():
+            while True:
+                await asyncio.sleep(stats_interval)
+                print(f"sessions active={self.active} total={self.total} rejected={self.rejected} "
+                      f"routes={len(self.registry.routes)}", flush=True)
+
+        reporter = asyncio.ensure_future(report()) if stats_interval else None
+        try:
+            while True:
+                client, _ = await loop.sock_accept(listener)
+                client.setblocking(False)
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                session = asyncio.ensure_future(self.handle(client))
+                sessions.add(session)
+                session.add_done_callback(sessions.discard)
+        finally:
+            if reporter:
+                reporter.cancel()
+
+
+def listen(address, backlog=4096):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    listener.setblocking(False)
+    return listener
+
+
+def connect(host, port, developer):
+    """
+    ProxyCommand side: send the route line, then copy stdin/stdout to and
+    from the proxy
+    """
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(ROUTE_PREFIX + developer.encode() + b'\r\n')
+    stdin, stdout = sys.stdin.fileno(), sys.stdout.fileno()
+    selector = selectors.DefaultSelector()
+    selector.register(stdin, selectors.EVENT_READ)
+    selector.register(sock, selectors.EVENT_READ)
+    open_inputs = 2
+    while open_inputs:
+        for key, _ in selector.select():
+            if key.fileobj == stdin:
+                data = os.read(stdin, SPLICE_BYTES)
+                if data:
+                    sock.sendall(data)
+                else:
+                    selector.unregister(stdin)
+                    open_inputs -= 1
+                    try:
+                        sock.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        # The proxy already closed the connection
+                        pass
+            else:
+                data = sock.recv(SPLICE_BYTES)
+                if data:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(stdout, view):]
+                else:
+                    selector.unregister(sock)
+                    open_inputs -= 1
+                    # The server side is gone; nothing more to send either
+                    return 0
+    return 0
+
+
+# Benchmark: a local stand-in for sshd that sends a version banner and then
+# echoes everything, the proxy, and clients, each in its own process.
+
+STANDIN_BANNER = b'SSH-2.0-OpenSSH_9.6 dev-fleet-standin\r\n'
+
+
+async def _standin_session(client):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sock_sendall(client, STANDIN_BANNER)
+        buffer = bytearray(SPLICE_BYTES)
+        while True:
+            received = await loop.sock_recv_into(client, buffer)
+            if not received:
+                break
+            await loop.sock_sendall(client, memoryview(buffer)[:received])
+    except OSError:
+        pass
+    finally:
+        client.close()
+
+
+def run_standin(port):
+    raise_fd_limit()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        listener = listen(('127.0.0.1', port))
+        sessions = set()
+        while True:
+            client, _ = await loop.sock_accept(listener)
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = asyncio.ensure_future(_standin_session(client))
+            sessions.add(session)
+            session.add_done_callback(sessions.discard)
+
+    asyncio.run(main())
+
+
+def run_proxy(port, routes, splice):
+    raise_fd_limit()
+    registry = Registry(lambda: routes)
+    asyncio.run(FrontProxy(registry, splice=splice).serve(listen(('127.0.0.1', port)), stats_interval=0))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def _process_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                stats['rss_mb'] = int(line.split()[1]) / 1024
+    stats['fds'] = len(os.listdir(f"/proc/{pid}/fd"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    stats['cpu_seconds'] = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return stats
+
+
+def _open_session(port, route):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if route:
+        sock.sendall(ROUTE_PREFIX + route + b'\r\n')
+    banner = b''
+    while not banner.endswith(b'\n'):
+        chunk = sock.recv(256)
+        if not chunk:
+            raise ConnectionError('closed before the banner')
+        banner += chunk
+    return sock
+
+
+def _measure(port, route, rtt_samples, transfer_mb):
+    connects = []
+    for _ in range(200):
+        start = time.perf_counter()
+        _open_session(port, route).close()
+        connects.append(time.perf_counter() - start)
+
+    sock = _open_session(port, route)
+    rtts = []
+    payload = b'k'
+    for _ in range(rtt_samples):
+        start = time.perf_counter()
+        sock.sendall(payload)
+        sock.recv(16)
+        rtts.append(time.perf_counter() - start)
+
+    # Bulk transfer through the echo: a writer and this thread reading back
+    import threading
+    block = os.urandom(SPLICE_BYTES)
+    total = transfer_mb * 1024 * 1024
+
+    def writer():
+        sent = 0
+        while sent < total:
+            sock.sendall(block)
+            sent += len(block)
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    received = 0
+    buffer = bytearray(SPLICE_BYTES * 4)
+    while received < total:
+        received += sock.recv_into(buffer)
+    thread.join()
+    seconds = time.perf_counter() - start
+    sock.close()
+    return {
+        'connect_p50_ms': _percentile(connects, 50) * 1000,
+        'connect_p99_ms': _percentile(connects, 99) * 1000,
+        'rtt_p50_us': _percentile(rtts, 50) * 1e6,
+        'rtt_p99_us': _percentile(rtts, 99) * 1e6,
+        'mb_per_s': transfer_mb / seconds,
+    }
+
+
+def bench(sessions, rtt_samples, transfer_mb):
+    import multiprocessing
+
+    raise_fd_limit()
+    standin_port, proxy_port, buffer_proxy_port = 22022, 22023, 22024
+    routes = {f"dev{index:04d}": ('127.0.0.1', standin_port) for index in range(1000)}
+    processes = [
+        multiprocessing.Process(target=run_standin, args=(standin_port,), daemon=True),
+        multiprocessing.Process(target=run_proxy, args=(proxy_port, routes, CAN_SPLICE), daemon=True),
+        multiprocessing.Process(target=run_proxy, args=(buffer_proxy_port, routes, False), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)
+
+    print(f"{'path':<24} {'connect p50':>12} {'p99':>9} {'keystroke p50':>14} {'p99':>9} {'throughput':>12}")
+    rows = [('direct', standin_port, None)]
+    if CAN_SPLICE:
+        rows.append(('proxy (splice)', proxy_port, b'dev0042'))
+    rows.append(('proxy (buffer)', buffer_proxy_port, b'dev0042'))
+    for label, port, route in rows:
+        r = _measure(port, route, rtt_samples, transfer_mb)
+        print(f"{label:<24} {r['connect_p50_ms']:>10.2f}ms {r['connect_p99_ms']:>7.2f}ms "
+              f"{r['rtt_p50_us']:>12.0f}us {r['rtt_p99_us']:>7.0f}us {r['mb_per_s']:>8.0f} MB/s")
+
+    # Concurrency: hold many sessions open through the proxy and measure
+    # keystroke latency and the proxy's footprint while they are open
+    proxy_pid = processes[1].pid
+    before = _process_stats(proxy_pid)
+    held = []
+    start = time.perf_counter()
+    for index in range(sessions):
+        held.append(_open_session(proxy_port, f"dev{index % 1000:04d}".encode()))
+    opened = time.perf_counter() - start
+    during = _process_stats(proxy_pid)
+    loaded = _measure(proxy_port, b'dev0001', rtt_samples, 0) if transfer_mb else None
+    for sock in held:
+        sock.close()
+    print(f"{sessions} concurrent sessions opened in {opened:.2f}s ({sessions / opened:.0f}/s); proxy RSS "
+          f"{before['rss_mb']:.1f} -> {during['rss_mb']:.1f} MB "
+          f"({(during['rss_mb'] - before['rss_mb']) * 1024 / sessions:.1f} KiB/session), "
+          f"{during['fds']} fds, {during['cpu_seconds'] - before['cpu_seconds']:.2f}s CPU to accept them")
+    if loaded:
+        print(f"keystroke RTT with {sessions} sessions open: p50 {loaded['rtt_p50_us']:.0f}us "
+              f"p99 {loaded['rtt_p99_us']:.0f}us")
+    for process in processes:
+        process.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Routing SSH front proxy for the dev fleet")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Accept SSH connections and route them by developer")
+    serve_parser.add_argument('--listen', default='0.0.0.0:22')
+    source = serve_parser.add_mutually_exclusive_group()
+    source.add_argument('--registry', help="JSON file of developer -> host[:port]")
+    source.add_argument('--cluster', action='append', dest='clusters',
+                        help="Route to running tasks in this cluster (repeatable; default: every cluster)")
+    serve_parser.add_argument('--backend-port', type=int, default=22)
+    serve_parser.add_argument('--default-backend', help="host[:port] for connections without a route line")
+    serve_parser.add_argument('--registry-ttl', type=float, default=REGISTRY_TTL)
+    serve_parser.add_argument('--no-splice', action='store_true', help="Copy through a buffer instead of splice(2)")
+    serve_parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+
+    connect_parser = subparsers.add_parser('connect', help="ProxyCommand that sends the route line")
+    connect_parser.add_argument('host')
+    connect_parser.add_argument('port', type=int)
+    connect_parser.add_argument('developer')
+
+    bench_parser = subparsers.add_parser('bench', help="Measure the proxy against a local sshd stand-in")
+    bench_parser.add_argument('--sessions', type=int, default=2000, help="Concurrent sessions to hold open")
+    bench_parser.add_argument('--rtt-samples', type=int, default=2000)
+    bench_parser.add_argument('--mb', type=int, default=256, help="Bulk transfer size per path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'connect':
+        return connect(args.host, args.port, args.developer)
+
+    if args.command == 'bench':
+        bench(args.sessions, args.rtt_samples, args.mb)
+        return 0
+
+    if args.registry:
+        load = file_registry(args.registry, args.backend_port)
+    else:
+        load = fleet_registry(args.region, args.clusters, args.backend_port)
+    default_backend = parse_address(args.default_backend, args.backend_port) if args.default_backend else None
+    limit = raise_fd_limit()
+    proxy = FrontProxy(Registry(load, args.registry_ttl), default_backend, splice=CAN_SPLICE and not args.no_splice)
+    host, port = parse_address(args.listen)
+    print(f"SSH front proxy listening on {host}:{port} ({'splice' if proxy.pump is splice_pump else 'buffered'}, "
+          f"fd limit {limit})", flush=True)
+    try:
+        asyncio.run(proxy.serve(listen((host, port))))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -101,9 +101,7 @@ function add_key() {
   aws s3 cp ${KEY_FILE} s3://${S3_BUCKET}/keys/${USERNAME}.pub --region ${AWS_REGION}
   
   echo "Key for ${USERNAME} has been added to authorized_keys and uploaded to S3"
-  
-  # Update ECS tasks with new keys
-  update_ecs_tasks
+  echo "Running containers pick up the change within ${KEYS_REFRESH_INTERVAL:-5} seconds (authorized-keys-helper.py)"
 }
 
 function remove_key() {
@@ -139,9 +137,7 @@ function remove_key() {
   aws s3 mv s3://${S3_BUCKET}/keys/${USERNAME}.pub s3://${S3_BUCKET}/keys/archived/${USERNAME}.pub --region ${AWS_REGION} || true
   
   echo "Key for ${USERNAME} has been removed from authorized_keys"
-  
-  # Update ECS tasks with new keys
-  update_ecs_tasks
+  echo "Running containers pick up the change within ${KEYS_REFRESH_INTERVAL:-5} seconds (authorized-keys-helper.py)"
 }
 
 function list_keys() {
@@ -197,7 +193,8 @@ function print_usage() {
   echo "  add <username> <key_file>   - Add a user's public key"
   echo "  remove <username>           - Remove a user's public key"
   echo "  list                        - List all authorized keys"
-  echo "  update                      - Update ECS tasks with current keys"
+  echo "  sync <roster_file> [opts]   - Apply a roster of users and keys in one pass (see ssh-key-sync.py)"
+  echo "  update                      - Force a new deployment (only needed for images without authorized-keys-helper.py)"
 }
 
 # Main execution
@@ -214,6 +211,14 @@ case "$1" in
   list)
     list_keys
     ;;
+  sync)
+    if [ -z "$2" ]; then
+      echo "Error: Missing roster file"
+      echo "Usage: $0 sync <roster_file> [--dry-run] [--keep-unlisted] [--rollout]"
+      exit 1
+    fi
+    python3 "$(dirname "$0")/ssh-key-sync.py" sync "$2" --bucket ${S3_BUCKET} --region ${AWS_REGION} "${@:3}"
+    ;;
   update)
     update_ecs_tasks
     ;;
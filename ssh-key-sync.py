@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+ssh-key-sync.py - Sync developer SSH keys in S3 with a roster file in one pass
+
+Diffs a desired roster against the current authorized_keys object and the
+keys/<user>.pub objects, then applies every add, key change, remove and
+archive together: authorized_keys is written once, first (conditional on the
+ETag it was read with, so a concurrent edit is detected before anything has
+changed), then per-user objects are uploaded and archived in parallel, and
+each fleet service is rolled out at most once. A per-user object an earlier
+run left missing or behind is fixed on the next run. Running containers with
+authorized-keys-helper.py pick the change up without any rollout.
+
+Roster format (a JSON list, or the CDK roster document {"developers": [...]} with keys added):
+  [{"name": "alice", "public_key": "ssh-ed25519 AAAA... alice@laptop"},
+   {"name": "bob", "public_key_file": "keys/bob.pub"},
+   {"name": "carol", "public_keys": ["ssh-ed25519 ...", "ssh-rsa ..."]},
+   {"name": "dave", "retired": true}]
+
+Usage:
+  ssh-key-sync.py sync roster.json [--bucket B] [--dry-run] [--keep-unlisted] [--rollout [--service S ...]]
+  ssh-key-sync.py simulate [--existing 200] [--roster 250]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fleet_ecs import describe_services
+
+AWS_REGION = 'us-east-1'
+KEYS_OBJECT = 'authorized_keys'
+KEYS_PREFIX = 'keys/'
+ARCHIVE_PREFIX = 'keys/archived/'
+# Task family of the shared environment; roster environments append -<name>
+FLEET_TASK_FAMILY = 'dev-environment'
+
+
+def error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def normalize_key(key):
+    """
+    "<type> <blob>" without the comment, for comparing keys
+    """
+    fields = key.split()
+    if len(fields) < 2:
+        raise ValueError(f"not an SSH public key: {key[:40]!r}")
+    return f"{fields[0]} {fields[1]}"
+
+
+def load_key_roster(path):
+    """
+    Desired state from a roster file: {user: [public key, ...]} for every
+    active entry that has keys. Retired entries are left out, so their keys
+    are removed.
+    """
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        # The CDK roster document: {"developers": [...]}
+        entries = entries.get('developers', [])
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    desired = {}
+    for entry in entries:
+        name = entry['name']
+        if entry.get('retired'):
+            continue
+        if name in desired:
+            raise ValueError(f"duplicate roster entry: {name}")
+        keys = list(entry.get('public_keys', []))
+        if entry.get('public_key'):
+            keys.append(entry['public_key'])
+        if entry.get('public_key_file'):
+            with open(os.path.join(base_dir, entry['public_key_file']), 'r') as f:
+                keys.extend(line.strip() for line in f if line.strip())
+        if not keys:
+            print(f"Warning: roster entry {name} has no public keys; leaving its current keys unchanged",
+                  file=sys.stderr)
+            desired[name] = None
+            continue
+        desired[name] = [key.strip() for key in keys]
+    return desired
+
+
+def parse_current(text):
+    """
+    {user: [authorized_keys line, ...]} from a file written by
+    ssh-key-management.sh ("<key> # <user> (added ...)"), plus unowned lines
+    """
+    owned = {}
+    unowned = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        _, separator, annotation = line.partition(' # ')
+        owner = annotation.split(' (', 1)[0].strip() if separator else ''
+        if owner:
+            owned.setdefault(owner, []).append(line)
+        else:
+            unowned.append(line)
+    return owned, unowned
+
+
+def read_state(s3_client, bucket):
+    """
+    Current authorized_keys contents and ETag, and the users with a keys/<user>.pub object
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=KEYS_OBJECT)
+        text, etag = response['Body'].read().decode(), response['ETag']
+    except Exception as e:
+        if error_code(e) != 'NoSuchKey':
+            raise
+        text, etag = '', None
+
+    pub_users = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=KEYS_PREFIX):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if not key.startswith(ARCHIVE_PREFIX) and key.endswith('.pub'):
+                pub_users.add(key[len(KEYS_PREFIX):-len('.pub')])
+    return text, etag, pub_users
+
+
+def plan_sync(current_text, desired, keep_unlisted=False):
+    """
+    Work out the changes and the new authorized_keys contents.
+
+    Returns (plan, new_text) where plan has 'add', 'update', 'remove' and
+    'unchanged' user lists. Lines of unchanged keys are kept as they are, so
+    their "added" dates survive the sync.
+    """
+    owned, unowned = parse_current(current_text)
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    plan = {'add': [], 'update': [], 'remove': [], 'unchanged': []}
+    lines = list(unowned)
+
+    for user in sorted(set(owned) | set(desired)):
+        current_lines = owned.get(user, [])
+        keys = desired.get(user)
+        if user not in desired:
+            if keep_unlisted:
+                lines.extend(current_lines)
+                plan['unchanged'].append(user)
+            else:
+                plan['remove'].append(user)
+            continue
+        if keys is None:
+            # Listed without keys: leave whatever is there
+            lines.extend(current_lines)
+            plan['unchanged'].append(user)
+            continue
+
+        current_by_key = {}
+        for line in current_lines:
+            try:
+                current_by_key[normalize_key(line.partition(' # ')[0])] = line
+            except ValueError:
+                print(f"Warning: Dropping malformed authorized_keys line for {user}: {line[:40]!r}",
+                      file=sys.stderr)
+        wanted = {normalize_key(key): key for key in keys}
+        for normalized, key in wanted.items():
+            lines.append(current_by_key.get(normalized) or f"{key} # {user} (added {timestamp})")
+        if not current_lines:
+            plan['add'].append(user)
+        elif set(current_by_key) != set(wanted) or len(current_by_key) != len(current_lines):
+            plan['update'].append(user)
+        else:
+            plan['unchanged'].append(user)
+
+    new_text = '\n'.join(lines) + '\n' if lines else ''
+    return plan, new_text
+
+
+def pub_repairs(plan, desired, pub_users, keep_unlisted=False):
+    """
+    Users whose keys/<user>.pub an interrupted sync left missing (listed with
+    unchanged keys) or behind (removed from authorized_keys)
+    """
+    missing = [user for user in plan['unchanged'] if desired.get(user) and user not in pub_users]
+    leftover = [] if keep_unlisted else sorted(pub_users - set(desired) - set(plan['remove']))
+    return missing, leftover
+
+
+def apply_sync(s3_client, bucket, desired, new_text, etag, uploads, archives, pub_users, max_workers=16):
+    """
+    Write authorized_keys once (skipped when new_text is None), then upload
+    per-user keys and archive removed users in parallel. authorized_keys goes
+    first so that a concurrent edit fails the sync before any per-user object
+    has changed.
+    """
+    if new_text is not None:
+        params = {'Bucket': bucket, 'Key': KEYS_OBJECT, 'Body': new_text}
+        if etag:
+            params['IfMatch'] = etag
+        else:
+            params['IfNoneMatch'] = '*'
+        try:
+            s3_client.put_object(**params)
+        except Exception as e:
+            if error_code(e) in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise RuntimeError(
+                    f"s3://{bucket}/{KEYS_OBJECT} changed while syncing; re-run the sync to apply on top of it"
+                ) from e
+            raise
+
+    def upload(user):
+        s3_client.put_object(Bucket=bucket, Key=f"{KEYS_PREFIX}{user}.pub", Body='\n'.join(desired[user]) + '\n')
+
+    def archive(user):
+        if user not in pub_users:
+            return
+        s3_client.copy_object(
+            Bucket=bucket, Key=f"{ARCHIVE_PREFIX}{user}.pub",
+            CopySource={'Bucket': bucket, 'Key': f"{KEYS_PREFIX}{user}.pub"}
+        )
+        s3_client.delete_object(Bucket=bucket, Key=f"{KEYS_PREFIX}{user}.pub")
+
+    jobs = [(upload, user) for user in uploads] + [(archive, user) for user in archives]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(user, executor.submit(action, user)) for action, user in jobs]
+    failed = []
+    for user, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Warning: Could not update {KEYS_PREFIX}{user}.pub: {e}", file=sys.stderr)
+            failed.append(user)
+    if failed:
+        raise RuntimeError(f"{KEYS_OBJECT} is up to date but {len(failed)} per-user key object(s) are not; "
+                           "re-run the sync to finish them")
+
+
+def sync(s3_client, bucket, desired, dry_run=False, keep_unlisted=False, max_workers=16):
+    """
+    Returns (plan, changed), where changed means authorized_keys changed.
+    plan['repair'] lists the users whose keys/<user>.pub is fixed up.
+    """
+    text, etag, pub_users = read_state(s3_client, bucket)
+    plan, new_text = plan_sync(text, desired, keep_unlisted)
+    missing, leftover = pub_repairs(plan, desired, pub_users, keep_unlisted)
+    plan['repair'] = missing + leftover
+    changed = bool(plan['add'] or plan['update'] or plan['remove'])
+    if (changed or plan['repair']) and not dry_run:
+        apply_sync(s3_client, bucket, desired, new_text if changed else None, etag,
+                   plan['add'] + plan['update'] + missing, plan['remove'] + leftover, pub_users, max_workers)
+    return plan, changed
+
+
+def is_fleet_task_definition(task_definition_arn):
+    """
+    Whether a task definition ARN (arn:...:task-definition/<family>:<revision>)
+    belongs to the shared environment (dev-environment) or a roster
+    environment (dev-environment-<name>)
+    """
+    family = task_definition_arn.split('/')[-1].rsplit(':', 1)[0]
+    return family == FLEET_TASK_FAMILY or family.startswith(f"{FLEET_TASK_FAMILY}-")
+
+
+def fleet_services(ecs_client, cluster, names=None):
+    """
+    ACTIVE services among names, or by default every service in the cluster
+    running a fleet task definition. CloudFormation generates the services'
+    names, so they are found by what they run.
+    """
+    if names:
+        return [service['serviceName'] for service in describe_services(ecs_client, cluster, names)
+                if service['status'] == 'ACTIVE']
+    arns = []
+    for page in ecs_client.get_paginator('list_services').paginate(cluster=cluster):
+        arns.extend(page['serviceArns'])
+    return [service['serviceName'] for service in describe_services(ecs_client, cluster, arns)
+            if service['status'] == 'ACTIVE' and is_fleet_task_definition(service['taskDefinition'])]
+
+
+def rollout(ecs_client, cluster, services=None, max_workers=16):
+    """
+    Force one new deployment of each fleet service, for containers without
+    authorized-keys-helper.py
+    """
+    services = fleet_services(ecs_client, cluster, services)
+    if not services:
+        print(f"No dev-environment service found in {cluster}. Keys will be used for new tasks only.")
+        return False
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(services))) as executor:
+        list(executor.map(
+            lambda service: ecs_client.update_service(cluster=cluster, service=service, forceNewDeployment=True),
+            services
+        ))
+    print(f"Forced a new deployment of {len(services)} ECS service(s). New tasks will use the updated keys.")
+    return True
+
+
+def print_plan(plan, dry_run):
+    labels = {'add': ('Would add', 'Added'), 'update': ('Would update keys for', 'Updated keys for'),
+              'remove': ('Would remove and archive', 'Removed and archived'),
+              'repair': (f"Would fix {KEYS_PREFIX}<user>.pub of", f"Fixed {KEYS_PREFIX}<user>.pub of")}
+    for action, (planned, applied) in labels.items():
+        users = plan.get(action, [])
+        if users:
+            shown = ', '.join(users[:10]) + (f", ... ({len(users) - 10} more)" if len(users) > 10 else '')
+            print(f"{planned if dry_run else applied} {len(users)} user(s): {shown}")
+    print(f"{len(plan['unchanged'])} user(s) unchanged")
+
+
+def simulate(existing, roster_size):
+    """
+    Sync a roster against a seeded LocalS3 bucket and report the calls made
+    """
+    from local_aws import LocalS3
+
+    def key_for(index):
+        return f"ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAI{index:043d} user{index}@laptop"
+
+    s3 = LocalS3(api_latency=0.02)
+    s3.create_bucket(Bucket='keys')
+    seeded = '\n'.join(f"{key_for(i)} # user{i:04d} (added 2025-01-01 00:00:00)" for i in range(existing))
+    s3.put_object(Bucket='keys', Key=KEYS_OBJECT, Body=seeded + '\n')
+    for i in range(existing):
+        s3.put_object(Bucket='keys', Key=f"{KEYS_PREFIX}user{i:04d}.pub", Body=key_for(i) + '\n')
+    s3.calls.clear()
+
+    # Drop the first 10% of users, rotate the key of the next 10%, add the rest
+    start = existing // 10
+    desired = {
+        f"user{i:04d}": [key_for(i + 100000 if i < start * 2 else i)]
+        for i in range(start, start + roster_size)
+    }
+
+    began = time.perf_counter()
+    plan, _ = sync(s3, 'keys', desired)
+    elapsed = time.perf_counter() - began
+    calls = dict(s3.calls)
+    print_plan(plan, dry_run=False)
+
+    text = s3.get_object(Bucket='keys', Key=KEYS_OBJECT)['Body'].read().decode()
+    owned, _ = parse_current(text)
+    assert set(owned) == set(desired), "authorized_keys does not match the roster"
+    archived = [k for k in s3._buckets['keys'] if k.startswith(ARCHIVE_PREFIX)]
+    assert len(archived) == len(plan['remove']), "removed users were not archived"
+    print(f"Synced in {elapsed:.2f}s with 20ms simulated S3 latency; calls: {calls}")
+    print(f"authorized_keys written {calls['PutObject'] - len(plan['add']) - len(plan['update'])} time(s), "
+          "0 rollouts")
+    print(f"The shell script would have made {len(plan['add']) + len(plan['update']) + len(plan['remove'])} "
+          "sequential download/upload rounds and as many rollouts")
+
+    # authorized_keys edited between the read and the write: no per-user object changes
+    def per_user_objects():
+        return {key: obj for key, obj in s3._buckets['keys'].items() if key != KEYS_OBJECT}
+    before = per_user_objects()
+    get = s3.get_object
+    def edited_meanwhile(**kwargs):
+        response = get(**kwargs)
+        s3.get_object = get
+        s3.put_object(Bucket='keys', Key=KEYS_OBJECT, Body=f"{key_for(999999)} # eve\n")
+        return response
+    s3.get_object = edited_meanwhile
+    try:
+        sync(s3, 'keys', {**desired, 'user9999': [key_for(9999)]})
+        raise AssertionError("a concurrent edit was overwritten")
+    except RuntimeError as e:
+        print(f"Concurrent edit: {e}")
+    assert per_user_objects() == before, "per-user objects changed before authorized_keys was written"
+
+    # A per-user upload fails after authorized_keys is written; the next run finishes it
+    put = s3.put_object
+    def failing_put(**kwargs):
+        if kwargs['Key'] == f"{KEYS_PREFIX}user9998.pub":
+            raise RuntimeError("SlowDown")
+        return put(**kwargs)
+    s3.put_object = failing_put
+    retry = {**desired, 'user9998': [key_for(9998)]}
+    try:
+        sync(s3, 'keys', retry)
+        raise AssertionError("a failed per-user upload was not reported")
+    except RuntimeError as e:
+        print(f"Failed upload: {e}")
+    s3.put_object = put
+    plan, changed = sync(s3, 'keys', retry)
+    assert not changed and plan['repair'] == ['user9998'], plan['repair']
+    assert f"{KEYS_PREFIX}user9998.pub" in s3._buckets['keys']
+    print("Re-run fixed the missing per-user object without rewriting authorized_keys")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync developer SSH keys in S3 with a roster file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help="Apply a roster file to the key bucket")
+    sync_parser.add_argument('roster')
+    sync_parser.add_argument('--bucket', default=os.environ.get('DEV_FLEET_KEYS_BUCKET'),
+                             help="Defaults to dev-fleet-keys-<account id>")
+    sync_parser.add_argument('--region', default=AWS_REGION)
+    sync_parser.add_argument('--dry-run', action='store_true', help="Print the plan without changing anything")
+    sync_parser.add_argument('--keep-unlisted', action='store_true',
+                             help="Keep keys of users missing from the roster instead of removing them")
+    sync_parser.add_argument('--rollout', action='store_true',
+                             help="Force one new ECS deployment if anything changed")
+    sync_parser.add_argument('--cluster', default='dev-fleet-cluster')
+    sync_parser.add_argument('--service', action='append', dest='services',
+                             help="Service to roll out (repeatable; default: every service in the cluster "
+                                  "running a dev-environment task definition)")
+    sync_parser.add_argument('--max-workers', type=int, default=16)
+
+    simulate_parser = subparsers.add_parser('simulate', help="Sync against a local S3 stand-in")
+    simulate_parser.add_argument('--existing', type=int, default=200)
+    simulate_parser.add_argument('--roster', type=int, default=250)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        simulate(args.existing, args.roster)
+        return 0
+
+    import boto3
+    session = boto3.Session(region_name=args.region)
+    bucket = args.bucket or f"dev-fleet-keys-{session.client('sts').get_caller_identity()['Account']}"
+    desired = load_key_roster(args.roster)
+
+    plan, changed = sync(session.client('s3'), bucket, desired, args.dry_run, args.keep_unlisted,
+                         args.max_workers)
+    print_plan(plan, args.dry_run)
+    if not changed:
+        print("Keys already match the roster")
+    elif not args.dry_run:
+        print(f"Updated s3://{bucket}/{KEYS_OBJECT}")
+        if args.rollout:
+            rollout(session.client('ecs'), args.cluster, args.services, args.max_workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+"""
+ssh-load-test.py - Concurrent SSH sessions and workloads against one dev container
+
+Drives N concurrent OpenSSH clients against a single server and measures
+what the developers in those sessions would notice, and what the server
+pays for it. Each step of --clients runs for --duration seconds and reports
+connection handshake latency and failures, keystroke round-trip
+percentiles, git clone and compile iteration times, server CPU (percent of
+one core) and peak memory, and sshd memory per session.
+
+Targets:
+  --docker IMAGE     run the image locally at the dev-environment task size
+                     (1 vCPU, 2 GiB), with its own entrypoint and sshd
+  --sshd [PATH]      a throwaway sshd on 127.0.0.1, running as the current user
+  --host HOST        an existing server, e.g. a task behind the NLB
+                     (with --port, --user and --identity)
+  --local            no SSH at all: the same workloads under a local pty, as
+                     a baseline for what sshd itself adds
+
+Workloads (--mix, weights per client):
+  echo      interactive typing: one key at a time into `cat` on a raw pty,
+            --keys-per-second per client, timing each echo
+  git       `git clone --no-local` of a seeded repository, then a pause
+  compile   `make -B -j2` of a seeded C project in bursts, with pauses
+  churn     connect, run `true` and disconnect, as fast as possible
+
+Server-side changes (sshd_config lines to try, e.g. MaxStartups 100:30:200)
+are applied with --sshd-option in the --docker and --sshd targets.
+
+Usage:
+  ssh-load-test.py --docker dev-fleet:latest --clients 10 25 50 100
+  ssh-load-test.py --sshd --clients 20 --mix echo=50,churn=50 --sshd-option 'MaxStartups 100:30:200'
+  ssh-load-test.py --host alice.qdev.ngdegtm.com --port 2200 --identity ~/.ssh/id_ed25519 --clients 10
+  ssh-load-test.py --local --clients 10 --duration 20
+"""
+
+import argparse
+import getpass
+import json
+import os
+import random
+import select
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Server-side working directory, under the login user's home
+WORKDIR = '.cache/ssh-load-test'
+
+MIX = {'echo': 80, 'git': 10, 'compile': 10}
+WORKLOADS = ('echo', 'git', 'compile', 'churn')
+ECHO_TIMEOUT = 5.0
+CONNECT_TIMEOUT = 30
+
+SSH_OPTIONS = [
+    '-o', 'BatchMode=yes',
+    '-o', 'StrictHostKeyChecking=no',
+    '-o', 'UserKnownHostsFile=/dev/null',
+    '-o', 'LogLevel=ERROR',
+    '-o', 'ControlMaster=no',
+    '-o', 'ControlPath=none',
+    '-o', f"ConnectTimeout={CONNECT_TIMEOUT}",
+]
+
+# Creates the repository the git workload clones and the project the compile
+# workload builds, once per server. Runs there as `python3 -`.
+SEED = r"""
+import os, random, subprocess, sys
+workdir = os.path.expanduser(sys.argv[1])
+files, commits, units = int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+rng = random.Random(3)
+words = [f"token{i}" for i in range(400)]
+seed = os.path.join(workdir, f"seed-{files}x{commits}.git")
+if not os.path.isdir(seed):
+    source = os.path.join(workdir, 'seed-source')
+    subprocess.run(['rm', '-rf', source], check=True)
+    os.makedirs(source)
+    git = lambda *args: subprocess.run(['git', '-C', source, '-c', 'user.name=load', '-c', 'user.email=load@test'] + list(args),
+                                       check=True, stdout=subprocess.DEVNULL)
+    git('init', '-q')
+    for commit in range(commits):
+        touched = range(files) if commit == 0 else rng.sample(range(files), max(1, files // 20))
+        for index in touched:
+            path = os.path.join(source, f"src/pkg{index // 50:03d}/module{index % 50:02d}.py")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a') as f:
+                f.write('\n'.join(' '.join(rng.choices(words, k=10)) for _ in range(rng.randint(20, 80))) + '\n')
+        git('add', '-A')
+        git('commit', '-q', '-m', f"change {commit}")
+    subprocess.run(['git', 'clone', '-q', '--bare', source, seed], check=True)
+    subprocess.run(['rm', '-rf', source], check=True)
+project = os.path.join(workdir, f"compile-{units}")
+if not os.path.isdir(project):
+    os.makedirs(project)
+    for unit in range(units):
+        with open(os.path.join(project, f"unit{unit:03d}.c"), 'w') as f:
+            f.write(f"#include <stdint.h>\n")
+            for fn in range(12):
+                f.write(f"uint64_t u{unit}_f{fn}(uint64_t x) {{ for (int i = 0; i < {40 + fn}; i++) "
+                        f"{{ x = x * 6364136223846793005ULL + {fn * 2 + 1}ULL; x ^= x >> {13 + fn % 7}; }} return x; }}\n")
+    with open(os.path.join(project, 'Makefile'), 'w') as f:
+        f.write("SOURCES := $(wildcard unit*.c)\nOBJECTS := $(SOURCES:.c=.o)\n"
+                "all: libunits.a\nlibunits.a: $(OBJECTS)\n\tar rcs $@ $^\n"
+                "%.o: %.c\n\t$(CC) -O2 -c $< -o $@\n")
+print('seeded', workdir)
+"""
+
+# Samples the server once per interval and prints a JSON line: CPU seconds
+# and memory of the sshd process tree (exited descendants' CPU is in their
+# live ancestors' cutime/cstime), and of the container's cgroup if readable.
+# Runs there as `python3 -`.
+PROBE = r"""
+import json, os, sys, time
+interval, root_pid, root_self = float(sys.argv[1]), int(sys.argv[2]), sys.argv[3] == '1'
+tick, me = os.sysconf('SC_CLK_TCK'), os.getpid()
+
+def read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+while True:
+    procs = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == me:
+            continue
+        stat = read(f"/proc/{pid}/stat")
+        status = read(f"/proc/{pid}/status")
+        if not stat or not status:
+            continue
+        comm = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat[stat.rindex(')') + 2:].split()
+        rss = next((int(line.split()[1]) for line in status.splitlines() if line.startswith('VmRSS:')), 0)
+        own = slice(11, 15) if root_self or int(pid) != root_pid else slice(13, 15)
+        procs[int(pid)] = (comm, int(fields[1]), sum(int(v) for v in fields[own]), rss)
+    if root_pid:
+        roots = [root_pid] if root_pid in procs else []
+    else:
+        roots = [pid for pid, (comm, ppid, _, _) in procs.items()
+                 if comm == 'sshd' and not procs.get(ppid, ('',))[0].startswith('sshd')]
+    children = {}
+    for pid, (_, ppid, _, _) in procs.items():
+        children.setdefault(ppid, []).append(pid)
+    tree, stack = set(), list(roots)
+    while stack:
+        pid = stack.pop()
+        if pid not in tree:
+            tree.add(pid)
+            stack.extend(children.get(pid, []))
+    cgroup_cpu = read('/sys/fs/cgroup/cpu.stat')
+    cgroup_mem = read('/sys/fs/cgroup/memory.current')
+    print(json.dumps({
+        'time': time.time(),
+        'tree_cpu': sum(procs[pid][2] for pid in tree) / tick,
+        'tree_rss_kb': sum(procs[pid][3] for pid in tree),
+        'sshd_rss_kb': sum(procs[pid][3] for pid in tree if procs[pid][0].startswith('sshd')),
+        'sshd_processes': sum(1 for pid in tree if procs[pid][0].startswith('sshd')),
+        'cgroup_cpu': int(cgroup_cpu.split()[1]) / 1e6 if cgroup_cpu and cgroup_cpu.startswith('usage_usec') else None,
+        'cgroup_mem_kb': int(cgroup_mem) // 1024 if cgroup_mem and cgroup_mem.strip().isdigit() else None,
+    }), flush=True)
+    time.sleep(interval)
+"""
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"unknown workload '{name}', expected one of {', '.join(WORKLOADS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def assign_workloads(clients, mix):
+    """
+    Workload of each client, in proportion to the mix weights (largest
+    remainder), interleaved so every step starts a bit of everything
+    """
+    total = sum(mix.values())
+    shares = {name: clients * weight / total for name, weight in mix.items()}
+    counts = {name: int(share) for name, share in shares.items()}
+    for name in sorted(shares, key=lambda name: counts[name] - shares[name])[:clients - sum(counts.values())]:
+        counts[name] += 1
+    assigned = []
+    while len(assigned) < clients:
+        for name in mix:
+            if counts[name]:
+                assigned.append(name)
+                counts[name] -= 1
+    return assigned
+
+
+class Target:
+    """
+    How to reach the server: the command that runs a shell command there
+    (through ssh, or locally), and the command that runs the probe
+    """
+
+    def __init__(self, label, ssh_base=None, probe_prefix=None, root_pid=0, cleanup=None):
+        self.label = label
+        self.ssh_base = ssh_base
+        self.probe_prefix = probe_prefix
+        self.root_pid = root_pid
+        self.cleanup = cleanup
+
+    def command(self, remote, tty=False):
+        if self.ssh_base is None:
+            if tty:
+                return ['script', '-qfec', remote, '/dev/null']
+            return ['bash', '-c', remote]
+        return self.ssh_base + (['-tt'] if tty else ['-T']) + [remote]
+
+    def run_python(self, source, *args, timeout=600):
+        return subprocess.run(self.command(f"python3 - {' '.join(shlex.quote(str(a)) for a in args)}"),
+                              input=source, capture_output=True, text=True, timeout=timeout)
+
+    def start_probe(self, interval):
+        # In the local baseline the root is this process, whose own CPU is
+        # the clients'; only its children's counts
+        args = ['python3', '-', str(interval), str(self.root_pid), '0' if self.ssh_base is None else '1']
+        if self.probe_prefix is not None:
+            command = self.probe_prefix + args
+        else:
+            command = self.command(' '.join(args))
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, text=True)
+        process.stdin.write(PROBE)
+        process.stdin.close()
+        return process
+
+
+def wait_for_ssh(target, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if subprocess.run(target.command('true'), capture_output=True, timeout=CONNECT_TIMEOUT + 5).returncode == 0:
+            return True
+        time.sleep(1)
+    return False
+
+
+def client_key(workdir):
+    key = os.path.join(workdir, 'id_ed25519')
+    subprocess.run(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', key], check=True)
+    return key
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def docker_target(image, sshd_options, workdir):
+    name = f"ssh-load-test-{os.getpid()}"
+    subprocess.run(['docker', 'run', '-d', '--rm', '--name', name, '--cpus', '1', '--memory', '2g',
+                    '-p', '127.0.0.1::22', image], check=True, stdout=subprocess.DEVNULL)
+    cleanup = lambda: subprocess.run(['docker', 'rm', '-f', name], capture_output=True)
+    try:
+        port = subprocess.run(['docker', 'port', name, '22/tcp'], check=True, capture_output=True,
+                              text=True).stdout.split()[0].rsplit(':', 1)[1]
+        key = client_key(workdir)
+        with open(f"{key}.pub", 'rb') as f:
+            subprocess.run(['docker', 'exec', '-i', name, 'sh', '-c',
+                            'cat >> /home/developer/.ssh/authorized_keys'], input=f.read(), check=True)
+        if sshd_options:
+            # sshd re-executes itself with the new configuration on SIGHUP
+            lines = ''.join(f"{option}\n" for option in sshd_options)
+            subprocess.run(['docker', 'exec', '-i', name, 'sh', '-c',
+                            'cat >> /etc/ssh/sshd_config && kill -HUP "$(cat /run/sshd.pid)"'],
+                           input=lines.encode(), check=True)
+        target = Target(
+            f"docker {image} (1 vCPU, 2 GiB)",
+            ssh_base=['ssh', *SSH_OPTIONS, '-i', key, '-p', port, 'developer@127.0.0.1'],
+            probe_prefix=['docker', 'exec', '-i', name],
+            cleanup=cleanup
+        )
+        if not wait_for_ssh(target):
+            raise RuntimeError(f"sshd in {name} did not accept connections")
+        return target
+    except BaseException:
+        cleanup()
+        raise
+
+
+def sshd_target(sshd_path, sshd_options, workdir):
+    sshd_path = os.path.abspath(shutil.which(sshd_path) or sshd_path)
+    host_key = os.path.join(workdir, 'host_key')
+    subprocess.run(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', host_key], check=True)
+    key = client_key(workdir)
+    authorized_keys = os.path.join(workdir, 'authorized_keys')
+    shutil.copy(f"{key}.pub", authorized_keys)
+    port = free_port()
+    config = os.path.join(workdir, 'sshd_config')
+    with open(config, 'w') as f:
+        f.write('\n'.join([
+            f"Port {port}",
+            "ListenAddress 127.0.0.1",
+            f"HostKey {host_key}",
+            f"AuthorizedKeysFile {authorized_keys}",
+            f"PidFile {workdir}/sshd.pid",
+            "UsePAM no",
+            "StrictModes no",
+            "PermitRootLogin yes" if os.getuid() == 0 else "PermitRootLogin no",
+            *sshd_options,
+        ]) + '\n')
+    process = subprocess.Popen([sshd_path, '-D', '-e', '-f', config], stderr=subprocess.DEVNULL)
+
+    def cleanup():
+        process.terminate()
+        process.wait()
+
+    target = Target(
+        f"sshd {sshd_path} on 127.0.0.1:{port}",
+        ssh_base=['ssh', *SSH_OPTIONS, '-i', key, '-p', str(port), f"{getpass.getuser()}@127.0.0.1"],
+        probe_prefix=[],
+        root_pid=process.pid,
+        cleanup=cleanup
+    )
+    if not wait_for_ssh(target, timeout=15):
+        cleanup()
+        raise RuntimeError(f"{sshd_path} did not accept connections on port {port}")
+    return target
+
+
+def host_target(host, port, user, identity):
+    ssh_base = ['ssh', *SSH_OPTIONS, '-p', str(port)]
+    if identity:
+        ssh_base += ['-i', os.path.expanduser(identity)]
+    target = Target(f"{user}@{host}:{port}", ssh_base=ssh_base + [f"{user}@{host}"])
+    if not wait_for_ssh(target, timeout=CONNECT_TIMEOUT):
+        raise RuntimeError(f"could not connect to {user}@{host}:{port}")
+    return target
+
+
+def local_target():
+    return Target(f"local baseline (no SSH) on {socket.gethostname()}", probe_prefix=[], root_pid=os.getpid())
+
+
+class Client(threading.Thread):
+    """
+    One SSH client running one workload until stopped. Records its
+    handshake (spawn until the server-side command reports READY) and
+    per-iteration timings.
+    """
+
+    def __init__(self, target, workload, pause, keys_per_second, seed, stop, rng):
+        super().__init__(daemon=True)
+        self.target = target
+        self.seed = seed
+        self.workload = workload
+        self.pause = pause
+        self.keys_per_second = keys_per_second
+        self.stop = stop
+        self.rng = rng
+        self.handshakes = []
+        self.failures = 0
+        self.rtts = []
+        self.lost_keys = 0
+        self.iterations = []
+        self.process = None
+
+    def remote_command(self):
+        work = f"$HOME/{WORKDIR}" if self.target.ssh_base else os.path.expanduser(f"~/{WORKDIR}")
+        if self.workload == 'echo':
+            return "echo READY; stty raw -echo; exec cat"
+        if self.workload == 'git':
+            files, commits, _ = self.seed
+            body = f'rm -rf "$d/w"; git clone -q --no-local "{work}/seed-{files}x{commits}.git" "$d/w"'
+        else:
+            units = self.seed[2]
+            body = (f'[ -d "$d/compile" ] || cp -r "{work}/compile-{units}" "$d/compile"; '
+                    f'make -s -B -j2 -C "$d/compile" >/dev/null')
+        return (f'd=$(mktemp -d); trap \'rm -rf "$d"\' EXIT HUP TERM; echo READY; '
+                f'while :; do {body}; echo DONE; sleep {self.pause}; done')
+
+    def run(self):
+        try:
+            if self.workload == 'churn':
+                self.run_churn()
+            else:
+                self.run_session()
+        finally:
+            if self.process and self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+
+    def run_churn(self):
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            result = subprocess.run(self.target.command('true'), stdin=subprocess.DEVNULL,
+                                    capture_output=True, timeout=CONNECT_TIMEOUT + 5)
+            if result.returncode == 0:
+                self.handshakes.append(time.perf_counter() - start)
+            else:
+                self.failures += 1
+
+    def read_until(self, fd, marker, deadline):
+        buffered = b''
+        while marker not in buffered:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return None
+            buffered += chunk
+        return buffered
+
+    def run_session(self):
+        start = time.perf_counter()
+        self.process = subprocess.Popen(self.target.command(self.remote_command(), tty=self.workload == 'echo'),
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        fd = self.process.stdout.fileno()
+        ready = self.read_until(fd, b'READY', start + CONNECT_TIMEOUT)
+        if ready is None:
+            self.failures += 1
+            return
+        self.handshakes.append(time.perf_counter() - start)
+        if self.workload == 'echo':
+            self.type_keys(fd)
+            return
+        # Each DONE ends an iteration that began at the previous DONE plus the pause
+        began = time.perf_counter()
+        while not self.stop.is_set():
+            if not select.select([fd], [], [], 0.5)[0]:
+                continue
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            for _ in range(chunk.count(b'DONE')):
+                now = time.perf_counter()
+                self.iterations.append(now - began)
+                began = now + self.pause
+
+    def type_keys(self, fd):
+        # The end of the READY line, and anything sent before the pty went raw
+        time.sleep(0.2)
+        while select.select([fd], [], [], 0)[0]:
+            if not os.read(fd, 4096):
+                return
+        stdin = self.process.stdin.fileno()
+        while not self.stop.wait(self.rng.expovariate(self.keys_per_second)):
+            key = bytes([self.rng.randint(97, 122)])
+            start = time.perf_counter()
+            os.write(stdin, key)
+            if self.read_until(fd, key, start + ECHO_TIMEOUT) is None:
+                self.lost_keys += 1
+                continue
+            self.rtts.append(time.perf_counter() - start)
+
+
+def run_step(target, clients, mix, duration, ramp, pause, keys_per_second, seed, probe_interval):
+    probe = target.start_probe(probe_interval)
+    samples = []
+
+    def read_probe():
+        for line in probe.stdout:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                pass
+
+    threading.Thread(target=read_probe, daemon=True).start()
+    time.sleep(probe_interval * 1.5)
+    baseline = samples[-1] if samples else None
+
+    stop = threading.Event()
+    rng = random.Random(clients)
+    workers = [Client(target, workload, pause, keys_per_second, seed, stop, random.Random(rng.random()))
+               for workload in assign_workloads(clients, mix)]
+    for worker in workers:
+        worker.start()
+        time.sleep(ramp / max(1, clients))
+    steady_from = len(samples)
+    time.sleep(duration)
+    stop.set()
+    for worker in workers:
+        worker.join(timeout=CONNECT_TIMEOUT + 10)
+    probe.kill()
+    probe.wait()
+
+    def all_of(attribute, workloads=WORKLOADS):
+        return [value for worker in workers if worker.workload in workloads for value in getattr(worker, attribute)]
+
+    handshakes = all_of('handshakes')
+    rtts = all_of('rtts')
+    result = {
+        'clients': clients,
+        'workloads': {name: sum(1 for worker in workers if worker.workload == name) for name in mix},
+        'handshakes': len(handshakes),
+        'failed_connections': sum(worker.failures for worker in workers),
+        'handshake_p50_ms': ms(percentile(handshakes, 50)),
+        'handshake_p95_ms': ms(percentile(handshakes, 95)),
+        'handshake_p99_ms': ms(percentile(handshakes, 99)),
+        'keystrokes': len(rtts),
+        'lost_keystrokes': sum(worker.lost_keys for worker in workers),
+        'keystroke_p50_ms': ms(percentile(rtts, 50)),
+        'keystroke_p95_ms': ms(percentile(rtts, 95)),
+        'keystroke_p99_ms': ms(percentile(rtts, 99)),
+        'keystroke_max_ms': ms(max(rtts) if rtts else None),
+        'git_clones': len(all_of('iterations', ('git',))),
+        'git_clone_p50_s': percentile(all_of('iterations', ('git',)), 50),
+        'compiles': len(all_of('iterations', ('compile',))),
+        'compile_p50_s': percentile(all_of('iterations', ('compile',)), 50),
+    }
+    result.update(server_usage(samples, steady_from, baseline, clients - result['workloads'].get('churn', 0)))
+    return result
+
+
+def ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def server_usage(samples, steady_from, baseline, sessions):
+    """
+    CPU as a percentage of one core, averaged over the steady state and at
+    its busiest interval; the container's cgroup is used when the probe can
+    read it, the sshd process tree otherwise
+    """
+    steady = samples[max(0, steady_from - 1):]
+    if len(steady) < 2:
+        return {}
+    source = 'cgroup_cpu' if all(sample.get('cgroup_cpu') is not None for sample in steady) else 'tree_cpu'
+    rates = [
+        100 * (b[source] - a[source]) / (b['time'] - a['time'])
+        for a, b in zip(steady, steady[1:]) if b['time'] > a['time']
+    ]
+    span = steady[-1]['time'] - steady[0]['time']
+    memory_source = 'cgroup_mem_kb' if steady[-1].get('cgroup_mem_kb') is not None else 'tree_rss_kb'
+    peak_sshd = max(sample['sshd_rss_kb'] for sample in steady)
+    return {
+        'cpu_source': 'container' if source == 'cgroup_cpu' else 'server process tree',
+        'cpu_avg_pct': 100 * (steady[-1][source] - steady[0][source]) / span if span else None,
+        'cpu_peak_pct': max(rates) if rates else None,
+        'memory_peak_mb': max(sample[memory_source] for sample in steady) / 1024,
+        'sshd_processes': max(sample['sshd_processes'] for sample in steady),
+        'sshd_kb_per_session': (
+            (peak_sshd - baseline['sshd_rss_kb']) / sessions if baseline and sessions and peak_sshd else None
+        ),
+    }
+
+
+def fmt(value, spec, width, unit=''):
+    width += len(unit)
+    return f"{'-':>{width}}" if value is None else f"{f'{value:{spec}}{unit}':>{width}}"
+
+
+def print_results(target, results):
+    print(f"Target: {target.label}")
+    print(f"{'clients':>7} {'handshake p50':>13} {'p95':>7} {'p99':>7} {'fail':>5} "
+          f"{'key p50':>8} {'p95':>7} {'p99':>7} {'max':>7} {'lost':>5} "
+          f"{'clone':>6} {'build':>6} {'cpu avg':>8} {'peak':>6} {'mem MB':>7} {'sshd KB/sess':>12}")
+    for r in results:
+        print(f"{r['clients']:>7} {fmt(r['handshake_p50_ms'], '.0f', 11, 'ms')} {fmt(r['handshake_p95_ms'], '.0f', 5, 'ms')} "
+              f"{fmt(r['handshake_p99_ms'], '.0f', 5, 'ms')} {r['failed_connections']:>5} "
+              f"{fmt(r['keystroke_p50_ms'], '.1f', 6, 'ms')} {fmt(r['keystroke_p95_ms'], '.1f', 5, 'ms')} "
+              f"{fmt(r['keystroke_p99_ms'], '.1f', 5, 'ms')} {fmt(r['keystroke_max_ms'], '.0f', 5, 'ms')} "
+              f"{r['lost_keystrokes']:>5} {fmt(r['git_clone_p50_s'], '.1f', 5, 's')} {fmt(r['compile_p50_s'], '.1f', 5, 's')} "
+              f"{fmt(r.get('cpu_avg_pct'), '.0f', 7, '%')} {fmt(r.get('cpu_peak_pct'), '.0f', 5, '%')} "
+              f"{fmt(r.get('memory_peak_mb'), '.0f', 7)} {fmt(r.get('sshd_kb_per_session'), '.0f', 12)}")
+    if results and results[0].get('cpu_source'):
+        print(f"CPU is a percentage of one core, measured on the {results[0]['cpu_source']}; clone and build "
+              f"are p50 seconds per iteration")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent SSH sessions and workloads against one dev container")
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument('--docker', metavar='IMAGE', help="Run this dev image locally at 1 vCPU / 2 GiB")
+    targets.add_argument('--sshd', nargs='?', const='/usr/sbin/sshd', metavar='PATH',
+                         help="Start a throwaway sshd on 127.0.0.1 as the current user")
+    targets.add_argument('--host', help="An existing server")
+    targets.add_argument('--local', action='store_true', help="No SSH: run the workloads locally as a baseline")
+    parser.add_argument('--port', type=int, default=22)
+    parser.add_argument('--user', default='developer')
+    parser.add_argument('--identity', help="Private key for --host")
+    parser.add_argument('--sshd-option', action='append', default=[],
+                        help="sshd_config line for --docker/--sshd, e.g. 'MaxStartups 100:30:200' (repeatable)")
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 25, 50],
+                        help="Concurrent clients; one step per value")
+    parser.add_argument('--mix', type=parse_mix, default=MIX, help="Workload weights, e.g. echo=80,git=10,compile=10")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of steady state per step")
+    parser.add_argument('--ramp', type=float, default=5, help="Seconds over which a step's clients connect")
+    parser.add_argument('--pause', type=float, default=5, help="Seconds between git clones and between builds")
+    parser.add_argument('--keys-per-second', type=float, default=5, help="Typing rate of each echo client")
+    parser.add_argument('--seed-files', type=int, default=1000, help="Files in the seeded git repository")
+    parser.add_argument('--seed-commits', type=int, default=20)
+    parser.add_argument('--compile-units', type=int, default=16, help="C files in the seeded project")
+    parser.add_argument('--probe-interval', type=float, default=1.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='ssh-load-test-')
+    target = None
+    try:
+        if args.docker:
+            target = docker_target(args.docker, args.sshd_option, workdir)
+        elif args.sshd:
+            target = sshd_target(args.sshd, args.sshd_option, workdir)
+        elif args.host:
+            target = host_target(args.host, args.port, args.user, args.identity)
+        else:
+            target = local_target()
+
+        if {'git', 'compile'} & set(args.mix):
+            seeded = target.run_python(SEED, f"~/{WORKDIR}", args.seed_files, args.seed_commits, args.compile_units)
+            if seeded.returncode != 0:
+                print(f"Error: seeding the server failed: {seeded.stderr.strip()}", file=sys.stderr)
+                return 1
+
+        results = []
+        for clients in args.clients:
+            print(f"{clients} client(s) for {args.duration:g}s...", file=sys.stderr)
+            results.append(run_step(target, clients, args.mix, args.duration, args.ramp, args.pause,
+                                    args.keys_per_second, (args.seed_files, args.seed_commits, args.compile_units),
+                                    args.probe_interval))
+        if args.json:
+            print(json.dumps({'target': target.label, 'results': results}, indent=2))
+        else:
+            print_results(target, results)
+        return 0
+    except (RuntimeError, subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if target and target.cleanup:
+            target.cleanup()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    sys.exit(main())
@@ -0,0 +1,1003 @@
+#!/usr/bin/env python3
+"""
+toolchain-cache.py - Shared, content-addressed pip/apt/ccache caches on EFS
+
+Every container mounts the same cache directory from the fleet EFS. pip and
+apt fetch through a small pull-through proxy each container runs on
+127.0.0.1, which serves packages from the shared store and adds what it
+downloads. ccache uses the shared directory as its secondary storage.
+
+Store layout under DEV_FLEET_CACHE_DIR:
+  objects/<aa>/<sha256>      package files, named by the SHA-256 of their content
+  refs/apt/<sha256 of path>  pool path of a .deb -> object (apt only knows names)
+  ccache/                    ccache secondary storage (also content-addressed)
+  tmp/                       partial downloads, linked into objects/ when complete
+  stats/<host>.json          hit/miss counters of each container's proxy and ccache
+  janitor.lock               held by whichever container's janitor is evicting
+
+Objects are written under a temporary name, verified, then hard-linked into
+place, so readers never see a partial file and two containers downloading
+the same package at once both end up with the same, single object. pip links
+carry the file's SHA-256 from the index, so a pip object is checked before
+it is served. apt checks every .deb against its signed indexes itself.
+Reading an object refreshes its mtime, as ccache does with update_mtime, so
+the janitor can evict the least recently used files once the cache is over
+its size budget.
+
+Usage:
+  toolchain-cache.py configure        # at container start, as root
+  toolchain-cache.py serve [--port 3141]
+  toolchain-cache.py janitor [--max-gib 50] [--interval 1800] [--once]
+  toolchain-cache.py stats [--json]
+  toolchain-cache.py simulate [--packages 40] [--containers 8] [--upstream-mbps 200]
+"""
+
+import argparse
+import base64
+import collections
+import contextlib
+import fcntl
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CACHE_DIR = os.environ.get('DEV_FLEET_CACHE_DIR', '/mnt/dev-fleet-cache')
+PROXY_PORT = 3141
+PIP_UPSTREAM = 'https://pypi.org/simple'
+MAX_GIB = 50
+NAMESPACE = 'DevFleet'
+
+# Objects used in the last EVICT_GRACE seconds are never evicted, so nothing
+# is removed while another container may be reading it. Reads only refresh an
+# object's mtime when it is older than TOUCH_AFTER, which saves a metadata
+# write to EFS on every hit of a hot package.
+EVICT_GRACE = 600
+TOUCH_AFTER = 300
+TEMP_MAX_AGE = 3600
+# Only one container downloads a given package at a time; the others wait for
+# its object to appear. The holder renews its lease as the download
+# progresses, and a lease older than LEASE_STALE is abandoned.
+LEASE_STALE = 60
+LEASE_POLL = 0.2
+# The janitor evicts down to this share of the budget, so it is not back
+# after every few downloads
+LOW_WATER = 0.9
+
+READ_BYTES = 1024 * 1024
+STATS_INTERVAL = 60
+
+APT_PACKAGE = re.compile(r'/pool/.+\.(u|d)?deb$')
+HREF = re.compile(r'href="([^"]+)"')
+
+# Written by configure. The profile script reaches SSH sessions, which do not
+# see the task's environment.
+APT_CONF = '/etc/apt/apt.conf.d/01dev-fleet-cache'
+PIP_CONF = '/etc/pip.conf'
+CCACHE_CONF = '/etc/ccache.conf'
+PROFILE_SCRIPT = '/etc/profile.d/dev-fleet-cache.sh'
+CCACHE_LOCAL_DIR = '/home/developer/.cache/ccache'
+
+
+class Store:
+    """
+    The content-addressed store shared by every container
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def ref_path(self, namespace, key):
+        return os.path.join(self.root, 'refs', namespace, hashlib.sha256(key.encode()).hexdigest())
+
+    def open(self, digest):
+        """
+        The object opened for reading, or None; refreshes its mtime for the
+        janitor's LRU order
+        """
+        path = self.object_path(digest)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            if time.time() - os.fstat(f.fileno()).st_mtime > TOUCH_AFTER:
+                os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def put(self, chunks, expected=None):
+        """
+        Store the content of an iterable of byte strings and return
+        (digest, size). Raises ValueError, storing nothing, if expected is
+        given and the content does not hash to it.
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, f"{socket.gethostname()}-{uuid.uuid4().hex}")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            if expected and digest != expected:
+                raise ValueError(f"content hashes to {digest}, expected {expected}")
+            path = self.object_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                # Someone stored the same content first; theirs is identical
+                os.utime(path)
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+        return digest, size
+
+    def lease_path(self, key):
+        return os.path.join(self.root, 'tmp', f"{hashlib.sha256(key.encode()).hexdigest()}.lease")
+
+    def acquire_lease(self, key):
+        """
+        True if this container now holds the download lease for key. The
+        lease file is created exclusively, which NFSv4 makes atomic across
+        clients; a lease not renewed for LEASE_STALE seconds (its holder
+        died mid-download) is taken over.
+        """
+        path = self.lease_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return True
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.stat(path).st_mtime > LEASE_STALE:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return False
+
+    def renew_lease(self, key):
+        try:
+            os.utime(self.lease_path(key))
+        except FileNotFoundError:
+            pass
+
+    def release_lease(self, key):
+        try:
+            os.unlink(self.lease_path(key))
+        except FileNotFoundError:
+            pass
+
+    def resolve(self, namespace, key):
+        try:
+            with open(self.ref_path(namespace, key), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_ref(self, namespace, key, digest):
+        path = self.ref_path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(digest)
+        os.replace(tmp_path, path)
+
+
+class Stats:
+    """
+    Hit and miss counters per cache, with the bytes and seconds behind them
+    """
+
+    FIELDS = ('hits', 'misses', 'hit_bytes', 'miss_bytes', 'hit_seconds', 'miss_seconds', 'errors')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.caches = collections.defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, cache, hit, size, seconds):
+        with self.lock:
+            counters = self.caches[cache]
+            kind = 'hit' if hit else 'miss'
+            counters['hits' if hit else 'misses'] += 1
+            counters[f"{kind}_bytes"] += size
+            counters[f"{kind}_seconds"] += seconds
+
+    def error(self, cache):
+        with self.lock:
+            self.caches[cache]['errors'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {cache: dict(counters) for cache, counters in self.caches.items()}
+
+
+def seconds_saved(counters):
+    """
+    Download time the hits avoided, priced at the throughput of this
+    container's own misses
+    """
+    if not counters.get('miss_bytes') or not counters.get('miss_seconds'):
+        return None
+    seconds_per_byte = counters['miss_seconds'] / counters['miss_bytes']
+    return max(0.0, counters['hit_bytes'] * seconds_per_byte - counters['hit_seconds'])
+
+
+def ccache_stats():
+    """
+    Shared-cache hits and misses from `ccache --print-stats`, or None if
+    ccache is not installed. ccache 4.8 renamed secondary storage to remote.
+    """
+    try:
+        output = subprocess.run(['ccache', '--print-stats'], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    values = {}
+    for line in output.splitlines():
+        name, _, value = line.partition('\t')
+        if value.strip().isdigit():
+            values[name] = int(value)
+    hits = values.get('secondary_storage_hit', values.get('remote_storage_hit', 0))
+    misses = values.get('secondary_storage_miss', values.get('remote_storage_miss', 0))
+    return dict(dict.fromkeys(Stats.FIELDS, 0), hits=hits, misses=misses)
+
+
+def encode_url(url):
+    return base64.urlsafe_b64encode(url.encode()).decode().rstrip('=')
+
+
+def decode_url(token):
+    return base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+
+
+def rewrite_simple_page(page, page_url):
+    """
+    Point every file link that carries a sha256 fragment at the proxy's
+    /files/<sha256>/ path. Links without one stay as they are and bypass the
+    cache. The file name stays last in the path, so pip still parses it and
+    its <file>.metadata requests still resolve.
+    """
+    def rewrite(match):
+        url = urllib.parse.urljoin(page_url, html.unescape(match.group(1)))
+        target, _, fragment = url.partition('#')
+        digest = urllib.parse.parse_qs(fragment).get('sha256', [None])[0]
+        if not digest or not re.fullmatch(r'[0-9a-f]{64}', digest):
+            return match.group(0)
+        filename = urllib.parse.unquote(target.rsplit('/', 1)[-1])
+        proxied = f"/files/{digest}/{encode_url(target)}/{urllib.parse.quote(filename)}#sha256={digest}"
+        return f'href="{html.escape(proxied)}"'
+    return HREF.sub(rewrite, page)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers passed through to the upstream and back, for conditional
+    # index requests
+    REQUEST_HEADERS = ('If-Modified-Since', 'If-None-Match', 'Range', 'Cache-Control')
+    RESPONSE_HEADERS = ('Content-Type', 'Last-Modified', 'ETag', 'Content-Range', 'Cache-Control')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        try:
+            if self.path.startswith('http://'):
+                # apt, through Acquire::http::Proxy: absolute URLs
+                if APT_PACKAGE.search(urllib.parse.urlsplit(self.path).path):
+                    self.serve_apt_package(self.path)
+                else:
+                    self.pass_through(self.path)
+            elif self.path.startswith('/simple/'):
+                self.serve_simple_page(self.path[len('/simple/'):])
+            elif self.path.startswith('/files/'):
+                self.serve_pip_file(self.path[len('/files/'):])
+            elif self.path == '/stats':
+                self.send_bytes(200, json.dumps(self.server.stats.snapshot()).encode(), 'application/json')
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def upstream(self, url, headers=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        return urllib.request.urlopen(request, timeout=60)
+
+    def send_bytes(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_object(self, f):
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, READ_BYTES)
+
+    def pass_through(self, url):
+        headers = {name: self.headers[name] for name in self.REQUEST_HEADERS if self.headers[name]}
+        try:
+            response = self.upstream(url, headers)
+        except urllib.error.HTTPError as e:
+            response = e
+        except OSError as e:
+            self.send_error(502, f"Upstream unavailable: {e}")
+            return
+        with response:
+            body = response.read()
+            self.send_bytes(
+                response.status, body, response.headers.get('Content-Type', 'application/octet-stream'),
+                {name: response.headers[name] for name in self.RESPONSE_HEADERS[1:] if response.headers[name]}
+            )
+
+    def download(self, cache, url, digest=None, ref=None):
+        """
+        Download url into the store, renewing the lease on it as chunks
+        arrive. Returns the object's digest.
+        """
+        store = self.server.store
+        key = digest or ref
+
+        def chunks(response):
+            renewed = time.time()
+            while True:
+                chunk = response.read(READ_BYTES)
+                if not chunk:
+                    return
+                if time.time() - renewed > LEASE_STALE / 4:
+                    store.renew_lease(key)
+                    renewed = time.time()
+                yield chunk
+
+        with self.upstream(url) as response:
+            known, _ = store.put(chunks(response), expected=digest)
+        if ref:
+            store.set_ref(cache, ref, known)
+        return known
+
+    def serve_cached(self, cache, url, digest=None, ref=None):
+        """
+        Serve an object from the shared store, downloading and storing it
+        first on a miss. Concurrent misses for the same file, in this proxy
+        or in any other container's, wait for one download instead of
+        starting their own.
+        """
+        store, stats = self.server.store, self.server.stats
+        start = time.perf_counter()
+        key = digest or ref
+        hit = True
+        with self.server.key_lock(key):
+            while True:
+                known = digest or store.resolve(cache, ref)
+                f = store.open(known) if known else None
+                if f is not None:
+                    break
+                if not store.acquire_lease(key):
+                    time.sleep(LEASE_POLL)
+                    continue
+                hit = False
+                try:
+                    known = self.download(cache, url, digest, ref)
+                except urllib.error.HTTPError as e:
+                    self.send_error(e.code)
+                    return
+                except (OSError, ValueError) as e:
+                    stats.error(cache)
+                    self.send_error(502, f"Download failed: {e}")
+                    return
+                finally:
+                    store.release_lease(key)
+        size = os.fstat(f.fileno()).st_size
+        if not hit:
+            stats.record(cache, False, size, time.perf_counter() - start)
+            start = time.perf_counter()
+        self.send_object(f)
+        if hit:
+            stats.record(cache, True, size, time.perf_counter() - start)
+
+    def serve_apt_package(self, url):
+        # Pool paths name one version of one package for one architecture,
+        # whichever mirror serves them
+        path = urllib.parse.urlsplit(url).path
+        self.serve_cached('apt', url, ref=path[path.index('/pool/'):])
+
+    def serve_pip_file(self, rest):
+        parts = rest.split('/', 2)
+        if len(parts) != 3 or not re.fullmatch(r'[0-9a-f]{64}', parts[0]):
+            self.send_error(404)
+            return
+        digest, token, filename = parts
+        try:
+            url = decode_url(token)
+        except ValueError:
+            self.send_error(404)
+            return
+        if filename.endswith('.metadata'):
+            # PEP 658 metadata next to the file, small and fetched once per resolve
+            self.pass_through(url + '.metadata')
+            return
+        self.serve_cached('pip', url, digest=digest)
+
+    def serve_simple_page(self, project):
+        page_url = f"{self.server.pip_upstream}/{project}"
+        try:
+            with self.upstream(page_url, {'Accept': 'text/html'}) as response:
+                page = response.read().decode('utf-8')
+                page_url = response.geturl()
+        except urllib.error.HTTPError as e:
+            self.send_error(e.code)
+            return
+        except OSError as e:
+            self.send_error(502, f"Upstream unavailable: {e}")
+            return
+        self.send_bytes(200, rewrite_simple_page(page, page_url).encode('utf-8'), 'text/html; charset=utf-8')
+
+
+class CacheProxy(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store, pip_upstream=PIP_UPSTREAM):
+        super().__init__(address, ProxyHandler)
+        self.store = store
+        self.pip_upstream = pip_upstream.rstrip('/')
+        self.stats = Stats()
+        self._key_locks = {}    # key -> [lock, holders and waiters]
+        self._key_locks_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def key_lock(self, key):
+        """
+        Hold the lock for one cache key. A key's lock is dropped once nobody
+        holds or waits for it, so a long-running proxy keeps one per fetch in
+        flight rather than one per package it has ever fetched.
+        """
+        with self._key_locks_lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+
+def stats_path(root, name=None):
+    return os.path.join(root, 'stats', f"{name or socket.gethostname()}.json")
+
+
+def write_stats(root, caches, name=None):
+    path = stats_path(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'updated': time.time(), 'caches': caches}, f)
+    os.replace(tmp_path, path)
+
+
+def emf_line(deltas, timestamp=None):
+    """
+    One EMF document per cache with this interval's hits, misses and bytes
+    served from the shared cache, published from stdout like
+    session-metrics-agent.py's
+    """
+    lines = []
+    for cache, counters in deltas.items():
+        lookups = counters['hits'] + counters['misses']
+        if not lookups:
+            continue
+        document = {
+            '_aws': {
+                'Timestamp': int((timestamp or time.time()) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Cache']],
+                    'Metrics': [
+                        {'Name': 'CacheHits', 'Unit': 'Count'},
+                        {'Name': 'CacheMisses', 'Unit': 'Count'},
+                        {'Name': 'CacheHitRate', 'Unit': 'Percent'},
+                        {'Name': 'CacheBytesServed', 'Unit': 'Bytes'},
+                    ]
+                }]
+            },
+            'Cache': cache,
+            'CacheHits': counters['hits'],
+            'CacheMisses': counters['misses'],
+            'CacheHitRate': round(100.0 * counters['hits'] / lookups, 1),
+            'CacheBytesServed': counters['hit_bytes'],
+        }
+        lines.append(json.dumps(document, separators=(',', ':')))
+    return lines
+
+
+def serve(root, port, pip_upstream, stats_interval=STATS_INTERVAL):
+    proxy = CacheProxy(('127.0.0.1', port), Store(root), pip_upstream)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    print(f"toolchain-cache: serving {root} on 127.0.0.1:{port}", file=sys.stderr)
+    previous = {}
+    while True:
+        time.sleep(stats_interval)
+        caches = proxy.stats.snapshot()
+        ccache = ccache_stats()
+        if ccache is not None:
+            caches['ccache'] = ccache
+        deltas = {
+            cache: {field: value - previous.get(cache, {}).get(field, 0) for field, value in counters.items()}
+            for cache, counters in caches.items()
+        }
+        for line in emf_line(deltas):
+            print(line, flush=True)
+        try:
+            write_stats(root, caches)
+        except OSError as e:
+            print(f"toolchain-cache: could not write stats: {e}", file=sys.stderr)
+        previous = caches
+
+
+def scan_files(directory):
+    """
+    (mtime, size, path) of every file under a directory
+    """
+    files = []
+    stack = [directory]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+    return files
+
+
+def clean(root, max_bytes, grace=EVICT_GRACE, now=None):
+    """
+    One janitor pass: evict the least recently used objects and ccache
+    entries until the cache is under LOW_WATER of max_bytes, remove
+    abandoned partial downloads, then drop refs to evicted objects. Returns
+    the pass's statistics, or None if another container's janitor holds the
+    lock.
+    """
+    now = now or time.time()
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'janitor.lock'), 'a') as lock:
+        try:
+            fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+
+        start = time.perf_counter()
+        removed_temp = 0
+        for mtime, _, path in scan_files(os.path.join(root, 'tmp')):
+            if now - mtime > TEMP_MAX_AGE:
+                try:
+                    os.unlink(path)
+                    removed_temp += 1
+                except FileNotFoundError:
+                    pass
+
+        files = scan_files(os.path.join(root, 'objects')) + scan_files(os.path.join(root, 'ccache'))
+        total = sum(size for _, size, _ in files)
+        before = total
+        evicted = evicted_bytes = 0
+        if total > max_bytes:
+            for mtime, size, path in sorted(files):
+                if total <= max_bytes * LOW_WATER or now - mtime < grace:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                evicted += 1
+                evicted_bytes += size
+
+        dangling = 0
+        if evicted:
+            store = Store(root)
+            for _, _, path in scan_files(os.path.join(root, 'refs')):
+                try:
+                    with open(path, 'r') as f:
+                        digest = f.read().strip()
+                except FileNotFoundError:
+                    continue
+                if not os.path.exists(store.object_path(digest)):
+                    try:
+                        os.unlink(path)
+                        dangling += 1
+                    except FileNotFoundError:
+                        pass
+
+        result = {
+            'time': now,
+            'files': len(files) - evicted,
+            'bytes_before': before,
+            'bytes': total,
+            'max_bytes': max_bytes,
+            'evicted': evicted,
+            'evicted_bytes': evicted_bytes,
+            'dangling_refs': dangling,
+            'stale_temp_files': removed_temp,
+            'seconds': time.perf_counter() - start,
+        }
+        with open(os.path.join(root, 'janitor.json.tmp'), 'w') as f:
+            json.dump(result, f)
+        os.replace(os.path.join(root, 'janitor.json.tmp'), os.path.join(root, 'janitor.json'))
+        return result
+
+
+def janitor(root, max_gib, interval, once=False):
+    while True:
+        result = clean(root, int(max_gib * 1024 ** 3))
+        if result is None:
+            print("toolchain-cache: another container's janitor is running", file=sys.stderr)
+        else:
+            print(json.dumps({'event': 'cache-janitor', **{k: v for k, v in result.items() if k != 'time'}}),
+                  flush=True)
+        if once:
+            return 0
+        time.sleep(interval)
+
+
+def aggregate(root):
+    """
+    Counters of every container that has reported, summed per cache
+    """
+    totals = collections.defaultdict(lambda: dict.fromkeys(Stats.FIELDS, 0))
+    containers = 0
+    for _, _, path in scan_files(os.path.join(root, 'stats')):
+        if not path.endswith('.json'):
+            continue
+        try:
+            with open(path, 'r') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        containers += 1
+        for cache, counters in report.get('caches', {}).items():
+            for field in Stats.FIELDS:
+                totals[cache][field] += counters.get(field, 0)
+    return containers, dict(totals)
+
+
+def print_stats(containers, totals, janitor_result=None):
+    print(f"{containers} container(s) reporting")
+    print(f"{'cache':<8} {'hits':>8} {'misses':>8} {'hit rate':>9} {'served':>10} {'fetched':>10} {'time saved':>11}")
+    for cache, counters in sorted(totals.items()):
+        lookups = counters['hits'] + counters['misses']
+        rate = f"{100.0 * counters['hits'] / lookups:.1f}%" if lookups else '-'
+        saved = seconds_saved(counters)
+        print(f"{cache:<8} {counters['hits']:>8} {counters['misses']:>8} {rate:>9} "
+              f"{counters['hit_bytes'] / 1e6:>8.1f}MB {counters['miss_bytes'] / 1e6:>8.1f}MB "
+              f"{(f'{saved:.1f}s' if saved is not None else '-'):>11}")
+    if janitor_result:
+        print(f"Cache size {janitor_result['bytes'] / 1024 ** 3:.2f} of {janitor_result['max_bytes'] / 1024 ** 3:.2f} GiB; "
+              f"last janitor pass evicted {janitor_result['evicted']} file(s), "
+              f"{janitor_result['evicted_bytes'] / 1e6:.1f} MB")
+
+
+def configure(root, port, max_gib):
+    """
+    Point apt, pip and ccache at the shared cache. Run as root when the
+    container starts, before the proxy.
+    """
+    for directory in ('objects', 'refs', 'tmp', 'ccache', 'stats'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    proxy = f"http://127.0.0.1:{port}"
+    files = {
+        # Only plain-http sources go through the proxy; https sources are
+        # fetched directly
+        APT_CONF: f'Acquire::http::Proxy "{proxy}/";\n',
+        PIP_CONF: f"[global]\nindex-url = {proxy}/simple/\n",
+        CCACHE_CONF: (f"cache_dir = {CCACHE_LOCAL_DIR}\n"
+                      f"secondary_storage = file:{root}/ccache|umask=002|update_mtime=true\n"),
+        PROFILE_SCRIPT: (f"export DEV_FLEET_CACHE_DIR={root}\n"
+                         f"export DEV_FLEET_CACHE_MAX_GIB={max_gib:g}\n"
+                         f"case \":$PATH:\" in *:/usr/lib/ccache:*) ;; *) export PATH=\"/usr/lib/ccache:$PATH\" ;; esac\n"),
+    }
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+    print(f"toolchain-cache: apt, pip and ccache configured for {root}", file=sys.stderr)
+    return 0
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    """
+    A PyPI simple index and an apt pool of generated packages, served at a
+    fixed bandwidth per download with a per-request latency
+    """
+
+    daemon_threads = True
+
+    def __init__(self, packages, bytes_per_second, latency):
+        self.packages = packages
+        self.bytes_per_second = bytes_per_second
+        self.latency = latency
+        self.downloads = collections.Counter()
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                path = urllib.parse.urlsplit(self.path).path
+                if path.startswith('/simple/'):
+                    project = path[len('/simple/'):].strip('/')
+                    package = server.packages.get(('pip', project))
+                    if package is None:
+                        self.send_error(404)
+                        return
+                    body = (f'<html><body><a href="/packages/{package["filename"]}#sha256={package["sha256"]}" '
+                            f'data-requires-python="&gt;=3.8">{package["filename"]}</a></body></html>').encode()
+                    content_type = 'text/html'
+                else:
+                    package = next((p for p in server.packages.values() if p['path'] == path), None)
+                    if package is None:
+                        self.send_error(404)
+                        return
+                    with server.lock:
+                        server.downloads[path] += 1
+                    body = package['content']
+                    content_type = 'application/octet-stream'
+                    time.sleep(len(body) / server.bytes_per_second)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def fake_packages(count, seed=7):
+    """
+    count wheels and count .debs, sized like a typical dev toolchain: mostly
+    small, a few tens of MB
+    """
+    import random
+    rng = random.Random(seed)
+    packages = {}
+    for kind in ('pip', 'apt'):
+        for index in range(count):
+            size = int(min(40e6, rng.lognormvariate(13, 1.3)))
+            content = rng.randbytes(size)
+            name = f"{kind}pkg{index:03d}"
+            if kind == 'pip':
+                filename = f"{name}-1.0-py3-none-any.whl"
+                path = f"/packages/{filename}"
+            else:
+                filename = f"{name}_1.0-1_amd64.deb"
+                path = f"/ubuntu/pool/main/{name[0]}/{name}/{filename}"
+            packages[(kind, name)] = {
+                'name': name,
+                'filename': filename,
+                'path': path,
+                'content': content,
+                'sha256': hashlib.sha256(content).hexdigest(),
+            }
+    return packages
+
+
+def first_build(proxy_url, upstream_url, packages, names=None):
+    """
+    Fetch packages through a proxy the way pip (index page, then file) and
+    apt (absolute URL through the proxy) do. Returns (seconds, bytes,
+    corrupt).
+    """
+    import http.client
+    proxy = urllib.parse.urlsplit(proxy_url)
+    start = time.perf_counter()
+    fetched = corrupt = 0
+    for (kind, name), package in packages.items():
+        if names is not None and name not in names:
+            continue
+        connection = http.client.HTTPConnection(proxy.hostname, proxy.port, timeout=120)
+        if kind == 'pip':
+            connection.request('GET', f"/simple/{name}/")
+            page = connection.getresponse().read().decode()
+            href = html.unescape(HREF.search(page).group(1)).split('#')[0]
+            connection.request('GET', href)
+        else:
+            connection.request('GET', upstream_url + package['path'])
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        fetched += len(body)
+        if response.status != 200 or hashlib.sha256(body).hexdigest() != package['sha256']:
+            corrupt += 1
+    return time.perf_counter() - start, fetched, corrupt
+
+
+def simulate(package_count, containers, upstream_mbps, latency):
+    """
+    Cold and warm first builds, concurrent cold builds sharing one store,
+    and an LRU eviction pass, against a local upstream and a temporary
+    directory standing in for the EFS cache
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    packages = fake_packages(package_count)
+    total_bytes = sum(len(p['content']) for p in packages.values())
+    upstream = FakeUpstream(packages, upstream_mbps * 1e6 / 8, latency)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix='toolchain-cache-')
+    root = os.path.join(workdir, 'cache')
+
+    def container(name):
+        proxy = CacheProxy(('127.0.0.1', 0), Store(root), f"{upstream.url}/simple")
+        threading.Thread(target=proxy.serve_forever, daemon=True).start()
+        return proxy, f"http://127.0.0.1:{proxy.server_address[1]}"
+
+    leftover_locks = []
+
+    def build(name, names=None):
+        proxy, url = container(name)
+        seconds, fetched, corrupt = first_build(url, upstream.url, packages, names)
+        leftover_locks.append(len(proxy._key_locks))
+        write_stats(root, proxy.stats.snapshot(), name)
+        proxy.shutdown()
+        return seconds, fetched, corrupt, proxy.stats.snapshot()
+
+    def hit_rate(snapshot):
+        hits = sum(c['hits'] for c in snapshot.values())
+        lookups = hits + sum(c['misses'] for c in snapshot.values())
+        return 100.0 * hits / lookups if lookups else 0.0
+
+    def report(label, seconds, fetched, corrupt, snapshot):
+        print(f"{label:<34} {seconds:>7.2f}s  {fetched / 1e6:>7.1f} MB  hit rate {hit_rate(snapshot):>5.1f}%  "
+              f"corrupt {corrupt}")
+
+    print(f"{package_count} wheels + {package_count} .debs, {total_bytes / 1e6:.0f} MB; upstream "
+          f"{upstream_mbps} Mbit/s per download, {latency * 1000:.0f}ms per request")
+    cold = build('cold')
+    report('cold first build', *cold)
+    warm = build('warm')
+    report('warm first build (new container)', *warm)
+    print(f"{'':<34} {cold[0] / warm[0]:>7.1f}x faster")
+
+    shutil.rmtree(root)
+    downloads_before = sum(upstream.downloads.values())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=containers) as executor:
+        results = list(executor.map(lambda index: build(f"concurrent-{index}"), range(containers)))
+    seconds = time.perf_counter() - start
+    downloads = sum(upstream.downloads.values()) - downloads_before
+    store = Store(root)
+    bad_objects = sum(
+        1 for package in packages.values()
+        if (f := store.open(package['sha256'])) is None or hashlib.sha256(f.read()).hexdigest() != package['sha256']
+    )
+    print(f"{f'{containers} cold builds at once':<34} {seconds:>7.2f}s  "
+          f"{downloads} upstream downloads for {len(packages)} packages, "
+          f"corrupt responses {sum(r[2] for r in results)}, bad or missing objects {bad_objects}, "
+          f"key locks left after builds {sum(leftover_locks)}")
+
+    # Make half the packages recently used, then evict down to half the cache
+    hot = {name for _, name in list(packages)[::2]}
+    cache_bytes = sum(size for _, size, _ in scan_files(os.path.join(root, 'objects')))
+    for _, _, path in scan_files(os.path.join(root, 'objects')):
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+    build('hot', hot)
+    result = clean(root, cache_bytes // 2, grace=60)
+    print(f"{'janitor, budget half the cache':<34} {result['seconds']:>7.2f}s  evicted {result['evicted']} "
+          f"file(s), {result['evicted_bytes'] / 1e6:.1f} MB; {result['dangling_refs']} dangling ref(s) removed")
+    hot_rebuild = build('hot-rebuild', hot)
+    report('recently used half after eviction', *hot_rebuild)
+    cold_rebuild = build('cold-rebuild', {name for _, name in packages} - hot)
+    report('least recently used half', *cold_rebuild)
+
+    print()
+    containers_reporting, totals = aggregate(root)
+    print_stats(containers_reporting, totals, result)
+    upstream.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    corrupt = cold[2] + warm[2] + sum(r[2] for r in results) + bad_objects + hot_rebuild[2] + cold_rebuild[2]
+    return 0 if corrupt == 0 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared, content-addressed pip/apt/ccache caches on EFS")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cache-dir', default=CACHE_DIR)
+    common.add_argument('--max-gib', type=float, default=float(os.environ.get('DEV_FLEET_CACHE_MAX_GIB', MAX_GIB)),
+                        help="Size budget the janitor keeps the cache within")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    configure_parser = subparsers.add_parser('configure', parents=[common],
+                                             help="Point apt, pip and ccache at the shared cache")
+    configure_parser.add_argument('--port', type=int, default=PROXY_PORT)
+
+    serve_parser = subparsers.add_parser('serve', parents=[common], help="Run the pip/apt pull-through proxy")
+    serve_parser.add_argument('--port', type=int, default=PROXY_PORT)
+    serve_parser.add_argument('--pip-upstream', default=os.environ.get('DEV_FLEET_CACHE_PIP_UPSTREAM', PIP_UPSTREAM))
+    serve_parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL)
+
+    janitor_parser = subparsers.add_parser('janitor', parents=[common], help="Evict least recently used files")
+    janitor_parser.add_argument('--interval', type=float, default=1800)
+    janitor_parser.add_argument('--once', action='store_true')
+
+    stats_parser = subparsers.add_parser('stats', parents=[common], help="Fleet-wide hit rates")
+    stats_parser.add_argument('--json', action='store_true')
+
+    simulate_parser = subparsers.add_parser('simulate', help="Cold, warm and concurrent builds against a local upstream")
+    simulate_parser.add_argument('--packages', type=int, default=40, help="Wheels, and as many .debs")
+    simulate_parser.add_argument('--containers', type=int, default=8)
+    simulate_parser.add_argument('--upstream-mbps', type=float, default=200, help="Megabits per second per download")
+    simulate_parser.add_argument('--latency', type=float, default=0.05, help="Seconds per upstream request")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        return simulate(args.packages, args.containers, args.upstream_mbps, args.latency)
+    if args.command == 'configure':
+        return configure(args.cache_dir, args.port, args.max_gib)
+    if args.command == 'serve':
+        return serve(args.cache_dir, args.port, args.pip_upstream, args.stats_interval)
+    if args.command == 'janitor':
+        return janitor(args.cache_dir, args.max_gib, args.interval, args.once)
+
+    containers, totals = aggregate(args.cache_dir)
+    try:
+        with open(os.path.join(args.cache_dir, 'janitor.json'), 'r') as f:
+            janitor_result = json.load(f)
+    except (OSError, ValueError):
+        janitor_result = None
+    if args.json:
+        print(json.dumps({'containers': containers, 'caches': totals, 'janitor': janitor_result}, indent=2))
+        return 0
+    print_stats(containers, totals, janitor_result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
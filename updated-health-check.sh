@@ -1,8 +1,8 @@
 #!/bin/bash
 # updated-health-check.sh - Simple HTTP health check for development containers
 
-# Check if HTTP server is running on port 80
-if curl -s http://localhost:80 > /dev/null; then
+# Check the health server's liveness endpoint (fails when sshd is down)
+if curl -sf http://localhost:80/live > /dev/null; then
   echo "HTTP health check passed"
   exit 0
 else
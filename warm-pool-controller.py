@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+warm-pool-controller.py - Warm pool and scale-to-zero controller for developer tasks
+
+Keeps a configurable number of pre-started dev-environment tasks (EFS already
+mounted, sshd already up) ready to hand out, assigns one to a developer on
+demand, and stops assigned tasks that have been idle past a threshold. A task
+counts as idle when nobody has sent a heartbeat for it and its health server
+reports no live SSH sessions. All ECS reads and writes are batched
+(DescribeTasks by 100, RunTask by 10), and hand-out latency percentiles are
+exposed on the /metrics endpoint.
+
+Usage:
+  warm-pool-controller.py serve --cluster dev-fleet-cluster --task-definition dev-environment \\
+      --subnets subnet-a subnet-b --security-groups sg-123 --pool-size 3 [--bind 127.0.0.1] \\
+      [--fargate-spot-weight 3 --fargate-weight 1 --fargate-base 1]
+  warm-pool-controller.py simulate --pool-size 3 --developers 20 --start-delay 2
+"""
+
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fleet_ecs import (DEVELOPER_TAG, capacity_provider_strategy, describe_tasks, list_task_arns, run_tasks,
+                       task_private_ip, task_tags)
+
+STARTED_BY = 'dev-fleet-warm-pool'
+POOL_TAG = 'dev-fleet:pool'
+HEALTH_PORT = 80
+# Shared secret for the POST endpoints, required when serving beyond localhost
+TOKEN_ENV = 'DEV_FLEET_CONTROLLER_TOKEN'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class WarmPoolController:
+    """
+    Tracks pool tasks in memory and reconciles them against ECS on an interval.
+
+    A task is "warm" until it is assigned to a developer; assignment is
+    recorded as a tag on the task so a restarted controller can rebuild its
+    state from ListTasks + DescribeTasks.
+    """
+
+    def __init__(self, ecs_client, cluster, task_definition, pool_size=2, idle_timeout=30 * 60,
+                 subnets=None, security_groups=None, assign_public_ip=True, start_timeout=600,
+                 poll_interval=2.0, session_probe=None, capacity_provider_strategy=None):
+        self.ecs = ecs_client
+        self.cluster = cluster
+        self.task_definition = task_definition
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self.poll_interval = poll_interval
+        # task -> live SSH sessions, or None when the task can't be asked
+        self.session_probe = session_probe or health_server_sessions
+        self.run_task_params = {
+            'cluster': cluster,
+            'taskDefinition': task_definition,
+            'startedBy': STARTED_BY,
+            'enableECSManagedTags': True,
+            'networkConfiguration': {
+                'awsvpcConfiguration': {
+                    'subnets': list(subnets or []),
+                    'securityGroups': list(security_groups or []),
+                    'assignPublicIp': 'ENABLED' if assign_public_ip else 'DISABLED'
+                }
+            }
+        }
+        # The same FARGATE/FARGATE_SPOT split as the stack's services
+        if capacity_provider_strategy:
+            self.run_task_params['capacityProviderStrategy'] = capacity_provider_strategy
+        else:
+            self.run_task_params['launchType'] = 'FARGATE'
+
+        self._lock = threading.Lock()
+        self._replenish = threading.Event()
+        self._stop = threading.Event()
+        self.warm = {}          # task ARN -> task description
+        self.assigned = {}      # developer -> task description
+        self.assigning = {}     # developer -> Event set when their hand-out finishes
+        self.last_activity = {} # developer -> epoch seconds
+        self.failed_stops = {}  # task ARN -> stop reason, retried next pass
+        self.handout_latencies = []
+        self.cold_starts = 0
+
+    # -- state ---------------------------------------------------------------
+
+    def recover(self):
+        """
+        Rebuild pool state from tasks this controller started earlier
+        """
+        arns = list_task_arns(self.ecs, self.cluster, started_by=STARTED_BY)
+        now = time.time()
+        with self._lock:
+            for task in describe_tasks(self.ecs, self.cluster, arns, include_tags=True):
+                developer = task_tags(task).get(DEVELOPER_TAG)
+                if developer:
+                    self.assigned[developer] = task
+                    self.last_activity.setdefault(developer, now)
+                else:
+                    self.warm[task['taskArn']] = task
+        print(f"Recovered {len(self.warm)} warm and {len(self.assigned)} assigned task(s)")
+
+    def reconcile(self):
+        """
+        One control loop pass: refresh every tracked task with batched
+        DescribeTasks, reap idle and surplus tasks, then top the pool up
+        """
+        with self._lock:
+            tracked = set(self.warm) | {task['taskArn'] for task in self.assigned.values()}
+            to_stop = list(self.failed_stops.items())
+            self.failed_stops.clear()
+        described = {
+            task['taskArn']: task
+            for task in describe_tasks(self.ecs, self.cluster, tracked)
+        }
+
+        now = time.time()
+        idle = []
+        with self._lock:
+            # Tasks assigned or started after the describe call are left alone
+            for arn in list(self.warm):
+                if arn not in tracked:
+                    continue
+                task = described.get(arn)
+                if task is None or task['lastStatus'] == 'STOPPED':
+                    del self.warm[arn]
+                else:
+                    self.warm[arn] = task
+            for developer, task in list(self.assigned.items()):
+                if task['taskArn'] not in tracked:
+                    continue
+                current = described.get(task['taskArn'])
+                if current is None or current['lastStatus'] == 'STOPPED':
+                    del self.assigned[developer]
+                    self.last_activity.pop(developer, None)
+                    continue
+                self.assigned[developer] = current
+                if now - self.last_activity.get(developer, now) > self.idle_timeout:
+                    idle.append((developer, current))
+
+            surplus = len(self.warm) - self.pool_size
+            if surplus > 0:
+                # Shrink the pool by stopping tasks that are still starting first
+                by_readiness = sorted(self.warm.values(), key=lambda t: t['lastStatus'] == 'RUNNING')
+                for task in by_readiness[:surplus]:
+                    to_stop.append((task['taskArn'], "Warm pool shrunk"))
+                    del self.warm[task['taskArn']]
+            deficit = self.pool_size - len(self.warm)
+
+        to_stop.extend(self._reap_idle(idle))
+        self._stop_tasks(to_stop)
+        if deficit > 0:
+            self._start_warm_tasks(deficit)
+
+    def _reap_idle(self, idle):
+        """
+        Of the (developer, task) pairs without a recent heartbeat, release
+        the ones whose task has no live SSH session. A session counts as
+        activity, so it resets the idle clock.
+        """
+        if not idle:
+            return []
+        with ThreadPoolExecutor(max_workers=min(16, len(idle))) as executor:
+            sessions = list(executor.map(lambda pair: self.session_probe(pair[1]), idle))
+        now = time.time()
+        to_stop = []
+        with self._lock:
+            for (developer, task), count in zip(idle, sessions):
+                current = self.assigned.get(developer)
+                # Reassigned or heartbeating since the describe call
+                if current is None or current['taskArn'] != task['taskArn']:
+                    continue
+                if now - self.last_activity.get(developer, now) <= self.idle_timeout:
+                    continue
+                if count:
+                    self.last_activity[developer] = now
+                    continue
+                if count is None:
+                    print(f"Warning: Could not read SSH sessions of {task['taskArn'].split('/')[-1]}, "
+                          f"treating it as idle")
+                to_stop.append((task['taskArn'], f"Idle for more than {self.idle_timeout}s"))
+                del self.assigned[developer]
+                self.last_activity.pop(developer, None)
+        return to_stop
+
+    def _start_warm_tasks(self, count):
+        tasks, failures = run_tasks(
+            self.ecs, count,
+            tags=[{'key': POOL_TAG, 'value': 'warm'}],
+            **self.run_task_params
+        )
+        with self._lock:
+            for task in tasks:
+                self.warm[task['taskArn']] = task
+        for failure in failures:
+            print(f"Warning: Could not start warm task: {failure.get('reason')}")
+
+    def _stop_tasks(self, to_stop):
+        """
+        StopTask has no batch form, so stop in parallel. The tasks are no
+        longer tracked, so a failed stop is kept for the next reconcile pass
+        instead of leaving the task running unnoticed.
+        """
+        if not to_stop:
+            return
+        with ThreadPoolExecutor(max_workers=min(16, len(to_stop))) as executor:
+            futures = []
+            for arn, reason in to_stop:
+                print(f"Stopping {arn.split('/')[-1]}: {reason}")
+                futures.append((arn, reason, executor.submit(
+                    self.ecs.stop_task, cluster=self.cluster, task=arn, reason=reason)))
+        failed = {}
+        for arn, reason, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Warning: Could not stop {arn.split('/')[-1]}, retrying next pass: {e}")
+                failed[arn] = reason
+        with self._lock:
+            self.failed_stops.update(failed)
+
+    # -- hand-out ------------------------------------------------------------
+
+    def _claim_warm_task(self):
+        """
+        Take the best warm task: a RUNNING one if any, otherwise the one that
+        has been starting the longest
+        """
+        with self._lock:
+            if not self.warm:
+                return None
+            task = max(
+                self.warm.values(),
+                key=lambda t: (t['lastStatus'] == 'RUNNING', -t['createdAt'].timestamp())
+            )
+            del self.warm[task['taskArn']]
+            return task
+
+    def _wait_running(self, task):
+        deadline = time.monotonic() + self.start_timeout
+        while task['lastStatus'] != 'RUNNING':
+            if task['lastStatus'] == 'STOPPED' or time.monotonic() > deadline:
+                raise RuntimeError(f"Task {task['taskArn']} did not reach RUNNING")
+            time.sleep(self.poll_interval)
+            task = describe_tasks(self.ecs, self.cluster, [task['taskArn']])[0]
+        return task
+
+    def assign(self, developer):
+        """
+        Hand a running task to a developer, starting one cold only when the
+        pool is empty. Returns the task description. Concurrent requests for
+        one developer share a single hand-out.
+        """
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                existing = self.assigned.get(developer)
+                if existing:
+                    self.last_activity[developer] = time.time()
+                    return existing
+                pending = self.assigning.get(developer)
+                if pending is None:
+                    self.assigning[developer] = threading.Event()
+                    break
+            # Another request is handing this developer a task; use its
+            # result, or try again if it failed
+            pending.wait()
+
+        task = None
+        try:
+            task = self._claim_warm_task()
+            self._replenish.set()
+            if task is None:
+                with self._lock:
+                    self.cold_starts += 1
+                tasks, failures = run_tasks(self.ecs, 1, **self.run_task_params)
+                if not tasks:
+                    raise RuntimeError(f"Could not start a task for {developer}: {failures}")
+                task = tasks[0]
+
+            task = self._wait_running(task)
+            self.ecs.tag_resource(resourceArn=task['taskArn'], tags=[{'key': DEVELOPER_TAG, 'value': developer}])
+        except Exception:
+            # A claimed task is no longer tracked anywhere, so stop it
+            # rather than leave it running unseen
+            if task is not None:
+                self._stop_tasks([(task['taskArn'], f"Hand-out to {developer} failed")])
+            with self._lock:
+                self.assigning.pop(developer).set()
+            raise
+
+        with self._lock:
+            self.assigned[developer] = task
+            self.last_activity[developer] = time.time()
+            self.handout_latencies.append(time.perf_counter() - start)
+            self.assigning.pop(developer).set()
+        return task
+
+    def heartbeat(self, developer):
+        with self._lock:
+            if developer in self.assigned:
+                self.last_activity[developer] = time.time()
+                return True
+            return False
+
+    def release(self, developer):
+        with self._lock:
+            task = self.assigned.pop(developer, None)
+            self.last_activity.pop(developer, None)
+        if task:
+            self._stop_tasks([(task['taskArn'], f"Released by {developer}")])
+        return task is not None
+
+    def metrics(self):
+        with self._lock:
+            latencies = list(self.handout_latencies)
+            return {
+                'pool_size': self.pool_size,
+                'warm': len(self.warm),
+                'warm_running': sum(1 for t in self.warm.values() if t['lastStatus'] == 'RUNNING'),
+                'assigned': len(self.assigned),
+                'handouts': len(latencies),
+                'cold_starts': self.cold_starts,
+                'handout_seconds': {
+                    f"p{pct}": percentile(latencies, pct) for pct in (50, 90, 95, 99)
+                }
+            }
+
+    # -- loop ----------------------------------------------------------------
+
+    def run(self, interval=15.0):
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Warning: Reconcile failed: {e}")
+            # Wake early when a hand-out drained the pool
+            self._replenish.wait(interval)
+            self._replenish.clear()
+
+    def start(self, interval=15.0):
+        thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        self._replenish.set()
+
+
+def health_server_sessions(task, port=HEALTH_PORT, timeout=2.0):
+    """
+    Live SSH sessions on a task, from health-server.py's /sessions endpoint
+    """
+    ip = task_private_ip(task)
+    if not ip:
+        return None
+    try:
+        with urllib.request.urlopen(f"http://{ip}:{port}/sessions", timeout=timeout) as response:
+            return json.load(response)['active_ssh_sessions']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def task_summary(task):
+    return {
+        'taskArn': task['taskArn'],
+        'lastStatus': task['lastStatus'],
+        'privateIp': task_private_ip(task)
+    }
+
+
+def make_handler(controller, token=None):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/metrics':
+                self._send(200, controller.metrics())
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if token and not hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}"):
+                self._send(401, {'error': 'unauthorized'})
+                return
+            url = urlparse(self.path)
+            developer = parse_qs(url.query).get('developer', [''])[0]
+            if not developer:
+                self._send(400, {'error': 'developer is required'})
+            elif url.path == '/assign':
+                try:
+                    self._send(200, task_summary(controller.assign(developer)))
+                except Exception as e:
+                    self._send(503, {'error': str(e)})
+            elif url.path == '/heartbeat':
+                self._send(200 if controller.heartbeat(developer) else 404, {'developer': developer})
+            elif url.path == '/release':
+                self._send(200 if controller.release(developer) else 404, {'developer': developer})
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def simulate(args):
+    """
+    Drive the controller against the local ECS stand-in with random
+    developer arrivals and report hand-out latency and API call counts
+    """
+    from local_aws import LocalECS
+
+    ecs_client = LocalECS(start_delay=args.start_delay, api_latency=args.api_latency)
+    # Every fourth developer stays logged in without sending heartbeats
+    connected = {f"dev{index:03d}" for index in range(0, args.developers, 4)}
+
+    def session_probe(task):
+        return int(any(controller.assigned.get(developer, {}).get('taskArn') == task['taskArn']
+                       for developer in connected))
+
+    controller = WarmPoolController(
+        ecs_client, 'dev-fleet-cluster', 'dev-environment',
+        pool_size=args.pool_size,
+        idle_timeout=args.idle_timeout,
+        poll_interval=min(0.2, args.start_delay / 10),
+        session_probe=session_probe
+    )
+    controller.reconcile()
+    controller.start(interval=args.interval)
+
+    # Give the initial pool time to come up, as it would between work days
+    time.sleep(args.start_delay * 1.2)
+
+    rng = random.Random(args.seed)
+    with ThreadPoolExecutor(max_workers=args.developers) as executor:
+        futures = []
+        for index in range(args.developers):
+            time.sleep(rng.expovariate(args.arrival_rate))
+            # A double-clicked connect: both requests must get the same task
+            futures.append((executor.submit(controller.assign, f"dev{index:03d}"),
+                            executor.submit(controller.assign, f"dev{index:03d}")))
+        duplicates = sum(first.result()['taskArn'] != second.result()['taskArn'] for first, second in futures)
+
+    # Nobody sends heartbeats, so every assigned task without an SSH session
+    # goes idle and is reaped
+    time.sleep(args.idle_timeout + args.interval * 2)
+    controller.stop()
+
+    metrics = controller.metrics()
+    print(json.dumps(metrics, indent=2))
+    print("ECS API calls: " + ", ".join(f"{op}={count}" for op, count in sorted(ecs_client.calls.items())))
+    print(f"Developers handed two different tasks: {duplicates}")
+    running = len(list_task_arns(ecs_client, 'dev-fleet-cluster'))
+    print(f"Tasks still running after idle reaping: {running} "
+          f"(warm pool of {args.pool_size} + {len(connected)} with an SSH session)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm pool and scale-to-zero controller for developer tasks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="Run the controller against ECS")
+    serve.add_argument('--cluster', default='dev-fleet-cluster')
+    serve.add_argument('--task-definition', default='dev-environment')
+    serve.add_argument('--subnets', nargs='+', required=True)
+    serve.add_argument('--security-groups', nargs='+', required=True)
+    serve.add_argument('--pool-size', type=int, default=2, help="Warm tasks to keep ready (0 scales to zero)")
+    serve.add_argument('--idle-timeout', type=float, default=30 * 60, help="Seconds without a heartbeat or SSH session before an assigned task is stopped")
+    serve.add_argument('--interval', type=float, default=15.0, help="Seconds between reconcile passes")
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--bind', default='127.0.0.1',
+                       help=f"Address to listen on; anything but loopback needs ${TOKEN_ENV} set")
+    serve.add_argument('--region', default='us-east-1')
+    serve.add_argument('--fargate-spot-weight', type=int, default=0,
+                       help="Same as the stack's fargate_spot_weight context; 0 runs on demand")
+    serve.add_argument('--fargate-weight', type=int, default=1)
+    serve.add_argument('--fargate-base', type=int, default=0)
+
+    sim = subparsers.add_parser('simulate', help="Run against a local ECS stand-in and report latencies")
+    sim.add_argument('--pool-size', type=int, default=3)
+    sim.add_argument('--developers', type=int, default=20)
+    sim.add_argument('--arrival-rate', type=float, default=4.0, help="Mean developer arrivals per second")
+    sim.add_argument('--start-delay', type=float, default=2.0, help="Simulated seconds for a task to reach RUNNING")
+    sim.add_argument('--api-latency', type=float, default=0.02)
+    sim.add_argument('--idle-timeout', type=float, default=2.0)
+    sim.add_argument('--interval', type=float, default=0.5)
+    sim.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args(argv)
+    if args.command == 'simulate':
+        simulate(args)
+        return 0
+
+    # /assign and /release start and stop tasks, so outside callers must
+    # present the shared token
+    token = os.environ.get(TOKEN_ENV)
+    if not token and not ipaddress.ip_address(args.bind).is_loopback:
+        raise SystemExit(f"Set {TOKEN_ENV} to serve on {args.bind}; POST requests must then send "
+                         f"'Authorization: Bearer <token>'")
+
+    import boto3
+
+    controller = WarmPoolController(
+        boto3.client('ecs', region_name=args.region),
+        args.cluster, args.task_definition,
+        pool_size=args.pool_size,
+        idle_timeout=args.idle_timeout,
+        subnets=args.subnets,
+        security_groups=args.security_groups,
+        capacity_provider_strategy=capacity_provider_strategy(
+            args.fargate_spot_weight, args.fargate_weight, args.fargate_base)
+    )
+    controller.recover()
+    controller.start(interval=args.interval)
+    server = ThreadingHTTPServer((args.bind, args.port), make_handler(controller, token))
+    print(f"Warm pool controller listening on {args.bind}:{args.port} (pool size {args.pool_size}"
+          f"{', token required' if token else ''})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        controller.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
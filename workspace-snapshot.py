@@ -0,0 +1,772 @@
+#!/usr/bin/env python3
+"""
+workspace-snapshot.py - Incremental, content-addressed workspace snapshots in S3
+
+Files are split into content-defined chunks, so an insert in the middle of a
+large file only changes the chunks around it, and every chunk is stored once
+per bucket under its SHA-256 however many developers' workspaces contain it.
+A snapshot only reads files whose size, mtime or inode changed since the
+previous snapshot, only uploads chunks the bucket does not already hold, and
+packs them into large objects sent as parallel multipart uploads. The
+snapshot itself is a manifest listing every file's chunks, written last, so
+a snapshot is either complete or absent.
+
+Bucket layout:
+  packs/<pack id>                  concatenated chunks, immutable
+  index/<pack id>.json.gz          chunk id -> offset and length in the pack
+  snapshots/<workspace>/<id>.json.gz
+  snapshots/<workspace>/LATEST     id of the newest snapshot
+
+The index objects are mirrored into a SQLite cache under --cache-dir, so
+deduplication costs an indexed local read per chunk and each run only lists
+index objects written since the last one. Restores fetch each file's chunks
+with ranged GETs and verify them, one file at a time, so a single file (or a
+glob of them) can be restored without downloading the rest of the snapshot.
+
+Usage:
+  workspace-snapshot.py create [--path /home/developer] [--workspace alice]
+  workspace-snapshot.py ls [--workspace alice] [--snapshot ID]
+  workspace-snapshot.py restore TARGET [--snapshot ID] [--only 'src/*.py' ...]
+  workspace-snapshot.py cat PATH [--snapshot ID]
+  workspace-snapshot.py check [--workspace alice]   # can this container reach its snapshots?
+  workspace-snapshot.py simulate [--mb 256] [--api-latency 0.01]
+"""
+
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Chunk boundaries: a position is a candidate when the byte before it is one
+# of CANDIDATE_BYTES (newlines in text, 0x00/0xff runs and a few others in
+# binaries), and a cut when the CRC-32 of the WINDOW bytes ending there has
+# its low bits clear. Boundaries only depend on nearby content, so they line
+# up again right after an insert or delete. Average chunks are ~300 KiB.
+MIN_CHUNK = 128 * 1024
+MAX_CHUNK = 1024 * 1024
+WINDOW = 48
+CUT_MASK = (1 << 12) - 1
+CANDIDATE_BYTES = b'\n\x00\x01\x80\x90\xfe\xff'
+CANDIDATES = re.compile(b'[' + re.escape(CANDIDATE_BYTES) + b']')
+# Inside a run of one repeated byte every window is the same, so the run is
+# skipped in one search instead of one CRC per byte
+RUN_END = {byte: re.compile(b'[^' + re.escape(bytes([byte])) + b']') for byte in CANDIDATE_BYTES}
+READ_BYTES = 4 * 1024 * 1024
+
+PACK_BYTES = 64 * 1024 * 1024
+PART_BYTES = 8 * 1024 * 1024
+UPLOAD_WORKERS = 8
+SCAN_WORKERS = 16
+# Index objects are listed from this long before the last listing, so a pack
+# finished by a slow uploader shortly after is still picked up
+INDEX_LIST_OVERLAP = 600
+
+CACHE_DIR = os.path.expanduser('~/.cache/dev-fleet-snapshots')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    pack TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packs (
+    key TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def new_id(now=None):
+    """
+    Time-ordered id, so listing with StartAfter finds everything newer
+    """
+    return time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now)) + '-' + uuid.uuid4().hex[:8]
+
+
+def chunk_spans(buf, final):
+    """
+    Content-defined (start, end) spans of buf and the offset where unchunked
+    data begins. Unless final, a chunk is only cut once MAX_CHUNK bytes
+    past its start are in buf, so spans do not depend on how the file was
+    read.
+    """
+    spans = []
+    start = 0
+    size = len(buf)
+    search = CANDIDATES.search
+    crc32 = zlib.crc32
+    while start < size and (final or size - start >= MAX_CHUNK):
+        limit = min(start + MAX_CHUNK, size)
+        position = start + MIN_CHUNK
+        cut = None
+        while position < limit:
+            match = search(buf, position, limit)
+            if match is None:
+                break
+            end = match.end()
+            window = buf[end - WINDOW:end]
+            if not crc32(window) & CUT_MASK:
+                cut = end
+                break
+            position = end
+            if window.count(window[-1]) == WINDOW:
+                run_end = RUN_END[window[-1]].search(buf, end, limit)
+                position = run_end.start() if run_end else limit
+        spans.append((start, cut or limit))
+        start = cut or limit
+    return spans, start
+
+
+def iter_chunks(path):
+    """
+    Yield the content-defined chunks of a file
+    """
+    with open(path, 'rb') as f:
+        buf = f.read(READ_BYTES)
+        if len(buf) <= MIN_CHUNK:
+            if buf:
+                yield buf
+            return
+        while True:
+            data = f.read(READ_BYTES)
+            final = not data
+            if data:
+                buf += data
+            spans, consumed = chunk_spans(buf, final)
+            for start, end in spans:
+                yield buf[start:end]
+            buf = buf[consumed:]
+            if final:
+                return
+
+
+def chunk_id(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def scan(root, workers=SCAN_WORKERS, exclude=()):
+    """
+    Map relative path -> entry for everything under root, without crossing
+    into other file systems. Directories are listed in parallel, which is
+    what makes a scan fast on NFS where every stat is a round trip.
+    """
+    root_dev = os.lstat(root).st_dev
+    entries = {}
+
+    def excluded(path):
+        return any(fnmatch.fnmatch(path, pattern) for pattern in exclude)
+
+    def list_dir(rel):
+        found, subdirs = [], []
+        with os.scandir(os.path.join(root, rel) if rel else root) as it:
+            for entry in it:
+                path = f"{rel}/{entry.name}" if rel else entry.name
+                if excluded(path):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    if entry.is_symlink():
+                        found.append((path, {'type': 'symlink', 'target': os.readlink(entry.path)}))
+                    elif entry.is_dir(follow_symlinks=False):
+                        found.append((path, {'type': 'dir', 'mode': st.st_mode & 0o7777}))
+                        if st.st_dev == root_dev:
+                            subdirs.append(path)
+                    elif entry.is_file(follow_symlinks=False):
+                        found.append((path, {
+                            'type': 'file',
+                            'mode': st.st_mode & 0o7777,
+                            'size': st.st_size,
+                            'mtime_ns': st.st_mtime_ns,
+                            'ino': st.st_ino,
+                        }))
+                except FileNotFoundError:
+                    continue
+        return found, subdirs
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(list_dir, '')}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                entries.update(found)
+                pending |= {pool.submit(list_dir, path) for path in subdirs}
+    return entries
+
+
+def unchanged(entry, previous):
+    return (previous is not None and previous.get('type') == 'file'
+            and all(previous.get(field) == entry[field] for field in ('size', 'mtime_ns', 'ino')))
+
+
+class ChunkIndex:
+    """
+    Local SQLite mirror of the bucket's index objects: which chunks exist
+    and where. Shared by the snapshot threads behind one lock.
+    """
+
+    def __init__(self, s3_client, bucket, cache_dir=CACHE_DIR):
+        self.s3 = s3_client
+        self.bucket = bucket
+        directory = os.path.join(cache_dir, bucket)
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def sync(self):
+        """
+        Load index objects written since the last sync; returns how many
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'listed_at'").fetchone()
+        listed_at = float(row[0]) if row else 0
+        now = time.time()
+        start_after = f"index/{new_id(listed_at - INDEX_LIST_OVERLAP)[:16]}" if listed_at else ''
+        known = {key for (key,) in self.conn.execute('SELECT key FROM packs')}
+        keys = []
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix='index/',
+                                                                       StartAfter=start_after):
+            keys += [obj['Key'] for obj in page.get('Contents', []) if obj['Key'] not in known]
+
+        def fetch(key):
+            return key, json.loads(gzip.decompress(self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()))
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            for key, index in pool.map(fetch, keys):
+                self.add(key, index['pack'], index['chunks'])
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('listed_at', ?)", (str(now),))
+        return len(keys)
+
+    def add(self, index_key, pack, chunks):
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO chunks VALUES (?, ?, ?, ?)',
+                                  [(cid, pack, offset, length) for cid, (offset, length) in chunks.items()])
+            self.conn.execute('INSERT OR IGNORE INTO packs VALUES (?)', (index_key,))
+
+    def get(self, cid):
+        with self.lock:
+            return self.conn.execute('SELECT pack, offset, length FROM chunks WHERE id = ?', (cid,)).fetchone()
+
+
+class PackUploader:
+    """
+    Appends new chunks to the open pack and streams it to S3 as a multipart
+    upload, PART_BYTES at a time with up to UPLOAD_WORKERS parts in flight.
+    A full pack is completed and its index object written in the background
+    while the next one fills. Packs smaller than one part use a single PUT.
+    """
+
+    def __init__(self, s3_client, bucket, index, pack_bytes=PACK_BYTES, part_bytes=PART_BYTES,
+                 workers=UPLOAD_WORKERS):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.index = index
+        self.pack_bytes = pack_bytes
+        self.part_bytes = part_bytes
+        self.parts = ThreadPoolExecutor(max_workers=workers)
+        self.finisher = ThreadPoolExecutor(max_workers=2)
+        self.in_flight = threading.BoundedSemaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.finishing = []
+        self.uploads = []
+        self.new_chunks = 0
+        self.new_bytes = 0
+        self._open_pack()
+
+    def _open_pack(self):
+        self.pack = new_id()
+        self.pack_key = f"packs/{self.pack}"
+        self.pack_chunks = {}
+        self.buffer = bytearray()
+        self.flushed = 0
+        self.upload_id = None
+        self.part_futures = []
+
+    def add(self, cid, data):
+        """
+        Store a chunk not already in the bucket; returns its location
+        """
+        with self.lock:
+            if cid in self.pending:
+                return self.pending[cid]
+            offset = self.flushed + len(self.buffer)
+            self.buffer += data
+            self.pack_chunks[cid] = (offset, len(data))
+            self.pending[cid] = (self.pack_key, offset, len(data))
+            self.new_chunks += 1
+            self.new_bytes += len(data)
+            if len(self.buffer) >= self.part_bytes:
+                self._send_part(self.buffer[:self.part_bytes])
+                del self.buffer[:self.part_bytes]
+            if self.flushed + len(self.buffer) >= self.pack_bytes:
+                self._finish_pack()
+            return self.pending[cid]
+
+    def _send_part(self, body):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.pack_key)['UploadId']
+            self.uploads.append((self.pack_key, self.upload_id))
+        number = len(self.part_futures) + 1
+        key, upload_id = self.pack_key, self.upload_id
+        self.in_flight.acquire()
+
+        def upload():
+            try:
+                response = self.s3.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                               PartNumber=number, Body=bytes(body))
+                return {'PartNumber': number, 'ETag': response['ETag']}
+            finally:
+                self.in_flight.release()
+
+        self.part_futures.append(self.parts.submit(upload))
+        self.flushed += len(body)
+
+    def _finish_pack(self):
+        if not self.pack_chunks:
+            return
+        if self.upload_id is None:
+            body = bytes(self.buffer)
+        else:
+            if self.buffer:
+                self._send_part(self.buffer)
+            body = None
+        pack, key, upload_id = self.pack, self.pack_key, self.upload_id
+        futures, chunks = self.part_futures, self.pack_chunks
+
+        def finish():
+            if body is not None:
+                self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+            else:
+                parts = [future.result() for future in futures]
+                self.s3.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={'Parts': parts})
+            index_key = f"index/{pack}.json.gz"
+            self.s3.put_object(Bucket=self.bucket, Key=index_key,
+                               Body=gzip.compress(json.dumps({'pack': key, 'chunks': chunks}).encode()))
+            self.index.add(index_key, key, chunks)
+
+        self.finishing.append(self.finisher.submit(finish))
+        self._open_pack()
+
+    def close(self):
+        """
+        Finish the open pack and wait for every upload; aborts unfinished
+        multipart uploads if any of them failed
+        """
+        with self.lock:
+            self._finish_pack()
+        try:
+            for future in self.finishing:
+                future.result()
+        except Exception:
+            for key, upload_id in self.uploads:
+                try:
+                    self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+                except Exception:
+                    pass
+            raise
+        finally:
+            self.parts.shutdown()
+            self.finisher.shutdown()
+
+
+def manifest_key(workspace, snapshot_id):
+    return f"snapshots/{workspace}/{snapshot_id}.json.gz"
+
+
+def latest_snapshot_id(s3_client, bucket, workspace):
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=f"snapshots/{workspace}/LATEST")['Body'].read()
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+    return body.decode().strip()
+
+
+def load_manifest(s3_client, bucket, workspace, snapshot_id=None, cache_dir=CACHE_DIR):
+    """
+    A snapshot manifest (the latest by default), read from the local cache
+    when this container wrote or fetched it before
+    """
+    snapshot_id = snapshot_id or latest_snapshot_id(s3_client, bucket, workspace)
+    if snapshot_id is None:
+        return None
+    cached = os.path.join(cache_dir, bucket, 'manifests', workspace, f"{snapshot_id}.json.gz")
+    if os.path.exists(cached):
+        with open(cached, 'rb') as f:
+            return json.loads(gzip.decompress(f.read()))
+    body = s3_client.get_object(Bucket=bucket, Key=manifest_key(workspace, snapshot_id))['Body'].read()
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    with open(cached, 'wb') as f:
+        f.write(body)
+    return json.loads(gzip.decompress(body))
+
+
+def create_snapshot(s3_client, bucket, root, workspace, cache_dir=CACHE_DIR, exclude=(), workers=SCAN_WORKERS,
+                    pack_bytes=PACK_BYTES, part_bytes=PART_BYTES):
+    """
+    Snapshot root as workspace; returns the manifest's id and statistics
+    """
+    started = time.perf_counter()
+    index = ChunkIndex(s3_client, bucket, cache_dir)
+    new_index_objects = index.sync()
+    previous = load_manifest(s3_client, bucket, workspace, cache_dir=cache_dir)
+    previous_entries = previous['entries'] if previous else {}
+
+    entries = scan(root, workers, exclude)
+    scanned = time.perf_counter()
+    changed = []
+    for path, entry in entries.items():
+        if entry['type'] != 'file':
+            continue
+        if unchanged(entry, previous_entries.get(path)):
+            entry['chunks'] = previous_entries[path]['chunks']
+        else:
+            changed.append(path)
+
+    uploader = PackUploader(s3_client, bucket, index, pack_bytes, part_bytes)
+    stats = {'bytes_read': 0, 'chunks': 0}
+    stats_lock = threading.Lock()
+
+    def store(path):
+        chunks = []
+        read = 0
+        try:
+            for data in iter_chunks(os.path.join(root, path)):
+                read += len(data)
+                cid = chunk_id(data)
+                location = index.get(cid) or uploader.add(cid, data)
+                chunks.append([cid, *location])
+        except FileNotFoundError:
+            return path, None
+        with stats_lock:
+            stats['bytes_read'] += read
+            stats['chunks'] += len(chunks)
+        return path, chunks
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, chunks in pool.map(store, changed):
+                if chunks is None:
+                    del entries[path]
+                else:
+                    entries[path]['chunks'] = chunks
+    finally:
+        uploader.close()
+
+    snapshot_id = new_id()
+    manifest = {
+        'version': 1,
+        'workspace': workspace,
+        'id': snapshot_id,
+        'parent': previous['id'] if previous else None,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'entries': entries,
+    }
+    body = gzip.compress(json.dumps(manifest, separators=(',', ':')).encode())
+    s3_client.put_object(Bucket=bucket, Key=manifest_key(workspace, snapshot_id), Body=body)
+    s3_client.put_object(Bucket=bucket, Key=f"snapshots/{workspace}/LATEST", Body=snapshot_id.encode())
+    cached = os.path.join(cache_dir, bucket, 'manifests', workspace, f"{snapshot_id}.json.gz")
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    with open(cached, 'wb') as f:
+        f.write(body)
+
+    files = sum(1 for entry in entries.values() if entry['type'] == 'file')
+    return snapshot_id, {
+        'files': files,
+        'total_bytes': sum(entry.get('size', 0) for entry in entries.values()),
+        'changed_files': len(changed),
+        'bytes_read': stats['bytes_read'],
+        'chunks_read': stats['chunks'],
+        'new_chunks': uploader.new_chunks,
+        'bytes_uploaded': uploader.new_bytes,
+        'index_objects_loaded': new_index_objects,
+        'scan_seconds': round(scanned - started, 3),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def read_chunks(s3_client, bucket, chunks):
+    """
+    Yield the data of a file's chunks, fetching runs of chunks stored next
+    to each other in one pack with a single ranged GET
+    """
+    runs = []
+    for cid, pack, offset, length in chunks:
+        if runs and runs[-1][0] == pack and runs[-1][2] == offset:
+            runs[-1][2] += length
+            runs[-1][3].append((cid, length))
+        else:
+            runs.append([pack, offset, offset + length, [(cid, length)]])
+    for pack, start, end, members in runs:
+        data = s3_client.get_object(Bucket=bucket, Key=pack, Range=f"bytes={start}-{end - 1}")['Body'].read()
+        position = 0
+        for cid, length in members:
+            chunk = data[position:position + length]
+            if chunk_id(chunk) != cid:
+                raise ValueError(f"Chunk {cid} in {pack} failed verification")
+            position += length
+            yield chunk
+
+
+def restore(s3_client, bucket, manifest, target, only=(), workers=UPLOAD_WORKERS):
+    """
+    Write the snapshot's files (those matching only, if given) under target.
+    Each file is written to a temporary name and renamed into place when
+    complete, so files become usable one at a time as they land.
+    """
+    entries = manifest['entries']
+    selected = {path: entry for path, entry in entries.items()
+                if not only or any(fnmatch.fnmatch(path, pattern) for pattern in only)}
+    for path, entry in sorted(selected.items()):
+        if entry['type'] == 'dir':
+            os.makedirs(os.path.join(target, path), exist_ok=True)
+    for path in selected:
+        os.makedirs(os.path.dirname(os.path.join(target, path)) or target, exist_ok=True)
+
+    def restore_file(path):
+        entry = selected[path]
+        destination = os.path.join(target, path)
+        temporary = f"{destination}.restore-{uuid.uuid4().hex[:8]}"
+        with open(temporary, 'wb') as f:
+            for data in read_chunks(s3_client, bucket, entry['chunks']):
+                f.write(data)
+        os.chmod(temporary, entry['mode'])
+        os.utime(temporary, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        os.replace(temporary, destination)
+        return entry['size']
+
+    files = [path for path, entry in selected.items() if entry['type'] == 'file']
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        restored = sum(pool.map(restore_file, files))
+    for path, entry in selected.items():
+        if entry['type'] == 'symlink':
+            destination = os.path.join(target, path)
+            if os.path.lexists(destination):
+                os.unlink(destination)
+            os.symlink(entry['target'], destination)
+    for path, entry in sorted(selected.items(), reverse=True):
+        if entry['type'] == 'dir':
+            os.chmod(os.path.join(target, path), entry['mode'])
+    return len(files), restored
+
+
+def tree_digest(root):
+    digest = {}
+    for path, entry in scan(root).items():
+        if entry['type'] == 'file':
+            with open(os.path.join(root, path), 'rb') as f:
+                digest[path] = (hashlib.sha256(f.read()).hexdigest(), entry['mode'])
+        elif entry['type'] == 'symlink':
+            digest[path] = entry['target']
+    return digest
+
+
+def simulate(total_mb, api_latency):
+    """
+    Full, incremental and cross-developer snapshots of a generated workspace
+    against the local S3 stand-in, followed by a single-file and a full
+    restore
+    """
+    import random
+    from local_aws import LocalS3
+
+    random.seed(7)
+    workdir = tempfile.mkdtemp(prefix='workspace-snapshot-')
+    s3 = LocalS3(api_latency=api_latency)
+    s3.create_bucket(Bucket='snapshots')
+    alice = os.path.join(workdir, 'alice')
+
+    # Source files, a few large binaries (build outputs, a git pack) and a
+    # symlink, sized to total_mb
+    words = [f"identifier{index}".encode() for index in range(500)]
+    source_files = 2000
+    for index in range(source_files):
+        path = os.path.join(alice, f"src/pkg{index // 50:03d}/module{index % 50:02d}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\n'.join(b' '.join(random.choices(words, k=8)) for _ in range(random.randint(40, 200))))
+    large_files = 4
+    large_bytes = max(1, (total_mb * 1024 * 1024 - 2000 * 8 * 1024) // large_files)
+    os.makedirs(os.path.join(alice, 'build'))
+    for index in range(large_files):
+        with open(os.path.join(alice, f"build/artifact{index}.bin"), 'wb') as f:
+            f.write(random.randbytes(large_bytes))
+    os.symlink('src/pkg000/module00.py', os.path.join(alice, 'main.py'))
+
+    def report(label, stats):
+        print(f"{label:<28} {stats['seconds']:>7.2f}s  files {stats['changed_files']:>5}/{stats['files']:<5} "
+              f"read {stats['bytes_read'] / 1e6:>7.1f} MB  uploaded {stats['bytes_uploaded'] / 1e6:>7.1f} MB "
+              f"of {stats['total_bytes'] / 1e6:.1f} MB ({stats['new_chunks']} new chunks)")
+
+    cache = os.path.join(workdir, 'cache-alice')
+    print(f"Workspace: {source_files} source files and {large_files} x {large_bytes / 1e6:.0f} MB binaries; "
+          f"S3 API latency {api_latency * 1000:.0f}ms")
+    _, stats = create_snapshot(s3, 'snapshots', alice, 'alice', cache_dir=cache)
+    report('full snapshot', stats)
+
+    _, stats = create_snapshot(s3, 'snapshots', alice, 'alice', cache_dir=cache)
+    report('no changes', stats)
+
+    # Edit a handful of files, insert into the middle of a large one, add
+    # and delete a file
+    for index in range(0, source_files, 100):
+        path = os.path.join(alice, f"src/pkg{index // 50:03d}/module{index % 50:02d}.py")
+        with open(path, 'ab') as f:
+            f.write(b'\n# edited\n')
+    artifact = os.path.join(alice, 'build/artifact0.bin')
+    with open(artifact, 'rb') as f:
+        data = f.read()
+    with open(artifact, 'wb') as f:
+        f.write(data[:len(data) // 2] + b'inserted bytes' * 100 + data[len(data) // 2:])
+    with open(os.path.join(alice, 'src/new_module.py'), 'wb') as f:
+        f.write(b'print("new")\n')
+    os.unlink(os.path.join(alice, 'src/pkg001/module01.py'))
+    snapshot_id, stats = create_snapshot(s3, 'snapshots', alice, 'alice', cache_dir=cache)
+    report('edits + mid-file insert', stats)
+
+    # A second developer on a fresh container (empty local cache) with a
+    # near-identical checkout
+    bob = os.path.join(workdir, 'bob')
+    shutil.copytree(alice, bob, symlinks=True)
+    with open(os.path.join(bob, 'src/pkg002/module02.py'), 'ab') as f:
+        f.write(b'\n# bob was here\n')
+    _, stats = create_snapshot(s3, 'snapshots', bob, 'bob', cache_dir=os.path.join(workdir, 'cache-bob'))
+    report('second developer (dedupe)', stats)
+
+    # Restores, from a container that has never seen the snapshot
+    restore_cache = os.path.join(workdir, 'cache-restore')
+    manifest = load_manifest(s3, 'snapshots', 'alice', cache_dir=restore_cache)
+    before = dict(s3.calls)
+    start = time.perf_counter()
+    single = os.path.join(workdir, 'single')
+    restore(s3, 'snapshots', manifest, single, only=['src/pkg003/module03.py'])
+    single_seconds = time.perf_counter() - start
+    gets = s3.calls['GetObject'] - before.get('GetObject', 0)
+    start = time.perf_counter()
+    full = os.path.join(workdir, 'full')
+    files, restored = restore(s3, 'snapshots', manifest, full)
+    full_seconds = time.perf_counter() - start
+    matches = tree_digest(full) == tree_digest(alice)
+    print(f"{'restore one file':<28} {single_seconds:>7.2f}s  {gets} GET(s)")
+    print(f"{'restore everything':<28} {full_seconds:>7.2f}s  {files} files, {restored / 1e6:.1f} MB, "
+          f"identical to the workspace: {'yes' if matches else 'NO'}")
+    print(f"S3 calls: {dict(s3.calls)}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if matches else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental, content-addressed workspace snapshots in S3")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--bucket', default=os.environ.get('DEV_FLEET_SNAPSHOT_BUCKET'))
+    common.add_argument('--workspace', default=os.environ.get('DEV_FLEET_DEVELOPER', 'developer'))
+    common.add_argument('--cache-dir', default=os.environ.get('DEV_FLEET_SNAPSHOT_CACHE', CACHE_DIR))
+    common.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-east-1'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = subparsers.add_parser('create', parents=[common], help="Snapshot a workspace")
+    create_parser.add_argument('--path', default=os.path.expanduser('~'))
+    create_parser.add_argument('--exclude', action='append', default=[],
+                               help="Glob of relative paths to skip (repeatable)")
+
+    ls_parser = subparsers.add_parser('ls', parents=[common], help="Show the latest snapshot's files")
+    ls_parser.add_argument('--snapshot', help="Snapshot id (default: latest)")
+
+    restore_parser = subparsers.add_parser('restore', parents=[common], help="Restore a snapshot under a path")
+    restore_parser.add_argument('target')
+    restore_parser.add_argument('--snapshot', help="Snapshot id (default: latest)")
+    restore_parser.add_argument('--only', action='append', default=[],
+                                help="Glob of relative paths to restore (repeatable)")
+
+    cat_parser = subparsers.add_parser('cat', parents=[common], help="Write one file from a snapshot to stdout")
+    cat_parser.add_argument('path')
+    cat_parser.add_argument('--snapshot', help="Snapshot id (default: latest)")
+
+    subparsers.add_parser('check', parents=[common], help="Check that the workspace's snapshots can be listed")
+
+    simulate_parser = subparsers.add_parser('simulate', help="Run snapshots and restores against local S3")
+    simulate_parser.add_argument('--mb', type=int, default=256, help="Approximate workspace size")
+    simulate_parser.add_argument('--api-latency', type=float, default=0.01)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        return simulate(args.mb, args.api_latency)
+
+    if not args.bucket:
+        print("Error: set --bucket or DEV_FLEET_SNAPSHOT_BUCKET", file=sys.stderr)
+        return 1
+
+    try:
+        import boto3
+    except ImportError as e:
+        print(f"Snapshots unavailable: {e}", file=sys.stderr)
+        return 1
+    s3_client = boto3.client('s3', region_name=args.region)
+
+    if args.command == 'check':
+        try:
+            latest = latest_snapshot_id(s3_client, args.bucket, args.workspace)
+        except Exception as e:
+            print(f"Snapshots unavailable: s3://{args.bucket}/{args.workspace}: {e}", file=sys.stderr)
+            return 1
+        print(f"Snapshots OK: s3://{args.bucket}/{args.workspace} (latest: {latest or 'none yet'})")
+        return 0
+
+    if args.command == 'create':
+        snapshot_id, stats = create_snapshot(s3_client, args.bucket, args.path, args.workspace,
+                                             cache_dir=args.cache_dir, exclude=args.exclude)
+        print(f"Snapshot {args.workspace}/{snapshot_id}: {stats['changed_files']} of {stats['files']} files read, "
+              f"{stats['bytes_uploaded'] / 1e6:.1f} MB uploaded in {stats['seconds']:.1f}s")
+        return 0
+
+    manifest = load_manifest(s3_client, args.bucket, args.workspace, args.snapshot, args.cache_dir)
+    if manifest is None:
+        print(f"Error: no snapshots for {args.workspace} in s3://{args.bucket}", file=sys.stderr)
+        return 1
+
+    if args.command == 'ls':
+        print(f"{args.workspace}/{manifest['id']} created {manifest['created']}")
+        for path, entry in sorted(manifest['entries'].items()):
+            if entry['type'] == 'file':
+                print(f"  {entry['mode']:04o} {entry['size']:>12} {path}")
+            elif entry['type'] == 'symlink':
+                print(f"  link {'':>12} {path} -> {entry['target']}")
+        return 0
+
+    if args.command == 'cat':
+        entry = manifest['entries'].get(args.path)
+        if entry is None or entry['type'] != 'file':
+            print(f"Error: {args.path} is not a file in {args.workspace}/{manifest['id']}", file=sys.stderr)
+            return 1
+        for data in read_chunks(s3_client, args.bucket, entry['chunks']):
+            sys.stdout.buffer.write(data)
+        return 0
+
+    files, restored = restore(s3_client, args.bucket, manifest, args.target, args.only)
+    print(f"Restored {files} files ({restored / 1e6:.1f} MB) from {args.workspace}/{manifest['id']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())